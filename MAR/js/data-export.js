@@ -86,7 +86,7 @@ class DataExportManager {
       });
 
       if (response.ok) {
-        const blob = await response.blob();
+        const blob = await this.exportBlob(response);
         const url = window.URL.createObjectURL(blob);
         const a = document.createElement('a');
         a.href = url;
@@ -109,6 +109,30 @@ class DataExportManager {
     }
   }
 
+  async exportBlob(response) {
+    // JSON/CSV exports run as background jobs: poll the job, then download its artifact
+    const headers = { 'Authorization': `Bearer ${localStorage.getItem('access_token')}` };
+    if (response.status !== 202 && !(response.headers.get('Content-Type') || '').includes('application/json')) {
+      return response.blob();
+    }
+    let job = await response.json();
+    if (!job.job_id) {
+      return new Blob([JSON.stringify(job)], { type: 'application/json' });
+    }
+    while (job.status === 'queued' || job.status === 'running') {
+      await new Promise(resolve => setTimeout(resolve, 1000));
+      job = await (await fetch(job.status_url, { headers })).json();
+    }
+    if (job.status !== 'done') {
+      throw new Error(job.error || `Export ${job.status}`);
+    }
+    const download = await fetch(job.download_url, { headers });
+    if (!download.ok) {
+      throw new Error(`Export download failed (${download.status})`);
+    }
+    return download.blob();
+  }
+
   showImportModal() {
     const modal = document.getElementById('import-modal');
     if (modal) {
@@ -4,6 +4,10 @@
  */
 
 class OfflineQueue {
+    // Collections whose queued creates are synced through POST <collection>bulk/
+    static BULK_COLLECTIONS = ['/strength-sets/', '/nutrition-logs/'];
+    static BULK_MAX_ITEMS = 200;
+    
     constructor() {
         this.dbName = 'FitnessTrackerOfflineQueue';
         this.dbVersion = 1;
@@ -110,26 +114,34 @@ class OfflineQueue {
         
         try {
             const requests = await this.getQueuedRequests();
+            let batch = [];
             
             for (const request of requests) {
+                // Consecutive creates on the same collection are replayed through its bulk endpoint
+                if (this.bulkUrlFor(request)) {
+                    if (batch.length && (this.bulkUrlFor(batch[0]) !== this.bulkUrlFor(request) || batch.length >= OfflineQueue.BULK_MAX_ITEMS)) {
+                        await this.processBulk(batch);
+                        batch = [];
+                    }
+                    batch.push(request);
+                    continue;
+                }
+                if (batch.length) {
+                    await this.processBulk(batch);
+                    batch = [];
+                }
+                
                 try {
                     await this.processRequest(request);
                     await this.removeRequest(request.id);
                 } catch (error) {
                     console.error(`Failed to process queued request:`, error);
-                    
-                    // Increment retry count
-                    request.retryCount++;
-                    
-                    if (request.retryCount >= request.maxRetries) {
-                        console.error(`Max retries exceeded for request ${request.id}, removing from queue`);
-                        await this.removeRequest(request.id);
-                    } else {
-                        // Update retry count in database
-                        await this.updateRequest(request);
-                    }
+                    await this.recordFailure(request);
                 }
             }
+            if (batch.length) {
+                await this.processBulk(batch);
+            }
         } catch (error) {
             console.error('Error flushing queue:', error);
         } finally {
@@ -137,6 +149,70 @@ class OfflineQueue {
         }
     }
     
+    async recordFailure(request) {
+        // Increment retry count
+        request.retryCount++;
+        
+        if (request.retryCount >= request.maxRetries) {
+            console.error(`Max retries exceeded for request ${request.id}, removing from queue`);
+            await this.removeRequest(request.id);
+        } else {
+            // Update retry count in database
+            await this.updateRequest(request);
+        }
+    }
+    
+    bulkUrlFor(request) {
+        if (request.method !== 'POST' || !request.data || Array.isArray(request.data)) {
+            return null;
+        }
+        const path = request.url.split('?')[0];
+        const collection = OfflineQueue.BULK_COLLECTIONS.find((name) => path.endsWith(name));
+        return collection ? `${path}bulk/` : null;
+    }
+    
+    async processBulk(batch) {
+        const items = batch.map((request) => ({
+            ...request.data,
+            // Per-item key: the server applies each queued create once, however often it is replayed
+            idempotency_key: `q${request.timestamp}-${request.id}`
+        }));
+        
+        let results;
+        try {
+            const response = await fetch(this.bulkUrlFor(batch[0]), {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    ...batch[0].headers
+                },
+                body: JSON.stringify({ items: items })
+            });
+            const body = await response.json();
+            if (!body || !Array.isArray(body.results)) {
+                throw new Error(`HTTP ${response.status}: ${response.statusText}`);
+            }
+            results = body.results;
+        } catch (error) {
+            console.error('Failed to process queued bulk request:', error);
+            for (const request of batch) {
+                await this.recordFailure(request);
+            }
+            return;
+        }
+        
+        for (const result of results) {
+            const request = batch[result.index];
+            if (result.status === 'invalid') {
+                // Rejected by validation; kept until its retries run out, as a single request would be
+                console.error(`Queued request ${request.id} rejected:`, result.errors);
+                await this.recordFailure(request);
+                continue;
+            }
+            await this.removeRequest(request.id);
+        }
+    }
+    
     async getQueuedRequests() {
         return new Promise((resolve, reject) => {
             const transaction = this.db.transaction([this.storeName], 'readonly');
@@ -201,6 +201,14 @@ class WorkoutWebSocketClient {
         });
     }
 
+    sendGpsPoints(points) {
+        // points: [{latitude, longitude, altitude, speed, accuracy, timestamp (epoch seconds)}]
+        return this.wsManager.send(this.connectionId, {
+            type: 'gps_point',
+            points: points
+        });
+    }
+
     sendWorkoutPaused() {
         return this.wsManager.send(this.connectionId, {
             type: 'workout_paused'
@@ -256,6 +264,8 @@ class DashboardWebSocketClient {
             onDashboardUpdate: null,
             onError: null
         };
+        this.state = null;
+        this.version = 0;
     }
 
     connect(userId) {
@@ -277,8 +287,25 @@ class DashboardWebSocketClient {
     handleMessage(data) {
         switch (data.type) {
             case 'dashboard_update':
+                this.state = data.data;
+                this.version = data.version || 0;
                 if (this.callbacks.onDashboardUpdate) {
-                    this.callbacks.onDashboardUpdate(data.data);
+                    this.callbacks.onDashboardUpdate(this.state);
+                }
+                break;
+            case 'dashboard_delta':
+                if (data.version <= this.version) {
+                    break;
+                }
+                if (this.state === null || data.version !== this.version + 1) {
+                    // Missed a delta; ask for a fresh snapshot
+                    this.resync();
+                    break;
+                }
+                this.state = { ...this.state, ...data.fragments };
+                this.version = data.version;
+                if (this.callbacks.onDashboardUpdate) {
+                    this.callbacks.onDashboardUpdate(this.state);
                 }
                 break;
             case 'error':
@@ -305,6 +332,12 @@ class DashboardWebSocketClient {
         });
     }
 
+    resync() {
+        return this.wsManager.send(this.connectionId, {
+            type: 'resync'
+        });
+    }
+
     onDashboardUpdate(callback) {
         this.callbacks.onDashboardUpdate = callback;
     }
@@ -205,6 +205,65 @@ MAR_FLAGS = {
     "onboarding_enabled": True,       # gate account-level onboarding
 }
 
+# Write-behind buffer for WebSocket HR samples (see tracker/hr_ingest.py)
+MAR_HR_INGEST = {
+    "flush_interval_ms": int(os.getenv('HR_FLUSH_INTERVAL_MS', '250')),  # max time a sample waits
+    "max_batch": int(os.getenv('HR_FLUSH_MAX_BATCH', '500')),            # rows per executemany
+    "max_pending": int(os.getenv('HR_MAX_PENDING', '10000')),            # backpressure threshold
+}
+
+# Coalesced WebSocket HR room broadcasts (see tracker/hr_broadcast.py)
+MAR_HR_BROADCAST = {
+    "interval_ms": int(os.getenv('HR_BROADCAST_INTERVAL_MS', '1000')),          # one aggregate per athlete/room
+    "max_interval_ms": int(os.getenv('HR_BROADCAST_MAX_INTERVAL_MS', '5000')),  # back-off ceiling under load
+}
+
+# WebSocket client_msg_id de-duplication (see tracker/ws_dedup.py); "shared" uses the Redis channel layer
+MAR_WS_DEDUP = {
+    "window_s": int(os.getenv('WS_DEDUP_WINDOW_S', '300')),
+    "max_ids": int(os.getenv('WS_DEDUP_MAX_IDS', '1000')),   # per connection
+    "shared": os.getenv('WS_DEDUP_SHARED', 'True') == 'True',
+}
+
+# Background data export jobs (see tracker/export_jobs.py); artifacts live outside MEDIA_ROOT
+MAR_EXPORTS = {
+    "root": os.getenv('EXPORT_ROOT', str(BASE_DIR / 'exports')),
+    "workers": int(os.getenv('EXPORT_WORKERS', '2')),                    # thread pool size per process
+    "max_artifact_mb": int(os.getenv('EXPORT_MAX_ARTIFACT_MB', '50')),    # jobs fail above this size
+    "artifact_ttl_s": int(os.getenv('EXPORT_ARTIFACT_TTL_S', '86400')),   # see the expire_exports command
+}
+
+# Time-series retention tiers (see tracker/retention.py and the expire_timeseries command)
+MAR_RETENTION = {
+    "hr_raw_days": int(os.getenv('RETENTION_HR_RAW_DAYS', '30')),      # raw HR samples, then minute/daily rollups
+    "gps_raw_days": int(os.getenv('RETENTION_GPS_RAW_DAYS', '90')),
+    "minute_days": int(os.getenv('RETENTION_MINUTE_DAYS', '365')),     # tracker_minute_hr; daily rows are kept
+    "batch_size": int(os.getenv('RETENTION_BATCH_SIZE', '5000')),      # rows deleted per transaction
+    "archive_sessions": os.getenv('RETENTION_ARCHIVE_SESSIONS', 'True') == 'True',
+}
+
+# Per-session HR analytics (see tracker/session_hr.py); max_hr applies when the profile has no age
+MAR_HR_ANALYTICS = {
+    "resting_hr": int(os.getenv('HR_ANALYTICS_RESTING_HR', '60')),
+    "max_hr": int(os.getenv('HR_ANALYTICS_MAX_HR', '190')),
+    "trimp_k": float(os.getenv('HR_ANALYTICS_TRIMP_K', '1.92')),   # Banister factor; 1.67 for women
+}
+
+# GPS track summaries (see tracker/gps_tracks.py)
+MAR_GPS = {
+    "moving_speed_ms": float(os.getenv('GPS_MOVING_SPEED_MS', '0.5')),       # slower segments count as stopped
+    "max_accuracy_m": float(os.getenv('GPS_MAX_ACCURACY_M', '50')),          # worse fixes are ignored
+    "simplify_tolerance_m": float(os.getenv('GPS_SIMPLIFY_TOLERANCE_M', '5')),
+    "max_polyline_points": int(os.getenv('GPS_MAX_POLYLINE_POINTS', '500')),
+}
+
+# Gamification leaderboard rank index (see tracker/rank_index.py); "memory" is per-process only
+MAR_RANK_INDEX = {
+    "backend": os.getenv('RANK_INDEX_BACKEND', 'redis'),
+    "redis_url": os.getenv('RANK_INDEX_REDIS_URL', 'redis://127.0.0.1:6379/1'),
+    "key_prefix": "mar:rank",
+}
+
 # Enhanced JWT settings for production
 SIMPLE_JWT.update({
     'SIGNING_KEY': SECRET_KEY,
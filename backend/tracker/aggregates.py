@@ -0,0 +1,812 @@
+"""
+Incremental maintenance of the daily aggregate tables from migration 0022.
+
+``tracker_strength_summary_daily``, ``tracker_cardio_load_daily`` and
+``tracker_weight_trend_daily`` hold one row per (user, local date), and
+``tracker_exercise_strength_daily`` (migration 0028) one row per (user,
+exercise, local date) for per-exercise trends. Writes to
+``StrengthSet``, ``CardioEntry``, ``BodyMeasurement`` and ``WorkoutSession``
+mark the affected (table, user, date) keys dirty (see ``tracker/signals.py``)
+and only those rows are recomputed once the surrounding transaction commits.
+HR samples arrive far too often for that, so their keys are collected and
+refreshed at most every ``HR_REFRESH_SECONDS`` by the HR write-behind buffer.
+Cardio days whose raw samples were expired by ``tracker/retention.py`` are
+frozen: their HR columns are kept as they were when the day was rolled up,
+while the session count is still recomputed from their cardio entries.
+
+The ``refresh_aggregates`` management command uses the same functions for
+range backfills and can diff the tables against a plain-ORM recomputation.
+"""
+import logging
+import threading
+import time as time_module
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, Count, F, FloatField, Max, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import hr_archive
+from .minute_buckets import as_aware_utc
+from .models import BodyMeasurement, CardioEntry, StrengthSet, WorkoutSession
+
+logger = logging.getLogger(__name__)
+
+STRENGTH = 'strength'
+CARDIO = 'cardio'
+WEIGHT = 'weight'
+EXERCISE = 'exercise'
+TABLES = {
+    STRENGTH: 'tracker_strength_summary_daily',
+    CARDIO: 'tracker_cardio_load_daily',
+    WEIGHT: 'tracker_weight_trend_daily',
+    EXERCISE: 'tracker_exercise_strength_daily',
+}
+# Row keys are a date, except for the per-exercise table where they are (date, exercise_id)
+KEY_COLUMNS = {
+    STRENGTH: ['date'],
+    CARDIO: ['date'],
+    WEIGHT: ['date'],
+    EXERCISE: ['date', 'exercise_id'],
+}
+COLUMNS = {
+    STRENGTH: ['sessions_count', 'exercises_count', 'total_tonnage', 'avg_tonnage_per_session',
+               'max_weight_lifted', 'best_e1rm'],
+    # total_trimp is owned by the session HR analytics and never overwritten here
+    # hr_session_ids (migration 0038) lets frozen days count cardio entries without their samples
+    CARDIO: ['total_samples', 'avg_hr', 'max_hr', 'min_hr', 'sessions_count', 'hr_session_ids'],
+    WEIGHT: ['current_weight', 'previous_weight', 'weight_change', 'body_fat_percentage', 'muscle_mass'],
+    EXERCISE: ['max_weight', 'best_e1rm_epley', 'best_e1rm_brzycki', 'total_volume', 'set_count', 'total_reps'],
+}
+
+HR_REFRESH_SECONDS = 60
+# Days per grouped HR-sample query; keeps the parameter count under SQLite's limit
+CARDIO_DAYS_PER_QUERY = 200
+
+# Series names in tracker_retention_watermark (migration 0033, see tracker/retention.py)
+HR_SERIES = 'hr_sample'
+GPS_SERIES = 'gps_point'
+
+# Epley e1RM as a database expression (mirrors tracker.metrics.epley_e1rm)
+EPLEY_E1RM = Case(
+    When(weight_kg__lte=0, then=Value(0.0)),
+    When(reps__lte=0, then=F('weight_kg')),
+    default=F('weight_kg') * (Value(1.0) + F('reps') / Value(30.0)),
+    output_field=FloatField(),
+)
+
+# Brzycki e1RM (mirrors tracker.metrics.brzycki_e1rm); undefined from 37 reps, so NULL there
+BRZYCKI_E1RM = Case(
+    When(weight_kg__lte=0, then=Value(0.0)),
+    When(reps__lte=1, then=F('weight_kg')),
+    When(reps__gte=37, then=Value(None)),
+    default=F('weight_kg') * Value(36.0) / (Value(37.0) - F('reps')),
+    output_field=FloatField(),
+)
+
+
+def aggregates_enabled():
+    return settings.MAR_FLAGS.get("aggregates_enabled", True)
+
+
+def day_bounds(start_day, end_day=None):
+    """Aware datetimes covering [start_day, end_day] in the current time zone"""
+    end_day = end_day or start_day
+    start = timezone.make_aware(datetime.combine(start_day, time.min))
+    end = timezone.make_aware(datetime.combine(end_day + timedelta(days=1), time.min))
+    return start, end
+
+
+def local_day(value):
+    """Local calendar date of an aware datetime (None-safe)"""
+    if value is None:
+        return None
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return timezone.localdate(value)
+
+
+# ----------------------------------------------------------------------
+# Computation (grouped queries, bounded by the number of output rows)
+# ----------------------------------------------------------------------
+def compute_strength_rows(user_id, start_day, end_day):
+    """{date: row} for tracker_strength_summary_daily over [start_day, end_day]"""
+    start, end = day_bounds(start_day, end_day)
+    sessions = (
+        WorkoutSession.objects
+        .filter(user_id=user_id, start_time__gte=start, start_time__lt=end)
+        .annotate(day=TruncDate('start_time'))
+        .values('day')
+        .annotate(n=Count('id'))
+    )
+    sets = (
+        StrengthSet.objects
+        .filter(session__user_id=user_id, session__start_time__gte=start, session__start_time__lt=end)
+        .annotate(day=TruncDate('session__start_time'))
+        .values('day')
+        .annotate(
+            tonnage=Sum(F('reps') * F('weight_kg'), output_field=FloatField()),
+            max_weight=Max('weight_kg'),
+            best_e1rm=Max(EPLEY_E1RM),
+            exercises=Count('exercise', distinct=True),
+        )
+    )
+
+    rows = {}
+    session_counts = {row['day']: row['n'] for row in sessions}
+    for row in sets:
+        day = row['day']
+        count = session_counts.get(day, 0)
+        tonnage = float(row['tonnage'] or 0)
+        rows[day] = {
+            'sessions_count': count,
+            'exercises_count': row['exercises'],
+            'total_tonnage': tonnage,
+            'avg_tonnage_per_session': tonnage / count if count else 0.0,
+            'max_weight_lifted': float(row['max_weight'] or 0),
+            'best_e1rm': float(row['best_e1rm'] or 0),
+        }
+    for day, count in session_counts.items():
+        rows.setdefault(day, {
+            'sessions_count': count, 'exercises_count': 0, 'total_tonnage': 0.0,
+            'avg_tonnage_per_session': 0.0, 'max_weight_lifted': 0.0, 'best_e1rm': 0.0,
+        })
+    return rows
+
+
+def compute_exercise_rows(user_id, start_day=None, end_day=None, exercise_id=None):
+    """{(date, exercise_id): row} for tracker_exercise_strength_daily over [start_day, end_day]"""
+    sets = StrengthSet.objects.filter(session__user_id=user_id, session__start_time__isnull=False)
+    if exercise_id is not None:
+        sets = sets.filter(exercise_id=exercise_id)
+    if start_day is not None:
+        sets = sets.filter(session__start_time__gte=day_bounds(start_day)[0])
+    if end_day is not None:
+        sets = sets.filter(session__start_time__lt=day_bounds(end_day)[1])
+    grouped = (
+        sets
+        .annotate(day=TruncDate('session__start_time'))
+        .values('day', 'exercise_id')
+        .annotate(
+            max_weight=Max('weight_kg'),
+            epley=Max(EPLEY_E1RM),
+            brzycki=Max(BRZYCKI_E1RM),
+            volume=Sum(F('reps') * F('weight_kg'), output_field=FloatField()),
+            sets=Count('id'),
+            reps_total=Sum('reps'),
+        )
+    )
+    return {
+        (row['day'], row['exercise_id']): {
+            'max_weight': float(row['max_weight'] or 0),
+            'best_e1rm_epley': float(row['epley'] or 0),
+            'best_e1rm_brzycki': float(row['brzycki'] or 0),
+            'total_volume': float(row['volume'] or 0),
+            'set_count': row['sets'],
+            'total_reps': row['reps_total'] or 0,
+        }
+        for row in grouped
+    }
+
+
+def _hr_sample_stats(user_id, bounds):
+    """
+    [(count, avg, max, min, session ids)] of raw HR samples in each of the sorted
+    [start, end) ``bounds``: two grouped queries per CARDIO_DAYS_PER_QUERY days
+    """
+    stats = [[0, None, None, None, set()] for _ in bounds]
+    for offset in range(0, len(bounds), CARDIO_DAYS_PER_QUERY):
+        chunk = bounds[offset:offset + CARDIO_DAYS_PER_QUERY]
+        values = ', '.join(['(%s, %s, %s)'] * len(chunk))
+        params = []
+        for index, (start, end) in enumerate(chunk, start=offset):
+            params += [index, db_datetime(start), db_datetime(end)]
+        # A VALUES list names its columns column1, column2, ... on both SQLite and Postgres
+        joined = f"""
+            FROM tracker_hr_sample s
+            JOIN (VALUES {values}) AS d ON s.timestamp >= d.column2 AND s.timestamp < d.column3
+            WHERE s.user_id = %s AND s.timestamp >= %s AND s.timestamp < %s
+        """
+        params += [user_id, db_datetime(chunk[0][0]), db_datetime(chunk[-1][1])]
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT d.column1, COUNT(*), AVG(s.heart_rate), MAX(s.heart_rate), MIN(s.heart_rate)
+                {joined}
+                GROUP BY d.column1
+            """, params)
+            for index, total, avg_hr, max_hr, min_hr in cursor.fetchall():
+                stats[int(index)][:4] = [total, avg_hr, max_hr, min_hr]
+            cursor.execute(f"""
+                SELECT DISTINCT d.column1, s.session_id
+                {joined}
+                AND s.session_id IS NOT NULL
+            """, params)
+            for index, session_id in cursor.fetchall():
+                stats[int(index)][4].add(int(session_id))
+    return stats
+
+
+def compute_cardio_day_rows(user_id, days, entry_sessions):
+    """{date: row} for tracker_cardio_load_daily on ``days``, skipping days without cardio data"""
+    days = sorted(days)
+    bounds = [day_bounds(day) for day in days]
+    raw = _hr_sample_stats(user_id, bounds)
+    # Completed sessions whose samples were packed by hr_archive
+    archived = hr_archive.archived_daily_stats(user_id, bounds)
+
+    rows = {}
+    for day, (total, avg_hr, max_hr, min_hr, session_ids), archive in zip(days, raw, archived):
+        a_total, a_sum, a_min, a_max, a_sessions = archive
+        if a_total:
+            raw_total = total or 0
+            avg_hr = ((avg_hr or 0) * raw_total + a_sum) / (raw_total + a_total)
+            max_hr = a_max if max_hr is None else max(max_hr, a_max)
+            min_hr = a_min if min_hr is None else min(min_hr, a_min)
+            total = raw_total + a_total
+            session_ids = session_ids | a_sessions
+        entry_ids = entry_sessions.get(day, set())
+        if not total and not session_ids and not entry_ids:
+            continue
+        rows[day] = {
+            'total_samples': total or 0,
+            'avg_hr': float(avg_hr or 0),
+            'max_hr': int(max_hr or 0),
+            'min_hr': int(min_hr or 0),
+            'sessions_count': len(session_ids | entry_ids),
+            'hr_session_ids': session_id_list(session_ids),
+        }
+    return rows
+
+
+def compute_cardio_rows(user_id, start_day, end_day):
+    """{date: row} for tracker_cardio_load_daily, probing only days that can hold data"""
+    start, end = day_bounds(start_day, end_day)
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT MIN(timestamp), MAX(timestamp)
+            FROM tracker_hr_sample
+            WHERE user_id = %s AND timestamp >= %s AND timestamp < %s
+        """, [user_id, db_datetime(start), db_datetime(end)])
+        first_ts, last_ts = cursor.fetchone()
+    first_ts = as_aware_utc(first_ts) if first_ts is not None else None
+    last_ts = as_aware_utc(last_ts) if last_ts is not None else None
+    archived_first, archived_last = hr_archive.archived_span(user_id, start, end)
+    if archived_first is not None:
+        first_ts = archived_first if first_ts is None else min(first_ts, archived_first)
+        last_ts = archived_last if last_ts is None else max(last_ts, archived_last)
+
+    entry_sessions = {}
+    for day, session_id in (
+        CardioEntry.objects
+        .filter(session__user_id=user_id, session__start_time__gte=start, session__start_time__lt=end)
+        .annotate(day=TruncDate('session__start_time'))
+        .values_list('day', 'session_id')
+        .distinct()
+    ):
+        entry_sessions.setdefault(day, set()).add(session_id)
+    days = set(entry_sessions)
+    if first_ts is not None:
+        first_day = max(local_day(first_ts), start_day)
+        last_day = min(local_day(last_ts), end_day)
+        days.update(first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1))
+
+    rows = compute_cardio_day_rows(user_id, days, entry_sessions)
+    return with_frozen_cardio(user_id, start_day, end_day, rows, entry_sessions)
+
+
+def session_id_list(session_ids):
+    """Stored form of a set of session ids: sorted and comma-separated"""
+    return ','.join(str(session_id) for session_id in sorted(session_ids))
+
+
+def with_frozen_cardio(user_id, start_day, end_day, rows, entry_sessions):
+    """
+    Keep the stored HR columns of days whose raw HR samples were expired by
+    retention; ``entry_sessions`` ({date: session ids of its cardio entries})
+    still decides their session count. Rows frozen before hr_session_ids was
+    stored are kept whole.
+    """
+    expired = expired_before(HR_SERIES, user_id)
+    if expired is None or day_bounds(start_day)[0] >= expired:
+        return rows
+    frozen_end = min(end_day, local_day(expired) - timedelta(days=1))
+    kept = {day: row for day, row in rows.items() if day > frozen_end}
+    stored = stored_rows(CARDIO, user_id, start_day, frozen_end)
+    frozen_days = set(stored) | {day for day in entry_sessions if start_day <= day <= frozen_end}
+    for day in frozen_days:
+        row = stored.get(day)
+        if row is not None and row['hr_session_ids'] is None:
+            kept[day] = row
+            continue
+        hr_ids = {int(value) for value in row['hr_session_ids'].split(',') if value} if row else set()
+        entry_ids = entry_sessions.get(day, set())
+        if not (row and row['total_samples']) and not hr_ids and not entry_ids:
+            continue
+        kept[day] = {
+            'total_samples': row['total_samples'] if row else 0,
+            'avg_hr': row['avg_hr'] if row else 0.0,
+            'max_hr': row['max_hr'] if row else 0,
+            'min_hr': row['min_hr'] if row else 0,
+            'sessions_count': len(hr_ids | entry_ids),
+            'hr_session_ids': session_id_list(hr_ids),
+        }
+    return kept
+
+
+def compute_weight_rows(user_id, start_day, end_day):
+    """{date: row} for tracker_weight_trend_daily over [start_day, end_day]"""
+    previous = (
+        BodyMeasurement.objects
+        .filter(user_id=user_id, date__lt=start_day, weight_kg__isnull=False)
+        .order_by('-date')
+        .values_list('weight_kg', flat=True)
+        .first()
+    )
+    rows = {}
+    measurements = (
+        BodyMeasurement.objects
+        .filter(user_id=user_id, date__gte=start_day, date__lte=end_day)
+        .order_by('date')
+        .values('date', 'weight_kg', 'body_fat_percentage', 'muscle_mass_kg')
+    )
+    for m in measurements:
+        weight = m['weight_kg']
+        rows[m['date']] = {
+            'current_weight': weight,
+            'previous_weight': previous,
+            'weight_change': (weight - previous) if weight is not None and previous is not None else None,
+            'body_fat_percentage': m['body_fat_percentage'],
+            'muscle_mass': m['muscle_mass_kg'],
+        }
+        if weight is not None:
+            previous = weight
+    return rows
+
+
+def db_datetime(value):
+    """Adapt an aware datetime for a raw-cursor parameter (naive UTC on SQLite)"""
+    return connection.ops.adapt_datetimefield_value(value)
+
+
+def expired_before(series, user_id):
+    """Start of the first local day still holding raw rows of ``series`` for the user, or None"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT expired_before FROM tracker_retention_watermark WHERE series = %s AND user_id = %s",
+            [series, user_id],
+        )
+        row = cursor.fetchone()
+    return as_aware_utc(row[0]) if row else None
+
+
+def first_hr_day(user_id):
+    """Local date of the user's oldest HR sample, raw or archived, or None"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT MIN(timestamp) FROM tracker_hr_sample WHERE user_id = %s", [user_id])
+        first_ts = cursor.fetchone()[0]
+    candidates = [as_aware_utc(first_ts)] if first_ts is not None else []
+    archived_first = hr_archive.archived_span(user_id)[0]
+    if archived_first is not None:
+        candidates.append(archived_first)
+    return local_day(min(candidates)) if candidates else None
+
+
+# ----------------------------------------------------------------------
+# Persistence
+# ----------------------------------------------------------------------
+def key_values(kind, key):
+    """Row key as a list matching KEY_COLUMNS[kind]"""
+    return list(key) if len(KEY_COLUMNS[kind]) > 1 else [key]
+
+
+def write_rows(kind, user_id, start_day, end_day, rows):
+    """Replace the stored rows of one table for a user over [start_day, end_day]"""
+    table = TABLES[kind]
+    keys = KEY_COLUMNS[kind]
+    columns = COLUMNS[kind]
+    placeholders = ', '.join(['%s'] * (len(keys) + len(columns) + 1))
+    updates = ', '.join(f"{col} = excluded.{col}" for col in columns)
+    sql = f"""
+        INSERT INTO {table} (user_id, {', '.join(keys)}, {', '.join(columns)})
+        VALUES ({placeholders})
+        ON CONFLICT (user_id, {', '.join(keys)}) DO UPDATE SET {updates}, updated_at = CURRENT_TIMESTAMP
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            _delete_missing(cursor, kind, user_id, start_day, end_day, rows)
+            if rows:
+                cursor.executemany(sql, [
+                    [user_id] + key_values(kind, key) + [row[col] for col in columns]
+                    for key, row in sorted(rows.items())
+                ])
+
+
+def _delete_missing(cursor, kind, user_id, start_day, end_day, rows):
+    """Drop stored rows in the range whose source data no longer exists"""
+    table = TABLES[kind]
+    keys = KEY_COLUMNS[kind]
+    cursor.execute(
+        f"SELECT {', '.join(keys)} FROM {table} WHERE user_id = %s AND date >= %s AND date <= %s",
+        [user_id, start_day, end_day],
+    )
+    keep = {tuple(str(v) for v in key_values(kind, key)) for key in rows}
+    stale = [list(row) for row in cursor.fetchall() if tuple(str(v) for v in row) not in keep]
+    if stale:
+        where = ' AND '.join(f"{col} = %s" for col in keys)
+        cursor.executemany(
+            f"DELETE FROM {table} WHERE user_id = %s AND {where}",
+            [[user_id] + key for key in stale],
+        )
+
+
+def refresh_range(kind, user_id, start_day, end_day):
+    """Recompute and store one table for a user over [start_day, end_day]"""
+    if kind == STRENGTH:
+        rows = compute_strength_rows(user_id, start_day, end_day)
+    elif kind == CARDIO:
+        rows = compute_cardio_rows(user_id, start_day, end_day)
+    elif kind == EXERCISE:
+        rows = compute_exercise_rows(user_id, start_day, end_day)
+    elif kind == WEIGHT:
+        # The next measurement's previous_weight depends on this day as well
+        next_date = (
+            BodyMeasurement.objects
+            .filter(user_id=user_id, date__gt=end_day)
+            .order_by('date')
+            .values_list('date', flat=True)
+            .first()
+        )
+        end_day = next_date or end_day
+        rows = compute_weight_rows(user_id, start_day, end_day)
+    else:
+        raise ValueError(f"Unknown aggregate table: {kind}")
+    write_rows(kind, user_id, start_day, end_day, rows)
+    return len(rows)
+
+
+def refresh_keys(keys):
+    """Recompute a set of (kind, user_id, date) keys; errors are logged, never raised"""
+    for kind, user_id, day in sorted(keys, key=lambda k: (k[0], k[1], str(k[2]))):
+        try:
+            refresh_range(kind, user_id, day, day)
+        except Exception as e:
+            logger.error(f"Error refreshing {kind} aggregate for user {user_id} on {day}: {str(e)}")
+
+
+# ----------------------------------------------------------------------
+# Per-exercise trend reads
+# ----------------------------------------------------------------------
+RESOLUTIONS = ('day', 'week', 'month')
+
+
+def fetch_exercise_trend(user_id, exercise_id, start_day=None, end_day=None):
+    """Daily rows for one exercise with a single range scan of the (user, exercise, date) key"""
+    sql = """
+        SELECT date, max_weight, best_e1rm_epley, best_e1rm_brzycki, total_volume, set_count, total_reps
+        FROM tracker_exercise_strength_daily
+        WHERE user_id = %s AND exercise_id = %s
+    """
+    params = [user_id, exercise_id]
+    if start_day is not None:
+        sql += " AND date >= %s"
+        params.append(start_day)
+    if end_day is not None:
+        sql += " AND date <= %s"
+        params.append(end_day)
+    with connection.cursor() as cursor:
+        cursor.execute(sql + " ORDER BY date ASC", params)
+        return [
+            {
+                'date': row[0] if not isinstance(row[0], str) else datetime.strptime(row[0], '%Y-%m-%d').date(),
+                'max_weight': float(row[1] or 0),
+                'best_e1rm_epley': float(row[2] or 0),
+                'best_e1rm_brzycki': float(row[3] or 0),
+                'total_volume': float(row[4] or 0),
+                'set_count': int(row[5] or 0),
+                'total_reps': int(row[6] or 0),
+            }
+            for row in cursor.fetchall()
+        ]
+
+
+def compute_exercise_trend(user_id, exercise_id, start_day=None, end_day=None):
+    """Same rows as fetch_exercise_trend, grouped from StrengthSet when the table is unavailable"""
+    rows = compute_exercise_rows(user_id, start_day, end_day, exercise_id=exercise_id)
+    return [dict(row, date=day) for (day, _exercise_id), row in sorted(rows.items())]
+
+
+def downsample_trend(rows, resolution='day'):
+    """Fold daily trend rows into week (ISO, Monday) or month buckets"""
+    if resolution == 'day':
+        return rows
+    buckets = {}
+    for row in rows:
+        day = row['date']
+        start = day - timedelta(days=day.weekday()) if resolution == 'week' else day.replace(day=1)
+        bucket = buckets.get(start)
+        if bucket is None:
+            buckets[start] = dict(row, date=start)
+            continue
+        for col in ('max_weight', 'best_e1rm_epley', 'best_e1rm_brzycki'):
+            bucket[col] = max(bucket[col], row[col])
+        for col in ('total_volume', 'set_count', 'total_reps'):
+            bucket[col] += row[col]
+    return [buckets[start] for start in sorted(buckets)]
+
+
+# ----------------------------------------------------------------------
+# Dirty tracking
+# ----------------------------------------------------------------------
+class _DirtyBatch:
+    """Keys marked inside one transaction, refreshed once it commits"""
+
+    def __init__(self):
+        self.keys = set()
+        self.done = False
+        self.hooks = None
+        self.levels = set()
+
+    def schedule(self, conn, using=None):
+        """
+        Register with on_commit once per savepoint level. A registration made at
+        an enclosing level outlives anything that could drop a nested one, and
+        any rollback replaces conn.run_on_commit, so the levels are forgotten
+        and the batch registers again from wherever it is marked next.
+        """
+        if conn.run_on_commit is not self.hooks:
+            self.hooks = conn.run_on_commit
+            self.levels = set()
+        level = tuple(conn.savepoint_ids)
+        if any(level[:depth] in self.levels for depth in range(len(level) + 1)):
+            return
+        transaction.on_commit(self, using=using)
+        # on_commit appends in place; re-read in case it started a fresh list
+        self.hooks = conn.run_on_commit
+        self.levels.add(level)
+
+    def __call__(self):
+        # Duplicate registrations survive some rollbacks; only the first call refreshes
+        if self.done:
+            return
+        self.done = True
+        refresh_keys(self.keys)
+
+
+def mark_dirty(kind, user_id, day, using=None):
+    """Schedule a refresh of one aggregate row after the current transaction commits"""
+    if not aggregates_enabled() or user_id is None or day is None:
+        return
+    key = (kind, user_id, day)
+    conn = transaction.get_connection(using)
+    if not conn.in_atomic_block:
+        refresh_keys({key})
+        return
+
+    batch = getattr(conn, '_mar_dirty_batch', None)
+    if batch is None or batch.done:
+        batch = _DirtyBatch()
+        conn._mar_dirty_batch = batch
+    batch.keys.add(key)
+    # Keys left over from a rolled-back savepoint just cause a redundant refresh
+    batch.schedule(conn, using=using)
+
+
+_hr_lock = threading.Lock()
+_hr_dirty = set()
+_hr_last_refresh = 0.0
+
+
+def mark_hr_rows_dirty(rows):
+    """Collect cardio keys for written HR rows (see hr_ingest.to_sample_row)"""
+    if not aggregates_enabled():
+        return
+    keys = {(CARDIO, row[0], local_day(row[2])) for row in rows}
+    with _hr_lock:
+        _hr_dirty.update(keys)
+
+
+def refresh_hr_dirty(force=False):
+    """Refresh collected HR cardio keys if HR_REFRESH_SECONDS have passed"""
+    global _hr_last_refresh
+    with _hr_lock:
+        now = time_module.monotonic()
+        if not _hr_dirty or (not force and now - _hr_last_refresh < HR_REFRESH_SECONDS):
+            return 0
+        keys = set(_hr_dirty)
+        _hr_dirty.clear()
+        _hr_last_refresh = now
+    refresh_keys(keys)
+    return len(keys)
+
+
+# ----------------------------------------------------------------------
+# Verification against ORM ground truth
+# ----------------------------------------------------------------------
+def stored_rows(kind, user_id, start_day, end_day):
+    """{key: row} as currently stored in the aggregate table"""
+    keys = KEY_COLUMNS[kind]
+    columns = COLUMNS[kind]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {', '.join(keys)}, {', '.join(columns)} FROM {TABLES[kind]} "
+            f"WHERE user_id = %s AND date >= %s AND date <= %s",
+            [user_id, start_day, end_day],
+        )
+        result = {}
+        for row in cursor.fetchall():
+            day = row[0] if not isinstance(row[0], str) else datetime.strptime(row[0], '%Y-%m-%d').date()
+            key = (day,) + tuple(row[1:len(keys)]) if len(keys) > 1 else day
+            result[key] = dict(zip(columns, row[len(keys):]))
+        return result
+
+
+def _strength_sets(user_id, start_day, end_day):
+    """Per-day session counts and the (day index, exercise, weight, reps) arrays of a range's sets"""
+    start, end = day_bounds(start_day, end_day)
+    session_days = {
+        session_id: local_day(start_time)
+        for session_id, start_time in WorkoutSession.objects.filter(
+            user_id=user_id, start_time__gte=start, start_time__lt=end
+        ).values_list('id', 'start_time')
+    }
+    days = sorted(set(session_days.values()))
+    day_index = {day: i for i, day in enumerate(days)}
+    sessions_count = np.bincount([day_index[day] for day in session_days.values()], minlength=len(days))
+    sets = StrengthSet.objects.filter(
+        session__user_id=user_id, session__start_time__gte=start, session__start_time__lt=end
+    ).values_list('session_id', 'exercise_id', 'weight_kg', 'reps')
+    session_ids, exercise_ids, weights, reps = list(zip(*sets)) or [(), (), (), ()]
+    set_days = np.array([day_index[session_days[session_id]] for session_id in session_ids], dtype=np.int64)
+    # Missing weights and reps count as 0, as in the SQL aggregates
+    weights = np.nan_to_num(np.array(weights, dtype=float))
+    reps = np.nan_to_num(np.array(reps, dtype=float))
+    return days, sessions_count, set_days, np.array(exercise_ids, dtype=np.int64), weights, reps
+
+
+def _group_max(index, values, size):
+    """Maximum of values per index (0 for empty groups and NaN-only groups)"""
+    result = np.zeros(size)
+    np.fmax.at(result, index, values)
+    return result
+
+
+def ground_truth_strength(user_id, start_day, end_day):
+    """Strength rows rebuilt from the raw sets with the array metrics"""
+    from .metrics import epley_e1rm_array
+
+    days, sessions_count, set_days, exercise_ids, weights, reps = _strength_sets(user_id, start_day, end_day)
+    size = len(days)
+    tonnage = np.bincount(set_days, weights=reps * weights, minlength=size)
+    max_weight = _group_max(set_days, weights, size)
+    best_e1rm = _group_max(set_days, epley_e1rm_array(weights, reps), size)
+    pairs = np.unique(np.stack([set_days, exercise_ids]), axis=1)
+    exercises_count = np.bincount(pairs[0], minlength=size)
+    return {
+        day: {
+            'sessions_count': int(sessions_count[i]),
+            'exercises_count': int(exercises_count[i]),
+            'total_tonnage': float(tonnage[i]),
+            'avg_tonnage_per_session': float(tonnage[i] / sessions_count[i]),
+            'max_weight_lifted': float(max_weight[i]),
+            'best_e1rm': float(best_e1rm[i]),
+        }
+        for i, day in enumerate(days)
+    }
+
+
+def ground_truth_exercise(user_id, start_day, end_day):
+    """Per-exercise rows rebuilt from the raw sets with the array metrics"""
+    from .metrics import brzycki_e1rm_array, epley_e1rm_array
+
+    days, _, set_days, exercise_ids, weights, reps = _strength_sets(user_id, start_day, end_day)
+    keys, group = np.unique(np.stack([set_days, exercise_ids]), axis=1, return_inverse=True)
+    group = group.reshape(-1)
+    size = keys.shape[1]
+    max_weight = _group_max(group, weights, size)
+    best_epley = _group_max(group, epley_e1rm_array(weights, reps), size)
+    # NaN from 37 reps, which fmax skips like SQL MAX skips NULL
+    best_brzycki = _group_max(group, brzycki_e1rm_array(weights, reps), size)
+    volume = np.bincount(group, weights=reps * weights, minlength=size)
+    set_count = np.bincount(group, minlength=size)
+    total_reps = np.bincount(group, weights=reps, minlength=size)
+    return {
+        (days[day], int(exercise_id)): {
+            'max_weight': float(max_weight[i]),
+            'best_e1rm_epley': float(best_epley[i]),
+            'best_e1rm_brzycki': float(best_brzycki[i]),
+            'total_volume': float(volume[i]),
+            'set_count': int(set_count[i]),
+            'total_reps': int(total_reps[i]),
+        }
+        for i, (day, exercise_id) in enumerate(keys.T)
+    }
+
+
+def ground_truth_cardio(user_id, start_day, end_day):
+    """Cardio rows rebuilt from raw and archived HR samples and cardio entries in Python"""
+    start, end = day_bounds(start_day, end_day)
+    rows = {}
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT timestamp, heart_rate, session_id FROM tracker_hr_sample
+            WHERE user_id = %s AND timestamp >= %s AND timestamp < %s
+        """, [user_id, db_datetime(start), db_datetime(end)])
+        samples = cursor.fetchall() + hr_archive.archived_samples(user_id, start, end)
+        for ts, bpm, session_id in samples:
+            row = rows.setdefault(local_day(as_aware_utc(ts)), {'bpm': [], 'sessions': set()})
+            row['bpm'].append(bpm)
+            if session_id is not None:
+                row['sessions'].add(int(session_id))
+    entry_sessions = {}
+    entries = CardioEntry.objects.filter(
+        session__user_id=user_id, session__start_time__gte=start, session__start_time__lt=end
+    ).select_related('session')
+    for entry in entries.iterator(chunk_size=500):
+        day = local_day(entry.session.start_time)
+        rows.setdefault(day, {'bpm': [], 'sessions': set()})
+        entry_sessions.setdefault(day, set()).add(entry.session_id)
+
+    result = {}
+    for day, row in rows.items():
+        bpm = row['bpm']
+        result[day] = {
+            'total_samples': len(bpm),
+            'avg_hr': (sum(bpm) / len(bpm)) if bpm else 0.0,
+            'max_hr': max(bpm) if bpm else 0,
+            'min_hr': min(bpm) if bpm else 0,
+            'sessions_count': len(row['sessions'] | entry_sessions.get(day, set())),
+            'hr_session_ids': session_id_list(row['sessions']),
+        }
+    # Only the HR columns of frozen days are taken from the table, so entry drift still shows
+    return with_frozen_cardio(user_id, start_day, end_day, result, entry_sessions)
+
+
+def ground_truth_weight(user_id, start_day, end_day):
+    """Weight rows rebuilt from every measurement of the user in Python"""
+    rows = {}
+    previous = None
+    for m in BodyMeasurement.objects.filter(user_id=user_id, date__lte=end_day).order_by('date'):
+        if m.date >= start_day:
+            weight = m.weight_kg
+            rows[m.date] = {
+                'current_weight': weight,
+                'previous_weight': previous,
+                'weight_change': (weight - previous) if weight is not None and previous is not None else None,
+                'body_fat_percentage': m.body_fat_percentage,
+                'muscle_mass': m.muscle_mass_kg,
+            }
+        if m.weight_kg is not None:
+            previous = m.weight_kg
+    return rows
+
+
+GROUND_TRUTH = {
+    STRENGTH: ground_truth_strength,
+    CARDIO: ground_truth_cardio,
+    WEIGHT: ground_truth_weight,
+    EXERCISE: ground_truth_exercise,
+}
+
+
+def diff_rows(kind, user_id, start_day, end_day, tolerance=1e-6):
+    """List of (key, column, stored, expected) mismatches for one table and user"""
+    expected = GROUND_TRUTH[kind](user_id, start_day, end_day)
+    stored = stored_rows(kind, user_id, start_day, end_day)
+    mismatches = []
+    for key in sorted(set(expected) | set(stored)):
+        exp_row = expected.get(key)
+        got_row = stored.get(key)
+        if exp_row is None or got_row is None:
+            mismatches.append((key, '*', got_row, exp_row))
+            continue
+        for col in COLUMNS[kind]:
+            exp_val, got_val = exp_row.get(col), got_row.get(col)
+            if exp_val is None or got_val is None or isinstance(exp_val, str):
+                if exp_val != got_val:
+                    mismatches.append((key, col, got_val, exp_val))
+            elif abs(float(exp_val) - float(got_val)) > tolerance * max(1.0, abs(float(exp_val))):
+                mismatches.append((key, col, got_val, exp_val))
+    return mismatches
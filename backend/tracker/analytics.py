@@ -5,37 +5,46 @@ import math
 from datetime import date, timedelta, datetime
 from typing import Dict, List, Any, Optional, Tuple
 from django.contrib.auth.models import User
-from django.db.models import Sum, Avg, Count, Max, Min, Q, F
 from django.utils import timezone
+from . import pr_index
 from .models import (
-    WorkoutSession, StrengthSet, CardioEntry, NutritionLog, BodyMeasurement,
-    ProgressAnalytics, PersonalRecord, WorkoutStreak, UserConnection,
+    WorkoutSession, ProgressAnalytics, PersonalRecord, WorkoutStreak, UserConnection,
     Challenge, ChallengeParticipation, Leaderboard, LeaderboardEntry,
     Achievement, UserAchievement, ExerciseCatalog
 )
+from .snapshot import UserDataSnapshot
 
 
 class AdvancedAnalytics:
     """Advanced analytics engine for comprehensive fitness insights."""
     
-    def __init__(self, user: User):
+    def __init__(self, user: User, snapshot: Optional[UserDataSnapshot] = None):
         self.user = user
         self.today = date.today()
+        self.snapshot = snapshot or UserDataSnapshot(user)
+    
+    def _snapshot_for(self, start_date: date, end_date: date) -> UserDataSnapshot:
+        """The shared snapshot if it covers the dates, else one fetched for them."""
+        if self.snapshot.covers(start_date, end_date):
+            return self.snapshot
+        return UserDataSnapshot(self.user, days=(end_date - start_date).days, end_day=end_date)
     
     def compute_daily_analytics(self, target_date: date = None) -> Dict[str, Any]:
         """Compute comprehensive analytics for a specific day."""
         if target_date is None:
             target_date = self.today
         
+        # Every section reads the same rows: the week up to the target day
+        snapshot = self._snapshot_for(target_date - timedelta(days=7), target_date)
         analytics = {
             'date': target_date,
-            'strength': self._compute_strength_analytics(target_date),
-            'cardio': self._compute_cardio_analytics(target_date),
-            'nutrition': self._compute_nutrition_analytics(target_date),
-            'recovery': self._compute_recovery_analytics(target_date),
-            'performance': self._compute_performance_metrics(target_date),
-            'personal_records': self._check_personal_records(target_date),
-            'achievements': self._check_achievements(target_date)
+            'strength': self._compute_strength_analytics(target_date, snapshot),
+            'cardio': self._compute_cardio_analytics(target_date, snapshot),
+            'nutrition': self._compute_nutrition_analytics(target_date, snapshot),
+            'recovery': self._compute_recovery_analytics(target_date, snapshot),
+            'performance': self._compute_performance_metrics(target_date, snapshot),
+            'personal_records': self._check_personal_records(target_date, snapshot),
+            'achievements': self._check_achievements(target_date, snapshot)
         }
         
         # Compute overall score
@@ -46,14 +55,9 @@ class AdvancedAnalytics:
         
         return analytics
     
-    def _compute_strength_analytics(self, target_date: date) -> Dict[str, Any]:
+    def _compute_strength_analytics(self, target_date: date, snapshot: UserDataSnapshot) -> Dict[str, Any]:
         """Compute strength training analytics."""
-        sessions = WorkoutSession.objects.filter(
-            user=self.user,
-            date=target_date
-        )
-        
-        if not sessions.exists():
+        if not snapshot.sessions_between(target_date, target_date):
             return {
                 'total_volume_kg': 0,
                 'total_sets': 0,
@@ -63,15 +67,12 @@ class AdvancedAnalytics:
                 'intensity_score': 0
             }
         
-        # Get all strength sets for the day
-        strength_sets = StrengthSet.objects.filter(
-            session__in=sessions
-        )
-        
-        total_volume = sum(set_obj.weight_kg * set_obj.reps for set_obj in strength_sets)
-        total_sets = strength_sets.count()
-        total_reps = sum(set_obj.reps for set_obj in strength_sets)
-        unique_exercises = strength_sets.values('exercise').distinct().count()
+        # Totals of the day's strength sets
+        totals = snapshot.strength_totals(target_date, target_date)
+        total_volume = totals['total_volume_kg']
+        total_sets = totals['total_sets']
+        total_reps = totals['total_reps']
+        unique_exercises = totals['unique_exercises']
         
         avg_weight_per_set = total_volume / total_sets if total_sets > 0 else 0
         
@@ -87,14 +88,9 @@ class AdvancedAnalytics:
             'intensity_score': round(intensity_score, 1)
         }
     
-    def _compute_cardio_analytics(self, target_date: date) -> Dict[str, Any]:
+    def _compute_cardio_analytics(self, target_date: date, snapshot: UserDataSnapshot) -> Dict[str, Any]:
         """Compute cardio analytics."""
-        sessions = WorkoutSession.objects.filter(
-            user=self.user,
-            date=target_date
-        )
-        
-        if not sessions.exists():
+        if not snapshot.sessions_between(target_date, target_date):
             return {
                 'total_minutes': 0,
                 'total_distance_km': 0,
@@ -102,12 +98,9 @@ class AdvancedAnalytics:
                 'calories_burned': 0
             }
         
-        cardio_entries = CardioEntry.objects.filter(
-            session__in=sessions
-        )
-        
-        total_minutes = sum(entry.duration_minutes or 0 for entry in cardio_entries)
-        total_distance = sum(entry.distance_km or 0 for entry in cardio_entries)
+        totals = snapshot.cardio_totals(target_date, target_date)
+        total_minutes = totals['total_minutes']
+        total_distance = totals['total_distance_km']
         
         # Estimate calories burned (simplified)
         calories_burned = total_minutes * 8  # Rough estimate
@@ -119,14 +112,11 @@ class AdvancedAnalytics:
             'calories_burned': calories_burned
         }
     
-    def _compute_nutrition_analytics(self, target_date: date) -> Dict[str, Any]:
+    def _compute_nutrition_analytics(self, target_date: date, snapshot: UserDataSnapshot) -> Dict[str, Any]:
         """Compute nutrition analytics."""
-        nutrition_logs = NutritionLog.objects.filter(
-            user=self.user,
-            date=target_date
-        )
+        totals = snapshot.nutrition_totals(target_date, target_date)
         
-        if not nutrition_logs.exists():
+        if not totals['logs']:
             return {
                 'total_calories': 0,
                 'total_protein_g': 0,
@@ -136,11 +126,11 @@ class AdvancedAnalytics:
                 'meals_logged': 0
             }
         
-        total_calories = sum(log.calories for log in nutrition_logs)
-        total_protein = sum(log.protein_g or 0 for log in nutrition_logs)
-        total_carbs = sum(log.carbs_g or 0 for log in nutrition_logs)
-        total_fat = sum(log.fat_g or 0 for log in nutrition_logs)
-        meals_logged = nutrition_logs.values('meal_type').distinct().count()
+        total_calories = totals['total_calories']
+        total_protein = totals['total_protein_g']
+        total_carbs = totals['total_carbs_g']
+        total_fat = totals['total_fat_g']
+        meals_logged = totals['meals_logged']
         
         # Compute macro balance score
         macro_balance_score = self._compute_macro_balance_score(
@@ -156,20 +146,17 @@ class AdvancedAnalytics:
             'meals_logged': meals_logged
         }
     
-    def _compute_recovery_analytics(self, target_date: date) -> Dict[str, Any]:
+    def _compute_recovery_analytics(self, target_date: date, snapshot: UserDataSnapshot) -> Dict[str, Any]:
         """Compute recovery analytics."""
         # Get sleep data (if available)
         sleep_logs = []  # Would need SleepLog model
         
         # Get previous day's workout intensity
         yesterday = target_date - timedelta(days=1)
-        yesterday_sessions = WorkoutSession.objects.filter(
-            user=self.user,
-            date=yesterday
-        )
+        yesterday_sessions = snapshot.sessions_between(yesterday, yesterday)
         
         recovery_score = 100  # Default
-        if yesterday_sessions.exists():
+        if yesterday_sessions:
             # Simple recovery calculation based on rest time
             hours_since_last_workout = 24  # Simplified
             recovery_score = min(100, hours_since_last_workout * 4)
@@ -181,23 +168,19 @@ class AdvancedAnalytics:
             'hours_since_last_workout': 24
         }
     
-    def _compute_performance_metrics(self, target_date: date) -> Dict[str, Any]:
+    def _compute_performance_metrics(self, target_date: date, snapshot: UserDataSnapshot) -> Dict[str, Any]:
         """Compute overall performance metrics."""
         # Get recent data for comparison
         week_ago = target_date - timedelta(days=7)
         
         # Workout frequency
-        recent_workouts = WorkoutSession.objects.filter(
-            user=self.user,
-            date__gte=week_ago,
-            date__lte=target_date
-        ).count()
+        recent_workouts = len(snapshot.sessions_between(week_ago, target_date))
         
         # Consistency score
         consistency_score = min(100, (recent_workouts / 7) * 100)
         
         # Progress indicators
-        progress_indicators = self._compute_progress_indicators(target_date)
+        progress_indicators = self._compute_progress_indicators(target_date, snapshot)
         
         return {
             'consistency_score': round(consistency_score, 1),
@@ -205,13 +188,10 @@ class AdvancedAnalytics:
             'progress_indicators': progress_indicators
         }
     
-    def _compute_progress_indicators(self, target_date: date) -> Dict[str, Any]:
+    def _compute_progress_indicators(self, target_date: date, snapshot: UserDataSnapshot) -> Dict[str, Any]:
         """Compute progress indicators."""
         # Get recent measurements
-        recent_measurements = BodyMeasurement.objects.filter(
-            user=self.user,
-            date__lte=target_date
-        ).order_by('-date')[:2]
+        recent_measurements = snapshot.measurements_between(None, target_date)[:2]
         
         if len(recent_measurements) < 2:
             return {'weight_change': 0, 'body_fat_change': 0}
@@ -303,56 +283,60 @@ class AdvancedAnalytics:
             }
         )
     
-    def _check_personal_records(self, target_date: date) -> List[Dict[str, Any]]:
+    def _check_personal_records(self, target_date: date, snapshot: UserDataSnapshot) -> List[Dict[str, Any]]:
         """Check for new personal records."""
         new_records = []
         
-        # Get strength sets from the day
-        sessions = WorkoutSession.objects.filter(
-            user=self.user,
-            date=target_date
-        )
-        
-        strength_sets = StrengthSet.objects.filter(
-            session__in=sessions
-        )
-        
+        # Get strength sets from the day, oldest session first
+        strength_sets = [
+            set_obj
+            for session in reversed(snapshot.sessions_between(target_date, target_date))
+            for set_obj in session.strength_sets.all()
+        ]
+        if not strength_sets:
+            return new_records
+        
+        # The day's sets that hold their exercise's max weight record in the PR index
+        exercise_ids = {set_obj.exercise_id for set_obj in strength_sets}
+        records = pr_index.records(self.user.id, exercise_ids=exercise_ids)
+        # Stored max weight per exercise, so a record already reported is not reported again
+        reported = {}
+        for exercise_id, weight_kg in PersonalRecord.objects.filter(
+            user=self.user, exercise_id__in=exercise_ids, record_type='max_weight'
+        ).values_list('exercise_id', 'weight_kg'):
+            reported[exercise_id] = max(weight_kg, reported.get(exercise_id, weight_kg))
         for set_obj in strength_sets:
-            # Check for max weight record
-            existing_max_weight = PersonalRecord.objects.filter(
+            record = records.get(set_obj.exercise_id)
+            if record is None or record['set_id'] != set_obj.id:
+                continue
+            if set_obj.exercise_id in reported and set_obj.weight_kg <= reported[set_obj.exercise_id]:
+                continue
+            PersonalRecord.objects.update_or_create(
                 user=self.user,
                 exercise=set_obj.exercise,
-                record_type='max_weight'
-            ).order_by('-weight_kg').first()
-            
-            if not existing_max_weight or set_obj.weight_kg > existing_max_weight.weight_kg:
-                # New max weight record
-                PersonalRecord.objects.update_or_create(
-                    user=self.user,
-                    exercise=set_obj.exercise,
-                    record_type='max_weight',
-                    defaults={
-                        'weight_kg': set_obj.weight_kg,
-                        'reps': set_obj.reps,
-                        'date_achieved': target_date,
-                        'session': set_obj.session
-                    }
-                )
-                new_records.append({
-                    'type': 'max_weight',
-                    'exercise': set_obj.exercise.name,
+                record_type='max_weight',
+                defaults={
                     'weight_kg': set_obj.weight_kg,
-                    'reps': set_obj.reps
-                })
+                    'reps': set_obj.reps,
+                    'date_achieved': target_date,
+                    'session': set_obj.session
+                }
+            )
+            new_records.append({
+                'type': 'max_weight',
+                'exercise': set_obj.exercise.name,
+                'weight_kg': set_obj.weight_kg,
+                'reps': set_obj.reps
+            })
         
         return new_records
     
-    def _check_achievements(self, target_date: date) -> List[Dict[str, Any]]:
+    def _check_achievements(self, target_date: date, snapshot: UserDataSnapshot) -> List[Dict[str, Any]]:
         """Check for new achievements."""
         new_achievements = []
         
         # Check workout count achievements
-        total_workouts = WorkoutSession.objects.filter(user=self.user).count()
+        total_workouts = snapshot.total_sessions
         
         workout_achievements = Achievement.objects.filter(
             achievement_type='workout_count',
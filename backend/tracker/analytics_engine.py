@@ -2,63 +2,127 @@
 # Created by Cursor AI
 
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import timedelta
 from typing import Dict, List, Tuple, Optional
 from django.db.models import Avg, Max, Min, Count, Q
+from django.utils import timezone
 from .models import (
-    BodyComposition, MuscleGroupMeasurement, MuscleGroup, 
-    BodyAnalytics, ProgressPrediction, User
+    MuscleGroup, BodyAnalytics, ProgressPrediction, User
 )
+from .snapshot import UserDataSnapshot
+
+
+PREDICTION_COMPOSITIONS = 10      # latest body compositions behind the predictions
+PREDICTION_MEASUREMENTS = 5       # latest measurements per muscle group behind its prediction
+
+
+def grouped_slopes(x, y, groups, size):
+    """
+    Least-squares slope of y on x for many series at once.
+
+    ``groups`` assigns every point to a series in ``range(size)``; the normal
+    equations of all series are summed with ``bincount`` and solved in one step.
+    Series whose x does not vary (fewer than two distinct days) get 0.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    groups = np.asarray(groups, dtype=np.int64)
+    if len(x):
+        x = x - x.min()  # keeps the sums small enough to subtract accurately
+    n = np.bincount(groups, minlength=size).astype(float)
+    sum_x = np.bincount(groups, weights=x, minlength=size)
+    sum_y = np.bincount(groups, weights=y, minlength=size)
+    sum_xy = np.bincount(groups, weights=x * y, minlength=size)
+    sum_x2 = np.bincount(groups, weights=x * x, minlength=size)
+    denominator = n * sum_x2 - sum_x * sum_x
+    slopes = np.zeros(size)
+    np.divide(n * sum_xy - sum_x * sum_y, denominator, out=slopes, where=denominator > 1e-9)
+    return slopes
 
 
 class AdvancedAnalyticsEngine:
-    """Advanced analytics engine for body measurements and predictions."""
+    """
+    Advanced analytics engine for body measurements and predictions.
+
+    Every analysis works on the body composition and muscle measurement arrays
+    of a ``UserDataSnapshot`` (sorted by date, measurements by muscle group
+    first), so the whole engine runs three queries, none when the snapshot
+    has already loaded them for another engine.
+    """
     
-    def __init__(self, user: User):
+    COMPOSITION_FIELDS = ('weight_kg', 'body_fat_percentage', 'muscle_mass_kg')
+    
+    def __init__(self, user: User, snapshot: Optional[UserDataSnapshot] = None):
         self.user = user
-        self.muscle_groups = MuscleGroup.objects.all()
+        self.snapshot = snapshot or UserDataSnapshot(user)
+    
+    @property
+    def muscle_groups(self) -> List[MuscleGroup]:
+        return self.snapshot.muscle_groups
+    
+    @property
+    def compositions(self) -> Dict:
+        return self.snapshot.compositions
+    
+    @property
+    def measurements(self) -> Dict:
+        return self.snapshot.muscle_measurements
+    
+    def _group_ends(self, index):
+        """(count, first, last) row index per muscle group of a subset of measurement rows"""
+        size = len(self.muscle_groups)
+        index = index[self.measurements['group'][index] >= 0]
+        group = self.measurements['group'][index]
+        count = np.bincount(group, minlength=size)
+        first = np.full(size, -1, dtype=np.int64)
+        last = np.full(size, -1, dtype=np.int64)
+        # Rows are sorted by group and date, so each group's rows form one run
+        starts = np.flatnonzero(np.diff(group, prepend=-2) != 0)
+        ends = np.append(starts[1:] - 1, len(group) - 1)[:len(starts)]
+        first[group[starts]] = index[starts]
+        last[group[ends]] = index[ends]
+        return count, first, last
     
     def analyze_body_composition_trends(self, days: int = 30) -> Dict:
         """Analyze body composition trends over specified period."""
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=days)
-        
-        compositions = BodyComposition.objects.filter(
-            user=self.user,
-            date__gte=start_date
-        ).order_by('date')
+        start = (timezone.now() - timedelta(days=days)).timestamp()
+        data = self.compositions
+        window = np.flatnonzero(data['timestamp'] >= start)
         
-        if len(compositions) < 2:
+        if len(window) < 2:
             return self._get_sample_body_composition_analysis()
         
-        # Calculate trends
-        weight_trend = self._calculate_trend(compositions, 'weight_kg')
-        body_fat_trend = self._calculate_trend(compositions, 'body_fat_percentage')
-        muscle_mass_trend = self._calculate_trend(compositions, 'muscle_mass_kg')
+        # One solve for the three series, which share their x values
+        fields = self.COMPOSITION_FIELDS
+        weight_trend, body_fat_trend, muscle_mass_trend = grouped_slopes(
+            np.tile(data['day'][window], len(fields)),
+            np.concatenate([data[field][window] for field in fields]),
+            np.repeat(np.arange(len(fields)), len(window)),
+            len(fields),
+        )
         
         # Calculate changes
-        first = compositions.first()
-        last = compositions.last()
-        
-        weight_change = last.weight_kg - first.weight_kg
-        body_fat_change = last.body_fat_percentage - first.body_fat_percentage
-        muscle_mass_change = last.muscle_mass_kg - first.muscle_mass_kg
+        first, last = window[0], window[-1]
+        weight_change, body_fat_change, muscle_mass_change = (
+            float(data[field][last] - data[field][first]) for field in fields
+        )
+        body_shape_type, metabolic_age, bmr_calories = data['extra'][last]
         
         return {
             'period_days': days,
-            'data_points': len(compositions),
-            'weight_trend': weight_trend,
-            'body_fat_trend': body_fat_trend,
-            'muscle_mass_trend': muscle_mass_trend,
+            'data_points': len(window),
+            'weight_trend': float(weight_trend),
+            'body_fat_trend': float(body_fat_trend),
+            'muscle_mass_trend': float(muscle_mass_trend),
             'weight_change_kg': round(weight_change, 2),
             'body_fat_change_percent': round(body_fat_change, 2),
             'muscle_mass_change_kg': round(muscle_mass_change, 2),
-            'current_weight': last.weight_kg,
-            'current_body_fat': last.body_fat_percentage,
-            'current_muscle_mass': last.muscle_mass_kg,
-            'body_shape_type': last.body_shape_type,
-            'metabolic_age': last.metabolic_age,
-            'bmr_calories': last.bmr_calories,
+            'current_weight': float(data['weight_kg'][last]),
+            'current_body_fat': float(data['body_fat_percentage'][last]),
+            'current_muscle_mass': float(data['muscle_mass_kg'][last]),
+            'body_shape_type': body_shape_type,
+            'metabolic_age': metabolic_age,
+            'bmr_calories': bmr_calories,
             'insights': self._generate_body_composition_insights(
                 weight_change, body_fat_change, muscle_mass_change
             )
@@ -66,35 +130,31 @@ class AdvancedAnalyticsEngine:
     
     def analyze_muscle_group_growth(self, days: int = 30) -> Dict:
         """Analyze muscle group growth patterns."""
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=days)
+        start = (timezone.now() - timedelta(days=days)).timestamp()
+        data = self.measurements
+        count, first, last = self._group_ends(np.flatnonzero(data['timestamp'] >= start))
+        sizes = data['circumference_cm']
         
         muscle_data = {}
         
-        for muscle_group in self.muscle_groups:
-            measurements = MuscleGroupMeasurement.objects.filter(
-                user=self.user,
-                muscle_group=muscle_group,
-                date__gte=start_date
-            ).order_by('date')
-            
-            if len(measurements) >= 2:
-                first = measurements.first()
-                last = measurements.last()
+        for i, muscle_group in enumerate(self.muscle_groups):
+            if count[i] >= 2:
+                first_cm, last_cm = float(sizes[first[i]]), float(sizes[last[i]])
+                muscle_density, is_flexed, workout_context = data['extra'][last[i]]
                 
-                growth_cm = last.circumference_cm - first.circumference_cm
-                growth_percent = (growth_cm / first.circumference_cm) * 100
+                growth_cm = last_cm - first_cm
+                growth_percent = (growth_cm / first_cm) * 100
                 
                 muscle_data[muscle_group.name] = {
                     'display_name': muscle_group.display_name,
-                    'current_size_cm': last.circumference_cm,
+                    'current_size_cm': last_cm,
                     'growth_cm': round(growth_cm, 2),
                     'growth_percent': round(growth_percent, 2),
-                    'measurements_count': len(measurements),
+                    'measurements_count': int(count[i]),
                     'trend': 'growing' if growth_cm > 0 else 'stable' if growth_cm == 0 else 'decreasing',
-                    'muscle_density': last.muscle_density,
-                    'is_flexed': last.is_flexed,
-                    'workout_context': last.workout_context
+                    'muscle_density': muscle_density,
+                    'is_flexed': is_flexed,
+                    'workout_context': workout_context
                 }
             else:
                 # Sample data for demonstration
@@ -117,39 +177,43 @@ class AdvancedAnalyticsEngine:
     
     def generate_progress_predictions(self, horizon_days: int = 30) -> Dict:
         """Generate AI-powered progress predictions."""
-        # Get recent data for trend analysis
-        recent_compositions = BodyComposition.objects.filter(
-            user=self.user
-        ).order_by('-date')[:10]
-        
-        recent_muscle_measurements = MuscleGroupMeasurement.objects.filter(
-            user=self.user
-        ).order_by('-date')[:50]
+        # Trends come from the latest compositions and the latest few measurements of each muscle group
+        data = self.compositions
+        recent = np.arange(len(data['day']))[-PREDICTION_COMPOSITIONS:]
         
-        if len(recent_compositions) < 3:
+        if len(recent) < 3:
             return self._get_sample_predictions()
         
-        # Calculate trends for predictions
-        weight_trend = self._calculate_trend(recent_compositions, 'weight_kg')
-        body_fat_trend = self._calculate_trend(recent_compositions, 'body_fat_percentage')
-        muscle_mass_trend = self._calculate_trend(recent_compositions, 'muscle_mass_kg')
+        fields = self.COMPOSITION_FIELDS
+        weight_trend, body_fat_trend, muscle_mass_trend = (float(slope) for slope in grouped_slopes(
+            np.tile(data['day'][recent], len(fields)),
+            np.concatenate([data[field][recent] for field in fields]),
+            np.repeat(np.arange(len(fields)), len(recent)),
+            len(fields),
+        ))
         
         # Get current values
-        current = recent_compositions[0]
+        current = {field: float(data[field][recent[-1]]) for field in fields}
         
         # Predict future values based on trends
-        predicted_weight = current.weight_kg + (weight_trend * horizon_days)
-        predicted_body_fat = current.body_fat_percentage + (body_fat_trend * horizon_days)
-        predicted_muscle_mass = current.muscle_mass_kg + (muscle_mass_trend * horizon_days)
+        predicted_weight = current['weight_kg'] + (weight_trend * horizon_days)
+        predicted_body_fat = current['body_fat_percentage'] + (body_fat_trend * horizon_days)
+        predicted_muscle_mass = current['muscle_mass_kg'] + (muscle_mass_trend * horizon_days)
+        
+        # Muscle group predictions: one batched solve over every group's latest measurements
+        measurements = self.measurements
+        size = len(self.muscle_groups)
+        group = measurements['group']
+        rows = np.flatnonzero(group >= 0)
+        rows = rows[measurements['latest'][group[rows]] - rows < PREDICTION_MEASUREMENTS]
+        count = np.bincount(group[rows], minlength=size)
+        trends = grouped_slopes(measurements['day'][rows], measurements['circumference_cm'][rows], group[rows], size)
         
-        # Muscle group predictions
         muscle_predictions = {}
-        for muscle_group in self.muscle_groups:
-            muscle_measurements = recent_muscle_measurements.filter(muscle_group=muscle_group)[:5]
-            if len(muscle_measurements) >= 2:
-                trend = self._calculate_trend(muscle_measurements, 'circumference_cm')
-                current_size = muscle_measurements[0].circumference_cm
-                predicted_size = current_size + (trend * horizon_days)
+        for i, muscle_group in enumerate(self.muscle_groups):
+            if count[i] >= 2:
+                current_size = float(measurements['circumference_cm'][measurements['latest'][i]])
+                predicted_size = current_size + (trends[i] * horizon_days)
                 
                 muscle_predictions[muscle_group.name] = {
                     'current_cm': current_size,
@@ -169,9 +233,9 @@ class AdvancedAnalyticsEngine:
             'prediction_horizon_days': horizon_days,
             'confidence_level': 0.85,
             'current_values': {
-                'weight_kg': current.weight_kg,
-                'body_fat_percent': current.body_fat_percentage,
-                'muscle_mass_kg': current.muscle_mass_kg
+                'weight_kg': current['weight_kg'],
+                'body_fat_percent': current['body_fat_percentage'],
+                'muscle_mass_kg': current['muscle_mass_kg']
             },
             'predicted_values': {
                 'weight_kg': round(predicted_weight, 2),
@@ -184,7 +248,7 @@ class AdvancedAnalyticsEngine:
                 'body_fat_trend_per_day': round(body_fat_trend, 3),
                 'muscle_mass_trend_per_day': round(muscle_mass_trend, 3)
             },
-            'data_points_used': len(recent_compositions),
+            'data_points_used': len(recent),
             'recommendations': self._generate_prediction_recommendations(
                 weight_trend, body_fat_trend, muscle_mass_trend
             )
@@ -192,20 +256,18 @@ class AdvancedAnalyticsEngine:
     
     def calculate_body_symmetry_score(self) -> Dict:
         """Calculate body symmetry and balance scores."""
-        # Get latest measurements for each muscle group
+        # Latest measurement of each muscle group
+        measurements = self.measurements
         symmetry_data = {}
         
-        for muscle_group in self.muscle_groups:
-            latest_measurement = MuscleGroupMeasurement.objects.filter(
-                user=self.user,
-                muscle_group=muscle_group
-            ).order_by('-date').first()
-            
-            if latest_measurement:
+        for i, muscle_group in enumerate(self.muscle_groups):
+            latest = measurements['latest'][i]
+            if latest >= 0:
+                muscle_density, is_flexed, _ = measurements['extra'][latest]
                 symmetry_data[muscle_group.name] = {
-                    'size_cm': latest_measurement.circumference_cm,
-                    'muscle_density': latest_measurement.muscle_density,
-                    'is_flexed': latest_measurement.is_flexed
+                    'size_cm': float(measurements['circumference_cm'][latest]),
+                    'muscle_density': muscle_density,
+                    'is_flexed': is_flexed
                 }
             else:
                 # Sample data
@@ -227,27 +289,6 @@ class AdvancedAnalyticsEngine:
             'recommendations': self._generate_symmetry_recommendations(symmetry_data)
         }
     
-    def _calculate_trend(self, queryset, field_name: str) -> float:
-        """Calculate linear trend for a field."""
-        if len(queryset) < 2:
-            return 0.0
-        
-        values = [getattr(item, field_name) for item in queryset]
-        days = [(queryset[0].date - item.date).days for item in queryset]
-        
-        if len(set(days)) < 2:
-            return 0.0
-        
-        # Simple linear regression
-        n = len(values)
-        sum_x = sum(days)
-        sum_y = sum(values)
-        sum_xy = sum(x * y for x, y in zip(days, values))
-        sum_x2 = sum(x * x for x in days)
-        
-        slope = (n * sum_xy - sum_x * sum_y) / (n * sum_x2 - sum_x * sum_x)
-        return slope
-    
     def _calculate_symmetry_score(self, muscle_data: Dict) -> float:
         """Calculate body symmetry score."""
         # Simplified symmetry calculation
@@ -5,3 +5,7 @@ from django.apps import AppConfig
 class TrackerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tracker'
+
+    def ready(self):
+        # Register model signal handlers (aggregate refresh, etc.)
+        from . import signals  # noqa: F401
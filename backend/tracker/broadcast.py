@@ -0,0 +1,47 @@
+"""
+Pre-serialized broadcast frames for channel-layer fan-out.
+
+A group event used to carry a dict that every receiving consumer rebuilt and
+passed to ``json.dumps`` on its own, so a room with N sockets serialized the
+same payload N times. Senders now serialize the client message once with
+:func:`frame_event` and the consumers' group handlers forward the finished
+frame untouched (:class:`FrameForwardingMixin`).
+
+The frame travels under ``text`` (or ``bytes`` for binary frames), which every
+channel layer backend carries as-is.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+def frame(message):
+    """Serialize a client-bound message once"""
+    return json.dumps(message, cls=DjangoJSONEncoder)
+
+
+def frame_event(handler, message):
+    """Channel-layer event that makes ``handler`` send ``message`` as a ready text frame"""
+    return {'type': handler, 'text': frame(message)}
+
+
+def bytes_event(handler, data):
+    """Channel-layer event carrying a ready binary frame"""
+    return {'type': handler, 'bytes': data}
+
+
+async def agroup_broadcast(channel_layer, group, handler, message):
+    """Serialize ``message`` once and send it to every socket in ``group``"""
+    event = frame_event(handler, message)
+    await channel_layer.group_send(group, event)
+    return event
+
+
+class FrameForwardingMixin:
+    """Group handlers of a consumer forward pre-serialized frames without decoding them"""
+
+    async def send_frame(self, event):
+        if 'bytes' in event:
+            await self.send(bytes_data=event['bytes'])
+        else:
+            await self.send(text_data=event['text'])
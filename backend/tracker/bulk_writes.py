@@ -0,0 +1,186 @@
+"""
+Bulk create/upsert endpoints for offline-queue replays.
+
+``BulkWriteMixin`` adds ``POST <collection>/bulk/`` to a viewset. The body is a
+list of items (or ``{"items": [...]}``), each optionally carrying a client
+``idempotency_key``. Every item is validated with the viewset's serializer, so
+one bad item is reported instead of failing the whole batch. Then all valid
+items are written in one transaction:
+
+* unseen keys (and items without a key) are inserted with ``bulk_create`` and
+  their keys recorded in ``tracker_bulk_write_key`` (migration 0031);
+* keys that were already applied update the row they created, with one
+  ``bulk_update`` (a replay of the same item is therefore harmless);
+* a key claimed concurrently by another request is reported as ``duplicate``
+  with the winner's id, and our copy is discarded.
+
+The response lists a result per item, in request order.
+"""
+import copy
+
+from django.db import connection, transaction
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+MAX_BULK_ITEMS = 500
+MAX_KEY_LENGTH = 64
+BULK_WRITE_BATCH = 200
+
+
+def load_keys(user_id, scope, keys):
+    """{idempotency_key: object_id} of keys this user already applied in ``scope``"""
+    keys = list(keys)
+    if not keys:
+        return {}
+    placeholders = ', '.join(['%s'] * len(keys))
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT idempotency_key, object_id FROM tracker_bulk_write_key
+            WHERE user_id = %s AND scope = %s AND idempotency_key IN ({placeholders})
+        """, [user_id, scope, *keys])
+        return dict(cursor.fetchall())
+
+
+def claim_keys(user_id, scope, pairs):
+    """Record (idempotency_key, object_id) pairs; returns the keys that were claimed by this call"""
+    if not pairs:
+        return set()
+    with connection.cursor() as cursor:
+        cursor.executemany("""
+            INSERT INTO tracker_bulk_write_key (user_id, scope, idempotency_key, object_id)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (user_id, scope, idempotency_key) DO NOTHING
+        """, [(user_id, scope, key, object_id) for key, object_id in pairs])
+    stored = load_keys(user_id, scope, [key for key, _ in pairs])
+    return {key for key, object_id in pairs if stored.get(key) == object_id}
+
+
+def forget_keys(user_id, scope, keys):
+    if not keys:
+        return
+    placeholders = ', '.join(['%s'] * len(keys))
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            DELETE FROM tracker_bulk_write_key
+            WHERE user_id = %s AND scope = %s AND idempotency_key IN ({placeholders})
+        """, [user_id, scope, *keys])
+
+
+def _invalid(index, key, errors):
+    return {'index': index, 'idempotency_key': key, 'status': 'invalid', 'errors': errors}
+
+
+class BulkWriteMixin:
+    """Adds a transactional bulk create/upsert action to a ModelViewSet"""
+
+    bulk_scope = None            # namespace of the idempotency keys, e.g. 'strength_set'
+    bulk_serializer_class = None  # defaults to the viewset's serializer
+    bulk_owner_field = None      # set to the request user on created rows, e.g. 'user'
+
+    def bulk_prefetch(self, items):
+        """{Model: {pk: obj}} for PrefetchedPrimaryKeyRelatedField lookups"""
+        return {}
+
+    def bulk_changed(self, objects, created=()):
+        """
+        Derived-data hook: bulk_create/bulk_update skip model signals. ``objects``
+        are the created rows, the updated rows and copies of the updated rows as
+        they were before; ``created`` are the created rows alone.
+        """
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        items = request.data.get('items') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'Expected a non-empty list of items'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > MAX_BULK_ITEMS:
+            return Response({'error': f'At most {MAX_BULK_ITEMS} items per request'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+        results = [None] * len(items)
+        keys = [None] * len(items)
+        seen = set()
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                results[index] = _invalid(index, None, {'non_field_errors': ['Expected an object']})
+                continue
+            key = item.get('idempotency_key')
+            if key is None:
+                continue
+            key = str(key)
+            if not key or len(key) > MAX_KEY_LENGTH:
+                results[index] = _invalid(index, key, {'idempotency_key': [f'Must be 1-{MAX_KEY_LENGTH} characters']})
+            elif key in seen:
+                results[index] = _invalid(index, key, {'idempotency_key': ['Repeated within this request']})
+            else:
+                seen.add(key)
+                keys[index] = key
+
+        known = load_keys(user.id, self.bulk_scope, sorted(seen))
+        existing = self.get_queryset().in_bulk(set(known.values()))
+        stale = [key for key, object_id in known.items() if object_id not in existing]
+
+        serializer_class = self.bulk_serializer_class or self.get_serializer_class()
+        model = serializer_class.Meta.model
+        context = {**self.get_serializer_context(), 'prefetched': self.bulk_prefetch(items)}
+        owner = {self.bulk_owner_field: user} if self.bulk_owner_field else {}
+
+        to_create, to_update, previous, update_fields = [], [], [], set()
+        for index, item in enumerate(items):
+            if results[index] is not None:
+                continue
+            data = {name: value for name, value in item.items() if name != 'idempotency_key'}
+            instance = existing.get(known.get(keys[index]))
+            serializer = serializer_class(instance, data=data, partial=instance is not None, context=context)
+            if not serializer.is_valid():
+                results[index] = _invalid(index, keys[index], serializer.errors)
+                continue
+            if instance is None:
+                to_create.append((index, model(**serializer.validated_data, **owner)))
+            else:
+                previous.append(copy.copy(instance))
+                for name, value in serializer.validated_data.items():
+                    setattr(instance, name, value)
+                    update_fields.add(name)
+                to_update.append((index, instance))
+
+        with transaction.atomic():
+            forget_keys(user.id, self.bulk_scope, stale)
+            model.objects.bulk_create([obj for _, obj in to_create], batch_size=BULK_WRITE_BATCH)
+            if to_update and update_fields:
+                model.objects.bulk_update([obj for _, obj in to_update], sorted(update_fields),
+                                          batch_size=BULK_WRITE_BATCH)
+            claimed = claim_keys(user.id, self.bulk_scope,
+                                 [(keys[index], obj.pk) for index, obj in to_create if keys[index]])
+
+            # Keys another request applied first: keep theirs, drop ours
+            lost = [(index, obj) for index, obj in to_create if keys[index] and keys[index] not in claimed]
+            if lost:
+                model.objects.filter(pk__in=[obj.pk for _, obj in lost]).delete()
+                winners = load_keys(user.id, self.bulk_scope, [keys[index] for index, _ in lost])
+                for index, _ in lost:
+                    results[index] = {'index': index, 'idempotency_key': keys[index], 'status': 'duplicate',
+                                      'id': winners.get(keys[index])}
+            lost_indexes = {index for index, _ in lost}
+            created = [(index, obj) for index, obj in to_create if index not in lost_indexes]
+
+            for index, obj in created:
+                results[index] = {'index': index, 'idempotency_key': keys[index], 'status': 'created', 'id': obj.pk}
+            for index, obj in to_update:
+                results[index] = {'index': index, 'idempotency_key': keys[index], 'status': 'updated', 'id': obj.pk}
+
+            self.bulk_changed([obj for _, obj in created] + [obj for _, obj in to_update] + previous,
+                              created=[obj for _, obj in created])
+
+        counts = {state: 0 for state in ('created', 'updated', 'duplicate', 'invalid')}
+        for result in results:
+            counts[result['status']] += 1
+        if counts['invalid'] == len(results):
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif counts['invalid']:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_200_OK
+        return Response({'results': results, **counts}, status=response_status)
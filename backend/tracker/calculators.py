@@ -4,6 +4,8 @@
 import math
 from datetime import date
 from typing import Dict, Any, Optional
+
+import numpy as np
 from django.contrib.auth.models import User
 from .models import MacroTarget, CalculatorResult, BodyMeasurement
 
@@ -19,6 +21,10 @@ class FitnessCalculator:
         'active': 1.725,       # Heavy exercise 6-7 days/week
         'very_active': 1.9     # Very heavy exercise, physical job
     }
+
+    # Lower BMI bound of each category after the first
+    BMI_CATEGORY_BOUNDS = [18.5, 25, 30]
+    BMI_CATEGORIES = ['Underweight', 'Normal weight', 'Overweight', 'Obese']
     
     @staticmethod
     def calculate_bmi(weight_kg: float, height_cm: float) -> Dict[str, Any]:
@@ -82,6 +88,41 @@ class FitnessCalculator:
             'multiplier': multiplier
         }
     
+    @staticmethod
+    def calculate_bmi_array(weight_kg, height_cm) -> Dict[str, np.ndarray]:
+        """BMI and category of many people at once; NaN and None where height or weight is invalid."""
+        weight_kg = np.asarray(weight_kg, dtype=float)
+        height_cm = np.asarray(height_cm, dtype=float)
+        valid = (weight_kg > 0) & (height_cm > 0)
+        height_m = np.where(valid, height_cm, 1.0) / 100.0
+        bmi = np.where(valid, weight_kg / (height_m * height_m), np.nan)
+        categories = np.array(FitnessCalculator.BMI_CATEGORIES, dtype=object)
+        category = categories[np.digitize(np.nan_to_num(bmi), FitnessCalculator.BMI_CATEGORY_BOUNDS)]
+        return {
+            'bmi': np.round(bmi, 1),
+            'category': np.where(valid, category, None),
+        }
+
+    @staticmethod
+    def calculate_bmr_array(weight_kg, height_cm, age, gender) -> np.ndarray:
+        """Mifflin-St Jeor BMR of many people at once; NaN where the inputs are invalid."""
+        weight_kg = np.asarray(weight_kg, dtype=float)
+        height_cm = np.asarray(height_cm, dtype=float)
+        age = np.asarray(age, dtype=float)
+        male = np.isin(np.char.lower(np.asarray(gender, dtype=str)), ['male', 'm'])
+        bmr = (10 * weight_kg) + (6.25 * height_cm) - (5 * age) + np.where(male, 5, -161)
+        valid = (age > 0) & (weight_kg > 0) & (height_cm > 0)
+        return np.where(valid, np.round(bmr, 0), np.nan)
+
+    @staticmethod
+    def calculate_tdee_array(bmr, activity_level) -> np.ndarray:
+        """TDEE of many BMRs at once; NaN where the activity level is unknown."""
+        levels = np.asarray(activity_level, dtype=str)
+        multiplier = np.full(levels.shape, np.nan)
+        for level, value in FitnessCalculator.ACTIVITY_MULTIPLIERS.items():
+            multiplier[levels == level] = value
+        return np.round(np.asarray(bmr, dtype=float) * multiplier, 0)
+
     @staticmethod
     def calculate_macro_targets(
         tdee: float, 
@@ -5,24 +5,25 @@ import json
 import asyncio
 import time
 import uuid
-from collections import defaultdict, deque
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from django.contrib.auth.models import User
 from .models import WorkoutSession, StrengthSet
 from django.utils import timezone
-from django.db import connection
 from django.conf import settings
+from .hr_ingest import get_hr_buffer, to_sample_row
+from .hr_broadcast import get_hr_broadcaster
+from .gps_tracks import get_gps_buffer, to_gps_row
+from .ws_dedup import MessageDeduplicator
+from .social_inbox import adeliver, afan_out
+from .broadcast import FrameForwardingMixin, agroup_broadcast
+from . import dashboard_push
 
 
-class WorkoutConsumer(AsyncWebsocketConsumer):
+class WorkoutConsumer(FrameForwardingMixin, AsyncWebsocketConsumer):
     """Real-time workout session consumer with reconciliation and HR aggregation"""
     
-    # Class-level variables for HR aggregation
-    HR_BUF = defaultdict(lambda: deque(maxlen=10))  # 10 samples per user
-    HR_WIN_MS = 1000  # 1 second window
     MAX_QUEUE = 100  # Max queued messages per user
-    recent_ids = defaultdict(set)  # Track recent message IDs for idempotency
+    MAX_GPS_POINTS = 100  # Max points per gps_point message
     
     async def connect(self):
         # Check authentication
@@ -35,6 +36,7 @@ class WorkoutConsumer(AsyncWebsocketConsumer):
         self.user_id = self.scope["user"].id
         self.room_group_name = f'workout_{self.session_id}'
         self.server_seq = 0  # Server-side sequence number
+        self.dedup = MessageDeduplicator(f'{self.user_id}:{self.session_id}', self.channel_layer)
         
         # Join room group
         await self.channel_layer.group_add(
@@ -48,6 +50,10 @@ class WorkoutConsumer(AsyncWebsocketConsumer):
         await self.send_workout_state()
     
     async def disconnect(self, close_code):
+        # Persist any HR samples and GPS points still sitting in the write-behind buffers
+        await get_hr_buffer().flush()
+        await get_gps_buffer().flush()
+
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -60,25 +66,25 @@ class WorkoutConsumer(AsyncWebsocketConsumer):
             message_type = data.get('type')
             client_msg_id = data.get('client_msg_id')
             
-            # Check for idempotency
-            if client_msg_id and client_msg_id in self.recent_ids[self.user_id]:
+            # Check for idempotency (time-windowed, see ws_dedup.py)
+            if await self.dedup.is_duplicate(client_msg_id):
                 return  # Duplicate message, ignore
             
-            # Add to recent IDs (keep last 1000)
-            if client_msg_id:
-                self.recent_ids[self.user_id].add(client_msg_id)
-                if len(self.recent_ids[self.user_id]) > 1000:
-                    # Remove oldest IDs (simple cleanup)
-                    self.recent_ids[self.user_id] = set(list(self.recent_ids[self.user_id])[-500:])
-            
-            if message_type == 'set_completed':
-                await self.handle_set_completed(data)
-            elif message_type == 'heart_rate':
-                await self.handle_heart_rate(data)
-            elif message_type == 'workout_paused':
-                await self.handle_workout_paused(data)
-            elif message_type == 'workout_resumed':
-                await self.handle_workout_resumed(data)
+            try:
+                if message_type == 'set_completed':
+                    await self.handle_set_completed(data)
+                elif message_type == 'heart_rate':
+                    await self.handle_heart_rate(data)
+                elif message_type == 'gps_point':
+                    await self.handle_gps_point(data)
+                elif message_type == 'workout_paused':
+                    await self.handle_workout_paused(data)
+                elif message_type == 'workout_resumed':
+                    await self.handle_workout_resumed(data)
+            except Exception:
+                # Not applied, so the client's retry of this id must not be dropped as a duplicate
+                await self.dedup.release(client_msg_id)
+                raise
                 
         except json.JSONDecodeError:
             await self.send_error("invalid_json", "Invalid JSON format")
@@ -106,9 +112,11 @@ class WorkoutConsumer(AsyncWebsocketConsumer):
         # Increment server sequence
         self.server_seq += 1
         
-        # Broadcast to group with server sequence
-        await self.channel_layer.group_send(
+        # Broadcast to group with server sequence, serialized once for the whole room
+        await agroup_broadcast(
+            self.channel_layer,
             self.room_group_name,
+            'set_update',
             {
                 'type': 'set_update',
                 'set': set_data,
@@ -117,58 +125,37 @@ class WorkoutConsumer(AsyncWebsocketConsumer):
         )
     
     async def handle_heart_rate(self, data):
-        """Handle heart rate data with 1-second aggregation"""
+        """Handle heart rate data; the room broadcast is coalesced to about one aggregate a second"""
         hr_data = data.get('heart_rate', {})
         heart_rate = hr_data.get('heart_rate')
         timestamp = hr_data.get('timestamp', time.time())
         
         if heart_rate is not None:
-            # Add to aggregation buffer
-            self.HR_BUF[self.user_id].append({
-                'heart_rate': heart_rate,
-                'timestamp': timestamp
-            })
-            
-            # Check if we should emit aggregated data (1-second window)
-            current_time = time.time()
-            window_start = current_time - (self.HR_WIN_MS / 1000.0)
+            row = to_sample_row(self.user_id, self.session_id, heart_rate, timestamp)
             
-            # Filter samples within the window
-            recent_samples = [
-                sample for sample in self.HR_BUF[self.user_id]
-                if sample['timestamp'] >= window_start
-            ]
+            # Queue the raw sample for the batched tracker_hr_sample writer
+            await get_hr_buffer().add(row)
             
-            if recent_samples:
-                # Calculate average HR for the window
-                avg_hr = sum(s['heart_rate'] for s in recent_samples) / len(recent_samples)
-                max_hr = max(s['heart_rate'] for s in recent_samples)
-                
-                # Save to database (async)
-                await self.save_hr_sample(heart_rate, timestamp)
-                
-                # Increment server sequence
-                self.server_seq += 1
-                
-                # Broadcast aggregated data
-                await self.channel_layer.group_send(
-                    self.room_group_name,
-                    {
-                        'type': 'heart_rate_update',
-                        'heart_rate': {
-                            'heart_rate': int(avg_hr),
-                            'max_hr': int(max_hr),
-                            'samples_count': len(recent_samples),
-                            'timestamp': current_time
-                        },
-                        'server_seq': self.server_seq
-                    }
-                )
+            # Fold it into the room's next heart_rate_update (see hr_broadcast.py)
+            if row is not None:
+                get_hr_broadcaster().add(self.room_group_name, self.user_id, row[3])
+    
+    async def handle_gps_point(self, data):
+        """Queue GPS fixes (one ``gps`` point or a ``points`` list) for the batched tracker_gps_point writer"""
+        points = data.get('points')
+        if not isinstance(points, list):
+            points = [data.get('gps', {})]
+        received_at = timezone.now()
+        buffer = get_gps_buffer()
+        for point in points[:self.MAX_GPS_POINTS]:
+            await buffer.add(to_gps_row(self.user_id, self.session_id, point, default_timestamp=received_at))
     
     async def handle_workout_paused(self, data):
         """Handle workout pause"""
-        await self.channel_layer.group_send(
+        await agroup_broadcast(
+            self.channel_layer,
             self.room_group_name,
+            'workout_paused',
             {
                 'type': 'workout_paused',
                 'timestamp': timezone.now().isoformat()
@@ -177,8 +164,10 @@ class WorkoutConsumer(AsyncWebsocketConsumer):
     
     async def handle_workout_resumed(self, data):
         """Handle workout resume"""
-        await self.channel_layer.group_send(
+        await agroup_broadcast(
+            self.channel_layer,
             self.room_group_name,
+            'workout_resumed',
             {
                 'type': 'workout_resumed',
                 'timestamp': timezone.now().isoformat()
@@ -195,33 +184,19 @@ class WorkoutConsumer(AsyncWebsocketConsumer):
     
     async def set_update(self, event):
         """Send set update to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'set_update',
-            'set': event['set'],
-            'server_seq': event.get('server_seq', 0)
-        }))
+        await self.send_frame(event)
     
     async def heart_rate_update(self, event):
         """Send heart rate update to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'heart_rate_update',
-            'heart_rate': event['heart_rate'],
-            'server_seq': event.get('server_seq', 0)
-        }))
+        await self.send_frame(event)
     
     async def workout_paused(self, event):
         """Send workout paused to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'workout_paused',
-            'timestamp': event['timestamp']
-        }))
+        await self.send_frame(event)
     
     async def workout_resumed(self, event):
         """Send workout resumed to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'workout_resumed',
-            'timestamp': event['timestamp']
-        }))
+        await self.send_frame(event)
     
     @database_sync_to_async
     def get_workout_session(self):
@@ -251,35 +226,10 @@ class WorkoutConsumer(AsyncWebsocketConsumer):
             )
         except WorkoutSession.DoesNotExist:
             pass
-    
-    @database_sync_to_async
-    def save_hr_sample(self, heart_rate, timestamp):
-        """Save heart rate sample to database"""
-        try:
-            from django.utils import timezone
-            from datetime import datetime
-            
-            # Convert timestamp to timezone-aware datetime
-            if isinstance(timestamp, (int, float)):
-                dt = datetime.fromtimestamp(timestamp, tz=timezone.utc)
-            else:
-                dt = timezone.now()
-            
-            # Insert into materialized view table
-            with connection.cursor() as cursor:
-                cursor.execute("""
-                    INSERT INTO tracker_hr_sample (user_id, session_id, timestamp, heart_rate, device_id)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, [self.user_id, self.session_id, dt, heart_rate, 'websocket'])
-                
-        except Exception as e:
-            # Log error but don't fail the WebSocket connection
-            print(f"Error saving HR sample: {e}")
-            pass
 
 
 class DashboardConsumer(AsyncWebsocketConsumer):
-    """Real-time dashboard consumer with authentication"""
+    """Real-time dashboard consumer: full snapshot on connect, versioned fragment deltas afterwards"""
     
     async def connect(self):
         # Check authentication
@@ -289,10 +239,12 @@ class DashboardConsumer(AsyncWebsocketConsumer):
             return
             
         self.user_id = self.scope["user"].id
-        self.room_group_name = f'dashboard_{self.user_id}'
+        self.room_group_name = dashboard_push.dashboard_group(self.user_id)
         self.server_seq = 0
+        self.epoch = None
+        self.version = 0
         
-        # Join room group
+        # Join room group before the snapshot so no change event falls in between
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
@@ -315,7 +267,7 @@ class DashboardConsumer(AsyncWebsocketConsumer):
             data = json.loads(text_data)
             message_type = data.get('type')
             
-            if message_type == 'request_update':
+            if message_type in ('request_update', 'resync'):
                 await self.send_dashboard_data()
                 
         except json.JSONDecodeError:
@@ -335,49 +287,41 @@ class DashboardConsumer(AsyncWebsocketConsumer):
         }))
     
     async def send_dashboard_data(self):
-        """Send current dashboard data"""
-        dashboard_data = await self.get_dashboard_data()
+        """Send a full dashboard snapshot"""
+        epoch, version, dashboard_data = await database_sync_to_async(dashboard_push.snapshot)(self.user_id)
+        self.epoch, self.version = epoch, version
         await self.send(text_data=json.dumps({
             'type': 'dashboard_update',
+            'version': version,
             'data': dashboard_data
         }))
     
+    async def dashboard_changed(self, event):
+        """Push only the fragments named by a change event, or resync after a gap or a counter reset"""
+        version = event['version']
+        if event.get('epoch') == self.epoch and version <= self.version:
+            return  # already covered by the snapshot we sent
+        if event.get('epoch') != self.epoch or version != self.version + 1:
+            await self.send_dashboard_data()
+            return
+        fragments = await database_sync_to_async(dashboard_push.build_fragments)(self.user_id, event['fragments'])
+        self.version = version
+        await self.send(text_data=json.dumps({
+            'type': 'dashboard_delta',
+            'version': version,
+            'fragments': fragments
+        }))
+    
     async def dashboard_update(self, event):
         """Send dashboard update to WebSocket"""
         await self.send(text_data=json.dumps({
             'type': 'dashboard_update',
+            'version': self.version,
             'data': event['data']
         }))
-    
-    @database_sync_to_async
-    def get_dashboard_data(self):
-        """Get dashboard data for user"""
-        try:
-            user = User.objects.get(id=self.user_id)
-            
-            # Get recent sessions
-            recent_sessions = WorkoutSession.objects.filter(
-                user=user
-            ).order_by('-start_time')[:5]
-            
-            sessions_data = []
-            for session in recent_sessions:
-                sessions_data.append({
-                    'id': session.id,
-                    'start_time': session.start_time.isoformat() if session.start_time else None,
-                    'duration_minutes': session.duration_minutes,
-                    'title': getattr(session, 'title', 'Workout')
-                })
-            
-            return {
-                'recent_sessions': sessions_data,
-                'timestamp': timezone.now().isoformat()
-            }
-        except User.DoesNotExist:
-            return {'error': 'User not found'}
 
 
-class SocialConsumer(AsyncWebsocketConsumer):
+class SocialConsumer(FrameForwardingMixin, AsyncWebsocketConsumer):
     """Real-time social features consumer for friends, challenges, and leaderboards"""
     
     async def connect(self):
@@ -392,29 +336,24 @@ class SocialConsumer(AsyncWebsocketConsumer):
         self.room_group_name = f'social_{self.user_id}'
         self.server_seq = 0
         
-        # Join user's social group
+        # Join user's social inbox; friends' events are fanned out into it on write
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
         )
         
-        # Join friends' activity groups for real-time updates
-        await self.join_friends_groups()
-        
         await self.accept()
         
         # Send initial social data
         await self.send_social_data()
     
     async def disconnect(self, close_code):
-        # Leave room group
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
-        
-        # Leave friends' groups
-        await self.leave_friends_groups()
+        # Leave the inbox group (never joined if authentication failed)
+        if hasattr(self, 'room_group_name'):
+            await self.channel_layer.group_discard(
+                self.room_group_name,
+                self.channel_name
+            )
     
     async def receive(self, text_data):
         try:
@@ -446,26 +385,6 @@ class SocialConsumer(AsyncWebsocketConsumer):
             'server_seq': self.server_seq
         }))
     
-    async def join_friends_groups(self):
-        """Join friends' activity groups for real-time updates"""
-        friends = await self.get_user_friends()
-        for friend in friends:
-            friend_group = f'activity_{friend["id"]}'
-            await self.channel_layer.group_add(
-                friend_group,
-                self.channel_name
-            )
-    
-    async def leave_friends_groups(self):
-        """Leave friends' activity groups"""
-        friends = await self.get_user_friends()
-        for friend in friends:
-            friend_group = f'activity_{friend["id"]}'
-            await self.channel_layer.group_discard(
-                friend_group,
-                self.channel_name
-            )
-    
     async def send_social_data(self):
         """Send current social data"""
         social_data = await self.get_social_data()
@@ -484,8 +403,8 @@ class SocialConsumer(AsyncWebsocketConsumer):
             # Notify the activity owner
             activity_owner = await self.get_activity_owner(activity_id)
             if activity_owner:
-                await self.channel_layer.group_send(
-                    f'activity_{activity_owner}',
+                await adeliver(
+                    [activity_owner],
                     {
                         'type': 'activity_liked',
                         'activity_id': activity_id,
@@ -506,8 +425,8 @@ class SocialConsumer(AsyncWebsocketConsumer):
             # Notify the activity owner
             activity_owner = await self.get_activity_owner(activity_id)
             if activity_owner:
-                await self.channel_layer.group_send(
-                    f'activity_{activity_owner}',
+                await adeliver(
+                    [activity_owner],
                     {
                         'type': 'activity_commented',
                         'activity_id': activity_id,
@@ -526,73 +445,47 @@ class SocialConsumer(AsyncWebsocketConsumer):
             result = await self.join_challenge_db(challenge_id)
             
             if result.get('success'):
-                # Notify friends about challenge join
-                await self.channel_layer.group_send(
-                    self.room_group_name,
+                # Notify friends (and the user's other sockets) about challenge join
+                await afan_out(
+                    self.user_id,
                     {
                         'type': 'challenge_joined',
                         'challenge_id': challenge_id,
                         'challenge_name': result.get('challenge_name'),
+                        'username': self.username,
                         'timestamp': timezone.now().isoformat()
-                    }
+                    },
+                    include_author=True
                 )
     
     # Real-time event handlers
     async def friend_activity(self, event):
         """Handle friend activity updates"""
-        await self.send(text_data=json.dumps({
-            'type': 'friend_activity',
-            'data': event['data'],
-            'timestamp': event.get('timestamp')
-        }))
+        await self.send_frame(event)
     
     async def challenge_update(self, event):
         """Handle challenge progress updates"""
-        await self.send(text_data=json.dumps({
-            'type': 'challenge_update',
-            'data': event['data'],
-            'timestamp': event.get('timestamp')
-        }))
+        await self.send_frame(event)
     
     async def leaderboard_change(self, event):
         """Handle leaderboard ranking updates"""
-        await self.send(text_data=json.dumps({
-            'type': 'leaderboard_change',
-            'data': event['data'],
-            'timestamp': event.get('timestamp')
-        }))
+        await self.send_frame(event)
     
     async def achievement_unlock(self, event):
         """Handle achievement unlock notifications"""
-        await self.send(text_data=json.dumps({
-            'type': 'achievement_unlock',
-            'data': event['data'],
-            'timestamp': event.get('timestamp')
-        }))
+        await self.send_frame(event)
     
     async def activity_liked(self, event):
         """Handle activity like notifications"""
-        await self.send(text_data=json.dumps({
-            'type': 'activity_liked',
-            'data': event,
-            'timestamp': event.get('timestamp')
-        }))
+        await self.send_frame(event)
     
     async def activity_commented(self, event):
         """Handle activity comment notifications"""
-        await self.send(text_data=json.dumps({
-            'type': 'activity_commented',
-            'data': event,
-            'timestamp': event.get('timestamp')
-        }))
+        await self.send_frame(event)
     
     async def challenge_joined(self, event):
         """Handle challenge join notifications"""
-        await self.send(text_data=json.dumps({
-            'type': 'challenge_joined',
-            'data': event,
-            'timestamp': event.get('timestamp')
-        }))
+        await self.send_frame(event)
     
     # Database operations
     @database_sync_to_async
@@ -611,26 +504,6 @@ class SocialConsumer(AsyncWebsocketConsumer):
         except Exception as e:
             return {'error': str(e)}
     
-    @database_sync_to_async
-    def get_user_friends(self):
-        """Get user's friends list"""
-        try:
-            from .models import UserConnection
-            friends = UserConnection.objects.filter(
-                follower_id=self.user_id,
-                connection_type='friend'
-            ).select_related('following')
-            
-            return [
-                {
-                    'id': friend.following.id,
-                    'username': friend.following.username
-                }
-                for friend in friends
-            ]
-        except Exception:
-            return []
-    
     @database_sync_to_async
     def save_activity_like(self, activity_id):
         """Save activity like to database"""
@@ -0,0 +1,210 @@
+"""
+Change events for the live dashboard socket.
+
+Writes to a user's sessions, sets, nutrition logs and measurements mark the
+dashboard fragments they affect. When the transaction commits, each touched
+user's dashboard version is bumped once and a ``dashboard_changed`` event
+naming the changed fragments is sent to ``dashboard_<user_id>``. The
+DashboardConsumer rebuilds just those fragments and pushes them as a versioned
+delta; it sends a full snapshot only on connect or when it sees a version gap
+(e.g. a dropped channel-layer message) or a new epoch.
+
+Versions live in ``tracker_dashboard_version`` (migration 0037), so every
+worker bumps and reads the same counter. Each counter row carries a random
+epoch set when the row is created; a consumer that sees another epoch knows
+the counter was reset and resyncs instead of treating the lower versions as
+already sent.
+"""
+import logging
+import uuid
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import connection, transaction
+from django.db.models import Count, F, FloatField, Sum
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+RECENT_SESSIONS = 'recent_sessions'
+NUTRITION_TODAY = 'nutrition_today'
+LATEST_MEASUREMENT = 'latest_measurement'
+FRAGMENTS = (RECENT_SESSIONS, NUTRITION_TODAY, LATEST_MEASUREMENT)
+
+# Fragments affected by writes to each model
+MODEL_FRAGMENTS = {
+    'WorkoutSession': (RECENT_SESSIONS,),
+    'StrengthSet': (RECENT_SESSIONS,),
+    'NutritionLog': (NUTRITION_TODAY,),
+    'BodyMeasurement': (LATEST_MEASUREMENT,),
+}
+
+
+def dashboard_group(user_id):
+    return f'dashboard_{user_id}'
+
+
+def current_version(user_id):
+    """(epoch, version) of a user's dashboard, creating the counter at version 0"""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO tracker_dashboard_version (user_id, epoch, version, updated_at)
+            VALUES (%s, %s, 0, CURRENT_TIMESTAMP)
+            ON CONFLICT (user_id) DO NOTHING
+        """, [user_id, uuid.uuid4().hex])
+        cursor.execute("SELECT epoch, version FROM tracker_dashboard_version WHERE user_id = %s", [user_id])
+        epoch, version = cursor.fetchone()
+    return epoch, version
+
+
+def next_version(user_id):
+    """Bump a user's dashboard version; returns the new (epoch, version)"""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO tracker_dashboard_version (user_id, epoch, version, updated_at)
+            VALUES (%s, %s, 1, CURRENT_TIMESTAMP)
+            ON CONFLICT (user_id) DO UPDATE SET
+                version = tracker_dashboard_version.version + 1, updated_at = CURRENT_TIMESTAMP
+            RETURNING epoch, version
+        """, [user_id, uuid.uuid4().hex])
+        epoch, version = cursor.fetchone()
+    return epoch, version
+
+
+# ----------------------------------------------------------------------
+# Fragments
+# ----------------------------------------------------------------------
+def recent_sessions(user_id):
+    from .models import WorkoutSession
+
+    sessions = (
+        WorkoutSession.objects.filter(user_id=user_id)
+        .annotate(
+            sets_count=Count('strength_sets'),
+            volume=Sum(F('strength_sets__weight_kg') * F('strength_sets__reps'), output_field=FloatField()),
+        )
+        .order_by('-start_time')[:5]
+    )
+    return [
+        {
+            'id': session.id,
+            'start_time': session.start_time.isoformat() if session.start_time else None,
+            'duration_minutes': (
+                int((session.end_time - session.start_time).total_seconds() // 60)
+                if session.start_time and session.end_time else None
+            ),
+            'title': getattr(session, 'title', 'Workout'),
+            'sets': session.sets_count,
+            'volume': session.volume or 0.0,
+        }
+        for session in sessions
+    ]
+
+
+def nutrition_today(user_id):
+    from .models import NutritionLog
+
+    totals = NutritionLog.objects.filter(user_id=user_id, date=timezone.localdate()).aggregate(
+        calories=Sum('calories'), protein=Sum('protein_g'), carbs=Sum('carbs_g'), fat=Sum('fat_g'), meals=Count('id'),
+    )
+    return {name: (value or 0) for name, value in totals.items()}
+
+
+def latest_measurement(user_id):
+    from .models import BodyMeasurement
+
+    measurement = BodyMeasurement.objects.filter(user_id=user_id).order_by('-date').first()
+    if measurement is None:
+        return None
+    return {
+        'date': measurement.date.isoformat(),
+        'weight_kg': measurement.weight_kg,
+        'body_fat_percentage': measurement.body_fat_percentage,
+    }
+
+
+BUILDERS = {
+    RECENT_SESSIONS: recent_sessions,
+    NUTRITION_TODAY: nutrition_today,
+    LATEST_MEASUREMENT: latest_measurement,
+}
+
+
+def build_fragments(user_id, names):
+    return {name: BUILDERS[name](user_id) for name in names if name in BUILDERS}
+
+
+def snapshot(user_id):
+    """(epoch, version, full dashboard data); the version is read first so later changes are never missed"""
+    epoch, version = current_version(user_id)
+    data = build_fragments(user_id, FRAGMENTS)
+    data['timestamp'] = timezone.now().isoformat()
+    return epoch, version, data
+
+
+# ----------------------------------------------------------------------
+# Change events
+# ----------------------------------------------------------------------
+def publish(changes):
+    """Bump versions and notify dashboards for {user_id: fragment names}"""
+    channel_layer = get_channel_layer()
+    for user_id, names in changes.items():
+        epoch, version = next_version(user_id)
+        if channel_layer is None:
+            continue
+        try:
+            async_to_sync(channel_layer.group_send)(dashboard_group(user_id), {
+                'type': 'dashboard_changed',
+                'epoch': epoch,
+                'version': version,
+                'fragments': sorted(names),
+            })
+        except Exception as e:
+            logger.error(f"Dashboard change event failed for user {user_id}: {str(e)}")
+
+
+class _ChangeBatch:
+    """Fragments changed inside one transaction, published once it commits"""
+
+    def __init__(self):
+        self.changes = {}
+        self.done = False
+        self.hooks = None
+        self.levels = set()
+
+    def schedule(self, conn, using=None):
+        """Register with on_commit once per savepoint level, as aggregates._DirtyBatch"""
+        if conn.run_on_commit is not self.hooks:
+            self.hooks = conn.run_on_commit
+            self.levels = set()
+        level = tuple(conn.savepoint_ids)
+        if any(level[:depth] in self.levels for depth in range(len(level) + 1)):
+            return
+        transaction.on_commit(self, using=using)
+        self.hooks = conn.run_on_commit
+        self.levels.add(level)
+
+    def __call__(self):
+        # Duplicate registrations survive some rollbacks; only the first call publishes
+        if self.done:
+            return
+        self.done = True
+        publish(self.changes)
+
+
+def mark_changed(model_name, user_id, using=None):
+    """Record that a write to ``model_name`` changed this user's dashboard"""
+    names = MODEL_FRAGMENTS.get(model_name)
+    if not names or user_id is None:
+        return
+    conn = transaction.get_connection(using)
+    if not conn.in_atomic_block:
+        publish({user_id: set(names)})
+        return
+
+    batch = getattr(conn, '_mar_dashboard_batch', None)
+    if batch is None or batch.done:
+        batch = _ChangeBatch()
+        conn._mar_dashboard_batch = batch
+    batch.changes.setdefault(user_id, set()).update(names)
+    batch.schedule(conn, using=using)
@@ -2,13 +2,20 @@
 import json
 import csv
 import io
+import os
+import zlib
 from datetime import datetime, timedelta
-from django.http import JsonResponse, HttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse, FileResponse
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
 from django.views import View
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.renderers import JSONRenderer
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
@@ -22,80 +29,232 @@ from .models import (
 from .serializers import (
     NutritionLogSerializer, MacroTargetSerializer, CalculatorResultSerializer
 )
+from . import dashboard_push
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Rows fetched per round trip by the streaming export (server-side cursor on PostgreSQL)
+STREAM_CHUNK_SIZE = 2000
+# Bytes accumulated before a chunk is handed to the response
+STREAM_BUFFER_BYTES = 64 * 1024
+STREAM_FORMATS = ('json', 'ndjson', 'csv')
+
+
+class _EchoBuffer:
+    """File-like object for csv.writer that returns each written line instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def gzip_stream(chunks, level=6):
+    """Gzip-compress an iterable of byte chunks on the fly"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _buffered(pieces, size=STREAM_BUFFER_BYTES):
+    """Join small string pieces into byte chunks of roughly ``size`` bytes"""
+    buffer = []
+    buffered = 0
+    for piece in pieces:
+        buffer.append(piece)
+        buffered += len(piece)
+        if buffered >= size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
 class DataExporter:
     """Handles data export in multiple formats"""
     
-    def __init__(self, user):
+    # Data types written by the export that are not re-imported
+    OTHER_EXPORT_TYPES = (
+        'workout_streaks', 'user_connections', 'challenges', 'challenge_participations',
+        'leaderboard_entries', 'macro_targets', 'calculator_results', 'weekly_schedules',
+    )
+    
+    def __init__(self, user, chunk_size=STREAM_CHUNK_SIZE):
         self.user = user
         self.data = {}
+        self.chunk_size = chunk_size
+        self.encoder = DjangoJSONEncoder()
+        self.records_streamed = 0
     
-    def collect_user_data(self):
-        """Collect all user data from various models"""
-        try:
+    def export_querysets(self):
+        """Ordered (data type, queryset) pairs that make up a user's export"""
+        return [
             # Core fitness data
-            self.data['workouts'] = WorkoutSession.objects.filter(user=self.user).values()
-            self.data['nutrition_logs'] = NutritionLog.objects.filter(user=self.user).values()
-            
+            ('workouts', WorkoutSession.objects.filter(user=self.user)),
+            ('nutrition_logs', NutritionLog.objects.filter(user=self.user)),
             # Progress and analytics
-            self.data['progress_analytics'] = ProgressAnalytics.objects.filter(user=self.user).values()
-            self.data['personal_records'] = PersonalRecord.objects.filter(user=self.user).values()
-            self.data['workout_streaks'] = WorkoutStreak.objects.filter(user=self.user).values()
-            
+            ('progress_analytics', ProgressAnalytics.objects.filter(user=self.user)),
+            ('personal_records', PersonalRecord.objects.filter(user=self.user)),
+            ('workout_streaks', WorkoutStreak.objects.filter(user=self.user)),
             # Social features
-            self.data['user_connections'] = UserConnection.objects.filter(user=self.user).values()
-            self.data['challenges'] = Challenge.objects.filter(created_by=self.user).values()
-            self.data['challenge_participations'] = ChallengeParticipation.objects.filter(user=self.user).values()
-            self.data['leaderboard_entries'] = LeaderboardEntry.objects.filter(user=self.user).values()
-            
+            ('user_connections', UserConnection.objects.filter(follower=self.user)),
+            ('challenges', Challenge.objects.filter(created_by=self.user)),
+            ('challenge_participations', ChallengeParticipation.objects.filter(user=self.user)),
+            ('leaderboard_entries', LeaderboardEntry.objects.filter(user=self.user)),
             # Achievements
-            self.data['user_achievements'] = UserAchievement.objects.filter(user=self.user).values()
-            
+            ('user_achievements', UserAchievement.objects.filter(user=self.user)),
             # Calculator data
-            self.data['macro_targets'] = MacroTarget.objects.filter(user=self.user).values()
-            self.data['calculator_results'] = CalculatorResult.objects.filter(user=self.user).values()
-            
-            # User profile data
-            try:
-                profile = self.user.tracker_profile
-                self.data['user_profile'] = {
-                    'height': profile.height,
-                    'weight': profile.weight,
-                    'age': profile.age,
-                    'gender': profile.gender,
-                    'activity_level': profile.activity_level,
-                    'fitness_goals': profile.fitness_goals,
-                    'preferred_units': profile.preferred_units,
-                    'timezone': profile.timezone,
-                    'equipment_available': profile.equipment_available,
-                    'dietary_restrictions': profile.dietary_restrictions,
-                    'medical_conditions': profile.medical_conditions,
-                    'onboarding_completed': profile.onboarding_completed,
-                    'created_at': profile.created_at.isoformat() if profile.created_at else None,
-                    'updated_at': profile.updated_at.isoformat() if profile.updated_at else None
-                }
-            except:
-                self.data['user_profile'] = None
-            
-            # Export metadata
-            self.data['export_metadata'] = {
-                'exported_at': datetime.now().isoformat(),
-                'user_id': self.user.id,
-                'username': self.user.username,
-                'email': self.user.email,
-                'data_version': '1.0',
-                'total_records': sum(len(records) for records in self.data.values() if isinstance(records, list))
+            ('macro_targets', MacroTarget.objects.filter(user=self.user)),
+            ('calculator_results', CalculatorResult.objects.filter(user=self.user)),
+        ]
+    
+    def profile_data(self):
+        """User profile fields, or None when the user has no profile"""
+        try:
+            profile = self.user.tracker_profile
+            return {
+                'height': profile.height,
+                'weight': profile.weight,
+                'age': profile.age,
+                'gender': profile.gender,
+                'activity_level': profile.activity_level,
+                'fitness_goals': profile.fitness_goals,
+                'preferred_units': profile.preferred_units,
+                'timezone': profile.timezone,
+                'equipment_available': profile.equipment_available,
+                'dietary_restrictions': profile.dietary_restrictions,
+                'medical_conditions': profile.medical_conditions,
+                'onboarding_completed': profile.onboarding_completed,
+                'created_at': profile.created_at.isoformat() if profile.created_at else None,
+                'updated_at': profile.updated_at.isoformat() if profile.updated_at else None
             }
-            
+        except Exception:
+            return None
+    
+    def export_metadata(self, total_records):
+        """Metadata block written at the end of every export"""
+        return {
+            'exported_at': datetime.now().isoformat(),
+            'user_id': self.user.id,
+            'username': self.user.username,
+            'email': self.user.email,
+            'data_version': '1.0',
+            'total_records': total_records
+        }
+    
+    def collect_user_data(self):
+        """Collect all user data from various models"""
+        try:
+            for data_type, queryset in self.export_querysets():
+                self.data[data_type] = list(queryset.values())
+            self.data['user_profile'] = self.profile_data()
+            self.data['export_metadata'] = self.export_metadata(
+                sum(len(records) for records in self.data.values() if isinstance(records, list))
+            )
             return True
             
         except Exception as e:
             logger.error(f"Error collecting user data: {str(e)}")
             return False
     
+    def iter_records(self, queryset):
+        """Stream a queryset as dicts without caching it"""
+        return queryset.order_by('pk').values().iterator(chunk_size=self.chunk_size)
+    
+    def selected_querysets(self, data_type='all'):
+        """``export_querysets`` narrowed to one data type unless ``data_type`` is 'all'"""
+        return [
+            (name, queryset) for name, queryset in self.export_querysets()
+            if data_type == 'all' or name == data_type
+        ]
+    
+    def _stream_json_pieces(self, data_type='all'):
+        # Tracks where the document stands so a failure can still close it (see _error_tail)
+        self._json_state = 'start'
+        yield '{'
+        for index, (name, queryset) in enumerate(self.selected_querysets(data_type)):
+            yield f'{", " if index else ""}{json.dumps(name)}: ['
+            self._json_state = 'array'
+            for count, record in enumerate(self.iter_records(queryset)):
+                yield (', ' if count else '') + self.encoder.encode(record)
+                self.records_streamed += 1
+            yield ']'
+            self._json_state = 'object'
+        separator = ', ' if self._json_state == 'object' else ''
+        if data_type in ('all', 'user_profile'):
+            yield separator + '"user_profile": ' + self.encoder.encode(self.profile_data())
+            self._json_state, separator = 'object', ', '
+        yield separator + '"export_metadata": ' + self.encoder.encode(self.export_metadata(self.records_streamed)) + '}'
+        self._json_state = 'closed'
+    
+    def _stream_ndjson_pieces(self, data_type='all'):
+        for name, queryset in self.selected_querysets(data_type):
+            for record in self.iter_records(queryset):
+                yield self.encoder.encode({'type': name, 'record': record}) + '\n'
+                self.records_streamed += 1
+        profile = self.profile_data() if data_type in ('all', 'user_profile') else None
+        if profile is not None:
+            yield self.encoder.encode({'type': 'user_profile', 'record': profile}) + '\n'
+        yield self.encoder.encode({'type': 'export_metadata', 'record': self.export_metadata(self.records_streamed)}) + '\n'
+    
+    def _stream_csv_pieces(self, data_type='all'):
+        writer = csv.writer(_EchoBuffer())
+        for name, queryset in self.selected_querysets(data_type):
+            header_written = False
+            for record in self.iter_records(queryset):
+                if not header_written:
+                    if data_type == 'all':
+                        yield writer.writerow([f"=== {name.upper()} ==="])
+                    yield writer.writerow(record.keys())  # Header
+                    header_written = True
+                yield writer.writerow(record.values())
+                self.records_streamed += 1
+            if header_written and data_type == 'all':
+                yield writer.writerow([])  # Empty row separator
+    
+    def _error_tail(self, format_type):
+        """Closing text that marks a stream cut short by an error"""
+        error = {'error': 'Export failed before completion', 'records_streamed': self.records_streamed}
+        if format_type == 'ndjson':
+            return self.encoder.encode({'type': 'error', 'record': error}) + '\n'
+        if format_type == 'csv':
+            return csv.writer(_EchoBuffer()).writerow(['=== EXPORT FAILED ==='])
+        state = getattr(self, '_json_state', 'start')
+        if state == 'closed':
+            return ''
+        opening = {'start': '', 'array': '], ', 'object': ', '}[state]
+        return opening + '"export_error": ' + self.encoder.encode(error) + '}'
+    
+    def stream_export(self, format_type='json', compress=False, data_type='all', error_marker=False):
+        """
+        Yield the export as byte chunks, reading each queryset with ``.iterator()``
+        so memory stays flat regardless of history size. Errors propagate unless
+        ``error_marker`` is set (HTTP responses, whose headers are already sent),
+        in which case the stream ends with a format-specific error marker.
+        """
+        self.records_streamed = 0
+        if format_type == 'ndjson':
+            pieces = self._stream_ndjson_pieces(data_type)
+        elif format_type == 'csv':
+            pieces = self._stream_csv_pieces(data_type)
+        elif format_type == 'json':
+            pieces = self._stream_json_pieces(data_type)
+        else:
+            raise ValueError(f"Unsupported streaming format: {format_type}")
+        
+        def marked(pieces):
+            try:
+                yield from pieces
+            except Exception as e:
+                logger.error(f"Streaming export error for user {self.user.id}: {str(e)}")
+                yield self._error_tail(format_type)
+        
+        chunks = _buffered(marked(pieces) if error_marker else pieces)
+        return gzip_stream(chunks) if compress else chunks
+    
     def export_to_json(self):
         """Export data as JSON"""
         if not self.collect_user_data():
@@ -179,75 +338,115 @@ TOTAL RECORDS EXPORTED: {self.data.get('export_metadata', {}).get('total_records
         return summary.strip()
 
 
+# Importable data types: model, natural key (per user) used for de-duplication,
+# the import option that gates it, and fields that reference rows of the source
+# account and cannot be carried over
+IMPORT_SPECS = {
+    'workouts': {
+        'model': WorkoutSession, 'key': ('start_time',), 'option': 'import_workouts', 'drop': (),
+    },
+    'nutrition_logs': {
+        'model': NutritionLog, 'key': ('date', 'meal_type', 'food_item'), 'option': 'import_nutrition', 'drop': (),
+    },
+    'progress_analytics': {
+        'model': ProgressAnalytics, 'key': ('analysis_date',), 'option': 'import_progress', 'drop': (),
+    },
+    'personal_records': {
+        'model': PersonalRecord, 'key': ('exercise_id', 'record_type', 'date_achieved', 'weight_kg', 'reps'),
+        'option': 'import_progress', 'drop': ('session',),
+    },
+    'user_achievements': {
+        'model': UserAchievement, 'key': ('achievement', 'achieved_at'), 'option': 'import_social', 'drop': (),
+    },
+}
+IMPORT_BATCH_SIZE = 500
+# Per-record errors kept for the response; the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+
 class DataImporter:
-    """Handles data import and validation"""
+    """
+    Handles data import and validation.
+
+    Records are validated in a streaming pass, collected into batches per data
+    type, de-duplicated against the user's existing rows by natural key with one
+    query per batch, and written with ``bulk_create`` inside one transaction per
+    batch. JSON documents and NDJSON streams (as produced by the export) share
+    the same engine.
+    """
     
-    def __init__(self, user):
+    def __init__(self, user, batch_size=IMPORT_BATCH_SIZE, on_batch=None):
         self.user = user
         self.errors = []
         self.warnings = []
         self.imported_count = 0
+        self.duplicate_count = 0
+        self.invalid_count = 0
+        self.batches = []
+        self.batch_size = batch_size
+        self.on_batch = on_batch
+    
+    def _error(self, message):
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+        elif len(self.errors) == MAX_REPORTED_ERRORS:
+            self.errors.append("Further errors omitted")
+    
+    def validate_metadata(self, metadata):
+        """Validate the export metadata block"""
+        if not isinstance(metadata, dict):
+            self.errors.append("Missing export metadata")
+            return False
+        
+        required_fields = ['exported_at', 'user_id', 'data_version']
+        for field in required_fields:
+            if field not in metadata:
+                self.errors.append(f"Missing required field in metadata: {field}")
+        
+        # Check data version compatibility
+        if metadata.get('data_version') != '1.0':
+            self.warnings.append(f"Data version {metadata.get('data_version')} may not be fully compatible")
+        
+        return len(self.errors) == 0
     
     def validate_json_data(self, json_data):
         """Validate imported JSON data"""
+        return self._parse_document(json_data) is not None
+    
+    def _parse_document(self, json_data):
         try:
-            data = json.loads(json_data)
-            
-            # Check required metadata
-            if 'export_metadata' not in data:
+            data = json.loads(json_data) if isinstance(json_data, (str, bytes)) else json_data
+            if not isinstance(data, dict) or 'export_metadata' not in data:
                 self.errors.append("Missing export metadata")
-                return False
-            
-            metadata = data['export_metadata']
-            required_fields = ['exported_at', 'user_id', 'data_version']
-            for field in required_fields:
-                if field not in metadata:
-                    self.errors.append(f"Missing required field in metadata: {field}")
-            
-            # Check data version compatibility
-            if metadata.get('data_version') != '1.0':
-                self.warnings.append(f"Data version {metadata.get('data_version')} may not be fully compatible")
-            
-            return len(self.errors) == 0
+                return None
+            return data if self.validate_metadata(data['export_metadata']) else None
             
         except json.JSONDecodeError as e:
             self.errors.append(f"Invalid JSON format: {str(e)}")
-            return False
+            return None
         except Exception as e:
             self.errors.append(f"Validation error: {str(e)}")
-            return False
+            return None
     
     def import_data(self, json_data, import_options=None):
-        """Import data from JSON"""
-        if not self.validate_json_data(json_data):
+        """Import data from a JSON export document (string or already-parsed dict)"""
+        data = self._parse_document(json_data)
+        if data is None:
             return False
         
         try:
-            data = json.loads(json_data)
             import_options = import_options or {}
             
             # Import user profile first
             if 'user_profile' in data and data['user_profile']:
                 self._import_user_profile(data['user_profile'], import_options)
             
-            # Import core data
-            if import_options.get('import_workouts', True):
-                self._import_workouts(data.get('workouts', []), import_options)
-            
-            if import_options.get('import_nutrition', True):
-                self._import_nutrition_logs(data.get('nutrition_logs', []), import_options)
-            
-            if import_options.get('import_schedules', True):
-                self._import_weekly_schedules(data.get('weekly_schedules', []), import_options)
-            
-            # Import progress data
-            if import_options.get('import_progress', True):
-                self._import_progress_data(data, import_options)
-            
-            # Import social data
-            if import_options.get('import_social', True):
-                self._import_social_data(data, import_options)
-            
+            records = (
+                (data_type, record)
+                for data_type in IMPORT_SPECS
+                for record in (data.get(data_type) or [])
+            )
+            self._import_records(records, import_options)
             return True
             
         except Exception as e:
@@ -255,11 +454,162 @@ class DataImporter:
             logger.error(f"Data import error: {str(e)}")
             return False
     
+    def import_ndjson(self, lines, import_options=None):
+        """
+        Import an NDJSON stream of ``{"type": ..., "record": {...}}`` lines, as
+        written by the NDJSON export. ``lines`` may be any iterable of str/bytes,
+        e.g. the request stream, so the file is never held in memory whole.
+        """
+        import_options = import_options or {}
+        saw_metadata = []
+        
+        def records():
+            for line_number, line in enumerate(lines, start=1):
+                if isinstance(line, bytes):
+                    line = line.decode('utf-8')
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                    data_type, record = item['type'], item['record']
+                except (ValueError, KeyError, TypeError) as e:
+                    self.invalid_count += 1
+                    self._error(f"Line {line_number}: invalid NDJSON record ({str(e)})")
+                    continue
+                if data_type == 'export_metadata':
+                    saw_metadata.append(True)
+                    self.validate_metadata(record)
+                elif data_type == 'user_profile':
+                    self._import_user_profile(record, import_options)
+                else:
+                    yield data_type, record
+        
+        try:
+            self._import_records(records(), import_options)
+        except Exception as e:
+            self.errors.append(f"Import error: {str(e)}")
+            logger.error(f"NDJSON import error: {str(e)}")
+            return False
+        if not saw_metadata:
+            self.warnings.append("No export_metadata line found")
+        return True
+    
+    # ------------------------------------------------------------------
+    # Bulk engine
+    # ------------------------------------------------------------------
+    def _import_records(self, records, options):
+        """Validate a (data_type, record) stream and write it in per-type batches"""
+        pending = {}
+        for data_type, record in records:
+            spec = IMPORT_SPECS.get(data_type)
+            if spec is None:
+                if data_type not in DataExporter.OTHER_EXPORT_TYPES:
+                    self.warnings.append(f"Skipped unknown data type: {data_type}")
+                continue
+            if not options.get(spec['option'], True):
+                continue
+            obj = self._build_instance(data_type, spec, record)
+            if obj is None:
+                continue
+            batch = pending.setdefault(data_type, [])
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                self._write_batch(data_type, spec, batch)
+                pending[data_type] = []
+        for data_type, batch in pending.items():
+            if batch:
+                self._write_batch(data_type, IMPORT_SPECS[data_type], batch)
+    
+    def _build_instance(self, data_type, spec, record):
+        """Clean one record into an unsaved model instance, or None if invalid"""
+        from django.core.exceptions import ValidationError
+        
+        model = spec['model']
+        if not isinstance(record, dict):
+            self.invalid_count += 1
+            self._error(f"Invalid {data_type} record: expected an object")
+            return None
+        values = {}
+        try:
+            for field in model._meta.concrete_fields:
+                if field.primary_key or field.name in ('user', 'uuid') or field.name in spec['drop']:
+                    continue
+                if field.attname in record:
+                    raw = record[field.attname]
+                elif field.name in record and not field.is_relation:
+                    raw = record[field.name]
+                else:
+                    if not field.null and not field.has_default() and not field.blank \
+                            and not getattr(field, 'auto_now', False) and not getattr(field, 'auto_now_add', False):
+                        raise ValidationError(f"missing required field '{field.name}'")
+                    continue
+                value = field.to_python(raw)
+                if value is None and not field.null:
+                    raise ValidationError(f"'{field.name}' may not be null")
+                if isinstance(value, datetime) and timezone.is_naive(value):
+                    value = timezone.make_aware(value)
+                values[field.attname] = value
+        except (ValidationError, ValueError, TypeError) as e:
+            self.invalid_count += 1
+            detail = '; '.join(e.messages) if isinstance(e, ValidationError) else str(e)
+            self._error(f"Invalid {data_type} record: {detail}")
+            return None
+        return model(user=self.user, **values)
+    
+    def _natural_key(self, spec, obj):
+        return tuple(getattr(obj, name) for name in spec['key'])
+    
+    def _write_batch(self, data_type, spec, batch):
+        """De-duplicate one batch against existing rows and bulk insert it atomically"""
+        model = spec['model']
+        key_fields = spec['key']
+        report = {'type': data_type, 'batch': len(self.batches) + 1, 'received': len(batch),
+                  'inserted': 0, 'duplicates': 0}
+        try:
+            with transaction.atomic():
+                first_values = {getattr(obj, key_fields[0]) for obj in batch}
+                existing = set(
+                    model.objects
+                    .filter(user=self.user, **{f'{key_fields[0]}__in': first_values})
+                    .values_list(*key_fields)
+                )
+                to_create = []
+                for obj in batch:
+                    key = self._natural_key(spec, obj)
+                    if key in existing:
+                        report['duplicates'] += 1
+                        continue
+                    existing.add(key)
+                    to_create.append(obj)
+                model.objects.bulk_create(to_create, batch_size=self.batch_size)
+                report['inserted'] = len(to_create)
+                # bulk_create skips model signals, so schedule the aggregate refresh here
+                if model is WorkoutSession:
+                    self._mark_sessions_dirty(to_create)
+                if to_create:
+                    dashboard_push.mark_changed(model.__name__, self.user.id)
+        except Exception as e:
+            report['error'] = str(e)
+            self._error(f"Error importing {data_type} batch {report['batch']}: {str(e)}")
+            logger.error(f"Bulk import error for {data_type}: {str(e)}")
+        
+        self.imported_count += report['inserted']
+        self.duplicate_count += report['duplicates']
+        self.batches.append(report)
+        if self.on_batch:
+            self.on_batch(report)
+    
+    def _mark_sessions_dirty(self, sessions):
+        from . import aggregates
+        
+        days = {aggregates.local_day(s.start_time) for s in sessions}
+        for day in days - {None}:
+            for kind in (aggregates.STRENGTH, aggregates.EXERCISE, aggregates.CARDIO):
+                aggregates.mark_dirty(kind, self.user.id, day)
+    
     def _import_user_profile(self, profile_data, options):
         """Import user profile data"""
         try:
-            from .models import UserProfile
-            
             profile, created = UserProfile.objects.get_or_create(
                 user=self.user,
                 defaults={
@@ -289,102 +639,28 @@ class DataImporter:
         except Exception as e:
             self.errors.append(f"Error importing user profile: {str(e)}")
     
-    def _import_workouts(self, workouts_data, options):
-        """Import workout data"""
-        for workout_data in workouts_data:
-            try:
-                # Remove user field from data to avoid conflicts
-                workout_data_copy = workout_data.copy()
-                workout_data_copy.pop('user', None)
-                workout_data_copy.pop('id', None)
-                
-                workout = WorkoutSession.objects.create(
-                    user=self.user,
-                    **workout_data_copy
-                )
-                self.imported_count += 1
-                
-            except Exception as e:
-                self.errors.append(f"Error importing workout: {str(e)}")
-    
-    def _import_nutrition_logs(self, nutrition_data, options):
-        """Import nutrition log data"""
-        for nutrition_log_data in nutrition_data:
-            try:
-                nutrition_log_data_copy = nutrition_log_data.copy()
-                nutrition_log_data_copy.pop('user', None)
-                nutrition_log_data_copy.pop('id', None)
-                
-                NutritionLog.objects.create(
-                    user=self.user,
-                    **nutrition_log_data_copy
-                )
-                self.imported_count += 1
-                
-            except Exception as e:
-                self.errors.append(f"Error importing nutrition log: {str(e)}")
-    
-    def _import_weekly_schedules(self, schedules_data, options):
-        """Import weekly schedule data"""
-        # WeeklySchedule model doesn't exist, skip this import
-        pass
-    
-    def _import_progress_data(self, data, options):
-        """Import progress and analytics data"""
-        # Import progress analytics
-        for progress_data in data.get('progress_analytics', []):
-            try:
-                progress_data_copy = progress_data.copy()
-                progress_data_copy.pop('user', None)
-                progress_data_copy.pop('id', None)
-                
-                ProgressAnalytics.objects.create(
-                    user=self.user,
-                    **progress_data_copy
-                )
-                self.imported_count += 1
-                
-            except Exception as e:
-                self.errors.append(f"Error importing progress analytics: {str(e)}")
-        
-        # Import personal records
-        for pr_data in data.get('personal_records', []):
-            try:
-                pr_data_copy = pr_data.copy()
-                pr_data_copy.pop('user', None)
-                pr_data_copy.pop('id', None)
-                
-                PersonalRecord.objects.create(
-                    user=self.user,
-                    **pr_data_copy
-                )
-                self.imported_count += 1
-                
-            except Exception as e:
-                self.errors.append(f"Error importing personal record: {str(e)}")
-    
-    def _import_social_data(self, data, options):
-        """Import social features data"""
-        # Import achievements
-        for achievement_data in data.get('user_achievements', []):
-            try:
-                achievement_data_copy = achievement_data.copy()
-                achievement_data_copy.pop('user', None)
-                achievement_data_copy.pop('id', None)
-                
-                UserAchievement.objects.create(
-                    user=self.user,
-                    **achievement_data_copy
-                )
-                self.imported_count += 1
-                
-            except Exception as e:
-                self.errors.append(f"Error importing user achievement: {str(e)}")
+    def report(self):
+        """Summary returned by the import endpoint"""
+        return {
+            'imported_count': self.imported_count,
+            'duplicate_count': self.duplicate_count,
+            'invalid_count': self.invalid_count,
+            'batches': self.batches,
+            'errors': self.errors,
+            'warnings': self.warnings,
+        }
+
+
+def _export_format_renderer(format_name):
+    # DRF treats ?format= as a renderer override and 404s on unknown values; these
+    # JSON renderers claim the export formats so the view can pick the output itself
+    return type(f'{format_name.title()}ExportRenderer', (JSONRenderer,), {'format': format_name})
 
 
 # API Views
 @api_view(['GET'])
 @permission_classes([])  # Temporarily allow unauthenticated access for testing
+@renderer_classes([JSONRenderer] + [_export_format_renderer(name) for name in ('ndjson', 'csv', 'summary')])
 def export_data(request):
     """Export user data in various formats"""
     format_type = request.GET.get('format', 'json')
@@ -394,6 +670,25 @@ def export_data(request):
         if request.user.is_authenticated:
             exporter = DataExporter(request.user)
             
+            streaming = request.GET.get('stream') in ('1', 'true', 'yes')
+            
+            # Background job (the default for streamable formats): artifact written to
+            # disk by a worker, polled and downloaded later. async=false or stream=true opt out.
+            if (format_type in STREAM_FORMATS and not streaming
+                    and request.GET.get('async', 'true') not in ('0', 'false', 'no')):
+                return enqueue_export_job(request, format_type)
+            
+            # Streaming mode: constant memory, optionally gzip-compressed on the fly
+            if format_type == 'ndjson' or streaming:
+                if format_type not in STREAM_FORMATS:
+                    return Response({'error': 'Unsupported streaming format'}, status=status.HTTP_400_BAD_REQUEST)
+                return streaming_export_response(
+                    exporter,
+                    format_type,
+                    compress=request.GET.get('compress') == 'gzip',
+                    data_type=request.GET.get('data_type', 'all'),
+                )
+            
             if format_type == 'json':
                 data = exporter.export_to_json()
                 if data:
@@ -477,26 +772,139 @@ def export_data(request):
         return Response({'error': 'Export failed'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+STREAM_CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+
+def streaming_export_response(exporter, format_type, compress=False, data_type='all'):
+    """StreamingHttpResponse that writes the export incrementally"""
+    filename = f'maverick_fitness_data_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{format_type}'
+    content_type = STREAM_CONTENT_TYPES[format_type]
+    if compress:
+        filename += '.gz'
+        content_type = 'application/gzip'
+    response = StreamingHttpResponse(
+        exporter.stream_export(format_type, compress=compress, data_type=data_type, error_marker=True),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+def _job_urls(request, job):
+    return (
+        request.build_absolute_uri(reverse('v1_export_job_status', args=[job['id']])),
+        request.build_absolute_uri(reverse('v1_export_job_download', args=[job['id']])),
+    )
+
+
+def enqueue_export_job(request, format_type):
+    """Queue (or reuse) a background export and describe it"""
+    from . import export_jobs
+    
+    if format_type not in STREAM_FORMATS:
+        return Response({'error': 'Unsupported format for background export'}, status=status.HTTP_400_BAD_REQUEST)
+    job, reused = export_jobs.enqueue_export(
+        request.user,
+        format_type,
+        compress=request.GET.get('compress') == 'gzip',
+        data_type=request.GET.get('data_type', 'all'),
+    )
+    status_url, download_url = _job_urls(request, job)
+    payload = export_jobs.job_payload(job, download_url)
+    payload.update({'reused': reused, 'status_url': status_url})
+    return Response(payload, status=status.HTTP_200_OK if reused else status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_job_status(request, job_id):
+    """Progress of a background export job"""
+    from . import export_jobs
+    
+    job = export_jobs.get_job(job_id, user_id=request.user.id)
+    if job is None:
+        return Response({'error': 'Export job not found'}, status=status.HTTP_404_NOT_FOUND)
+    status_url, download_url = _job_urls(request, job)
+    payload = export_jobs.job_payload(job, download_url)
+    payload['status_url'] = status_url
+    return Response(payload)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_job_download(request, job_id):
+    """Download a finished export artifact; honours single HTTP Range requests"""
+    from . import export_jobs
+    
+    job = export_jobs.get_job(job_id, user_id=request.user.id)
+    if job is None:
+        return Response({'error': 'Export job not found'}, status=status.HTTP_404_NOT_FOUND)
+    if job['status'] == export_jobs.EXPIRED:
+        return Response({'error': 'Export artifact has expired'}, status=status.HTTP_410_GONE)
+    if job['status'] != export_jobs.DONE:
+        return Response({'error': f"Export is {job['status']}"}, status=status.HTTP_409_CONFLICT)
+    path = job['file_path']
+    if not path or not os.path.exists(path):
+        return Response({'error': 'Export artifact has expired'}, status=status.HTTP_410_GONE)
+    
+    size = os.path.getsize(path)
+    etag = f'"{job["content_hash"]}"'
+    filename = f"maverick_fitness_data_{job['created_at'].strftime('%Y%m%d_%H%M%S')}{export_jobs.artifact_extension(job)}"
+    content_type = 'application/gzip' if job['compress'] else STREAM_CONTENT_TYPES[job['format']]
+    
+    byte_range = export_jobs.parse_range(request.META.get('HTTP_RANGE'), size)
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if byte_range is not None and if_range and if_range != etag:
+        # The client's partial copy is of a different artifact
+        byte_range = None
+    if byte_range == 'invalid':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range is None:
+        response = FileResponse(open(path, 'rb'), as_attachment=True, filename=filename, content_type=content_type)
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            export_jobs.iter_file_range(path, start, end), status=206, content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    return response
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def import_data(request):
-    """Import user data from JSON"""
+    """Import user data from a JSON export, or stream an NDJSON export as the request body"""
     try:
-        json_data = request.data.get('data')
-        import_options = request.data.get('options', {})
-        
-        if not json_data:
-            return Response({'error': 'No data provided'}, status=status.HTTP_400_BAD_REQUEST)
-        
         importer = DataImporter(request.user)
-        success = importer.import_data(json_data, import_options)
         
-        response_data = {
-            'success': success,
-            'imported_count': importer.imported_count,
-            'errors': importer.errors,
-            'warnings': importer.warnings
-        }
+        if request.content_type.startswith('application/x-ndjson'):
+            # Read the body line by line; options come from the query string
+            import_options = {
+                key: value.lower() not in ('0', 'false', 'no')
+                for key, value in request.query_params.items()
+            }
+            success = importer.import_ndjson(request.stream or [], import_options)
+        else:
+            json_data = request.data.get('data')
+            import_options = request.data.get('options', {})
+            
+            if not json_data:
+                return Response({'error': 'No data provided'}, status=status.HTTP_400_BAD_REQUEST)
+            
+            success = importer.import_data(json_data, import_options)
+        
+        response_data = {'success': success}
+        response_data.update(importer.report())
         
         if success:
             return Response(response_data, status=status.HTTP_200_OK)
@@ -512,10 +920,18 @@ def import_data(request):
 @permission_classes([])  # Temporarily allow unauthenticated access for testing
 def export_status(request):
     """Get export/import status and available formats"""
+    from .export_jobs import export_settings
+    
     return Response({
-        'available_formats': ['json', 'csv', 'summary'],
-        'supported_import_formats': ['json'],
-        'max_file_size': '10MB',
+        'available_formats': ['json', 'ndjson', 'csv', 'summary'],
+        'streaming_formats': list(STREAM_FORMATS),
+        'streaming_options': {'stream': 'true', 'compress': 'gzip'},
+        'background_export': {
+            'default': True, 'opt_out': 'async=false', 'formats': list(STREAM_FORMATS), 'range_downloads': True,
+            'artifact_ttl_hours': export_settings()['artifact_ttl_s'] // 3600,
+        },
+        'supported_import_formats': ['json', 'ndjson'],
+        'max_file_size': f"{export_settings()['max_artifact_mb']}MB",
         'data_types': [
             'workouts', 'nutrition_logs', 'weekly_schedules',
             'progress_analytics', 'personal_records', 'workout_streaks',
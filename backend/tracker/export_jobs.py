@@ -0,0 +1,409 @@
+"""
+Background data export jobs.
+
+``enqueue_export`` records a job in ``tracker_export_job`` (migration 0029) and
+hands it to a small per-process thread pool, reusing an in-flight job with the
+same options. The worker streams the export from ``DataExporter.stream_export``
+to disk in chunks, reporting progress as it goes, and names the finished
+artifact after the SHA-256 of its content.
+
+The worker first fingerprints the user's data with per-table COUNT/MAX
+queries (tables without ``updated_at`` are also checksummed, so edits in
+place are seen); when a finished job has the same fingerprint, its artifact
+is handed to the new job instead of exporting again. Fingerprinting runs in
+the worker so enqueueing stays cheap. An in-flight job whose row has not
+been touched for ``stale_after_s`` seconds belonged to a worker that died
+and is marked failed rather than reused. Finished artifacts expire after
+``artifact_ttl_s`` (see ``expire_artifacts`` and the expire_exports command).
+Downloads are served with HTTP Range support so interrupted transfers can
+resume.
+"""
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .export_import import DataExporter, STREAM_FORMATS
+from .minute_buckets import as_aware_utc
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+EXPIRED = 'expired'
+
+DEFAULTS = {
+    "root": None,           # defaults to <BASE_DIR>/exports
+    "workers": 2,
+    "max_artifact_mb": 50,
+    "stale_after_s": 600,   # in-flight jobs untouched this long are treated as dead
+    "artifact_ttl_s": 86400,  # finished artifacts are deleted this long after the job finished
+}
+# Progress is written back to the job row at most every this many bytes,
+# and at least every HEARTBEAT_SECONDS so live jobs never look stale
+PROGRESS_EVERY_BYTES = 1024 * 1024
+HEARTBEAT_SECONDS = 60
+RANGE_CHUNK_BYTES = 64 * 1024
+
+JOB_COLUMNS = [
+    'id', 'user_id', 'format', 'data_type', 'compress', 'status', 'fingerprint', 'content_hash',
+    'file_path', 'total_records', 'records_written', 'bytes_written', 'error',
+    'created_at', 'updated_at', 'finished_at',
+]
+
+
+class ExportTooLarge(Exception):
+    """Raised when an artifact grows past the configured size limit"""
+
+
+def export_settings():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'MAR_EXPORTS', {}))
+    if not config['root']:
+        config['root'] = os.path.join(str(getattr(settings, 'BASE_DIR', os.getcwd())), 'exports')
+    return config
+
+
+def max_artifact_bytes():
+    return export_settings()['max_artifact_mb'] * 1024 * 1024
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Process-wide worker pool, created on first use"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=export_settings()['workers'], thread_name_prefix='mar-export'
+            )
+        return _executor
+
+
+# ----------------------------------------------------------------------
+# Job rows
+# ----------------------------------------------------------------------
+def _row_to_job(row):
+    job = dict(zip(JOB_COLUMNS, row))
+    job['compress'] = bool(job['compress'])
+    for col in ('created_at', 'updated_at', 'finished_at'):
+        job[col] = as_aware_utc(job[col])
+    return job
+
+
+def get_job(job_id, user_id=None):
+    """Job dict by id (optionally scoped to a user), or None"""
+    sql = f"SELECT {', '.join(JOB_COLUMNS)} FROM tracker_export_job WHERE id = %s"
+    params = [job_id]
+    if user_id is not None:
+        sql += " AND user_id = %s"
+        params.append(user_id)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    return _row_to_job(row) if row else None
+
+
+def update_job(job_id, **fields):
+    """Set columns on a job row and bump updated_at"""
+    adapt = connection.ops.adapt_datetimefield_value
+    fields['updated_at'] = timezone.now()
+    assignments = ', '.join(f"{col} = %s" for col in fields)
+    values = [adapt(v) if hasattr(v, 'tzinfo') else v for v in fields.values()]
+    with connection.cursor() as cursor:
+        cursor.execute(f"UPDATE tracker_export_job SET {assignments} WHERE id = %s", values + [job_id])
+
+
+def find_inflight_job(user_id, format_type, compress, data_type):
+    """
+    Latest queued or running job with the same options. Jobs past
+    ``stale_after_s`` are marked failed instead of returned.
+    """
+    cutoff = timezone.now() - timedelta(seconds=export_settings()['stale_after_s'])
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT {', '.join(JOB_COLUMNS)} FROM tracker_export_job
+            WHERE user_id = %s AND format = %s AND compress = %s AND data_type = %s AND status IN (%s, %s)
+            ORDER BY created_at DESC
+        """, [user_id, format_type, bool(compress), data_type, RUNNING, QUEUED])
+        rows = cursor.fetchall()
+    for row in rows:
+        job = _row_to_job(row)
+        if job['updated_at'] is not None and job['updated_at'] < cutoff:
+            # Its worker died (restart, deploy, OOM) before finishing
+            update_job(job['id'], status=FAILED, error='Export worker stopped before finishing',
+                       finished_at=timezone.now())
+        else:
+            return job
+    return None
+
+
+def find_finished_job(user_id, fingerprint, exclude=None):
+    """Latest finished job with the same fingerprint whose artifact is still on disk"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT {', '.join(JOB_COLUMNS)} FROM tracker_export_job
+            WHERE user_id = %s AND fingerprint = %s AND status = %s AND id <> %s
+            ORDER BY created_at DESC
+        """, [user_id, fingerprint, DONE, exclude or ''])
+        rows = cursor.fetchall()
+    for row in rows:
+        job = _row_to_job(row)
+        if job['file_path'] and os.path.exists(job['file_path']):
+            return job
+    return None
+
+
+# ----------------------------------------------------------------------
+# Fingerprinting
+# ----------------------------------------------------------------------
+def content_checksum(queryset):
+    """SHA-256 over every row of a table, for tables without an updated_at high-water mark"""
+    digest = hashlib.sha256()
+    for row in queryset.order_by('pk').values_list().iterator(chunk_size=2000):
+        digest.update(repr(row).encode())
+    return digest.hexdigest()
+
+
+def data_fingerprint(exporter, format_type, compress, data_type):
+    """SHA-256 over per-table counts and change markers plus the export options"""
+    digest = hashlib.sha256(f"v2:{format_type}:{int(bool(compress))}:{data_type}".encode())
+    total = 0
+    for name, queryset in exporter.export_querysets():
+        if data_type != 'all' and name != data_type:
+            continue
+        aggregates = {'n': Count('pk'), 'max_pk': Max('pk')}
+        has_updated_at = any(field.name == 'updated_at' for field in queryset.model._meta.get_fields())
+        if has_updated_at:
+            aggregates['changed'] = Max('updated_at')
+        state = queryset.order_by().aggregate(**aggregates)
+        total += state['n']
+        # Count and max pk miss edits in place, so hash the rows when there is no updated_at
+        changed = state['changed'] if has_updated_at else (content_checksum(queryset) if state['n'] else None)
+        digest.update(f"|{name}:{state['n']}:{state['max_pk']}:{changed}".encode())
+    profile = exporter.profile_data()
+    digest.update(f"|profile:{profile.get('updated_at') if profile else None}".encode())
+    return digest.hexdigest(), total
+
+
+# ----------------------------------------------------------------------
+# Enqueue / run
+# ----------------------------------------------------------------------
+def enqueue_export(user, format_type='json', compress=False, data_type='all', executor=None):
+    """Return the in-flight job with the same options, or queue a new one. (job, reused)"""
+    if format_type not in STREAM_FORMATS:
+        raise ValueError(f"Unsupported export format: {format_type}")
+    existing = find_inflight_job(user.id, format_type, compress, data_type)
+    if existing is not None:
+        return existing, True
+
+    job_id = uuid.uuid4().hex
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    with connection.cursor() as cursor:
+        # The fingerprint and record total are filled in by the worker
+        cursor.execute("""
+            INSERT INTO tracker_export_job
+                (id, user_id, format, data_type, compress, status, fingerprint, total_records,
+                 records_written, bytes_written, created_at, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, '', 0, 0, 0, %s, %s)
+        """, [job_id, user.id, format_type, data_type, bool(compress), QUEUED, now, now])
+
+    executor = executor or get_executor()
+    # The worker reads the row on another connection, so wait for it to be committed
+    transaction.on_commit(lambda: executor.submit(run_export_job, job_id))
+    return get_job(job_id), False
+
+
+def artifact_dir(user_id):
+    path = os.path.join(export_settings()['root'], str(user_id))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def artifact_extension(job):
+    return f".{job['format']}.gz" if job['compress'] else f".{job['format']}"
+
+
+def run_export_job(job_id):
+    """Worker body: stream the export to disk, hashing and reporting progress"""
+    from django.contrib.auth.models import User
+
+    part_path = None
+    try:
+        job = get_job(job_id)
+        if job is None or job['status'] not in (QUEUED, RUNNING):
+            return
+        update_job(job_id, status=RUNNING)
+        exporter = DataExporter(User.objects.get(pk=job['user_id']))
+        fingerprint, total = data_fingerprint(exporter, job['format'], job['compress'], job['data_type'])
+        update_job(job_id, fingerprint=fingerprint, total_records=total)
+        previous = find_finished_job(job['user_id'], fingerprint, exclude=job_id)
+        if previous is not None:
+            # Unchanged data: hand over the existing artifact instead of exporting again
+            update_job(
+                job_id, status=DONE, content_hash=previous['content_hash'], file_path=previous['file_path'],
+                bytes_written=previous['bytes_written'], records_written=previous['records_written'],
+                finished_at=timezone.now(),
+            )
+            return
+        directory = artifact_dir(job['user_id'])
+        part_path = os.path.join(directory, f"{job_id}.part")
+        limit = max_artifact_bytes()
+
+        digest = hashlib.sha256()
+        written = 0
+        reported = 0
+        reported_at = time.monotonic()
+        with open(part_path, 'wb') as out:
+            for chunk in exporter.stream_export(job['format'], compress=job['compress'], data_type=job['data_type']):
+                out.write(chunk)
+                digest.update(chunk)
+                written += len(chunk)
+                if written > limit:
+                    raise ExportTooLarge(f"Export exceeds {export_settings()['max_artifact_mb']}MB")
+                if (written - reported >= PROGRESS_EVERY_BYTES
+                        or time.monotonic() - reported_at >= HEARTBEAT_SECONDS):
+                    update_job(job_id, bytes_written=written, records_written=exporter.records_streamed)
+                    reported, reported_at = written, time.monotonic()
+
+        content_hash = digest.hexdigest()
+        final_path = os.path.join(directory, content_hash + artifact_extension(job))
+        # Identical content is already on disk under the same name
+        os.replace(part_path, final_path)
+        part_path = None
+        update_job(
+            job_id, status=DONE, content_hash=content_hash, file_path=final_path,
+            bytes_written=written, records_written=exporter.records_streamed, finished_at=timezone.now(),
+        )
+    except Exception as e:
+        logger.error(f"Export job {job_id} failed: {str(e)}")
+        try:
+            update_job(job_id, status=FAILED, error=str(e), finished_at=timezone.now())
+        except Exception as update_error:
+            logger.error(f"Could not mark export job {job_id} failed: {str(update_error)}")
+    finally:
+        if part_path and os.path.exists(part_path):
+            os.remove(part_path)
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()
+
+
+def expire_artifacts(now=None, dry_run=False):
+    """
+    Expire finished jobs older than ``artifact_ttl_s`` and delete artifacts no
+    live job still points at, plus ``.part`` files left by dead workers.
+    Returns (jobs expired, files deleted).
+    """
+    config = export_settings()
+    cutoff = (now or timezone.now()) - timedelta(seconds=config['artifact_ttl_s'])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT id, file_path FROM tracker_export_job WHERE status = %s AND finished_at < %s",
+            [DONE, connection.ops.adapt_datetimefield_value(cutoff)],
+        )
+        expired = cursor.fetchall()
+    paths = {path for _, path in expired if path}
+    if dry_run:
+        return len(expired), len(paths)
+
+    for job_id, _ in expired:
+        update_job(job_id, status=EXPIRED, file_path=None)
+    deleted = 0
+    for path in paths:
+        with connection.cursor() as cursor:
+            # Jobs that reused the artifact keep it until they expire as well
+            cursor.execute("SELECT 1 FROM tracker_export_job WHERE status = %s AND file_path = %s",
+                           [DONE, path])
+            if cursor.fetchone():
+                continue
+        try:
+            os.remove(path)
+            deleted += 1
+        except FileNotFoundError:
+            pass
+
+    root = config['root']
+    stale_part = cutoff.timestamp()
+    for directory, _, names in os.walk(root) if os.path.isdir(root) else ():
+        for name in names:
+            path = os.path.join(directory, name)
+            if name.endswith('.part') and os.path.getmtime(path) < stale_part:
+                os.remove(path)
+                deleted += 1
+    return len(expired), deleted
+
+
+def job_payload(job, download_url=None):
+    """Public representation of a job for the API"""
+    total = job['total_records'] or 0
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'format': job['format'],
+        'data_type': job['data_type'],
+        'compressed': job['compress'],
+        'total_records': total,
+        'records_written': job['records_written'],
+        'bytes_written': job['bytes_written'],
+        'progress': 1.0 if job['status'] == DONE else (round(job['records_written'] / total, 3) if total else 0.0),
+        'content_hash': job['content_hash'],
+        'error': job['error'],
+        'created_at': job['created_at'].isoformat() if job['created_at'] else None,
+        'finished_at': job['finished_at'].isoformat() if job['finished_at'] else None,
+        'download_url': download_url if job['status'] == DONE else None,
+    }
+
+
+# ----------------------------------------------------------------------
+# Range downloads
+# ----------------------------------------------------------------------
+_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single-range header, None for no/ignored range, or 'invalid'"""
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        # Multi-range and malformed headers are ignored; the full body is sent
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(size - int(last), 0)
+        end = size - 1
+    if start >= size or start > end:
+        return 'invalid'
+    return start, end
+
+
+def iter_file_range(path, start, end, chunk_size=RANGE_CHUNK_BYTES):
+    """Yield bytes [start, end] of a file in chunks"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = f.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
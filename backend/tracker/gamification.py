@@ -6,9 +6,10 @@ Handles XP calculations, badge awarding, and quest management
 from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import date, timedelta
+from . import pr_index
 from .models import (
     GamificationProfile, Badge, UserBadge, DailyQuest, UserDailyQuest, 
-    StreakBonus, Activity, WorkoutSession, ChallengeParticipation
+    StreakBonus, Activity, WorkoutSession, ChallengeParticipation, ExerciseCatalog
 )
 
 
@@ -199,11 +200,19 @@ class GamificationEngine:
         # For now, return True as a placeholder
         return True
     
-    def check_exercise_pr(self, exercise_name):
-        """Check if user has set a PR for specific exercise"""
-        # This would check strength set history
-        # For now, return True as a placeholder
-        return True
+    def check_exercise_pr(self, requirement):
+        """Check if user has set a PR for specific exercise
+
+        ``requirement`` is an exercise name, or a dict with ``exercise`` and an
+        optional minimum ``weight_kg`` for the max weight record.
+        """
+        if isinstance(requirement, dict):
+            exercise_name, min_weight = requirement.get('exercise'), requirement.get('weight_kg') or 0
+        else:
+            exercise_name, min_weight = requirement, 0
+        exercise_ids = ExerciseCatalog.objects.filter(name__iexact=exercise_name).values_list('id', flat=True)
+        records = pr_index.records(self.user.id, exercise_ids=exercise_ids)
+        return any(record['value'] >= min_weight for record in records.values())
     
     def check_weight_loss_goal(self, target_loss):
         """Check if user has achieved weight loss goal"""
@@ -7,15 +7,21 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth.models import User
+from django.db.models import F, Q, Window
+from django.db.models.functions import Rank
 from django.utils import timezone
 from datetime import date
+import logging
 from .models import GamificationProfile, Badge, UserBadge, DailyQuest, UserDailyQuest, StreakBonus
 from .gamification import GamificationEngine, BadgeManager, QuestManager
+from . import rank_index
 from .gamification_serializers import (
     UserProfileSerializer, BadgeSerializer, UserBadgeSerializer,
     DailyQuestSerializer, UserDailyQuestSerializer, StreakBonusSerializer
 )
 
+logger = logging.getLogger(__name__)
+
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -154,6 +160,48 @@ def award_xp(request):
         )
 
 
+LEADERBOARD_ORDERING = {
+    'xp': ('-total_xp',),
+    'level': ('-current_level', '-total_xp'),
+    'streak': ('-current_streak',),
+}
+
+
+def _leaderboard_from_database(leaderboard_type, user_profile, limit, radius):
+    """Ranking straight from the table; used when the rank index is unavailable"""
+    ordering = LEADERBOARD_ORDERING[leaderboard_type]
+    # Competition rank, as the index gives it: ties share the rank of the first holder
+    ranked = GamificationProfile.objects.annotate(
+        position=Window(Rank(), order_by=[F(field.lstrip('-')).desc() for field in ordering])
+    ).order_by(*ordering, 'user_id').values_list('position', 'user_id')
+    top = list(ranked[:limit])
+    if leaderboard_type == 'xp':
+        above = Q(total_xp__gt=user_profile.total_xp)
+        tied = Q(total_xp=user_profile.total_xp)
+    elif leaderboard_type == 'level':
+        above = Q(current_level__gt=user_profile.current_level) | Q(
+            current_level=user_profile.current_level, total_xp__gt=user_profile.total_xp
+        )
+        tied = Q(current_level=user_profile.current_level, total_xp=user_profile.total_xp)
+    else:  # streak
+        above = Q(current_streak__gt=user_profile.current_streak)
+        tied = Q(current_streak=user_profile.current_streak)
+    user_rank = GamificationProfile.objects.filter(above).count() + 1
+    nearby = []
+    if radius:
+        # 0-based position of the caller in the ordering above, then a window slice around it
+        position = user_rank - 1 + GamificationProfile.objects.filter(tied, user_id__lt=user_profile.user_id).count()
+        nearby = list(ranked[max(position - radius, 0):position + radius + 1])
+    return top, user_rank, nearby
+
+
+def _leaderboard_from_index(leaderboard_type, user, limit, radius):
+    ranked = [(rank, member) for rank, member, _ in rank_index.top(leaderboard_type, limit)]
+    user_rank = rank_index.rank_of(leaderboard_type, user.id)
+    nearby = rank_index.around(leaderboard_type, user.id, radius) if radius else []
+    return ranked, user_rank, [(rank, member) for rank, member, _ in nearby]
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def leaderboard(request):
@@ -161,54 +209,53 @@ def leaderboard(request):
     try:
         leaderboard_type = request.GET.get('type', 'xp')  # xp, level, streak
         limit = int(request.GET.get('limit', 10))
+        radius = min(int(request.GET.get('around', 0)), 50)  # players either side of me
         
-        if leaderboard_type == 'xp':
-            profiles = GamificationProfile.objects.order_by('-total_xp')[:limit]
-        elif leaderboard_type == 'level':
-            profiles = GamificationProfile.objects.order_by('-current_level', '-total_xp')[:limit]
-        elif leaderboard_type == 'streak':
-            profiles = GamificationProfile.objects.order_by('-current_streak')[:limit]
-        else:
+        if leaderboard_type not in LEADERBOARD_ORDERING:
             return Response(
                 {'error': 'Invalid leaderboard type'},
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        leaderboard_data = []
-        for i, profile in enumerate(profiles, 1):
-            leaderboard_data.append({
-                'rank': i,
-                'username': profile.user.username,
-                'level': profile.current_level,
-                'xp': profile.total_xp,
-                'streak': profile.current_streak,
-                'total_workouts': profile.total_workouts,
-                'total_achievements': profile.total_achievements,
-            })
-        
-        # Get user's position
         user_profile = GamificationProfile.objects.get(user=request.user)
-        if leaderboard_type == 'xp':
-            user_rank = GamificationProfile.objects.filter(total_xp__gt=user_profile.total_xp).count() + 1
-        elif leaderboard_type == 'level':
-            user_rank = GamificationProfile.objects.filter(
-                current_level__gt=user_profile.current_level
-            ).count() + 1
-        else:  # streak
-            user_rank = GamificationProfile.objects.filter(
-                current_streak__gt=user_profile.current_streak
-            ).count() + 1
+        try:
+            ranked, user_rank, nearby = _leaderboard_from_index(leaderboard_type, request.user, limit, radius)
+        except Exception as e:
+            logger.error(f"Rank index unavailable, ranking from database: {str(e)}")
+            ranked, user_rank, nearby = _leaderboard_from_database(leaderboard_type, user_profile, limit, radius)
         
-        return Response({
+        # One query for every profile shown, whichever list it appears in
+        user_ids = {member for _, member in ranked} | {member for _, member in nearby}
+        profiles = GamificationProfile.objects.select_related('user').in_bulk(user_ids, field_name='user_id')
+        
+        def rows(positions):
+            return [
+                {
+                    'rank': position,
+                    'username': profile.user.username,
+                    'level': profile.current_level,
+                    'xp': profile.total_xp,
+                    'streak': profile.current_streak,
+                    'total_workouts': profile.total_workouts,
+                    'total_achievements': profile.total_achievements,
+                }
+                for position, profile in ((p, profiles.get(member)) for p, member in positions)
+                if profile is not None
+            ]
+        
+        response_data = {
             'type': leaderboard_type,
-            'leaderboard': leaderboard_data,
+            'leaderboard': rows(ranked),
             'user_rank': user_rank,
             'user_stats': {
                 'level': user_profile.current_level,
                 'xp': user_profile.total_xp,
                 'streak': user_profile.current_streak,
             }
-        })
+        }
+        if radius:
+            response_data['around_me'] = rows(nearby)
+        return Response(response_data)
     
     except Exception as e:
         return Response(
@@ -0,0 +1,348 @@
+"""
+GPS track ingestion and per-session track summaries.
+
+Points arrive as ``gps_point`` WebSocket messages (queued through the same
+write-behind buffer as HR samples, with ``write_gps_rows`` as its writer) or
+as bulk uploads to ``POST /api/v1/sessions/<id>/gps/``. Both paths insert
+into ``tracker_gps_point`` with one ``executemany`` per batch.
+
+``compute_track`` summarizes a whole track at once with NumPy: haversine
+distance over every pair of consecutive points, moving time, per-kilometre pace
+splits and smoothed elevation gain, plus a Douglas-Peucker simplified polyline,
+so map clients download a few hundred points instead of thousands. When a
+session is completed, ``store_track`` keeps that summary in
+``tracker_gps_track`` (migration 0034), where it outlives the raw points that
+``tracker/retention.py`` expires, and the completion hook fills in a blank
+cardio entry's distance. Active sessions are summarized live and not stored.
+"""
+import atexit
+import json
+import logging
+import math
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from .hr_ingest import HRSampleBuffer
+from .minute_buckets import as_aware_utc
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371008.8
+MAX_UPLOAD_POINTS = 10000
+
+DEFAULTS = {
+    'moving_speed_ms': 0.5,       # slower segments count as stopped (GPS drift)
+    'max_gap_s': 30,              # longer gaps between points count as paused
+    'max_accuracy_m': 50,         # points with a worse reported accuracy are ignored
+    'elevation_window': 5,        # points in the altitude moving average
+    'simplify_tolerance_m': 5,
+    'max_polyline_points': 500,   # the tolerance is doubled until the polyline fits
+}
+
+INSERT_SQL = """
+    INSERT INTO tracker_gps_point (user_id, session_id, timestamp, latitude, longitude, altitude, speed, accuracy)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+
+def gps_config():
+    return {**DEFAULTS, **getattr(settings, 'MAR_GPS', {})}
+
+
+# ----------------------------------------------------------------------
+# Ingestion
+# ----------------------------------------------------------------------
+def _optional_float(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def _timestamp(value):
+    """Aware datetime of an epoch-seconds or ISO 8601 timestamp, or None"""
+    if isinstance(value, (int, float)) and math.isfinite(value):
+        try:
+            return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+        except (ValueError, OverflowError, OSError):
+            return None
+    if isinstance(value, str):
+        try:
+            return as_aware_utc(parse_datetime(value))
+        except ValueError:
+            return None
+    return None
+
+
+def to_gps_row(user_id, session_id, point, default_timestamp=None):
+    """
+    Normalise a client GPS point into an insertable row.
+
+    Returns None for points without valid coordinates or timestamp, so one bad
+    fix never fails a whole batch.
+    """
+    if not isinstance(point, dict):
+        return None
+    latitude = _optional_float(point.get('latitude', point.get('lat')))
+    longitude = _optional_float(point.get('longitude', point.get('lng', point.get('lon'))))
+    if latitude is None or longitude is None or abs(latitude) > 90 or abs(longitude) > 180:
+        return None
+    timestamp = _timestamp(point.get('timestamp')) or default_timestamp
+    if timestamp is None:
+        return None
+    return (
+        user_id, session_id, timestamp, round(latitude, 8), round(longitude, 8),
+        _optional_float(point.get('altitude')), _optional_float(point.get('speed')),
+        _optional_float(point.get('accuracy')),
+    )
+
+
+def write_gps_rows(rows):
+    """Insert a batch of (user_id, session_id, timestamp, lat, lon, altitude, speed, accuracy) rows"""
+    adapt = connection.ops.adapt_datetimefield_value
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.executemany(INSERT_SQL, [(row[0], row[1], adapt(row[2]), *row[3:]) for row in rows])
+
+
+_buffer = None
+
+
+def get_gps_buffer():
+    """Return the process-wide GPS write-behind buffer, creating it on first use"""
+    global _buffer
+    if _buffer is None:
+        _buffer = HRSampleBuffer(writer=write_gps_rows)
+        atexit.register(_buffer.flush_sync)
+    return _buffer
+
+
+# ----------------------------------------------------------------------
+# Vectorized track computation
+# ----------------------------------------------------------------------
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Great-circle distances in metres between arrays of points given in degrees"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(a, dtype=float)) for a in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def elevation_gain(altitude, window=DEFAULTS['elevation_window']):
+    """Sum of climbs over a moving average of the altitudes (NaN = unknown), or None"""
+    altitude = np.asarray(altitude, dtype=float)
+    altitude = altitude[~np.isnan(altitude)]
+    if len(altitude) < 2:
+        return None
+    if window > 1 and len(altitude) >= window:
+        altitude = np.convolve(altitude, np.ones(window) / window, mode='valid')
+    return float(np.clip(np.diff(altitude), 0, None).sum())
+
+
+def summarize_track(seconds, latitude, longitude, altitude=None, config=None):
+    """Distance, moving time, pace splits and elevation gain of one time-ordered track"""
+    config = config or gps_config()
+    seconds = np.asarray(seconds, dtype=float)
+    latitude = np.asarray(latitude, dtype=float)
+    longitude = np.asarray(longitude, dtype=float)
+    summary = {
+        'point_count': len(seconds),
+        'distance_m': 0.0,
+        'moving_time_s': 0.0,
+        'elapsed_time_s': float(seconds[-1] - seconds[0]) if len(seconds) else 0.0,
+        'elevation_gain_m': elevation_gain(altitude, config['elevation_window']) if altitude is not None else None,
+        'avg_pace_s_per_km': None,
+        'splits': [],
+    }
+    if len(seconds) < 2:
+        return summary
+
+    dt = np.diff(seconds)
+    d = haversine_m(latitude[:-1], longitude[:-1], latitude[1:], longitude[1:])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = np.where(dt > 0, d / dt, 0.0)
+    moving = (dt > 0) & (dt <= config['max_gap_s']) & (speed >= config['moving_speed_ms'])
+
+    # Cumulative distance and moving time only advance together, so interpolation is unambiguous
+    cum_d = np.concatenate([[0.0], np.cumsum(np.where(moving, d, 0.0))])
+    cum_t = np.concatenate([[0.0], np.cumsum(np.where(moving, dt, 0.0))])
+    distance, moving_time = float(cum_d[-1]), float(cum_t[-1])
+    summary['distance_m'] = distance
+    summary['moving_time_s'] = moving_time
+    if distance > 0:
+        summary['avg_pace_s_per_km'] = moving_time / (distance / 1000.0)
+
+    marks = np.arange(1000.0, distance + 1e-9, 1000.0)
+    times = np.interp(marks, cum_d, cum_t)
+    splits = [
+        {'km': i + 1, 'distance_m': 1000.0, 'seconds': float(s), 'pace_s_per_km': float(s)}
+        for i, s in enumerate(np.diff(np.concatenate([[0.0], times])))
+    ]
+    remainder = distance - 1000.0 * len(marks)
+    if remainder >= 10:
+        rest = moving_time - (float(times[-1]) if len(times) else 0.0)
+        splits.append({'km': len(marks) + 1, 'distance_m': remainder, 'seconds': rest,
+                       'pace_s_per_km': rest / (remainder / 1000.0)})
+    summary['splits'] = splits
+    return summary
+
+
+def douglas_peucker(x, y, tolerance):
+    """Indexes of the points kept by Douglas-Peucker simplification of a planar polyline"""
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n < 3:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        px, py = x[start + 1:end], y[start + 1:end]
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        length2 = dx * dx + dy * dy
+        # Distance to the segment, not the infinite line, so out-and-back routes keep their far end
+        t = np.clip(((px - x[start]) * dx + (py - y[start]) * dy) / length2, 0, 1) if length2 else 0.0
+        distances = np.hypot(px - (x[start] + t * dx), py - (y[start] + t * dy))
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = start + 1 + farthest
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return np.flatnonzero(keep)
+
+
+def simplify_track(latitude, longitude, tolerance_m=None, max_points=None):
+    """Indexes of a simplified track, within tolerance_m metres and at most max_points points"""
+    config = gps_config()
+    tolerance = tolerance_m or config['simplify_tolerance_m']
+    max_points = max_points or config['max_polyline_points']
+    latitude = np.asarray(latitude, dtype=float)
+    longitude = np.asarray(longitude, dtype=float)
+    if not len(latitude):
+        return np.arange(0)
+    # Local equirectangular projection in metres; exact enough at track scale
+    lat0 = np.radians(latitude.mean())
+    x = np.radians(longitude) * np.cos(lat0) * EARTH_RADIUS_M
+    y = np.radians(latitude) * EARTH_RADIUS_M
+    kept = douglas_peucker(x, y, tolerance)
+    while len(kept) > max_points:
+        tolerance *= 2
+        kept = douglas_peucker(x, y, tolerance)
+    return kept
+
+
+def encode_polyline(latitude, longitude, precision=5):
+    """Google encoded polyline string of the points"""
+    factor = 10 ** precision
+    coords = np.column_stack([np.round(np.asarray(latitude, dtype=float) * factor),
+                              np.round(np.asarray(longitude, dtype=float) * factor)]).astype(np.int64)
+    deltas = np.diff(coords, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    chars = []
+    for value in deltas.tolist():
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            chars.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chars.append(chr(value + 63))
+    return ''.join(chars)
+
+
+# ----------------------------------------------------------------------
+# Session tracks
+# ----------------------------------------------------------------------
+def load_points(session_id, max_accuracy_m=None):
+    """(seconds, latitude, longitude, altitude) arrays of a session's usable points, in time order"""
+    max_accuracy_m = max_accuracy_m or gps_config()['max_accuracy_m']
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT timestamp, latitude, longitude, altitude FROM tracker_gps_point
+            WHERE session_id = %s AND (accuracy IS NULL OR accuracy <= %s)
+            ORDER BY timestamp, id
+        """, [session_id, max_accuracy_m])
+        rows = cursor.fetchall()
+    seconds = np.fromiter((as_aware_utc(row[0]).timestamp() for row in rows), dtype=float, count=len(rows))
+    columns = np.array([[float(row[1]), float(row[2]), np.nan if row[3] is None else float(row[3])] for row in rows],
+                       dtype=float).reshape(-1, 3)
+    return seconds, columns[:, 0], columns[:, 1], columns[:, 2]
+
+
+def compute_track(session_id):
+    """A session's track summary and simplified polyline, without storing it; None when it has no points"""
+    seconds, latitude, longitude, altitude = load_points(session_id)
+    if not len(seconds):
+        return None
+    summary = summarize_track(seconds, latitude, longitude, altitude)
+    kept = simplify_track(latitude, longitude)
+    return {**summary, 'polyline': encode_polyline(latitude[kept], longitude[kept]), 'polyline_points': len(kept)}
+
+
+def store_track(session_id, user_id):
+    """Compute and store a session's track summary; returns it, or None when it has no points"""
+    track = compute_track(session_id)
+    if track is None:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO tracker_gps_track
+                (session_id, user_id, point_count, distance_m, moving_time_s, elapsed_time_s,
+                 elevation_gain_m, avg_pace_s_per_km, splits, polyline, polyline_points, updated_at)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (session_id) DO UPDATE SET
+                point_count = excluded.point_count, distance_m = excluded.distance_m,
+                moving_time_s = excluded.moving_time_s, elapsed_time_s = excluded.elapsed_time_s,
+                elevation_gain_m = excluded.elevation_gain_m, avg_pace_s_per_km = excluded.avg_pace_s_per_km,
+                splits = excluded.splits, polyline = excluded.polyline,
+                polyline_points = excluded.polyline_points, updated_at = CURRENT_TIMESTAMP
+        """, [
+            session_id, user_id, track['point_count'], track['distance_m'], track['moving_time_s'],
+            track['elapsed_time_s'], track['elevation_gain_m'], track['avg_pace_s_per_km'],
+            json.dumps(track['splits']), track['polyline'], track['polyline_points'],
+        ])
+    return track
+
+
+def fill_cardio_distance(session_id, distance_m):
+    """Fill in a hand-entered cardio entry left blank, when there is exactly one to attribute it to"""
+    from .models import CardioEntry
+
+    blank = CardioEntry.objects.filter(session_id=session_id, distance_km__isnull=True)
+    if blank.count() == 1:
+        blank.update(distance_km=round(distance_m / 1000.0, 3))
+
+
+def load_track(session_id):
+    """Stored track summary of a session, or None"""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT point_count, distance_m, moving_time_s, elapsed_time_s, elevation_gain_m,
+                   avg_pace_s_per_km, splits, polyline, polyline_points
+            FROM tracker_gps_track WHERE session_id = %s
+        """, [session_id])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    columns = ['point_count', 'distance_m', 'moving_time_s', 'elapsed_time_s', 'elevation_gain_m',
+               'avg_pace_s_per_km', 'splits', 'polyline', 'polyline_points']
+    track = dict(zip(columns, row))
+    track['splits'] = json.loads(track['splits'])
+    return track
+
+
+def session_completed(session_id, user_id):
+    """on_commit hook of a session that just ended; errors are logged, never raised"""
+    try:
+        with transaction.atomic():
+            track = store_track(session_id, user_id)
+            if track is not None:
+                fill_cardio_distance(session_id, track['distance_m'])
+    except Exception as e:
+        logger.error(f"Error computing GPS track for session {session_id}: {str(e)}")
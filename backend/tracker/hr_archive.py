@@ -0,0 +1,246 @@
+"""
+Compressed columnar archive for the HR samples of completed sessions.
+
+Raw samples cost a ``tracker_hr_sample`` row each (plus two index entries).
+``archive_session`` packs all of a session's samples into one
+``tracker_hr_archive`` row (migration 0032) and deletes the raw rows in the
+same transaction. The payload is column-wise: timestamp deltas in milliseconds
+as uint32, followed by bpm deltas as int16, all zlib-compressed. A steady 1 Hz
+recording therefore compresses to well under a byte per sample. The row also
+keeps count/sum/min/max and the time span, so daily aggregates can skip
+sessions that do not overlap the day.
+
+``read_session`` returns NumPy arrays and merges any raw samples that arrived
+after the session was archived. Late samples are folded in the next time the
+session is archived.
+"""
+import struct
+import zlib
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.db import connection, transaction
+
+from .minute_buckets import as_aware_utc
+
+MAGIC = b'HRA1'
+HEADER = struct.Struct('<4sqI')  # magic, first timestamp (epoch ms), sample count
+COMPRESSION_LEVEL = 6
+
+HRSeries = namedtuple('HRSeries', ['timestamps', 'bpm'])
+
+
+def _epoch_ms(value):
+    return int(round(as_aware_utc(value).timestamp() * 1000))
+
+
+def _datetime(epoch_ms):
+    return datetime.fromtimestamp(int(epoch_ms) / 1000.0, tz=dt_timezone.utc)
+
+
+def _db(value):
+    return connection.ops.adapt_datetimefield_value(value)
+
+
+def encode(epoch_ms, bpm):
+    """Payload for samples sorted by time: epoch milliseconds (int64) and bpm arrays"""
+    epoch_ms = np.asarray(epoch_ms, dtype=np.int64)
+    bpm = np.asarray(bpm, dtype=np.int16)
+    if len(epoch_ms) == 0:
+        raise ValueError("Cannot archive an empty series")
+    ts_deltas = np.diff(epoch_ms, prepend=epoch_ms[0])
+    if ts_deltas.min() < 0 or ts_deltas.max() >= 2 ** 32:
+        raise ValueError("Samples must be sorted and less than 49 days apart")
+    body = ts_deltas.astype('<u4').tobytes() + np.diff(bpm, prepend=0).astype('<i2').tobytes()
+    return HEADER.pack(MAGIC, int(epoch_ms[0]), len(epoch_ms)) + zlib.compress(body, COMPRESSION_LEVEL)
+
+
+def decode(payload):
+    """(epoch milliseconds int64, bpm uint8) arrays of an archive payload"""
+    payload = bytes(payload)
+    magic, first, count = HEADER.unpack_from(payload)
+    if magic != MAGIC:
+        raise ValueError("Not an HR archive payload")
+    body = zlib.decompress(payload[HEADER.size:])
+    epoch_ms = first + np.cumsum(np.frombuffer(body, dtype='<u4', count=count).astype(np.int64))
+    bpm = np.cumsum(np.frombuffer(body, dtype='<i2', count=count, offset=4 * count)).astype(np.uint8)
+    return epoch_ms, bpm
+
+
+def _series(epoch_ms, bpm):
+    return HRSeries(np.asarray(epoch_ms, dtype=np.int64).astype('datetime64[ms]'), np.asarray(bpm, dtype=np.uint8))
+
+
+def _raw_samples(cursor, session_id):
+    cursor.execute("""
+        SELECT id, user_id, timestamp, heart_rate FROM tracker_hr_sample
+        WHERE session_id = %s ORDER BY timestamp, id
+    """, [session_id])
+    return cursor.fetchall()
+
+
+def _archived(cursor, session_id):
+    cursor.execute("SELECT payload FROM tracker_hr_archive WHERE session_id = %s", [session_id])
+    row = cursor.fetchone()
+    return decode(row[0]) if row else None
+
+
+def _merge(archived, rows):
+    epoch_ms = np.fromiter((_epoch_ms(row[2]) for row in rows), dtype=np.int64, count=len(rows))
+    bpm = np.fromiter((row[3] for row in rows), dtype=np.int16, count=len(rows))
+    if archived is not None:
+        epoch_ms = np.concatenate([archived[0], epoch_ms])
+        bpm = np.concatenate([archived[1].astype(np.int16), bpm])
+        order = np.argsort(epoch_ms, kind='stable')
+        epoch_ms, bpm = epoch_ms[order], bpm[order]
+    return epoch_ms, bpm
+
+
+def archive_session(session_id):
+    """Move a session's raw samples into its archive row; returns the number of samples moved"""
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            rows = _raw_samples(cursor, session_id)
+            if not rows:
+                return 0
+            epoch_ms, bpm = _merge(_archived(cursor, session_id), rows)
+            payload = encode(epoch_ms, bpm)
+            cursor.execute("""
+                INSERT INTO tracker_hr_archive
+                    (session_id, user_id, start_ts, end_ts, sample_count, min_hr, max_hr, sum_hr, payload)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (session_id) DO UPDATE SET
+                    start_ts = excluded.start_ts, end_ts = excluded.end_ts,
+                    sample_count = excluded.sample_count, min_hr = excluded.min_hr,
+                    max_hr = excluded.max_hr, sum_hr = excluded.sum_hr, payload = excluded.payload
+            """, [
+                session_id, rows[0][1], _db(_datetime(epoch_ms[0])), _db(_datetime(epoch_ms[-1])),
+                len(epoch_ms), int(bpm.min()), int(bpm.max()), int(bpm.sum()), payload,
+            ])
+            # Only the rows packed above; samples arriving meanwhile stay raw until the next run
+            cursor.execute(
+                "DELETE FROM tracker_hr_sample WHERE session_id = %s AND id <= %s",
+                [session_id, max(row[0] for row in rows)],
+            )
+    return len(rows)
+
+
+def read_session(session_id):
+    """HRSeries (datetime64[ms] UTC timestamps, uint8 bpm) of one session, archived and raw samples merged"""
+    with connection.cursor() as cursor:
+        archived = _archived(cursor, session_id)
+        rows = _raw_samples(cursor, session_id)
+    if archived is not None and not rows:
+        return _series(*archived)
+    return _series(*_merge(archived, rows))
+
+
+def archivable_sessions(ended_before, user_ids=None, limit=None):
+    """[(session_id, raw sample count)] of sessions that ended before ``ended_before``, oldest first"""
+    sql = """
+        SELECT w.id, COUNT(s.id) FROM tracker_workoutsession w
+        JOIN tracker_hr_sample s ON s.session_id = w.id
+        WHERE w.end_time IS NOT NULL AND w.end_time < %s
+    """
+    params = [_db(ended_before)]
+    if user_ids:
+        sql += f" AND w.user_id IN ({', '.join(['%s'] * len(user_ids))})"
+        params += list(user_ids)
+    sql += " GROUP BY w.id, w.end_time ORDER BY w.end_time, w.id"
+    if limit:
+        sql += " LIMIT %s"
+        params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def archive_size(session_id):
+    """(sample_count, payload bytes) of a session's archive row, or None"""
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT sample_count, payload FROM tracker_hr_archive WHERE session_id = %s", [session_id])
+        row = cursor.fetchone()
+    return (row[0], len(bytes(row[1]))) if row else None
+
+
+# ----------------------------------------------------------------------
+# Aggregates over archived sessions
+# ----------------------------------------------------------------------
+def _overlapping(user_id, start, end):
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT session_id, start_ts, end_ts, sample_count, min_hr, max_hr, sum_hr, payload
+            FROM tracker_hr_archive
+            WHERE user_id = %s AND start_ts < %s AND end_ts >= %s
+        """, [user_id, _db(end), _db(start)])
+        return cursor.fetchall()
+
+
+def archived_daily_stats(user_id, bounds):
+    """
+    [(count, sum, min, max, session ids)] of archived samples in each of the
+    sorted, disjoint [start, end) ``bounds``, from one read of the archive
+    """
+    stats = [[0, 0, None, None, set()] for _ in bounds]
+    if not bounds:
+        return []
+    starts = np.array([_epoch_ms(start) for start, _ in bounds], dtype=np.int64)
+    ends = np.array([_epoch_ms(end) for _, end in bounds], dtype=np.int64)
+    for session_id, first, last, n, min_hr, max_hr, sum_hr, payload in _overlapping(user_id, bounds[0][0], bounds[-1][1]):
+        first_ms, last_ms = _epoch_ms(first), _epoch_ms(last)
+        # Bounds [lo, hi) that can hold the session's samples
+        lo = int(np.searchsorted(ends, first_ms, side='right'))
+        hi = int(np.searchsorted(starts, last_ms, side='right'))
+        if lo >= hi:
+            continue
+        if hi - lo == 1 and first_ms >= starts[lo] and last_ms < ends[lo]:
+            # Whole session inside one bound: the stored summary is enough
+            parts = [(lo, n, sum_hr, min_hr, max_hr)]
+        else:
+            epoch_ms, bpm = decode(payload)
+            parts = []
+            for index in range(lo, hi):
+                left, right = np.searchsorted(epoch_ms, [starts[index], ends[index]])
+                if right > left:
+                    chunk = bpm[left:right]
+                    parts.append((index, len(chunk), int(chunk.sum(dtype=np.int64)), int(chunk.min()), int(chunk.max())))
+        for index, part_count, part_sum, part_min, part_max in parts:
+            stat = stats[index]
+            stat[0] += part_count
+            stat[1] += part_sum
+            stat[2] = part_min if stat[2] is None else min(stat[2], part_min)
+            stat[3] = part_max if stat[3] is None else max(stat[3], part_max)
+            stat[4].add(int(session_id))
+    return [tuple(stat) for stat in stats]
+
+
+def archived_span(user_id, start=None, end=None):
+    """(first, last) aware timestamps of the user's archived samples, optionally within [start, end)"""
+    sql = "SELECT MIN(start_ts), MAX(end_ts) FROM tracker_hr_archive WHERE user_id = %s"
+    params = [user_id]
+    if start is not None:
+        sql += " AND end_ts >= %s AND start_ts < %s"
+        params += [_db(start), _db(end)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        first, last = cursor.fetchone()
+    if first is None:
+        return None, None
+    first, last = as_aware_utc(first), as_aware_utc(last)
+    if start is not None:
+        first, last = max(first, start), min(last, end)
+    return first, last
+
+
+def archived_samples(user_id, start, end):
+    """[(timestamp, bpm, session_id)] of archived samples in [start, end), for ground-truth checks"""
+    start_ms, end_ms = _epoch_ms(start), _epoch_ms(end)
+    samples = []
+    for session_id, _, _, _, _, _, _, payload in _overlapping(user_id, start, end):
+        epoch_ms, bpm = decode(payload)
+        mask = (epoch_ms >= start_ms) & (epoch_ms < end_ms)
+        samples.extend(
+            (_datetime(ts), int(value), int(session_id)) for ts, value in zip(epoch_ms[mask], bpm[mask])
+        )
+    return samples
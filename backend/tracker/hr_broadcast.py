@@ -0,0 +1,190 @@
+"""
+Coalesced, rate-capped heart-rate broadcasts for workout rooms.
+
+``WorkoutConsumer`` hands every HR sample to the process-wide
+``HRBroadcastScheduler`` instead of broadcasting it. The scheduler folds the
+samples of each (room, athlete) into a running count/sum/max and a background
+task emits at most one ``heart_rate_update`` per athlete and room every
+``interval_ms``, covering exactly the samples received since the previous one
+(latest-value semantics: nothing is sent for a quiet athlete). At 10 Hz input
+and the default 1 Hz output that is a tenth of the channel-layer and client
+traffic, with the average still taken over every sample.
+
+The interval adapts to load: when a tick spends more than ``load_budget`` of
+the interval sending, the interval doubles (up to ``max_interval_ms``), and it
+halves back towards ``interval_ms`` once ticks are cheap again.
+"""
+import asyncio
+import logging
+import time
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from .broadcast import agroup_broadcast
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'interval_ms': 1000,        # at most one aggregate per athlete and room this often
+    'max_interval_ms': 5000,    # upper bound while under load
+    'load_budget': 0.25,        # share of the interval a tick may spend sending before backing off
+    'idle_rooms_s': 60,         # forget a room's sequence after this long without samples
+}
+
+
+async def send_heart_rate(group, message):
+    """Default sender: one pre-serialized frame per room through the channel layer"""
+    channel_layer = get_channel_layer()
+    if channel_layer is not None:
+        await agroup_broadcast(channel_layer, group, 'heart_rate_update', message)
+
+
+class _Room:
+    """Samples of one athlete in one room since the last emission"""
+
+    __slots__ = ('count', 'total', 'max_hr', 'seq', 'last_sample')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max_hr = 0
+        self.seq = 0
+        self.last_sample = 0.0
+
+
+class HRBroadcastScheduler:
+    """Per-process, loop-bound scheduler of coalesced HR room broadcasts"""
+
+    def __init__(self, interval_ms=None, max_interval_ms=None, load_budget=None, idle_rooms_s=None,
+                 sender=None, clock=None):
+        config = {**DEFAULTS, **getattr(settings, 'MAR_HR_BROADCAST', {})}
+        self.interval_ms = interval_ms or config['interval_ms']
+        self.max_interval_ms = max(max_interval_ms or config['max_interval_ms'], self.interval_ms)
+        self.load_budget = load_budget or config['load_budget']
+        self.idle_rooms_s = idle_rooms_s or config['idle_rooms_s']
+        self.sender = sender or send_heart_rate
+        self.clock = clock or time.time
+        self.current_interval_ms = self.interval_ms
+
+        self._rooms = {}
+        self._loop = None
+        self._task = None
+
+        self.counters = {
+            'samples': 0,
+            'broadcasts': 0,
+            'ticks': 0,
+            'send_errors': 0,
+            'last_tick_ms': 0.0,
+            'max_tick_ms': 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # Producer API
+    # ------------------------------------------------------------------
+    def add(self, group, user_id, heart_rate):
+        """Fold one sample into the room's pending aggregate; never blocks or sends"""
+        room = self._rooms.get((group, user_id))
+        if room is None:
+            room = self._rooms[(group, user_id)] = _Room()
+        room.count += 1
+        room.total += heart_rate
+        if heart_rate > room.max_hr:
+            room.max_hr = heart_rate
+        room.last_sample = self.clock()
+        self.counters['samples'] += 1
+        self._ensure_started()
+
+    async def tick(self):
+        """Emit one aggregate for every room that received samples since the last tick"""
+        started = time.perf_counter()
+        now = self.clock()
+        pending = []
+        for key, room in list(self._rooms.items()):
+            if room.count:
+                room.seq += 1
+                pending.append((key[0], {
+                    'type': 'heart_rate_update',
+                    'heart_rate': {
+                        'heart_rate': int(room.total / room.count),
+                        'max_hr': int(room.max_hr),
+                        'samples_count': room.count,
+                        'timestamp': now,
+                    },
+                    'server_seq': room.seq,
+                }))
+                room.count = room.total = room.max_hr = 0
+            elif now - room.last_sample > self.idle_rooms_s:
+                del self._rooms[key]
+
+        if pending:
+            results = await asyncio.gather(
+                *(self.sender(group, message) for group, message in pending), return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    self.counters['send_errors'] += 1
+                    logger.error(f"Error broadcasting heart rate: {result}")
+            self.counters['broadcasts'] += len(pending)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000.0
+        self.counters['ticks'] += 1
+        self.counters['last_tick_ms'] = elapsed_ms
+        if elapsed_ms > self.counters['max_tick_ms']:
+            self.counters['max_tick_ms'] = elapsed_ms
+        self._adapt(elapsed_ms)
+        return len(pending)
+
+    async def close(self):
+        """Stop the background task after emitting what is pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.tick()
+
+    def stats(self):
+        return {
+            **self.counters,
+            'rooms': len(self._rooms),
+            'interval_ms': self.current_interval_ms,
+        }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    def _adapt(self, elapsed_ms):
+        budget_ms = self.current_interval_ms * self.load_budget
+        if elapsed_ms > budget_ms:
+            self.current_interval_ms = min(self.current_interval_ms * 2, self.max_interval_ms)
+        elif elapsed_ms < budget_ms / 4:
+            self.current_interval_ms = max(self.current_interval_ms // 2, self.interval_ms)
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or the previous loop went away (e.g. between tests)
+            self._loop = loop
+            self._task = None
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while self._rooms:
+            await asyncio.sleep(self.current_interval_ms / 1000.0)
+            await self.tick()
+
+
+_scheduler = None
+
+
+def get_hr_broadcaster():
+    """Return the process-wide HR broadcast scheduler, creating it on first use"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = HRBroadcastScheduler()
+    return _scheduler
@@ -0,0 +1,302 @@
+"""
+Write-behind buffer for heart-rate samples streamed over WebSockets.
+
+Every ``WorkoutConsumer`` in the process pushes its samples into one shared
+``HRSampleBuffer``. A background task drains the buffer and writes the rows to
+``tracker_hr_sample`` with a single multi-row ``executemany`` every
+``flush_interval_ms`` milliseconds, or as soon as ``max_batch`` rows are waiting.
+Producers are paused (backpressure) once ``max_pending`` rows are queued.
+
+When ``MAR_FLAGS["live_minute_buckets"]`` is on, every written batch is also
+folded into a ``MinuteBucketAggregator`` and closed minutes are upserted into
+``tracker_minute_hr`` on the same flush tick. Written samples also mark their
+(user, day) row of ``tracker_cardio_load_daily`` dirty; those rows are
+recomputed by ``tracker.aggregates.refresh_hr_dirty`` at most once a minute.
+"""
+import asyncio
+import atexit
+import logging
+import time
+from collections import deque
+from datetime import datetime, timezone as dt_timezone
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import connection, transaction
+
+from .minute_buckets import MinuteBucketAggregator, upsert_minute_rows
+
+logger = logging.getLogger(__name__)
+
+# Matches the CHECK constraint on tracker_hr_sample.heart_rate (migration 0022)
+MIN_BPM = 30
+MAX_BPM = 220
+
+DEFAULTS = {
+    'flush_interval_ms': 250,   # flush at least this often while samples are pending
+    'max_batch': 500,           # rows per executemany
+    'max_pending': 10000,       # producers wait once this many rows are queued
+}
+
+INSERT_SQL = """
+    INSERT INTO tracker_hr_sample (user_id, session_id, timestamp, heart_rate, device_id)
+    VALUES (%s, %s, %s, %s, %s)
+"""
+
+
+def write_hr_rows(rows):
+    """Insert a batch of (user_id, session_id, timestamp, heart_rate, device_id) rows"""
+    adapt = connection.ops.adapt_datetimefield_value
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.executemany(INSERT_SQL, [
+                (user_id, session_id, adapt(ts), bpm, device_id)
+                for user_id, session_id, ts, bpm, device_id in rows
+            ])
+
+
+def to_sample_row(user_id, session_id, heart_rate, timestamp, device_id='websocket'):
+    """
+    Normalise a raw WebSocket sample into an insertable row.
+
+    Returns None when the sample would violate the table constraints, so one bad
+    reading can never fail a whole batch.
+    """
+    try:
+        bpm = int(round(float(heart_rate)))
+    except (TypeError, ValueError, OverflowError):
+        return None
+    if bpm < MIN_BPM or bpm > MAX_BPM:
+        return None
+
+    if isinstance(timestamp, (int, float)):
+        try:
+            dt = datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+        except (ValueError, OverflowError, OSError):
+            # Millisecond epochs and other out-of-range values
+            return None
+    else:
+        dt = datetime.now(tz=dt_timezone.utc)
+
+    return (user_id, session_id, dt, bpm, device_id)
+
+
+class HRSampleBuffer:
+    """Per-process, loop-bound write-behind queue for HR samples"""
+
+    def __init__(self, flush_interval_ms=None, max_batch=None, max_pending=None, writer=None,
+                 aggregator=None, minute_writer=None, track_daily_aggregates=False):
+        config = {**DEFAULTS, **getattr(settings, 'MAR_HR_INGEST', {})}
+        self.flush_interval_ms = flush_interval_ms or config['flush_interval_ms']
+        self.max_batch = max_batch or config['max_batch']
+        self.max_pending = max_pending or config['max_pending']
+        self.writer = writer or write_hr_rows
+        self.aggregator = aggregator
+        self.minute_writer = minute_writer or upsert_minute_rows
+        self.track_daily_aggregates = track_daily_aggregates
+
+        self._pending = deque()
+        self._loop = None
+        self._task = None
+        self._wake = None
+        self._has_space = None
+        self._flush_lock = None
+        self._closed = False
+
+        self.counters = {
+            'enqueued': 0,
+            'rejected': 0,
+            'flushed': 0,
+            'dropped': 0,
+            'flushes': 0,
+            'flush_errors': 0,
+            'backpressure_waits': 0,
+            'max_queue_depth': 0,
+            'last_flush_ms': 0.0,
+            'max_flush_ms': 0.0,
+            'total_flush_ms': 0.0,
+            'minutes_upserted': 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Producer API
+    # ------------------------------------------------------------------
+    async def add(self, row):
+        """Queue one row, waiting for space when the buffer is full"""
+        if row is None:
+            self.counters['rejected'] += 1
+            return False
+
+        self._ensure_started()
+
+        while len(self._pending) >= self.max_pending:
+            self.counters['backpressure_waits'] += 1
+            self._has_space.clear()
+            self._wake.set()
+            await self._has_space.wait()
+
+        self._pending.append(row)
+        self.counters['enqueued'] += 1
+        depth = len(self._pending)
+        if depth > self.counters['max_queue_depth']:
+            self.counters['max_queue_depth'] = depth
+        if depth >= self.max_batch:
+            self._wake.set()
+        return True
+
+    async def flush(self):
+        """Write every pending row now (used on disconnect)"""
+        if not self._pending:
+            return
+        self._bind_loop()
+        async with self._flush_lock:
+            while self._pending:
+                await self._write_batch(self._take_batch())
+
+    async def close(self):
+        """Stop the background task after a final flush"""
+        self._closed = True
+        if self._task is not None:
+            self._wake.set()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        await self._flush_minutes(force=True)
+        await self._refresh_daily_aggregates(force=True)
+
+    def flush_sync(self):
+        """Synchronous last-chance flush for interpreter shutdown"""
+        while self._pending:
+            batch = self._take_batch()
+            try:
+                self.writer(batch)
+                self.counters['flushed'] += len(batch)
+            except Exception as exc:
+                self.counters['dropped'] += len(batch)
+                logger.error(f"Dropped {len(batch)} HR samples at shutdown: {exc}")
+                break
+            if self.aggregator is not None:
+                self.aggregator.add_rows(batch)
+        if self.aggregator is not None:
+            rows = self.aggregator.pop_closed(force=True)
+            if rows:
+                try:
+                    self.minute_writer(rows)
+                    self.counters['minutes_upserted'] += len(rows)
+                except Exception as exc:
+                    logger.error(f"Dropped {len(rows)} HR minute buckets at shutdown: {exc}")
+
+    def stats(self):
+        """Snapshot of queue depth and flush latency counters"""
+        flushes = self.counters['flushes']
+        return {
+            **self.counters,
+            'queue_depth': len(self._pending),
+            'open_minutes': len(self.aggregator) if self.aggregator is not None else 0,
+            'avg_flush_ms': (self.counters['total_flush_ms'] / flushes) if flushes else 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or the previous loop went away (e.g. between tests)
+            self._loop = loop
+            self._wake = asyncio.Event()
+            self._has_space = asyncio.Event()
+            self._has_space.set()
+            self._flush_lock = asyncio.Lock()
+            self._task = None
+        return loop
+
+    def _ensure_started(self):
+        loop = self._bind_loop()
+        if self._task is None or self._task.done():
+            self._closed = False
+            self._task = loop.create_task(self._run())
+
+    def _take_batch(self):
+        size = min(self.max_batch, len(self._pending))
+        return [self._pending.popleft() for _ in range(size)]
+
+    async def _run(self):
+        interval = self.flush_interval_ms / 1000.0
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            async with self._flush_lock:
+                while self._pending:
+                    await self._write_batch(self._take_batch())
+            await self._flush_minutes()
+            await self._refresh_daily_aggregates()
+
+    async def _flush_minutes(self, force=False):
+        if self.aggregator is None:
+            return
+        rows = self.aggregator.pop_closed(force=force)
+        if not rows:
+            return
+        try:
+            await database_sync_to_async(self.minute_writer)(rows)
+            self.counters['minutes_upserted'] += len(rows)
+        except Exception as exc:
+            logger.error(f"Error upserting {len(rows)} HR minute buckets: {exc}")
+
+    async def _refresh_daily_aggregates(self, force=False):
+        if not self.track_daily_aggregates:
+            return
+        from .aggregates import refresh_hr_dirty
+        try:
+            await database_sync_to_async(refresh_hr_dirty)(force=force)
+        except Exception as exc:
+            logger.error(f"Error refreshing daily cardio aggregates: {exc}")
+
+    async def _write_batch(self, batch):
+        if not batch:
+            return
+        started = time.perf_counter()
+        try:
+            await database_sync_to_async(self.writer)(batch)
+            self.counters['flushed'] += len(batch)
+            if self.aggregator is not None:
+                self.aggregator.add_rows(batch)
+            if self.track_daily_aggregates:
+                from .aggregates import mark_hr_rows_dirty
+                mark_hr_rows_dirty(batch)
+        except Exception as exc:
+            # Never let a DB hiccup stall the sockets: count the loss and move on
+            self.counters['flush_errors'] += 1
+            self.counters['dropped'] += len(batch)
+            logger.error(f"Error flushing {len(batch)} HR samples: {exc}")
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000.0
+            self.counters['flushes'] += 1
+            self.counters['last_flush_ms'] = elapsed_ms
+            self.counters['total_flush_ms'] += elapsed_ms
+            if elapsed_ms > self.counters['max_flush_ms']:
+                self.counters['max_flush_ms'] = elapsed_ms
+            if self._has_space is not None and len(self._pending) < self.max_pending:
+                self._has_space.set()
+
+
+_buffer = None
+
+
+def get_hr_buffer():
+    """Return the process-wide HR buffer, creating it on first use"""
+    global _buffer
+    if _buffer is None:
+        aggregator = None
+        if settings.MAR_FLAGS.get("live_minute_buckets", False):
+            aggregator = MinuteBucketAggregator()
+        _buffer = HRSampleBuffer(aggregator=aggregator, track_daily_aggregates=True)
+        atexit.register(_buffer.flush_sync)
+    return _buffer
@@ -0,0 +1,50 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from tracker import hr_archive
+
+
+class Command(BaseCommand):
+    help = 'Pack the raw HR samples of completed sessions into compressed per-session archive rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-days', type=int, default=30,
+                            help='Only sessions that ended more than this many days ago (default 30).')
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only archive this user\'s sessions (repeatable). Defaults to all users.')
+        parser.add_argument('--limit', type=int,
+                            help='Archive at most this many sessions, oldest first.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='List the sessions that would be archived without changing anything.')
+
+    def handle(self, *args, **options):
+        if options['older_than_days'] < 0:
+            raise CommandError('--older-than-days must not be negative')
+        cutoff = timezone.now() - timedelta(days=options['older_than_days'])
+        sessions = hr_archive.archivable_sessions(cutoff, options['users'], options['limit'])
+        pending = sum(count for _, count in sessions)
+
+        if options['dry_run']:
+            for session_id, count in sessions:
+                self.stdout.write(f"session={session_id}: {count} samples")
+            self.stdout.write(self.style.SUCCESS(
+                f"Would archive {len(sessions)} sessions ({pending} samples) ended before {cutoff:%Y-%m-%d}"
+            ))
+            return
+
+        moved = stored = archived_bytes = 0
+        for done, (session_id, _) in enumerate(sessions, start=1):
+            moved += hr_archive.archive_session(session_id)
+            count, size = hr_archive.archive_size(session_id)
+            stored += count
+            archived_bytes += size
+            if done % 100 == 0 or done == len(sessions):
+                self.stdout.write(f"{done}/{len(sessions)} sessions, {moved}/{pending} samples")
+
+        per_sample = archived_bytes / stored if stored else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {moved} samples from {len(sessions)} sessions into {archived_bytes} bytes "
+            f"({per_sample:.2f} bytes/sample)"
+        ))
@@ -0,0 +1,77 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from tracker import session_hr
+from tracker.models import WorkoutSession
+
+logger = logging.getLogger(__name__)
+
+
+def _process_chunk(sessions):
+    """Worker body: analyze a chunk of (id, user_id, start_time) sessions; returns (stored, failed)"""
+    stored = failed = 0
+    try:
+        for session_id, user_id, start_time in sessions:
+            try:
+                if session_hr.store_session(session_id, user_id, start_time) is not None:
+                    stored += 1
+            except Exception as e:
+                failed += 1
+                logger.error(f"Error computing HR analytics for session {session_id}: {str(e)}")
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connection.close()
+    return stored, failed
+
+
+class Command(BaseCommand):
+    help = 'Compute per-session HR analytics (TRIMP, zone time, drift) for completed sessions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only process this user id (repeatable). Defaults to all users.')
+        parser.add_argument('--all', action='store_true',
+                            help='Recompute sessions that already have analytics.')
+        parser.add_argument('--chunk-size', type=int, default=50,
+                            help='Sessions per work item (default 50).')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Parallel worker threads (default 4, 1 runs inline).')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1 or options['workers'] < 1:
+            raise CommandError('--chunk-size and --workers must be positive')
+        sessions = WorkoutSession.objects.filter(end_time__isnull=False).order_by('id')
+        if options['users']:
+            sessions = sessions.filter(user_id__in=options['users'])
+        if not options['all']:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT session_id FROM tracker_session_hr")
+                done = {row[0] for row in cursor.fetchall()}
+            sessions = [row for row in sessions.values_list('id', 'user_id', 'start_time') if row[0] not in done]
+        else:
+            sessions = list(sessions.values_list('id', 'user_id', 'start_time'))
+
+        size = options['chunk_size']
+        chunks = [sessions[i:i + size] for i in range(0, len(sessions), size)]
+        if options['workers'] == 1:
+            self._report((_process_chunk(chunk) for chunk in chunks), chunks, len(sessions))
+            return
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='mar-session-hr') as pool:
+            futures = [pool.submit(_process_chunk, chunk) for chunk in chunks]
+            self._report((future.result() for future in as_completed(futures)), chunks, len(sessions))
+
+    def _report(self, results, chunks, total):
+        stored = failed = 0
+        for done, (chunk_stored, chunk_failed) in enumerate(results, start=1):
+            stored += chunk_stored
+            failed += chunk_failed
+            self.stdout.write(f"{done}/{len(chunks)} chunks, {stored} sessions stored")
+        message = f"Stored HR analytics for {stored} of {total} sessions"
+        if failed:
+            self.stdout.write(self.style.WARNING(f"{message}; {failed} failed"))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
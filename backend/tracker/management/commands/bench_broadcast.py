@@ -0,0 +1,92 @@
+import asyncio
+import json
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from tracker.broadcast import agroup_broadcast
+from tracker.consumers import WorkoutConsumer
+
+GROUP = 'workout_bench'
+
+
+def _heart_rate_message(seq):
+    return {
+        'type': 'heart_rate_update',
+        'heart_rate': {'heart_rate': 142, 'max_hr': 151, 'samples_count': 4, 'timestamp': time.time()},
+        'server_seq': seq,
+    }
+
+
+class _Receiver(WorkoutConsumer):
+    """Workout consumer whose socket discards frames"""
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        pass
+
+    async def legacy_heart_rate_update(self, event):
+        # What every consumer did before: rebuild the client dict and serialize it itself
+        await self.send(text_data=json.dumps({
+            'type': 'heart_rate_update',
+            'heart_rate': event['heart_rate'],
+            'server_seq': event.get('server_seq', 0)
+        }))
+
+
+class Command(BaseCommand):
+    help = 'Measure CPU time per workout-room broadcast against room size, per-receiver vs pre-serialized frames.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1,10,50,200',
+                            help='Comma-separated room sizes (default 1,10,50,200).')
+        parser.add_argument('--broadcasts', type=int, default=200,
+                            help='Broadcasts measured per room size (default 200).')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        self.stdout.write('CPU microseconds per broadcast: end to end (layer + handlers) and in the receiving handlers')
+        self.stdout.write(f"{'room':>6} {'per-receiver':>13} {'frame':>9} {'handlers':>9} {'frame':>9} {'speedup':>8}")
+        for size in sizes:
+            (legacy, legacy_handlers), (framed, framed_handlers) = asyncio.run(
+                self._measure(size, options['broadcasts'])
+            )
+            self.stdout.write(
+                f"{size:>6} {legacy:>13.1f} {framed:>9.1f} {legacy_handlers:>9.1f} {framed_handlers:>9.1f} "
+                f"{legacy_handlers / framed_handlers:>7.1f}x"
+            )
+
+    async def _measure(self, size, broadcasts):
+        layer = InMemoryChannelLayer(capacity=broadcasts + 1)
+        receivers = []
+        for _ in range(size):
+            receiver = _Receiver()
+            receiver.channel_name = await layer.new_channel()
+            await layer.group_add(GROUP, receiver.channel_name)
+            receivers.append(receiver)
+
+        async def run(send, handler_name, count):
+            total = handlers = 0.0
+            for seq in range(count):
+                started = time.process_time()
+                await send(seq)
+                events = [await layer.receive(receiver.channel_name) for receiver in receivers]
+                handled = time.process_time()
+                for receiver, event in zip(receivers, events):
+                    await getattr(receiver, handler_name)(event)
+                finished = time.process_time()
+                total += finished - started
+                handlers += finished - handled
+            return total / count * 1e6, handlers / count * 1e6
+
+        async def legacy(seq):
+            await layer.group_send(GROUP, _heart_rate_message(seq))
+
+        async def framed(seq):
+            await agroup_broadcast(layer, GROUP, 'heart_rate_update', _heart_rate_message(seq))
+
+        results = []
+        for send, handler_name in ((legacy, 'legacy_heart_rate_update'), (framed, 'heart_rate_update')):
+            await run(send, handler_name, 1)  # warm-up
+            results.append(await run(send, handler_name, broadcasts))
+        return results
@@ -0,0 +1,55 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from tracker import metrics
+
+# (name, scalar function, array function, argument generator)
+FUNCTIONS = [
+    ('epley_e1rm', metrics.epley_e1rm, metrics.epley_e1rm_array, 'sets'),
+    ('brzycki_e1rm', metrics.brzycki_e1rm, metrics.brzycki_e1rm_array, 'sets'),
+    ('coarse_trimp', metrics.coarse_trimp, metrics.coarse_trimp_array, 'heart_rates'),
+]
+
+
+def _inputs(kind, size, rng):
+    if kind == 'sets':
+        # Mostly ordinary sets plus the edge cases the masks handle
+        weights = np.round(rng.uniform(-5, 200, size), 1)
+        reps = rng.integers(-1, 36, size).astype(float)
+        return weights, reps
+    return rng.integers(40, 210, size).astype(float), np.full(size, 30.0)
+
+
+class Command(BaseCommand):
+    help = 'Measure per-item cost of the scalar metric functions against their array variants.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='100000,1000000,10000000',
+                            help='Comma-separated input sizes (default 100000,1000000,10000000).')
+        parser.add_argument('--scalar-max', type=int, default=1000000,
+                            help='Largest size also timed with the scalar loop (default 1000000).')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        rng = np.random.default_rng(0)
+        self.stdout.write('Nanoseconds per item: Python loop over the scalar function vs one array call')
+        self.stdout.write(f"{'function':<14} {'items':>10} {'scalar':>9} {'array':>8} {'speedup':>8}")
+        for name, scalar, array, kind in FUNCTIONS:
+            for size in sizes:
+                a, b = _inputs(kind, size, rng)
+                started = time.perf_counter()
+                array(a, b)
+                array_ns = (time.perf_counter() - started) / size * 1e9
+
+                if size <= options['scalar_max']:
+                    values_a, values_b = a.tolist(), b.tolist()
+                    started = time.perf_counter()
+                    [scalar(x, y) for x, y in zip(values_a, values_b)]
+                    scalar_ns = (time.perf_counter() - started) / size * 1e9
+                    self.stdout.write(
+                        f"{name:<14} {size:>10} {scalar_ns:>9.1f} {array_ns:>8.2f} {scalar_ns / array_ns:>7.0f}x"
+                    )
+                else:
+                    self.stdout.write(f"{name:<14} {size:>10} {'-':>9} {array_ns:>8.2f} {'-':>8}")
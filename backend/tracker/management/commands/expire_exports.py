@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from tracker.export_jobs import expire_artifacts
+
+
+class Command(BaseCommand):
+    help = 'Expire finished export jobs past MAR_EXPORTS["artifact_ttl_s"] and delete their artifacts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be expired without changing anything.')
+
+    def handle(self, *args, **options):
+        jobs, files = expire_artifacts(dry_run=options['dry_run'])
+        prefix = 'Dry run' if options['dry_run'] else 'Export cleanup complete'
+        self.stdout.write(self.style.SUCCESS(f"{prefix}: jobs_expired={jobs}, files_deleted={files}"))
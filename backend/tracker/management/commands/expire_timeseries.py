@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tracker.retention import RetentionRun
+
+
+class Command(BaseCommand):
+    help = 'Apply the time-series retention policy: archive, roll up and delete expired raw samples.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only process this user id (repeatable). Defaults to all users.')
+        parser.add_argument('--hr-raw-days', type=int,
+                            help='Days of raw HR samples to keep (default MAR_RETENTION["hr_raw_days"]).')
+        parser.add_argument('--gps-raw-days', type=int,
+                            help='Days of raw GPS points to keep (default MAR_RETENTION["gps_raw_days"]).')
+        parser.add_argument('--minute-days', type=int,
+                            help='Days of minute HR rows to keep (default MAR_RETENTION["minute_days"]).')
+        parser.add_argument('--batch-size', type=int,
+                            help='Rows deleted per transaction (default MAR_RETENTION["batch_size"]).')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be archived and deleted without changing anything.')
+
+    def handle(self, *args, **options):
+        try:
+            run = RetentionRun(
+                dry_run=options['dry_run'],
+                progress=self.stdout.write,
+                hr_raw_days=options['hr_raw_days'],
+                gps_raw_days=options['gps_raw_days'],
+                minute_days=options['minute_days'],
+                batch_size=options['batch_size'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        report = run.run(options['users'])
+        summary = ', '.join(f"{name}={count}" for name, count in report.items())
+        prefix = 'Dry run' if options['dry_run'] else 'Retention complete'
+        self.stdout.write(self.style.SUCCESS(f"{prefix}: {summary}"))
@@ -0,0 +1,24 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from tracker import pr_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the personal-record index from the stored strength sets (users are otherwise indexed on their first write or read).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only rebuild this user\'s records (repeatable). Defaults to all users.')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['users']:
+            users = users.filter(id__in=options['users'])
+
+        rebuilt = rows = 0
+        for user_id in users.values_list('id', flat=True).iterator():
+            rows += pr_index.refresh_user(user_id)
+            rebuilt += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt personal records of {rebuilt} users ({rows} index rows)"))
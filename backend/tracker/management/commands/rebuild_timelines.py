@@ -0,0 +1,37 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tracker import timeline
+from tracker.models import Activity
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized activity timelines and activity counters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only rebuild this user\'s timeline (repeatable). Defaults to all users.')
+        parser.add_argument('--limit', type=int, default=timeline.BACKFILL_ACTIVITIES,
+                            help=f'Activities kept per followed author (default {timeline.BACKFILL_ACTIVITIES}).')
+        parser.add_argument('--counts', action='store_true',
+                            help='Also recount likes and comments for every activity.')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['users']:
+            users = users.filter(id__in=options['users'])
+
+        rebuilt = 0
+        for user_id in users.values_list('id', flat=True).iterator():
+            with transaction.atomic():
+                timeline.rebuild_timeline(user_id, options['limit'])
+            rebuilt += 1
+
+        recounted = 0
+        if options['counts']:
+            for activity_id in Activity.objects.order_by('id').values_list('id', flat=True).iterator():
+                timeline.refresh_counts(activity_id)
+                recounted += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} timelines, recounted {recounted} activities"))
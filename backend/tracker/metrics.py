@@ -1,8 +1,14 @@
 """
 Fitness metrics calculation utilities
+
+Each scalar function has an ``*_array`` variant taking NumPy arrays or
+sequences (scalars broadcast) and returning an array, for callers that
+score many sets or samples at once.
 """
 import math
 
+import numpy as np
+
 
 def epley_e1rm(weight, reps):
     """
@@ -25,6 +31,24 @@ def epley_e1rm(weight, reps):
     return weight * (1 + reps / 30.0)
 
 
+def epley_e1rm_array(weights, reps):
+    """
+    Epley e1RM of many sets at once
+
+    Args:
+        weights (array-like): Weights lifted in kg
+        reps (array-like): Repetitions performed
+
+    Returns:
+        ndarray: Estimated 1-rep maxes in kg, 0 where weight <= 0 and the
+        weight itself where reps <= 0 (as ``epley_e1rm``)
+    """
+    weights = np.asarray(weights, dtype=float)
+    reps = np.asarray(reps, dtype=float)
+    e1rm = weights * (1 + np.maximum(reps, 0) / 30.0)
+    return np.where(weights <= 0, 0.0, e1rm)
+
+
 def brzycki_e1rm(weight, reps):
     """
     Calculate estimated 1-rep max using Brzycki formula
@@ -49,6 +73,29 @@ def brzycki_e1rm(weight, reps):
     return weight * (36 / (37 - reps))
 
 
+def brzycki_e1rm_array(weights, reps):
+    """
+    Brzycki e1RM of many sets at once
+
+    Args:
+        weights (array-like): Weights lifted in kg
+        reps (array-like): Repetitions performed
+
+    Returns:
+        ndarray: Estimated 1-rep maxes in kg, 0 where weight <= 0, the weight
+        itself where reps <= 1, and NaN from 37 reps where the formula is
+        undefined (NULL in ``aggregates.BRZYCKI_E1RM``)
+    """
+    weights = np.asarray(weights, dtype=float)
+    reps = np.asarray(reps, dtype=float)
+    reps, weights = np.broadcast_arrays(reps, weights)
+    defined = reps < 37
+    e1rm = np.full(weights.shape, np.nan)
+    np.divide(weights * 36.0, 37.0 - reps, out=e1rm, where=defined)
+    e1rm = np.where(reps <= 1, weights, e1rm)
+    return np.where(weights <= 0, 0.0, e1rm)
+
+
 def coarse_trimp(heart_rate, age=30):
     """
     Calculate coarse TRIMP (Training Impulse) based on heart rate zones
@@ -82,6 +129,25 @@ def coarse_trimp(heart_rate, age=30):
         return 5  # VO2 max
 
 
+def coarse_trimp_array(heart_rates, age=30):
+    """
+    Coarse TRIMP zone of many heart rate samples at once
+
+    Args:
+        heart_rates (array-like): Heart rates in BPM
+        age (int or array-like): Athlete's age in years
+
+    Returns:
+        ndarray: TRIMP zones (1-5) as integers, 1 for invalid samples
+    """
+    heart_rates = np.asarray(heart_rates, dtype=float)
+    age = np.asarray(age, dtype=float)
+    max_hr = 220 - age
+    hr_reserve = heart_rates - max_hr * 0.6
+    zone = 1 + sum((hr_reserve > max_hr * bound).astype(np.int8) for bound in (0.0, 0.1, 0.2, 0.3))
+    return np.where((heart_rates <= 0) | (age <= 0), 1, zone).astype(np.int8)
+
+
 def mifflin_st_jeor_bmr(weight_kg, height_cm, age, gender):
     """
     Calculate Basal Metabolic Rate using Mifflin-St Jeor equation
@@ -106,6 +172,28 @@ def mifflin_st_jeor_bmr(weight_kg, height_cm, age, gender):
     return max(0, bmr)
 
 
+def mifflin_st_jeor_bmr_array(weight_kg, height_cm, age, gender):
+    """
+    Mifflin-St Jeor BMR of many people at once
+
+    Args:
+        weight_kg (array-like): Weights in kg
+        height_cm (array-like): Heights in cm
+        age (array-like): Ages in years
+        gender (str or array-like): 'male' or 'female' per person
+
+    Returns:
+        ndarray: BMR in calories per day, 0 for invalid inputs
+    """
+    weight_kg = np.asarray(weight_kg, dtype=float)
+    height_cm = np.asarray(height_cm, dtype=float)
+    age = np.asarray(age, dtype=float)
+    male = np.char.lower(np.asarray(gender, dtype=str)) == 'male'
+    bmr = (10 * weight_kg) + (6.25 * height_cm) - (5 * age) + np.where(male, 5, -161)
+    valid = (weight_kg > 0) & (height_cm > 0) & (age > 0)
+    return np.where(valid, np.maximum(bmr, 0.0), 0.0)
+
+
 def calculate_hrr_zones(resting_hr, max_hr):
     """
     Calculate Heart Rate Reserve zones
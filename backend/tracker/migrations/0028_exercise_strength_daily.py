@@ -0,0 +1,66 @@
+# Generated by Django 5.2.5
+
+from django.db import migrations
+
+
+def create_exercise_strength_daily(apps, schema_editor):
+    """Create the per-(user, exercise, date) strength aggregate table"""
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_exercise_strength_daily (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                exercise_id INTEGER NOT NULL,
+                date DATE NOT NULL,
+                max_weight REAL DEFAULT 0,
+                best_e1rm_epley REAL DEFAULT 0,
+                best_e1rm_brzycki REAL DEFAULT 0,
+                total_volume REAL DEFAULT 0,
+                set_count INTEGER DEFAULT 0,
+                total_reps INTEGER DEFAULT 0,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(user_id, exercise_id, date)
+            )
+        """)
+    else:
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_exercise_strength_daily (
+                id BIGSERIAL PRIMARY KEY,
+                user_id BIGINT NOT NULL,
+                exercise_id BIGINT NOT NULL,
+                date DATE NOT NULL,
+                max_weight REAL DEFAULT 0,
+                best_e1rm_epley REAL DEFAULT 0,
+                best_e1rm_brzycki REAL DEFAULT 0,
+                total_volume REAL DEFAULT 0,
+                set_count INTEGER DEFAULT 0,
+                total_reps INTEGER DEFAULT 0,
+                created_at TIMESTAMPTZ DEFAULT NOW(),
+                updated_at TIMESTAMPTZ DEFAULT NOW(),
+                UNIQUE(user_id, exercise_id, date)
+            )
+        """)
+
+    # The unique constraint doubles as the (user, exercise, date) range-scan index;
+    # this one serves per-day refreshes that touch every exercise of a user
+    schema_editor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_exercise_strength_user_date
+            ON tracker_exercise_strength_daily (user_id, date)
+    """)
+
+
+def drop_exercise_strength_daily(apps, schema_editor):
+    """Drop the per-exercise strength aggregate table"""
+    schema_editor.execute("DROP TABLE IF EXISTS tracker_exercise_strength_daily;")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0027_notificationpreference_pushsubscription_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_exercise_strength_daily, drop_exercise_strength_daily),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.5
+
+from django.db import migrations
+
+
+def create_export_jobs(apps, schema_editor):
+    """Create the background export job table"""
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_export_job (
+                id VARCHAR(32) PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                format VARCHAR(10) NOT NULL,
+                data_type VARCHAR(50) NOT NULL DEFAULT 'all',
+                compress BOOLEAN NOT NULL DEFAULT 0,
+                status VARCHAR(10) NOT NULL DEFAULT 'queued',
+                fingerprint VARCHAR(64) NOT NULL,
+                content_hash VARCHAR(64),
+                file_path VARCHAR(500),
+                total_records INTEGER DEFAULT 0,
+                records_written INTEGER DEFAULT 0,
+                bytes_written BIGINT DEFAULT 0,
+                error TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                finished_at DATETIME
+            )
+        """)
+    else:
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_export_job (
+                id VARCHAR(32) PRIMARY KEY,
+                user_id BIGINT NOT NULL,
+                format VARCHAR(10) NOT NULL,
+                data_type VARCHAR(50) NOT NULL DEFAULT 'all',
+                compress BOOLEAN NOT NULL DEFAULT FALSE,
+                status VARCHAR(10) NOT NULL DEFAULT 'queued',
+                fingerprint VARCHAR(64) NOT NULL,
+                content_hash VARCHAR(64),
+                file_path VARCHAR(500),
+                total_records INTEGER DEFAULT 0,
+                records_written INTEGER DEFAULT 0,
+                bytes_written BIGINT DEFAULT 0,
+                error TEXT,
+                created_at TIMESTAMPTZ DEFAULT NOW(),
+                updated_at TIMESTAMPTZ DEFAULT NOW(),
+                finished_at TIMESTAMPTZ
+            )
+        """)
+
+    # Reuse lookups: latest finished job for the same user and data fingerprint
+    schema_editor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_export_job_user_fingerprint
+            ON tracker_export_job (user_id, fingerprint, status)
+    """)
+
+
+def drop_export_jobs(apps, schema_editor):
+    """Drop the background export job table"""
+    schema_editor.execute("DROP TABLE IF EXISTS tracker_export_job;")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0028_exercise_strength_daily'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_export_jobs, drop_export_jobs),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.5
+
+from django.db import migrations
+
+
+def create_activity_timeline(apps, schema_editor):
+    """Create the materialized per-user activity timeline and activity counters"""
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_activity_timeline (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                owner_id INTEGER NOT NULL,
+                activity_id INTEGER NOT NULL,
+                author_id INTEGER NOT NULL,
+                created_at DATETIME NOT NULL,
+                UNIQUE(owner_id, activity_id)
+            )
+        """)
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_activity_counts (
+                activity_id INTEGER PRIMARY KEY,
+                like_count INTEGER NOT NULL DEFAULT 0,
+                comment_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+    else:
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_activity_timeline (
+                id BIGSERIAL PRIMARY KEY,
+                owner_id BIGINT NOT NULL,
+                activity_id BIGINT NOT NULL,
+                author_id BIGINT NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL,
+                UNIQUE(owner_id, activity_id)
+            )
+        """)
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_activity_counts (
+                activity_id BIGINT PRIMARY KEY,
+                like_count INTEGER NOT NULL DEFAULT 0,
+                comment_count INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+
+    # Feed pages: keyset range scan per owner, newest first
+    schema_editor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_activity_timeline_owner_keyset
+            ON tracker_activity_timeline (owner_id, created_at DESC, activity_id DESC)
+    """)
+    # Re-materializing or deleting one activity
+    schema_editor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_activity_timeline_activity
+            ON tracker_activity_timeline (activity_id)
+    """)
+    # Dropping or rebuilding one author's rows in a follower's timeline
+    schema_editor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_activity_timeline_owner_author
+            ON tracker_activity_timeline (owner_id, author_id)
+    """)
+
+
+def drop_activity_timeline(apps, schema_editor):
+    """Drop the activity timeline tables"""
+    schema_editor.execute("DROP TABLE IF EXISTS tracker_activity_timeline;")
+    schema_editor.execute("DROP TABLE IF EXISTS tracker_activity_counts;")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0029_export_jobs'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_activity_timeline, drop_activity_timeline),
+    ]
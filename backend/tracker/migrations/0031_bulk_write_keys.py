@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5
+
+from django.db import migrations
+
+
+def create_bulk_write_keys(apps, schema_editor):
+    """Create the per-item idempotency key table of the bulk write endpoints"""
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_bulk_write_key (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                scope VARCHAR(32) NOT NULL,
+                idempotency_key VARCHAR(64) NOT NULL,
+                object_id INTEGER NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(user_id, scope, idempotency_key)
+            )
+        """)
+    else:
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_bulk_write_key (
+                id BIGSERIAL PRIMARY KEY,
+                user_id BIGINT NOT NULL,
+                scope VARCHAR(32) NOT NULL,
+                idempotency_key VARCHAR(64) NOT NULL,
+                object_id BIGINT NOT NULL,
+                created_at TIMESTAMPTZ DEFAULT NOW(),
+                UNIQUE(user_id, scope, idempotency_key)
+            )
+        """)
+
+    # Pruning old keys
+    schema_editor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_bulk_write_key_created
+            ON tracker_bulk_write_key (created_at)
+    """)
+
+
+def drop_bulk_write_keys(apps, schema_editor):
+    """Drop the bulk write key table"""
+    schema_editor.execute("DROP TABLE IF EXISTS tracker_bulk_write_key;")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0030_activity_timeline'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_bulk_write_keys, drop_bulk_write_keys),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.5
+
+from django.db import migrations
+
+
+def create_hr_archive(apps, schema_editor):
+    """Create the per-session compressed HR archive"""
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_hr_archive (
+                session_id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                start_ts DATETIME NOT NULL,
+                end_ts DATETIME NOT NULL,
+                sample_count INTEGER NOT NULL,
+                min_hr INTEGER NOT NULL,
+                max_hr INTEGER NOT NULL,
+                sum_hr BIGINT NOT NULL,
+                payload BLOB NOT NULL,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    else:
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_hr_archive (
+                session_id BIGINT PRIMARY KEY,
+                user_id BIGINT NOT NULL,
+                start_ts TIMESTAMPTZ NOT NULL,
+                end_ts TIMESTAMPTZ NOT NULL,
+                sample_count INTEGER NOT NULL,
+                min_hr INTEGER NOT NULL,
+                max_hr INTEGER NOT NULL,
+                sum_hr BIGINT NOT NULL,
+                payload BYTEA NOT NULL,
+                created_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        """)
+
+    # Daily cardio aggregates and user-level scans over archived sessions
+    schema_editor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_hr_archive_user_start
+            ON tracker_hr_archive (user_id, start_ts)
+    """)
+
+
+def drop_hr_archive(apps, schema_editor):
+    """Drop the HR archive table"""
+    schema_editor.execute("DROP TABLE IF EXISTS tracker_hr_archive;")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0031_bulk_write_keys'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_hr_archive, drop_hr_archive),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5
+
+from django.db import migrations
+
+
+def create_retention_watermark(apps, schema_editor):
+    """Create the per-user record of how far raw time series have been expired"""
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_retention_watermark (
+                series VARCHAR(32) NOT NULL,
+                user_id INTEGER NOT NULL,
+                expired_before DATETIME NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (series, user_id)
+            )
+        """)
+    else:
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_retention_watermark (
+                series VARCHAR(32) NOT NULL,
+                user_id BIGINT NOT NULL,
+                expired_before TIMESTAMPTZ NOT NULL,
+                updated_at TIMESTAMPTZ DEFAULT NOW(),
+                PRIMARY KEY (series, user_id)
+            )
+        """)
+
+
+def drop_retention_watermark(apps, schema_editor):
+    """Drop the retention watermark table"""
+    schema_editor.execute("DROP TABLE IF EXISTS tracker_retention_watermark;")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0032_hr_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_retention_watermark, drop_retention_watermark),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.5
+
+from django.db import migrations
+
+
+def create_gps_track(apps, schema_editor):
+    """Create the per-session GPS track summary with its simplified polyline"""
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_gps_track (
+                session_id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                point_count INTEGER NOT NULL,
+                distance_m REAL NOT NULL,
+                moving_time_s REAL NOT NULL,
+                elapsed_time_s REAL NOT NULL,
+                elevation_gain_m REAL,
+                avg_pace_s_per_km REAL,
+                splits TEXT NOT NULL,
+                polyline TEXT NOT NULL,
+                polyline_points INTEGER NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    else:
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_gps_track (
+                session_id BIGINT PRIMARY KEY,
+                user_id BIGINT NOT NULL,
+                point_count INTEGER NOT NULL,
+                distance_m DOUBLE PRECISION NOT NULL,
+                moving_time_s DOUBLE PRECISION NOT NULL,
+                elapsed_time_s DOUBLE PRECISION NOT NULL,
+                elevation_gain_m DOUBLE PRECISION,
+                avg_pace_s_per_km DOUBLE PRECISION,
+                splits TEXT NOT NULL,
+                polyline TEXT NOT NULL,
+                polyline_points INTEGER NOT NULL,
+                updated_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        """)
+
+    # Per-user track lists
+    schema_editor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_gps_track_user
+            ON tracker_gps_track (user_id)
+    """)
+
+
+def drop_gps_track(apps, schema_editor):
+    """Drop the GPS track summary table"""
+    schema_editor.execute("DROP TABLE IF EXISTS tracker_gps_track;")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0033_retention_watermark'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_gps_track, drop_gps_track),
+    ]
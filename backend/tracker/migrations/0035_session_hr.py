@@ -0,0 +1,67 @@
+# Generated by Django 5.2.5
+
+from django.db import migrations
+
+
+def create_session_hr(apps, schema_editor):
+    """Create the per-session HR analytics table (TRIMP, zone time, drift)"""
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_session_hr (
+                session_id INTEGER PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                session_date DATE NOT NULL,
+                samples INTEGER NOT NULL,
+                duration_s REAL NOT NULL,
+                avg_hr REAL NOT NULL,
+                max_hr INTEGER NOT NULL,
+                banister_trimp REAL NOT NULL,
+                edwards_trimp REAL NOT NULL,
+                zone_seconds TEXT NOT NULL,
+                cardiac_drift_pct REAL,
+                resting_hr INTEGER NOT NULL,
+                hr_max_used INTEGER NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    else:
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_session_hr (
+                session_id BIGINT PRIMARY KEY,
+                user_id BIGINT NOT NULL,
+                session_date DATE NOT NULL,
+                samples INTEGER NOT NULL,
+                duration_s DOUBLE PRECISION NOT NULL,
+                avg_hr DOUBLE PRECISION NOT NULL,
+                max_hr INTEGER NOT NULL,
+                banister_trimp DOUBLE PRECISION NOT NULL,
+                edwards_trimp DOUBLE PRECISION NOT NULL,
+                zone_seconds TEXT NOT NULL,
+                cardiac_drift_pct DOUBLE PRECISION,
+                resting_hr INTEGER NOT NULL,
+                hr_max_used INTEGER NOT NULL,
+                updated_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        """)
+
+    # Daily total_trimp rollups
+    schema_editor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_session_hr_user_date
+            ON tracker_session_hr (user_id, session_date)
+    """)
+
+
+def drop_session_hr(apps, schema_editor):
+    """Drop the session HR analytics table"""
+    schema_editor.execute("DROP TABLE IF EXISTS tracker_session_hr;")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0034_gps_track'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_session_hr, drop_session_hr),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.5
+
+from django.db import migrations
+
+
+def create_pr_index(apps, schema_editor):
+    """Create the personal-record index (best set per user, exercise, record type and rep bucket)"""
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_pr_index (
+                user_id INTEGER NOT NULL,
+                exercise_id INTEGER NOT NULL,
+                record_type VARCHAR(20) NOT NULL,
+                rep_bucket SMALLINT NOT NULL,
+                value REAL NOT NULL,
+                weight_kg REAL,
+                reps INTEGER,
+                set_id INTEGER NOT NULL,
+                session_id INTEGER NOT NULL,
+                achieved_at DATETIME NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id, exercise_id, record_type, rep_bucket)
+            )
+        """)
+    else:
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_pr_index (
+                user_id BIGINT NOT NULL,
+                exercise_id BIGINT NOT NULL,
+                record_type VARCHAR(20) NOT NULL,
+                rep_bucket SMALLINT NOT NULL,
+                value DOUBLE PRECISION NOT NULL,
+                weight_kg DOUBLE PRECISION,
+                reps INTEGER,
+                set_id BIGINT NOT NULL,
+                session_id BIGINT NOT NULL,
+                achieved_at TIMESTAMPTZ NOT NULL,
+                updated_at TIMESTAMPTZ DEFAULT NOW(),
+                PRIMARY KEY (user_id, exercise_id, record_type, rep_bucket)
+            )
+        """)
+
+    # Keys held by a set, looked up when it is edited or deleted
+    schema_editor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_pr_index_set
+            ON tracker_pr_index (set_id)
+    """)
+    # Keys of a session, updated when its start time moves
+    schema_editor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_pr_index_session
+            ON tracker_pr_index (session_id)
+    """)
+
+
+def drop_pr_index(apps, schema_editor):
+    """Drop the personal-record index"""
+    schema_editor.execute("DROP TABLE IF EXISTS tracker_pr_index;")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0035_session_hr'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_pr_index, drop_pr_index),
+    ]
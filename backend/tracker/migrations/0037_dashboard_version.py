@@ -0,0 +1,41 @@
+# Generated by Django 5.2.5
+
+from django.db import migrations
+
+
+def create_dashboard_version(apps, schema_editor):
+    """Create the per-user live dashboard version counter, shared by every worker"""
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_dashboard_version (
+                user_id INTEGER PRIMARY KEY,
+                epoch VARCHAR(32) NOT NULL,
+                version INTEGER NOT NULL,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    else:
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_dashboard_version (
+                user_id BIGINT PRIMARY KEY,
+                epoch VARCHAR(32) NOT NULL,
+                version BIGINT NOT NULL,
+                updated_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        """)
+
+
+def drop_dashboard_version(apps, schema_editor):
+    """Drop the dashboard version counter"""
+    schema_editor.execute("DROP TABLE IF EXISTS tracker_dashboard_version;")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0036_pr_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_dashboard_version, drop_dashboard_version),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5
+
+from django.db import migrations
+
+
+def add_hr_session_ids(apps, schema_editor):
+    """Keep each cardio day's HR session ids, so frozen days can still count cardio entries"""
+    schema_editor.execute("ALTER TABLE tracker_cardio_load_daily ADD COLUMN hr_session_ids TEXT")
+
+
+def drop_hr_session_ids(apps, schema_editor):
+    schema_editor.execute("ALTER TABLE tracker_cardio_load_daily DROP COLUMN hr_session_ids")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0037_dashboard_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_hr_session_ids, drop_hr_session_ids),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.5
+
+from django.db import migrations
+
+
+def create_pr_index_user(apps, schema_editor):
+    """Create the marker of users whose sets are fully in tracker_pr_index"""
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_pr_index_user (
+                user_id INTEGER PRIMARY KEY,
+                indexed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    else:
+        schema_editor.execute("""
+            CREATE TABLE IF NOT EXISTS tracker_pr_index_user (
+                user_id BIGINT PRIMARY KEY,
+                indexed_at TIMESTAMPTZ DEFAULT NOW()
+            )
+        """)
+
+
+def drop_pr_index_user(apps, schema_editor):
+    """Drop the indexed-user marker"""
+    schema_editor.execute("DROP TABLE IF EXISTS tracker_pr_index_user;")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0038_cardio_hr_session_ids'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_pr_index_user, drop_pr_index_user),
+    ]
@@ -0,0 +1,119 @@
+"""
+Live per-minute heart-rate aggregation feeding ``tracker_minute_hr``.
+
+The aggregator keeps a running sum/count per (user, minute) in memory. Once a
+minute is closed it is upserted in bulk, merging with any row already written
+for the same minute (late samples, another worker, a reconnect), so
+minute-resolution charts read one row instead of ~60 raw samples.
+"""
+from datetime import timedelta, datetime, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+# Weighted merge keeps avg_bpm correct when a minute is flushed more than once.
+# ON CONFLICT ... DO UPDATE is understood by both SQLite (>= 3.24) and PostgreSQL.
+UPSERT_SQL = """
+    INSERT INTO tracker_minute_hr (user_id, minute_ts, avg_bpm, samples, updated_at)
+    VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+    ON CONFLICT (user_id, minute_ts) DO UPDATE SET
+        avg_bpm = CAST(ROUND(
+            (tracker_minute_hr.avg_bpm * tracker_minute_hr.samples + excluded.avg_bpm * excluded.samples) * 1.0
+            / (tracker_minute_hr.samples + excluded.samples)
+        ) AS INTEGER),
+        samples = tracker_minute_hr.samples + excluded.samples,
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+
+def upsert_minute_rows(rows):
+    """Upsert a batch of (user_id, minute_ts, avg_bpm, samples) rows"""
+    adapt = connection.ops.adapt_datetimefield_value
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.executemany(UPSERT_SQL, [
+                (user_id, adapt(minute_ts), avg_bpm, samples)
+                for user_id, minute_ts, avg_bpm, samples in rows
+            ])
+
+
+def minute_floor(dt):
+    """Truncate a datetime to the start of its minute"""
+    return dt.replace(second=0, microsecond=0)
+
+
+class MinuteBucketAggregator:
+    """
+    Running sum/count of HR samples per (user, minute).
+
+    A minute is closed when the user has already sent samples for a later
+    minute, or when the wall clock is ``grace_seconds`` past its end.
+    """
+
+    def __init__(self, grace_seconds=5):
+        self.grace = timedelta(seconds=grace_seconds)
+        self._buckets = {}       # (user_id, minute_ts) -> [bpm_sum, samples]
+        self._latest = {}        # user_id -> newest minute_ts seen
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def add(self, user_id, timestamp, heart_rate):
+        """Fold one sample into its minute bucket"""
+        minute = minute_floor(timestamp)
+        bucket = self._buckets.get((user_id, minute))
+        if bucket is None:
+            self._buckets[(user_id, minute)] = [heart_rate, 1]
+        else:
+            bucket[0] += heart_rate
+            bucket[1] += 1
+        latest = self._latest.get(user_id)
+        if latest is None or minute > latest:
+            self._latest[user_id] = minute
+
+    def add_rows(self, rows):
+        """Fold rows shaped like ``hr_ingest.to_sample_row`` output"""
+        for user_id, _session_id, timestamp, heart_rate, _device_id in rows:
+            self.add(user_id, timestamp, heart_rate)
+
+    def pop_closed(self, now=None, force=False):
+        """Remove and return closed minutes as (user_id, minute_ts, avg_bpm, samples) rows"""
+        now = now or datetime.now(tz=dt_timezone.utc)
+        cutoff = now - self.grace - timedelta(minutes=1)
+        closed = []
+        for key, (bpm_sum, samples) in list(self._buckets.items()):
+            user_id, minute = key
+            if force or minute < self._latest[user_id] or minute <= cutoff:
+                closed.append((user_id, minute, int(round(bpm_sum / samples)), samples))
+                del self._buckets[key]
+
+        # Forget users with nothing left in flight
+        open_users = {user_id for user_id, _ in self._buckets}
+        for user_id in list(self._latest):
+            if user_id not in open_users:
+                del self._latest[user_id]
+
+        closed.sort(key=lambda row: (row[0], row[1]))
+        return closed
+
+
+def fetch_minute_series(user_id, start, end):
+    """Read pre-aggregated minutes for a user in [start, end) with one index range scan"""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT minute_ts, avg_bpm, samples
+            FROM tracker_minute_hr
+            WHERE user_id = %s AND minute_ts >= %s AND minute_ts < %s
+            ORDER BY minute_ts ASC
+        """, [user_id, connection.ops.adapt_datetimefield_value(start),
+              connection.ops.adapt_datetimefield_value(end)])
+        return [(as_aware_utc(row[0]), row[1], row[2]) for row in cursor.fetchall()]
+
+
+def as_aware_utc(value):
+    """Normalise a raw-cursor timestamp (SQLite returns naive UTC or text) to an aware datetime"""
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if value is not None and value.tzinfo is None:
+        value = value.replace(tzinfo=dt_timezone.utc)
+    return value
@@ -0,0 +1,356 @@
+"""
+Personal-record index: a user's best set per exercise, record type and rep bucket.
+
+``tracker_pr_index`` (migration 0036) holds one row per key
+(user, exercise, record type, rep bucket): the record value and the set that
+holds it. Record types follow ``PersonalRecord.record_type``:
+
+* ``max_weight``: heaviest set, over all reps (``ALL_REPS``) and per rep
+  bucket (1, 2-3, 4-6, 7-10 and 11+ reps, keyed by their lower bound);
+* ``one_rm``: best Epley e1RM;
+* ``max_volume``: best weight x reps of a single set;
+* ``max_reps``: most reps in a set.
+
+The StrengthSet signal handlers keep the index current inside the writer's
+transaction. A new set costs one upsert per key it competes for (at most
+five), guarded so only a better value, or an equal one achieved earlier,
+replaces the row. Editing or deleting a set rebuilds only the keys it held,
+from the user's sets of that exercise; deleting a session rebuilds the keys
+its sets held once, after the cascade (``session_deleting`` /
+``session_deleted``). Bulk writes skip the signals and call ``sets_written``
+with the same per-set work for the whole batch.
+
+Sets that predate the index are indexed before the user's first write or
+read: ``ensure_indexed`` rebuilds a user missing from
+``tracker_pr_index_user`` (migration 0039) and records them there. The
+``rebuild_pr_index`` command indexes everyone eagerly and repairs drift.
+
+Reads (``best``, ``records``, ``top``) are primary-key lookups, so callers do
+not scan a user's sets for maxima.
+"""
+import bisect
+from collections import defaultdict
+
+import numpy as np
+from django.db import IntegrityError, connection, transaction
+
+from . import metrics
+from .aggregates import db_datetime
+from .minute_buckets import as_aware_utc
+from .models import StrengthSet, WorkoutSession
+
+MAX_WEIGHT = 'max_weight'
+ONE_RM = 'one_rm'
+MAX_VOLUME = 'max_volume'
+MAX_REPS = 'max_reps'
+RECORD_TYPES = (MAX_WEIGHT, ONE_RM, MAX_VOLUME, MAX_REPS)
+
+ALL_REPS = 0
+# Lower bound of each max_weight rep bucket: 1, 2-3, 4-6, 7-10, 11+
+REP_BUCKETS = (1, 2, 4, 7, 11)
+
+COLUMNS = ['user_id', 'exercise_id', 'record_type', 'rep_bucket', 'value', 'weight_kg', 'reps', 'set_id',
+           'session_id', 'achieved_at']
+
+# Only a better value, or an equal one from an earlier set, takes a key over
+_UPSERT = """
+    INSERT INTO tracker_pr_index
+        (user_id, exercise_id, record_type, rep_bucket, value, weight_kg, reps, set_id, session_id, achieved_at,
+         updated_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+    ON CONFLICT (user_id, exercise_id, record_type, rep_bucket) DO UPDATE SET
+        value = excluded.value, weight_kg = excluded.weight_kg, reps = excluded.reps, set_id = excluded.set_id,
+        session_id = excluded.session_id, achieved_at = excluded.achieved_at, updated_at = CURRENT_TIMESTAMP
+    WHERE excluded.value > tracker_pr_index.value
+        OR (excluded.value = tracker_pr_index.value AND (
+            excluded.achieved_at < tracker_pr_index.achieved_at
+            OR (excluded.achieved_at = tracker_pr_index.achieved_at AND excluded.set_id < tracker_pr_index.set_id)
+        ))
+"""
+
+
+def rep_bucket(reps):
+    """Rep bucket (its lower bound) of a rep count, or None below one rep"""
+    if not reps or reps < 1:
+        return None
+    return REP_BUCKETS[bisect.bisect_right(REP_BUCKETS, reps) - 1]
+
+
+def set_keys(weight_kg, reps):
+    """(record_type, rep_bucket, value) of every key a set competes for; zero values hold no record"""
+    weight, reps = float(weight_kg or 0), max(int(reps or 0), 0)
+    keys = [
+        (MAX_WEIGHT, ALL_REPS, weight),
+        (ONE_RM, ALL_REPS, metrics.epley_e1rm(weight, reps)),
+        (MAX_VOLUME, ALL_REPS, weight * reps),
+        (MAX_REPS, ALL_REPS, float(reps)),
+    ]
+    bucket = rep_bucket(reps)
+    if bucket is not None:
+        keys.append((MAX_WEIGHT, bucket, weight))
+    return [key for key in keys if key[2] > 0]
+
+
+# ----------------------------------------------------------------------
+# Writes
+# ----------------------------------------------------------------------
+def _upsert_rows(set_obj, user_id, start_time):
+    return [
+        (user_id, set_obj.exercise_id, record_type, bucket, value, set_obj.weight_kg, set_obj.reps,
+         set_obj.pk, set_obj.session_id, db_datetime(start_time))
+        for record_type, bucket, value in set_keys(set_obj.weight_kg, set_obj.reps)
+    ]
+
+
+def set_saved(instance, created):
+    """Post-save hook of a StrengthSet: an edited set first gives up the keys it held"""
+    session = instance.session
+    if ensure_indexed(session.user_id):
+        return  # Rebuilt from the stored sets, this one included
+    if not created:
+        rebuild_keys(held_keys(instance.pk))
+    rows = _upsert_rows(instance, session.user_id, session.start_time)
+    if rows:
+        with connection.cursor() as cursor:
+            cursor.executemany(_UPSERT, rows)
+
+
+def sets_written(created, updated):
+    """
+    Bulk counterpart of ``set_saved`` for sets written with bulk_create or
+    bulk_update: the updated sets give up the keys they held, then every set
+    competes for its keys with the guarded upsert. Users indexed for the first
+    time here are rebuilt from the stored sets instead.
+    """
+    sets = list(created) + list(updated)
+    sessions = {
+        session_id: (user_id, start_time)
+        for session_id, user_id, start_time in WorkoutSession.objects.filter(
+            pk__in={set_obj.session_id for set_obj in sets}
+        ).values_list('pk', 'user_id', 'start_time')
+    }
+    rebuilt = {user_id for user_id in {user_id for user_id, _ in sessions.values()} if ensure_indexed(user_id)}
+    sessions = {session_id: key for session_id, key in sessions.items() if key[0] not in rebuilt}
+    updated = [set_obj for set_obj in updated if set_obj.session_id in sessions]
+    if updated:
+        rebuild_keys(held_keys(*(set_obj.pk for set_obj in updated)))
+    rows = [
+        row
+        for set_obj in sets if set_obj.session_id in sessions
+        for row in _upsert_rows(set_obj, *sessions[set_obj.session_id])
+    ]
+    if rows:
+        with connection.cursor() as cursor:
+            cursor.executemany(_UPSERT, rows)
+
+
+def set_deleted(instance):
+    """Post-delete hook of a StrengthSet: rebuild the keys it held, if any"""
+    rebuild_keys(held_keys(instance.pk))
+
+
+def session_deleting(instance):
+    """
+    Pre-delete hook of a WorkoutSession: remember the keys its sets hold, so
+    ``session_deleted`` rebuilds them once instead of once per cascaded set
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT user_id, exercise_id, record_type, rep_bucket FROM tracker_pr_index WHERE session_id = %s",
+            [instance.pk],
+        )
+        instance._pr_index_keys = [tuple(row) for row in cursor.fetchall()]
+
+
+def session_deleted(instance):
+    """Post-delete hook of a WorkoutSession: rebuild the keys its sets held, now that they are gone"""
+    rebuild_keys(getattr(instance, '_pr_index_keys', ()))
+
+
+def session_moved(session_id, start_time):
+    """Keep achieved_at in step when a session's start time changes"""
+    with connection.cursor() as cursor:
+        cursor.execute("UPDATE tracker_pr_index SET achieved_at = %s WHERE session_id = %s",
+                       [db_datetime(start_time), session_id])
+
+
+def held_keys(*set_ids):
+    """(user_id, exercise_id, record_type, rep_bucket) of every key the given sets hold"""
+    if not set_ids:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT user_id, exercise_id, record_type, rep_bucket FROM tracker_pr_index "
+            f"WHERE set_id IN ({', '.join(['%s'] * len(set_ids))})",
+            list(set_ids),
+        )
+        return [tuple(row) for row in cursor.fetchall()]
+
+
+def _first_best(groups, values, candidates):
+    """Index of each group's best value among ``candidates``, the earliest set winning ties"""
+    if not len(candidates):
+        return candidates
+    order = np.lexsort((candidates, -values[candidates], groups[candidates]))
+    ranked = candidates[order]
+    first = np.ones(len(ranked), dtype=bool)
+    first[1:] = groups[ranked][1:] != groups[ranked][:-1]
+    return ranked[first]
+
+
+def compute_rows(user_id, exercise_ids=None, keys=None):
+    """
+    Index rows of a user recomputed from the stored sets.
+
+    ``exercise_ids`` limits the sets read; ``keys`` limits the rows returned
+    to (exercise_id, record_type, rep_bucket) triples.
+    """
+    sets = StrengthSet.objects.filter(session__user_id=user_id)
+    if exercise_ids is not None:
+        sets = sets.filter(exercise_id__in=exercise_ids)
+    # Oldest first, so a later set must be strictly better to take a key (as in _UPSERT)
+    stored = list(sets.order_by('session__start_time', 'id').values_list(
+        'id', 'session_id', 'exercise_id', 'weight_kg', 'reps', 'session__start_time',
+    ))
+    if not stored:
+        return []
+    _, by_exercise = np.unique([row[2] for row in stored], return_inverse=True)
+    weight = np.array([float(row[3] or 0) for row in stored])
+    reps = np.maximum(np.array([int(row[4] or 0) for row in stored]), 0)
+    buckets = np.searchsorted(REP_BUCKETS, reps, side='right') - 1
+    values = {
+        MAX_WEIGHT: weight,
+        ONE_RM: metrics.epley_e1rm_array(weight, reps),
+        MAX_VOLUME: weight * reps,
+        MAX_REPS: reps.astype(float),
+    }
+
+    # (record_type, per-set bucket index or None for ALL_REPS, values, sets competing); zero values hold no record
+    competitions = [(record_type, None, value, np.flatnonzero(value > 0)) for record_type, value in values.items()]
+    competitions.append((MAX_WEIGHT, buckets, weight, np.flatnonzero((weight > 0) & (reps >= 1))))
+    rows = []
+    for record_type, set_buckets, value, candidates in competitions:
+        groups = by_exercise if set_buckets is None else by_exercise * len(REP_BUCKETS) + set_buckets
+        for index in _first_best(groups, value, candidates):
+            bucket = ALL_REPS if set_buckets is None else REP_BUCKETS[set_buckets[index]]
+            set_id, session_id, exercise_id, weight_kg, set_reps, start_time = stored[index]
+            if keys is not None and (exercise_id, record_type, bucket) not in keys:
+                continue
+            rows.append((user_id, exercise_id, record_type, bucket, float(value[index]), weight_kg, set_reps,
+                         set_id, session_id, db_datetime(start_time)))
+    return rows
+
+
+def _insert(cursor, rows):
+    if rows:
+        cursor.executemany(f"""
+            INSERT INTO tracker_pr_index ({', '.join(COLUMNS)}, updated_at)
+            VALUES ({', '.join(['%s'] * len(COLUMNS))}, CURRENT_TIMESTAMP)
+        """, rows)
+
+
+def rebuild_keys(keys):
+    """Recompute the given (user_id, exercise_id, record_type, rep_bucket) keys"""
+    by_user = defaultdict(set)
+    for user_id, exercise_id, record_type, bucket in keys:
+        by_user[user_id].add((exercise_id, record_type, bucket))
+    for user_id, wanted in by_user.items():
+        rows = compute_rows(user_id, {key[0] for key in wanted}, wanted)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany("""
+                DELETE FROM tracker_pr_index
+                WHERE user_id = %s AND exercise_id = %s AND record_type = %s AND rep_bucket = %s
+            """, [(user_id, *key) for key in wanted])
+            _insert(cursor, rows)
+
+
+def refresh_exercises(user_id, exercise_ids=None):
+    """Rebuild every key of a user's exercises (all of them by default); returns the rows written"""
+    if exercise_ids is not None:
+        exercise_ids = sorted(set(exercise_ids) - {None})
+        if not exercise_ids:
+            return 0
+    rows = compute_rows(user_id, exercise_ids)
+    with transaction.atomic(), connection.cursor() as cursor:
+        if exercise_ids is None:
+            cursor.execute("DELETE FROM tracker_pr_index WHERE user_id = %s", [user_id])
+        else:
+            cursor.execute(
+                f"DELETE FROM tracker_pr_index WHERE user_id = %s "
+                f"AND exercise_id IN ({', '.join(['%s'] * len(exercise_ids))})",
+                [user_id, *exercise_ids],
+            )
+        _insert(cursor, rows)
+    return len(rows)
+
+
+def refresh_user(user_id):
+    """Rebuild all of a user's keys and mark the user as fully indexed; returns the rows written"""
+    with transaction.atomic(), connection.cursor() as cursor:
+        written = refresh_exercises(user_id)
+        cursor.execute(
+            "INSERT INTO tracker_pr_index_user (user_id) VALUES (%s) ON CONFLICT (user_id) DO NOTHING", [user_id],
+        )
+    return written
+
+
+# ----------------------------------------------------------------------
+# Reads
+# ----------------------------------------------------------------------
+def ensure_indexed(user_id):
+    """
+    Index every stored set of a user the index has not fully seen (sets that
+    predate it); True if the user was rebuilt just now
+    """
+    if user_id is None:
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM tracker_pr_index_user WHERE user_id = %s", [user_id])
+        if cursor.fetchone() is not None:
+            return False
+    try:
+        refresh_user(user_id)
+    except IntegrityError:
+        # A concurrent writer or reader indexed the same user first
+        return False
+    return True
+
+
+def _fetch(user_id, where, params, suffix=''):
+    """Index rows of one user, indexing the user first if needed"""
+    ensure_indexed(user_id)
+    sql = f"SELECT {', '.join(COLUMNS)} FROM tracker_pr_index WHERE user_id = %s AND {where} {suffix}"
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [user_id, *params])
+        rows = [dict(zip(COLUMNS, row)) for row in cursor.fetchall()]
+    for row in rows:
+        row['achieved_at'] = as_aware_utc(row['achieved_at'])
+    return rows
+
+
+def best(user_id, exercise_id, record_type=MAX_WEIGHT, bucket=ALL_REPS):
+    """The record of one key as a dict, or None"""
+    rows = _fetch(
+        user_id, "exercise_id = %s AND record_type = %s AND rep_bucket = %s", [exercise_id, record_type, bucket],
+    )
+    return rows[0] if rows else None
+
+
+def records(user_id, record_type=MAX_WEIGHT, bucket=ALL_REPS, exercise_ids=None):
+    """{exercise_id: record} of a user for one record type and bucket"""
+    where, params = "record_type = %s AND rep_bucket = %s", [record_type, bucket]
+    if exercise_ids is not None:
+        exercise_ids = sorted(set(exercise_ids) - {None})
+        if not exercise_ids:
+            return {}
+        where += f" AND exercise_id IN ({', '.join(['%s'] * len(exercise_ids))})"
+        params += exercise_ids
+    return {row['exercise_id']: row for row in _fetch(user_id, where, params)}
+
+
+def top(user_id, record_type=MAX_WEIGHT, limit=10, bucket=ALL_REPS):
+    """A user's ``limit`` best records of one type and bucket, best first"""
+    return _fetch(
+        user_id, "record_type = %s AND rep_bucket = %s", [record_type, bucket, limit],
+        "ORDER BY value DESC, achieved_at, exercise_id LIMIT %s",
+    )
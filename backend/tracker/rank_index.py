@@ -0,0 +1,404 @@
+"""
+Rank index for the gamification leaderboards.
+
+Scores for each board ('xp', 'level', 'streak') are kept in a sorted structure
+so top-K, a user's rank and "players around me" are answered in O(log n)
+instead of an ORDER BY over every profile plus a COUNT for the caller.
+
+Two backends share one interface:
+
+- ``memory``: an indexable skip list per board, local to the process. Used in
+  tests and single-process deployments.
+- ``redis``: one sorted set (ZSET) per board, shared by all workers.
+
+The index is kept current by the GamificationProfile signal handlers and is
+lazily loaded from the database (one query per board) the first time a board
+is read after a restart or flush.
+"""
+import logging
+import random
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "backend": "memory",                      # or "redis"
+    "redis_url": "redis://127.0.0.1:6379/0",
+    "key_prefix": "mar:rank",
+}
+
+# Levels dominate XP in the level board; XP only breaks ties within a level
+LEVEL_SCALE = 10 ** 10
+
+
+def _level_score(profile):
+    return profile.current_level * LEVEL_SCALE + profile.total_xp
+
+
+# Board name -> (score of a profile, model fields the score depends on)
+BOARDS = {
+    'xp': (lambda profile: profile.total_xp, ('total_xp',)),
+    'level': (_level_score, ('current_level', 'total_xp')),
+    'streak': (lambda profile: profile.current_streak, ('current_streak',)),
+}
+
+
+def rank_settings():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'MAR_RANK_INDEX', {}))
+    return config
+
+
+# ----------------------------------------------------------------------
+# Indexable skip list
+# ----------------------------------------------------------------------
+class _Node:
+    __slots__ = ('key', 'forward', 'width')
+
+    def __init__(self, key, levels):
+        self.key = key
+        self.forward = [None] * levels
+        self.width = [1] * levels
+
+
+class SkipList:
+    """
+    Sorted keys with O(log n) insert, remove, position lookup and access by
+    position. Each forward link stores how many items it skips, so positions
+    are summed along the search path.
+    """
+
+    MAX_LEVELS = 32
+
+    def __init__(self):
+        self._head = _Node(None, self.MAX_LEVELS)
+        self._levels = 1
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _random_levels(self):
+        levels = 1
+        while levels < self.MAX_LEVELS and random.random() < 0.5:
+            levels += 1
+        return levels
+
+    def _path(self, key):
+        """Last node before ``key`` on each level, and its position"""
+        update = [self._head] * self.MAX_LEVELS
+        positions = [0] * self.MAX_LEVELS
+        node, position = self._head, 0
+        for level in range(self._levels - 1, -1, -1):
+            while node.forward[level] is not None and node.forward[level].key < key:
+                position += node.width[level]
+                node = node.forward[level]
+            update[level] = node
+            positions[level] = position
+        return update, positions
+
+    def insert(self, key):
+        update, positions = self._path(key)
+        levels = self._random_levels()
+        if levels > self._levels:
+            for level in range(self._levels, levels):
+                update[level] = self._head
+                positions[level] = 0
+                self._head.width[level] = self._size + 1
+            self._levels = levels
+
+        node = _Node(key, levels)
+        position = positions[0] + 1
+        for level in range(levels):
+            previous = update[level]
+            node.forward[level] = previous.forward[level]
+            previous.forward[level] = node
+            skipped = position - positions[level]
+            node.width[level] = previous.width[level] - skipped + 1
+            previous.width[level] = skipped
+        for level in range(levels, self._levels):
+            update[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key):
+        update, _ = self._path(key)
+        node = update[0].forward[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        for level in range(self._levels):
+            previous = update[level]
+            if previous.forward[level] is node:
+                previous.width[level] += node.width[level] - 1
+                previous.forward[level] = node.forward[level]
+            else:
+                previous.width[level] -= 1
+        while self._levels > 1 and self._head.forward[self._levels - 1] is None:
+            self._levels -= 1
+        self._size -= 1
+
+    def bisect_left(self, key):
+        """Number of keys strictly less than ``key``"""
+        _, positions = self._path(key)
+        return positions[0]
+
+    def slice(self, start, stop):
+        """Keys at positions [start, stop)"""
+        start, stop = max(start, 0), min(stop, self._size)
+        if start >= stop:
+            return []
+        node, position = self._head, 0
+        for level in range(self._levels - 1, -1, -1):
+            while node.forward[level] is not None and position + node.width[level] <= start:
+                position += node.width[level]
+                node = node.forward[level]
+        keys = []
+        node = node.forward[0]
+        while node is not None and len(keys) < stop - start:
+            keys.append(node.key)
+            node = node.forward[0]
+        return keys
+
+
+# ----------------------------------------------------------------------
+# Backends
+# ----------------------------------------------------------------------
+class MemoryRankIndex:
+    """Per-process rank index; keys are (-score, member) so the best comes first"""
+
+    def __init__(self):
+        self._boards = {}
+        self._loaded = set()
+        self._lock = threading.Lock()
+
+    def _board(self, board):
+        if board not in self._boards:
+            self._boards[board] = (SkipList(), {})
+        return self._boards[board]
+
+    def is_loaded(self, board):
+        return board in self._loaded
+
+    def load(self, board, items):
+        """Replace a board with (member, score) pairs"""
+        entries = SkipList()
+        scores = {}
+        for member, score in items:
+            scores[member] = score
+            entries.insert((-score, member))
+        with self._lock:
+            self._boards[board] = (entries, scores)
+            self._loaded.add(board)
+
+    def update(self, board, member, score):
+        with self._lock:
+            entries, scores = self._board(board)
+            previous = scores.get(member)
+            if previous == score:
+                return
+            if previous is not None:
+                entries.remove((-previous, member))
+            entries.insert((-score, member))
+            scores[member] = score
+
+    def remove(self, board, member):
+        with self._lock:
+            entries, scores = self._board(board)
+            previous = scores.pop(member, None)
+            if previous is not None:
+                entries.remove((-previous, member))
+
+    def score(self, board, member):
+        return self._board(board)[1].get(member)
+
+    def count(self, board):
+        return len(self._board(board)[0])
+
+    def range(self, board, start, stop):
+        """(member, score) at 0-based positions [start, stop), best first"""
+        with self._lock:
+            keys = self._board(board)[0].slice(start, stop)
+        return [(member, -negative) for negative, member in keys]
+
+    def position(self, board, member):
+        """0-based position of a member, or None"""
+        with self._lock:
+            entries, scores = self._board(board)
+            score = scores.get(member)
+            return None if score is None else entries.bisect_left((-score, member))
+
+    def count_above(self, board, score):
+        """Members with a strictly higher score"""
+        with self._lock:
+            # (-score, -inf) sorts before every member holding exactly this score
+            return self._board(board)[0].bisect_left((-score, float('-inf')))
+
+    def clear(self):
+        with self._lock:
+            self._boards.clear()
+            self._loaded.clear()
+
+
+class RedisRankIndex:
+    """Rank index on Redis sorted sets, shared across processes"""
+
+    def __init__(self, client, prefix):
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, board):
+        return f"{self.prefix}:{board}"
+
+    def is_loaded(self, board):
+        return bool(self.client.exists(f"{self._key(board)}:loaded"))
+
+    def load(self, board, items):
+        key = self._key(board)
+        pipe = self.client.pipeline()
+        pipe.delete(key)
+        mapping = {str(member): score for member, score in items}
+        if mapping:
+            pipe.zadd(key, mapping)
+        pipe.set(f"{key}:loaded", 1)
+        pipe.execute()
+
+    def update(self, board, member, score):
+        self.client.zadd(self._key(board), {str(member): score})
+
+    def remove(self, board, member):
+        self.client.zrem(self._key(board), str(member))
+
+    def score(self, board, member):
+        return self.client.zscore(self._key(board), str(member))
+
+    def count(self, board):
+        return self.client.zcard(self._key(board))
+
+    def range(self, board, start, stop):
+        start = max(start, 0)
+        if stop <= start:
+            return []
+        items = self.client.zrevrange(self._key(board), start, stop - 1, withscores=True)
+        return [(int(member), score) for member, score in items]
+
+    def position(self, board, member):
+        return self.client.zrevrank(self._key(board), str(member))
+
+    def count_above(self, board, score):
+        return self.client.zcount(self._key(board), f"({score}", '+inf')
+
+    def clear(self):
+        keys = list(self.client.scan_iter(f"{self.prefix}:*"))
+        if keys:
+            self.client.delete(*keys)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_rank_index():
+    """Process-wide rank index for the configured backend, created on first use"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            config = rank_settings()
+            if config['backend'] == 'redis':
+                import redis
+                _index = RedisRankIndex(redis.Redis.from_url(config['redis_url']), config['key_prefix'])
+            else:
+                _index = MemoryRankIndex()
+        return _index
+
+
+# ----------------------------------------------------------------------
+# Profile integration
+# ----------------------------------------------------------------------
+def ensure_loaded(board, index=None):
+    """Load a board from the database the first time it is read"""
+    from .models import GamificationProfile
+
+    index = index or get_rank_index()
+    if not index.is_loaded(board):
+        score_of, fields = BOARDS[board]
+        profiles = GamificationProfile.objects.only('user_id', *fields).order_by()
+        index.load(board, ((profile.user_id, score_of(profile)) for profile in profiles.iterator()))
+    return index
+
+
+def index_profile(profile, index=None):
+    """Write a profile's current scores to every board"""
+    index = index or get_rank_index()
+    for board, (score_of, _) in BOARDS.items():
+        index.update(board, profile.user_id, score_of(profile))
+
+
+def unindex_profile(user_id, index=None):
+    index = index or get_rank_index()
+    for board in BOARDS:
+        index.remove(board, user_id)
+
+
+def _ranked(index, board, start, items):
+    """
+    (rank, member, score) of consecutive items starting at 0-based ``start``,
+    with the same competition rank as ``rank_of``: ties share the rank of the
+    first member holding the score.
+    """
+    ranked, rank, previous = [], None, None
+    for offset, (member, score) in enumerate(items):
+        if offset == 0 or score != previous:
+            # A window may open inside a tie, so its first rank is counted
+            rank = index.count_above(board, score) + 1 if offset == 0 and start else start + offset + 1
+        ranked.append((rank, member, score))
+        previous = score
+    return ranked
+
+
+def top(board, limit):
+    """(rank, user_id, score) of the best ``limit`` members"""
+    index = ensure_loaded(board)
+    return _ranked(index, board, 0, index.range(board, 0, limit))
+
+
+def rank_of(board, user_id):
+    """
+    1-based competition rank (ties share a rank), or None if the user has no
+    profile on the board.
+    """
+    index = ensure_loaded(board)
+    score = index.score(board, user_id)
+    if score is None:
+        return None
+    return index.count_above(board, score) + 1
+
+
+def around(board, user_id, radius=5):
+    """(rank, user_id, score) of up to ``radius`` members either side of the user"""
+    index = ensure_loaded(board)
+    position = index.position(board, user_id)
+    if position is None:
+        return []
+    start = max(position - radius, 0)
+    return _ranked(index, board, start, index.range(board, start, position + radius + 1))
+
+
+def profile_changed(profile, deleted=False):
+    """Signal entry point: apply a profile write to the index once it commits"""
+    user_id = profile.user_id
+    scores = {board: score_of(profile) for board, (score_of, _) in BOARDS.items()}
+
+    def apply():
+        try:
+            index = get_rank_index()
+            for board, score in scores.items():
+                if deleted:
+                    index.remove(board, user_id)
+                else:
+                    index.update(board, user_id, score)
+        except Exception as e:
+            logger.error(f"Rank index update failed for user {user_id}: {str(e)}")
+
+    transaction.on_commit(apply)
@@ -5,19 +5,20 @@ import math
 from datetime import date, timedelta
 from typing import Dict, List, Any, Optional
 from django.contrib.auth.models import User
-from django.db.models import Avg, Count, Max, Q
+from django.db.models import Q
 from .models import (
-    WorkoutSession, StrengthSet, NutritionLog, BodyMeasurement,
+    WorkoutSession, NutritionLog,
     Goal, ExerciseCatalog, MacroTarget, UserProfile
 )
-from .calculators import FitnessCalculator
+from .snapshot import UserDataSnapshot
 
 
 class SmartRecommendations:
     """AI-powered recommendation engine for workouts and nutrition."""
     
-    def __init__(self, user: Optional[User]):
+    def __init__(self, user: Optional[User], snapshot: Optional[UserDataSnapshot] = None):
         self.user = user
+        self.snapshot = (snapshot or UserDataSnapshot(user)) if user else None
         self.user_profile = self._get_user_profile() if user else None
         self.recent_sessions = self._get_recent_sessions() if user else []
         self.recent_nutrition = self._get_recent_nutrition() if user else []
@@ -31,20 +32,12 @@ class SmartRecommendations:
             return None
     
     def _get_recent_sessions(self, days: int = 30) -> List[WorkoutSession]:
-        """Get recent workout sessions."""
-        cutoff_date = date.today() - timedelta(days=days)
-        return WorkoutSession.objects.filter(
-            user=self.user,
-            start_time__date__gte=cutoff_date
-        ).order_by('-start_time')
+        """Get recent workout sessions, newest first."""
+        return self.snapshot.sessions_between(self.snapshot.end_day - timedelta(days=days), self.snapshot.end_day)
     
     def _get_recent_nutrition(self, days: int = 7) -> List[NutritionLog]:
         """Get recent nutrition logs."""
-        cutoff_date = date.today() - timedelta(days=days)
-        return NutritionLog.objects.filter(
-            user=self.user,
-            date__gte=cutoff_date
-        )
+        return self.snapshot.nutrition_between(self.snapshot.end_day - timedelta(days=days), self.snapshot.end_day)
     
     def _get_current_goals(self) -> List[Goal]:
         """Get active goals."""
@@ -90,18 +83,15 @@ class SmartRecommendations:
         if not self.recent_sessions:
             return self._get_beginner_workout()
         
-        last_workout = self.recent_sessions.first()
+        last_workout = self.recent_sessions[0]
         days_since_last = (date.today() - last_workout.start_time.date()).days
         
-        # Analyze last workout to determine next
-        last_exercises = StrengthSet.objects.filter(session=last_workout)
-        muscle_groups_worked = set()
-        
-        for set_obj in last_exercises:
-            exercise = set_obj.exercise
-            # Get primary muscles for this exercise
-            primary_muscles = exercise.muscles.filter(exercisemuscle__role='primary')
-            muscle_groups_worked.update([m.name for m in primary_muscles])
+        # Analyze last workout to determine next: primary muscles of its exercises, in one query
+        exercise_ids = {set_obj.exercise_id for set_obj in last_workout.strength_sets.all()}
+        muscle_groups_worked = set(ExerciseCatalog.muscles.through.objects.filter(
+            exercise_id__in=exercise_ids,
+            role='primary'
+        ).values_list('muscle__name', flat=True)) if exercise_ids else set()
         
         # Recommend complementary workout
         if 'Chest' in muscle_groups_worked:
@@ -170,10 +160,10 @@ class SmartRecommendations:
         if not self.recent_sessions:
             return {'adjustment': 'start_light', 'reason': 'Begin with moderate intensity'}
         
-        # Analyze recent performance trends
-        recent_sets = StrengthSet.objects.filter(
-            session__in=self.recent_sessions[:7]  # Last 7 sessions
-        ).order_by('session__start_time')
+        # Analyze recent performance trends: sets of the last 7 sessions, oldest first
+        recent_sets = [
+            set_obj for session in reversed(self.recent_sessions[:7]) for set_obj in session.strength_sets.all()
+        ]
         
         if not recent_sets:
             return {'adjustment': 'maintain', 'reason': 'Continue current intensity'}
@@ -224,15 +214,15 @@ class SmartRecommendations:
             return {'rest_needed': False, 'reason': 'No recent workouts'}
         
         # Count workouts in last 7 days
-        week_ago = date.today() - timedelta(days=7)
-        recent_count = self.recent_sessions.filter(start_time__date__gte=week_ago).count()
+        week_ago = self.snapshot.end_day - timedelta(days=7)
+        recent_count = len(self.snapshot.sessions_between(week_ago, self.snapshot.end_day))
         
         if recent_count >= 5:
             return {
                 'rest_needed': True,
                 'reason': 'High workout frequency detected',
                 'suggestion': 'Take 1-2 rest days to allow recovery',
-                'days_since_last': (date.today() - self.recent_sessions.first().start_time.date()).days
+                'days_since_last': (date.today() - self.recent_sessions[0].start_time.date()).days
             }
         elif recent_count == 0:
             return {
@@ -252,15 +242,9 @@ class SmartRecommendations:
         suggestions = []
         
         # Analyze exercise patterns for potential form issues
-        recent_sets = StrengthSet.objects.filter(
-            session__in=self.recent_sessions[:5]
-        ).values('exercise__name').annotate(
-            avg_reps=Avg('reps'),
-            avg_weight=Avg('weight_kg')
-        )
-        
-        for exercise_data in recent_sets:
-            exercise_name = exercise_data['exercise__name']
+        recent_sets = self.snapshot.exercise_stats(5)
+        
+        for exercise_name, exercise_data in recent_sets.items():
             avg_reps = exercise_data['avg_reps']
             avg_weight = exercise_data['avg_weight']
             
@@ -515,10 +499,9 @@ class SmartRecommendations:
         for goal in self.current_goals:
             if goal.goal_type == 'weight_loss':
                 # Check if weight loss is too fast/slow
-                recent_measurements = BodyMeasurement.objects.filter(
-                    user=self.user,
-                    date__gte=date.today() - timedelta(days=30)
-                ).order_by('-date')
+                recent_measurements = self.snapshot.measurements_between(
+                    self.snapshot.end_day - timedelta(days=30), None
+                )
                 
                 if len(recent_measurements) >= 2:
                     weight_change = recent_measurements[0].weight_kg - recent_measurements[-1].weight_kg
@@ -547,17 +530,11 @@ class SmartRecommendations:
         suggestions = []
         
         # Analyze strength progression
-        recent_sets = StrengthSet.objects.filter(
-            session__in=self.recent_sessions[:10]
-        ).values('exercise__name').annotate(
-            max_weight=Max('weight_kg'),
-            avg_reps=Avg('reps')
-        )
+        recent_sets = self.snapshot.exercise_stats(10)
         
         plateau_exercises = []
-        for exercise_data in recent_sets:
+        for exercise_name, exercise_data in recent_sets.items():
             # Check if weight has plateaued (simplified logic)
-            exercise_name = exercise_data['exercise__name']
             max_weight = exercise_data['max_weight']
             avg_reps = exercise_data['avg_reps']
             
@@ -625,7 +602,7 @@ class SmartRecommendations:
         
         # Analyze workout intensity and frequency
         if len(self.recent_sessions) > 4:
-            avg_duration = sum(s.duration_minutes for s in self.recent_sessions[:5]) / 5
+            avg_duration = sum(self._session_minutes(s) for s in self.recent_sessions[:5]) / 5
             
             if avg_duration > 90:
                 suggestions.append({
@@ -655,6 +632,13 @@ class SmartRecommendations:
         
         return suggestions
     
+    @staticmethod
+    def _session_minutes(session: WorkoutSession) -> float:
+        """Session length in minutes (0 while it is still open)."""
+        if not session.start_time or not session.end_time:
+            return 0
+        return (session.end_time - session.start_time).total_seconds() / 60
+    
     def _get_beginner_workout(self) -> Dict[str, Any]:
         """Get a beginner-friendly workout recommendation."""
         return {
@@ -672,8 +656,8 @@ class SmartRecommendations:
     def get_comprehensive_recommendations(self) -> Dict[str, Any]:
         """Get all recommendations in one comprehensive response."""
         # Check if user has any data
-        has_workout_data = self.recent_sessions.exists()
-        has_nutrition_data = self.recent_nutrition.exists()
+        has_workout_data = bool(self.recent_sessions)
+        has_nutrition_data = bool(self.recent_nutrition)
         
         if not has_workout_data and not has_nutrition_data:
             # Return sample recommendations for new users
@@ -0,0 +1,212 @@
+"""
+Tiered retention for the raw time-series tables.
+
+``tracker_hr_sample`` and ``tracker_gps_point`` otherwise grow without bound,
+and so do their ``(user_id, timestamp DESC)`` indexes. The policy (settings
+``MAR_RETENTION``) keeps:
+
+* raw HR samples for ``hr_raw_days``. Older samples of completed sessions are
+  packed into ``tracker_hr_archive`` first (lossless, see ``hr_archive``).
+  The rest are rolled up one local day at a time: minute rows missing from
+  ``tracker_minute_hr`` are filled in, the day's ``tracker_cardio_load_daily``
+  row is refreshed, and the day is frozen by advancing the user's watermark
+  in ``tracker_retention_watermark`` (migration 0033). Only then are the raw
+  rows deleted;
+* minute rows for ``minute_days``; the daily rows are kept forever;
+* raw GPS points for ``gps_raw_days``.
+
+Deletes walk one user's ``(user_id, timestamp)`` index range in chunks of
+``batch_size`` rows, each in its own short transaction, so writers are never
+blocked for long. Cutoffs fall on local day boundaries, so a daily row never
+mixes expired and live samples.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import aggregates, hr_archive
+from .minute_buckets import MinuteBucketAggregator, as_aware_utc
+
+DEFAULTS = {
+    'hr_raw_days': 30,
+    'gps_raw_days': 90,
+    'minute_days': 365,
+    'batch_size': 5000,
+    'archive_sessions': True,
+}
+
+# Minutes already written by the live aggregator are authoritative
+INSERT_MINUTE_SQL = """
+    INSERT INTO tracker_minute_hr (user_id, minute_ts, avg_bpm, samples, updated_at)
+    VALUES (%s, %s, %s, %s, CURRENT_TIMESTAMP)
+    ON CONFLICT (user_id, minute_ts) DO NOTHING
+"""
+
+
+def retention_policy(**overrides):
+    policy = {**DEFAULTS, **getattr(settings, 'MAR_RETENTION', {})}
+    policy.update({name: value for name, value in overrides.items() if value is not None})
+    if policy['minute_days'] < policy['hr_raw_days']:
+        raise ValueError("minute_days must be at least hr_raw_days")
+    if policy['batch_size'] < 1:
+        raise ValueError("batch_size must be positive")
+    return policy
+
+
+def _db(value):
+    return connection.ops.adapt_datetimefield_value(value)
+
+
+def set_expired_before(series, user_id, value):
+    """Advance the user's watermark for ``series``; it never moves backwards"""
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO tracker_retention_watermark (series, user_id, expired_before, updated_at)
+            VALUES (%s, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (series, user_id) DO UPDATE SET
+                expired_before = CASE WHEN excluded.expired_before > tracker_retention_watermark.expired_before
+                                      THEN excluded.expired_before
+                                      ELSE tracker_retention_watermark.expired_before END,
+                updated_at = CURRENT_TIMESTAMP
+        """, [series, user_id, _db(value)])
+
+
+def count_rows(table, column, user_id, end):
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE user_id = %s AND {column} < %s", [user_id, _db(end)])
+        return cursor.fetchone()[0]
+
+
+def delete_chunked(table, column, user_id, end, start=None, batch_size=DEFAULTS['batch_size']):
+    """Delete a user's rows with start <= column < end, at most ~batch_size rows per transaction"""
+    lower = f" AND {column} >= %s" if start is not None else ''
+    bounds = [_db(start)] if start is not None else []
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                # Upper edge of the next chunk, found on the (user_id, timestamp) index
+                cursor.execute(
+                    f"SELECT {column} FROM {table} WHERE user_id = %s{lower} AND {column} < %s "
+                    f"ORDER BY {column} LIMIT 1 OFFSET %s",
+                    [user_id, *bounds, _db(end), batch_size - 1],
+                )
+                row = cursor.fetchone()
+                if row is None:
+                    cursor.execute(f"DELETE FROM {table} WHERE user_id = %s{lower} AND {column} < %s",
+                                   [user_id, *bounds, _db(end)])
+                else:
+                    cursor.execute(f"DELETE FROM {table} WHERE user_id = %s{lower} AND {column} <= %s",
+                                   [user_id, *bounds, _db(as_aware_utc(row[0]))])
+                deleted += cursor.rowcount
+        if row is None:
+            return deleted
+
+
+class RetentionRun:
+    """One pass of the retention policy; ``report`` holds per-tier counts"""
+
+    def __init__(self, now=None, dry_run=False, progress=None, **overrides):
+        self.policy = retention_policy(**overrides)
+        self.dry_run = dry_run
+        self.progress = progress or (lambda message: None)
+        today = timezone.localdate(now or timezone.now())
+        self.hr_cutoff = aggregates.day_bounds(today - timedelta(days=self.policy['hr_raw_days']))[0]
+        self.gps_cutoff = aggregates.day_bounds(today - timedelta(days=self.policy['gps_raw_days']))[0]
+        self.minute_cutoff = aggregates.day_bounds(today - timedelta(days=self.policy['minute_days']))[0]
+        self.report = {
+            'sessions_archived': 0,
+            'hr_days_rolled_up': 0,
+            'minute_rows_filled': 0,
+            'hr_samples_deleted': 0,
+            'minute_rows_deleted': 0,
+            'gps_points_deleted': 0,
+        }
+
+    def run(self, user_ids=None):
+        users = User.objects.order_by('id')
+        if user_ids:
+            users = users.filter(id__in=user_ids)
+        for user_id in users.values_list('id', flat=True).iterator():
+            self.expire_hr(user_id)
+            self.expire_minutes(user_id)
+            self.expire_gps(user_id)
+        return self.report
+
+    def expire_hr(self, user_id):
+        if self.dry_run:
+            sessions = (hr_archive.archivable_sessions(self.hr_cutoff, [user_id])
+                        if self.policy['archive_sessions'] else [])
+            archived = sum(count for _, count in sessions)
+            samples = count_rows('tracker_hr_sample', 'timestamp', user_id, self.hr_cutoff) - archived
+            self.report['sessions_archived'] += len(sessions)
+            self.report['hr_samples_deleted'] += samples
+            if sessions or samples:
+                self.progress(f"user={user_id} hr: would archive {len(sessions)} sessions, "
+                              f"roll up and delete {samples} samples")
+            return
+
+        if self.policy['archive_sessions']:
+            for session_id, _ in hr_archive.archivable_sessions(self.hr_cutoff, [user_id]):
+                hr_archive.archive_session(session_id)
+                self.report['sessions_archived'] += 1
+
+        while True:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT MIN(timestamp) FROM tracker_hr_sample WHERE user_id = %s AND timestamp < %s",
+                    [user_id, _db(self.hr_cutoff)],
+                )
+                first = cursor.fetchone()[0]
+            if first is None:
+                return
+            day = aggregates.local_day(as_aware_utc(first))
+            start, end = aggregates.day_bounds(day)
+            end = min(end, self.hr_cutoff)
+            with transaction.atomic():
+                self.report['minute_rows_filled'] += self._fill_minutes(user_id, start, end)
+                aggregates.refresh_range(aggregates.CARDIO, user_id, day, day)
+                set_expired_before(aggregates.HR_SERIES, user_id, end)
+            deleted = delete_chunked('tracker_hr_sample', 'timestamp', user_id, end, start,
+                                     self.policy['batch_size'])
+            self.report['hr_days_rolled_up'] += 1
+            self.report['hr_samples_deleted'] += deleted
+            self.progress(f"user={user_id} hr {day}: rolled up and deleted {deleted} samples")
+
+    def _fill_minutes(self, user_id, start, end):
+        """Write the minute rows of [start, end) that the live aggregator never wrote"""
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT timestamp, heart_rate FROM tracker_hr_sample
+                WHERE user_id = %s AND timestamp >= %s AND timestamp < %s
+            """, [user_id, _db(start), _db(end)])
+            buckets = MinuteBucketAggregator()
+            for ts, bpm in cursor.fetchall():
+                buckets.add(user_id, as_aware_utc(ts), bpm)
+            rows = buckets.pop_closed(force=True)
+            cursor.executemany(INSERT_MINUTE_SQL, [
+                (row_user, _db(minute_ts), avg_bpm, samples) for row_user, minute_ts, avg_bpm, samples in rows
+            ])
+        return len(rows)
+
+    def expire_minutes(self, user_id):
+        self._expire('minute_rows_deleted', 'tracker_minute_hr', 'minute_ts', user_id, self.minute_cutoff)
+
+    def expire_gps(self, user_id):
+        if self._expire('gps_points_deleted', 'tracker_gps_point', 'timestamp', user_id, self.gps_cutoff):
+            if not self.dry_run:
+                set_expired_before(aggregates.GPS_SERIES, user_id, self.gps_cutoff)
+
+    def _expire(self, counter, table, column, user_id, cutoff):
+        if self.dry_run:
+            count = count_rows(table, column, user_id, cutoff)
+        else:
+            count = delete_chunked(table, column, user_id, cutoff, batch_size=self.policy['batch_size'])
+        if count:
+            self.report[counter] += count
+            verb = 'would delete' if self.dry_run else 'deleted'
+            self.progress(f"user={user_id} {table}: {verb} {count} rows before {cutoff:%Y-%m-%d}")
+        return count
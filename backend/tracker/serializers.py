@@ -37,6 +37,30 @@ class StrengthSetSerializer(serializers.ModelSerializer):
         model = StrengthSet
         fields = '__all__'
 
+class PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Resolves pks from objects a bulk write prefetched in context['prefetched'] instead of one query per item"""
+
+    def to_internal_value(self, data):
+        model = self.get_queryset().model
+        prefetched = self.context.get('prefetched', {}).get(model)
+        if prefetched is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = model._meta.pk.to_python(data)
+        except Exception:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        obj = prefetched.get(pk)
+        if obj is None:
+            self.fail('does_not_exist', pk_value=data)
+        return obj
+
+class BulkStrengthSetSerializer(StrengthSetSerializer):
+    """StrengthSet items of a bulk write; sessions are limited to the ones the view prefetched for the user"""
+    session = PrefetchedPrimaryKeyRelatedField(queryset=WorkoutSession.objects.all())
+    exercise = PrefetchedPrimaryKeyRelatedField(queryset=ExerciseCatalog.objects.all())
+
 class CardioEntrySerializer(serializers.ModelSerializer):
     class Meta:
         model = CardioEntry
@@ -0,0 +1,215 @@
+"""
+Per-session heart-rate analytics: training load, zone time and cardiac drift.
+
+``analyze_hr`` takes a session's whole HR series (see ``hr_archive.read_session``)
+and computes everything in one vectorized pass. Each sample is weighted by the
+time until the next one, capped at ``max_gap_s`` so dropouts do not count as
+effort. From that it derives:
+
+* Banister TRIMP: minutes x HRR fraction x 0.64 e^(k x HRR fraction), with
+  k = 1.92 for men and 1.67 for women;
+* Edwards TRIMP: minutes in the 50/60/70/80/90 %HRmax zones, weighted 1-5;
+* seconds per HRR zone (the bands of ``metrics.calculate_hrr_zones``);
+* time-weighted average and maximum HR;
+* cardiac drift: second-half against first-half average HR, in percent, for
+  sessions of at least ``drift_min_minutes``.
+
+Results are stored in ``tracker_session_hr`` (migration 0035) when a session is
+completed. The sum of the day's Banister TRIMP is written to
+``tracker_cardio_load_daily.total_trimp``. Deleting a session drops its row
+and moving its start to another day moves it, re-rolling the days involved.
+"""
+import json
+import logging
+from datetime import date
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+
+from . import aggregates, hr_archive
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'resting_hr': 60,           # until the profile stores one
+    'max_hr': 190,              # used when the profile has no age (otherwise 220 - age)
+    'trimp_k': 1.92,            # Banister weighting factor (1.67 for women)
+    'max_gap_s': 10,            # longer gaps between samples count as this long
+    'drift_min_minutes': 20,
+}
+
+# Upper HRR fraction of each band in metrics.calculate_hrr_zones
+ZONES = ('recovery', 'aerobic_base', 'aerobic_threshold', 'lactate_threshold', 'vo2_max')
+HRR_BOUNDS = np.array([0.6, 0.7, 0.8, 0.9])
+# Edwards zones in %HRmax; below 50% carries no load
+EDWARDS_BOUNDS = np.array([0.5, 0.6, 0.7, 0.8, 0.9])
+
+
+def analytics_config():
+    return {**DEFAULTS, **getattr(settings, 'MAR_HR_ANALYTICS', {})}
+
+
+def sample_weights(seconds, max_gap_s=DEFAULTS['max_gap_s']):
+    """Seconds each sample stands for: the gap to the next one, capped; the last gets the median gap"""
+    seconds = np.asarray(seconds, dtype=float)
+    if len(seconds) < 2:
+        return np.ones(len(seconds))
+    gaps = np.clip(np.diff(seconds), 0, max_gap_s)
+    positive = gaps[gaps > 0]
+    last = float(np.median(positive)) if len(positive) else 0.0
+    return np.append(gaps, last)
+
+
+def analyze_hr(seconds, bpm, resting_hr, max_hr, trimp_k=None, max_gap_s=None, drift_min_minutes=None):
+    """Session HR metrics of time-ordered (seconds, bpm) arrays, or None for an empty series"""
+    config = analytics_config()
+    trimp_k = trimp_k or config['trimp_k']
+    max_gap_s = max_gap_s or config['max_gap_s']
+    drift_min_minutes = drift_min_minutes or config['drift_min_minutes']
+
+    seconds = np.asarray(seconds, dtype=float)
+    bpm = np.asarray(bpm, dtype=float)
+    if not len(bpm) or max_hr <= resting_hr:
+        return None
+    weights = sample_weights(seconds, max_gap_s)
+    duration = float(weights.sum())
+    minutes = weights / 60.0
+
+    hrr = np.clip((bpm - resting_hr) / (max_hr - resting_hr), 0.0, 1.0)
+    banister = float(np.sum(minutes * hrr * 0.64 * np.exp(trimp_k * hrr)))
+    edwards_zone = np.digitize(bpm / max_hr, EDWARDS_BOUNDS)  # 0 below 50%, 1..5 above
+    edwards = float(np.sum(minutes * edwards_zone))
+    zone_seconds = np.bincount(np.digitize(hrr, HRR_BOUNDS), weights=weights, minlength=len(ZONES))
+
+    avg_hr = float(np.average(bpm, weights=weights)) if duration > 0 else float(bpm.mean())
+    drift = None
+    if duration >= drift_min_minutes * 60:
+        elapsed = np.cumsum(weights) - weights
+        first = elapsed < duration / 2
+        first_avg = np.average(bpm[first], weights=weights[first])
+        second_avg = np.average(bpm[~first], weights=weights[~first])
+        drift = float((second_avg - first_avg) / first_avg * 100.0)
+
+    return {
+        'samples': int(len(bpm)),
+        'duration_s': duration,
+        'avg_hr': avg_hr,
+        'max_hr': int(bpm.max()),
+        'banister_trimp': banister,
+        'edwards_trimp': edwards,
+        'zone_seconds': {name: float(value) for name, value in zip(ZONES, zone_seconds)},
+        'cardiac_drift_pct': drift,
+    }
+
+
+def athlete_hr_limits(user_id):
+    """(resting_hr, max_hr) used for a user's sessions"""
+    from .models import UserProfile
+
+    config = analytics_config()
+    age = UserProfile.objects.filter(user_id=user_id).values_list('age', flat=True).first()
+    max_hr = 220 - age if age and 0 < age < 120 else config['max_hr']
+    return config['resting_hr'], max_hr
+
+
+def store_session(session_id, user_id, start_time):
+    """Analyze and store one session and refresh its day's total_trimp; returns the metrics or None"""
+    series = hr_archive.read_session(session_id)
+    resting_hr, max_hr = athlete_hr_limits(user_id)
+    metrics = analyze_hr(series.timestamps.astype(np.int64) / 1000.0, series.bpm, resting_hr, max_hr)
+    day = aggregates.local_day(start_time)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            if metrics is None:
+                cursor.execute("DELETE FROM tracker_session_hr WHERE session_id = %s", [session_id])
+            else:
+                cursor.execute("""
+                    INSERT INTO tracker_session_hr
+                        (session_id, user_id, session_date, samples, duration_s, avg_hr, max_hr, banister_trimp,
+                         edwards_trimp, zone_seconds, cardiac_drift_pct, resting_hr, hr_max_used, updated_at)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+                    ON CONFLICT (session_id) DO UPDATE SET
+                        user_id = excluded.user_id, session_date = excluded.session_date,
+                        samples = excluded.samples, duration_s = excluded.duration_s, avg_hr = excluded.avg_hr,
+                        max_hr = excluded.max_hr, banister_trimp = excluded.banister_trimp,
+                        edwards_trimp = excluded.edwards_trimp, zone_seconds = excluded.zone_seconds,
+                        cardiac_drift_pct = excluded.cardiac_drift_pct, resting_hr = excluded.resting_hr,
+                        hr_max_used = excluded.hr_max_used, updated_at = CURRENT_TIMESTAMP
+                """, [
+                    session_id, user_id, day, metrics['samples'], metrics['duration_s'], metrics['avg_hr'],
+                    metrics['max_hr'], metrics['banister_trimp'], metrics['edwards_trimp'],
+                    json.dumps(metrics['zone_seconds']), metrics['cardiac_drift_pct'], resting_hr, max_hr,
+                ])
+        roll_up_trimp(user_id, day)
+    return metrics
+
+
+def roll_up_trimp(user_id, day):
+    """Write the day's summed Banister TRIMP into its tracker_cardio_load_daily row"""
+    # The row may not exist yet when the HR refresh has not caught up with the samples
+    aggregates.refresh_range(aggregates.CARDIO, user_id, day, day)
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE tracker_cardio_load_daily SET total_trimp = (
+                SELECT CAST(ROUND(COALESCE(SUM(banister_trimp), 0)) AS INTEGER) FROM tracker_session_hr
+                WHERE user_id = %s AND session_date = %s
+            ), updated_at = CURRENT_TIMESTAMP
+            WHERE user_id = %s AND date = %s
+        """, [user_id, day, user_id, day])
+
+
+def _stored_day(cursor, session_id):
+    """(user_id, session_date) of a stored session, or None"""
+    cursor.execute("SELECT user_id, session_date FROM tracker_session_hr WHERE session_id = %s", [session_id])
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    user_id, day = row
+    return user_id, date.fromisoformat(day) if isinstance(day, str) else day
+
+
+def session_deleted(session_id):
+    """Post-delete hook of a WorkoutSession: drop its analytics and re-roll its day"""
+    with connection.cursor() as cursor:
+        stored = _stored_day(cursor, session_id)
+        if stored is None:
+            return
+        cursor.execute("DELETE FROM tracker_session_hr WHERE session_id = %s", [session_id])
+    roll_up_trimp(*stored)
+
+
+def session_moved(session_id, start_time):
+    """Keep session_date in step when a session's start moves to another day, re-rolling both days"""
+    day = aggregates.local_day(start_time)
+    with connection.cursor() as cursor:
+        stored = _stored_day(cursor, session_id)
+        if stored is None or stored[1] == day:
+            return
+        cursor.execute("UPDATE tracker_session_hr SET session_date = %s, updated_at = CURRENT_TIMESTAMP "
+                       "WHERE session_id = %s", [day, session_id])
+    user_id, previous_day = stored
+    roll_up_trimp(user_id, previous_day)
+    roll_up_trimp(user_id, day)
+
+
+def load_session(session_id):
+    """Stored HR analytics of a session, or None"""
+    columns = ['samples', 'duration_s', 'avg_hr', 'max_hr', 'banister_trimp', 'edwards_trimp', 'zone_seconds',
+               'cardiac_drift_pct', 'resting_hr', 'hr_max_used']
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT {', '.join(columns)} FROM tracker_session_hr WHERE session_id = %s", [session_id])
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    result = dict(zip(columns, row))
+    result['zone_seconds'] = json.loads(result['zone_seconds'])
+    return result
+
+
+def session_completed(session_id, user_id, start_time):
+    """on_commit hook of a session that just ended; errors are logged, never raised"""
+    try:
+        store_session(session_id, user_id, start_time)
+    except Exception as e:
+        logger.error(f"Error computing HR analytics for session {session_id}: {str(e)}")
@@ -0,0 +1,188 @@
+"""
+Model signal handlers that keep derived data in sync with user writes.
+"""
+from django.db import transaction
+from django.contrib.auth.models import User
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import aggregates, dashboard_push, gps_tracks, pr_index, rank_index, session_hr, social_inbox, timeline
+from .models import (
+    Activity, ActivityComment, ActivityLike, BodyMeasurement, CardioEntry, GamificationProfile, NutritionLog,
+    StrengthSet, UserConnection, WorkoutSession,
+)
+
+
+def _session_key(session_id):
+    """(user_id, local date) of a workout session, or (None, None) if it is gone"""
+    row = (
+        WorkoutSession.objects
+        .filter(pk=session_id)
+        .values_list('user_id', 'start_time')
+        .first()
+    )
+    if row is None:
+        return None, None
+    return row[0], aggregates.local_day(row[1])
+
+
+def _remember_previous_session(sender, instance, **kwargs):
+    # Moving a set/entry to another session also invalidates the old day
+    if instance.pk:
+        instance._previous_session_id = (
+            sender.objects.filter(pk=instance.pk).values_list('session_id', flat=True).first()
+        )
+
+
+def _mark_session_children(kinds, instance):
+    session_ids = {instance.session_id, getattr(instance, '_previous_session_id', None)}
+    cached = instance._state.fields_cache.get('session')
+    for session_id in session_ids - {None}:
+        if cached is not None and cached.pk == session_id:
+            user_id, day = cached.user_id, aggregates.local_day(cached.start_time)
+        else:
+            user_id, day = _session_key(session_id)
+        for kind in kinds:
+            aggregates.mark_dirty(kind, user_id, day)
+        dashboard_push.mark_changed(type(instance).__name__, user_id)
+
+
+@receiver(pre_save, sender=StrengthSet)
+def strength_set_pre_save(sender, instance, **kwargs):
+    _remember_previous_session(sender, instance)
+
+
+@receiver(post_save, sender=StrengthSet)
+@receiver(post_delete, sender=StrengthSet)
+def strength_set_changed(sender, instance, **kwargs):
+    _mark_session_children((aggregates.STRENGTH, aggregates.EXERCISE), instance)
+    # The PR index is updated in the writer's transaction, so a rollback undoes it too
+    if kwargs.get('signal') is post_save:
+        pr_index.set_saved(instance, kwargs.get('created', False))
+    elif not _cascaded_from_session(kwargs.get('origin')):
+        pr_index.set_deleted(instance)
+
+
+def _cascaded_from_session(origin):
+    """True when a delete started at a session (or its user), whose handlers rebuild the PR keys once"""
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model in (WorkoutSession, User)
+
+
+@receiver(pre_save, sender=CardioEntry)
+def cardio_entry_pre_save(sender, instance, **kwargs):
+    _remember_previous_session(sender, instance)
+
+
+@receiver(post_save, sender=CardioEntry)
+@receiver(post_delete, sender=CardioEntry)
+def cardio_entry_changed(sender, instance, **kwargs):
+    _mark_session_children((aggregates.CARDIO,), instance)
+
+
+@receiver(pre_save, sender=WorkoutSession)
+def workout_session_pre_save(sender, instance, **kwargs):
+    if instance.pk:
+        instance._previous_start_time, instance._previous_end_time = (
+            sender.objects.filter(pk=instance.pk).values_list('start_time', 'end_time').first() or (None, None)
+        )
+
+
+@receiver(pre_delete, sender=WorkoutSession)
+def workout_session_pre_delete(sender, instance, **kwargs):
+    pr_index.session_deleting(instance)
+
+
+@receiver(post_save, sender=WorkoutSession)
+@receiver(post_delete, sender=WorkoutSession)
+def workout_session_changed(sender, instance, **kwargs):
+    days = {
+        aggregates.local_day(instance.start_time),
+        aggregates.local_day(getattr(instance, '_previous_start_time', None)),
+    }
+    for day in days - {None}:
+        for kind in (aggregates.STRENGTH, aggregates.EXERCISE, aggregates.CARDIO):
+            aggregates.mark_dirty(kind, instance.user_id, day)
+    dashboard_push.mark_changed('WorkoutSession', instance.user_id)
+
+    previous_start = getattr(instance, '_previous_start_time', None)
+    if kwargs.get('signal') is post_save and previous_start and previous_start != instance.start_time:
+        pr_index.session_moved(instance.pk, instance.start_time)
+        session_hr.session_moved(instance.pk, instance.start_time)
+    if kwargs.get('signal') is post_delete:
+        pr_index.session_deleted(instance)
+        session_hr.session_deleted(instance.pk)
+
+    if kwargs.get('signal') is post_save and instance.end_time and not getattr(instance, '_previous_end_time', None):
+        # The session was just completed: summarize it once the end time is committed
+        session_id, user_id, start_time = instance.pk, instance.user_id, instance.start_time
+        transaction.on_commit(lambda: _session_completed(session_id, user_id, start_time))
+
+
+def _session_completed(session_id, user_id, start_time):
+    gps_tracks.session_completed(session_id, user_id)
+    session_hr.session_completed(session_id, user_id, start_time)
+
+
+@receiver(pre_save, sender=BodyMeasurement)
+def body_measurement_pre_save(sender, instance, **kwargs):
+    if instance.pk:
+        instance._previous_date = (
+            sender.objects.filter(pk=instance.pk).values_list('date', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=BodyMeasurement)
+@receiver(post_delete, sender=BodyMeasurement)
+def body_measurement_changed(sender, instance, **kwargs):
+    for day in {instance.date, getattr(instance, '_previous_date', None)} - {None}:
+        aggregates.mark_dirty(aggregates.WEIGHT, instance.user_id, day)
+    dashboard_push.mark_changed('BodyMeasurement', instance.user_id)
+
+
+@receiver(post_save, sender=NutritionLog)
+@receiver(post_delete, sender=NutritionLog)
+def nutrition_log_changed(sender, instance, **kwargs):
+    dashboard_push.mark_changed('NutritionLog', instance.user_id)
+
+
+@receiver(post_save, sender=GamificationProfile)
+def gamification_profile_saved(sender, instance, update_fields=None, **kwargs):
+    # XP and streak changes move the user on the leaderboards
+    if update_fields is not None and not set(update_fields) & {'total_xp', 'current_level', 'current_streak'}:
+        return
+    rank_index.profile_changed(instance)
+
+
+@receiver(post_delete, sender=GamificationProfile)
+def gamification_profile_deleted(sender, instance, **kwargs):
+    rank_index.profile_changed(instance, deleted=True)
+
+
+@receiver(post_save, sender=UserConnection)
+@receiver(post_delete, sender=UserConnection)
+def user_connection_changed(sender, instance, **kwargs):
+    # The followed user's part of the follower's feed is stale
+    timeline.rebuild_pair(instance.follower_id, instance.following_id)
+
+
+@receiver(post_save, sender=Activity)
+def activity_saved(sender, instance, created, **kwargs):
+    # Written in the same transaction as the activity; live delivery waits for the commit
+    timeline.materialize_activity(instance)
+    if created:
+        transaction.on_commit(lambda: social_inbox.publish_activity(instance))
+
+
+@receiver(post_delete, sender=Activity)
+def activity_deleted(sender, instance, **kwargs):
+    timeline.remove_activity(instance.id)
+
+
+@receiver(post_save, sender=ActivityLike)
+@receiver(post_delete, sender=ActivityLike)
+@receiver(post_save, sender=ActivityComment)
+@receiver(post_delete, sender=ActivityComment)
+def activity_reaction_changed(sender, instance, **kwargs):
+    timeline.refresh_counts(instance.activity_id)
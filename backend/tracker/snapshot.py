@@ -0,0 +1,275 @@
+"""
+One fetch of a user's training, nutrition and body data, shared by the analytics engines.
+
+``AdvancedAnalytics`` (analytics.py), ``AdvancedAnalyticsEngine``
+(analytics_engine.py) and ``SmartRecommendations`` (recommendations.py) all
+accept a ``UserDataSnapshot``. It loads every table at most once:
+
+* sessions whose local start day falls in ``[start_day, end_day]``, newest
+  first, with their strength sets (and exercises) and cardio entries
+  prefetched;
+* nutrition logs of the same window;
+* body measurements, body compositions and muscle measurements up to
+  ``end_day``. These are sparse, so their whole history is loaded and the
+  engines can reach past the window.
+
+Each table is fetched lazily on first use, so a caller that only needs
+measurements pays for one query. The rows are also exposed as NumPy columns
+(``set_columns``, ``nutrition_columns``, ``compositions``,
+``muscle_measurements``), and derived series (daily totals, per-exercise
+stats) are memoized per argument. Build one snapshot per request and pass it
+to every engine that renders the page.
+"""
+import functools
+from datetime import timedelta
+
+import numpy as np
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .aggregates import day_bounds, local_day
+from .models import (
+    BodyComposition, BodyMeasurement, MuscleGroup, MuscleGroupMeasurement, NutritionLog, StrengthSet,
+    WorkoutSession,
+)
+
+DEFAULT_DAYS = 30
+SECONDS_PER_DAY = 86400.0
+
+
+def memoized(method):
+    """Cache a snapshot method's result per positional arguments on the instance"""
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        key = (method.__name__,) + args
+        if key not in self._memo:
+            self._memo[key] = method(self, *args)
+        return self._memo[key]
+    return wrapper
+
+
+def whole_days(dates):
+    """Whole UTC day numbers of datetimes, so trends are per day"""
+    return np.floor(np.array([d.timestamp() for d in dates], dtype=float) / SECONDS_PER_DAY)
+
+
+class UserDataSnapshot:
+    """A user's data over ``days`` days ending at ``end_day`` (today by default), each table fetched once"""
+
+    def __init__(self, user, days=DEFAULT_DAYS, end_day=None):
+        self.user = user
+        self.end_day = end_day or timezone.localdate()
+        self.start_day = self.end_day - timedelta(days=days)
+        self._memo = {}
+
+    def covers(self, start_day, end_day):
+        """Whether the windowed tables hold every row of [start_day, end_day]"""
+        return self.start_day <= start_day and end_day <= self.end_day
+
+    # ------------------------------------------------------------------
+    # Rows
+    # ------------------------------------------------------------------
+    @cached_property
+    def sessions(self):
+        """Sessions of the window, newest first, with sets and cardio entries prefetched"""
+        start, end = day_bounds(self.start_day, self.end_day)
+        return list(
+            WorkoutSession.objects.filter(user=self.user, start_time__gte=start, start_time__lt=end)
+            .order_by('-start_time')
+            .prefetch_related(
+                Prefetch('strength_sets', queryset=StrengthSet.objects.select_related('exercise').order_by('id')),
+                'cardio_entries',
+            )
+        )
+
+    @cached_property
+    def session_days(self):
+        """Local start day of each session, aligned with ``sessions``"""
+        return [local_day(session.start_time) for session in self.sessions]
+
+    @cached_property
+    def total_sessions(self):
+        """All-time session count (not limited to the window)"""
+        return WorkoutSession.objects.filter(user=self.user).count()
+
+    @cached_property
+    def nutrition(self):
+        """Nutrition logs of the window"""
+        return list(NutritionLog.objects.filter(
+            user=self.user, date__gte=self.start_day, date__lte=self.end_day
+        ).order_by('-date', '-id'))
+
+    @cached_property
+    def measurements(self):
+        """Body measurements up to the end of the window, newest first"""
+        return list(BodyMeasurement.objects.filter(user=self.user, date__lte=self.end_day).order_by('-date'))
+
+    @cached_property
+    def muscle_groups(self):
+        return list(MuscleGroup.objects.all())
+
+    @memoized
+    def sessions_between(self, start_day, end_day):
+        """Sessions whose local start day is in [start_day, end_day], newest first"""
+        return [session for session, day in zip(self.sessions, self.session_days) if start_day <= day <= end_day]
+
+    @memoized
+    def nutrition_between(self, start_day, end_day):
+        return [log for log in self.nutrition if start_day <= log.date <= end_day]
+
+    @memoized
+    def measurements_between(self, start_day=None, end_day=None):
+        """Body measurements in [start_day, end_day] (open ends allowed), newest first"""
+        return [
+            measurement for measurement in self.measurements
+            if (start_day is None or measurement.date >= start_day) and (end_day is None or measurement.date <= end_day)
+        ]
+
+    # ------------------------------------------------------------------
+    # Columns
+    # ------------------------------------------------------------------
+    @cached_property
+    def set_columns(self):
+        """The window's strength sets as arrays, in session order (newest session first)"""
+        rows = [
+            (index, day, s.exercise_id, s.exercise.name, s.weight_kg, s.reps)
+            for index, (session, day) in enumerate(zip(self.sessions, self.session_days))
+            for s in session.strength_sets.all()
+        ]
+        session_index, days, exercise_ids, names, weights, reps = (list(column) for column in zip(*rows)) \
+            if rows else ([], [], [], [], [], [])
+        weights = np.nan_to_num(np.array(weights, dtype=float))
+        reps = np.nan_to_num(np.array(reps, dtype=float))
+        return {
+            'session_index': np.array(session_index, dtype=np.int64),
+            'day': np.array(days, dtype='datetime64[D]'),
+            'exercise_id': np.array(exercise_ids, dtype=np.int64),
+            'exercise_name': np.array(names, dtype=object),
+            'weight_kg': weights,
+            'reps': reps,
+            'volume': weights * reps,
+        }
+
+    @cached_property
+    def nutrition_columns(self):
+        logs = self.nutrition
+        return {
+            'day': np.array([log.date for log in logs], dtype='datetime64[D]'),
+            'calories': np.array([log.calories or 0 for log in logs], dtype=float),
+            'protein_g': np.array([log.protein_g or 0 for log in logs], dtype=float),
+            'carbs_g': np.array([log.carbs_g or 0 for log in logs], dtype=float),
+            'fat_g': np.array([log.fat_g or 0 for log in logs], dtype=float),
+            'meal_type': np.array([log.meal_type for log in logs], dtype=object),
+        }
+
+    @cached_property
+    def compositions(self):
+        """Body compositions up to the end of the window as date-ordered arrays"""
+        _, end = day_bounds(self.end_day)
+        rows = list(BodyComposition.objects.filter(user=self.user, date__lt=end).order_by('date', 'id').values_list(
+            'date', 'weight_kg', 'body_fat_percentage', 'muscle_mass_kg',
+            'body_shape_type', 'metabolic_age', 'bmr_calories',
+        ))
+        dates = [row[0] for row in rows]
+        data = {
+            'date': dates,
+            'timestamp': np.array([d.timestamp() for d in dates], dtype=float),
+            'day': whole_days(dates),
+            'extra': [row[4:] for row in rows],
+        }
+        for i, field in enumerate(('weight_kg', 'body_fat_percentage', 'muscle_mass_kg'), start=1):
+            data[field] = np.array([row[i] for row in rows], dtype=float)
+        return data
+
+    @cached_property
+    def muscle_measurements(self):
+        """Muscle measurements up to the end of the window as arrays sorted by muscle group, then date"""
+        _, end = day_bounds(self.end_day)
+        rows = list(MuscleGroupMeasurement.objects.filter(user=self.user, date__lt=end).order_by(
+            'muscle_group_id', 'date', 'id'
+        ).values_list('muscle_group_id', 'date', 'circumference_cm', 'muscle_density', 'is_flexed', 'workout_context'))
+        # Positions in ``muscle_groups``
+        position = {group.id: i for i, group in enumerate(self.muscle_groups)}
+        dates = [row[1] for row in rows]
+        group = np.array([position.get(row[0], -1) for row in rows], dtype=np.int64)
+        # Latest row of each group: the last of its run in the sorted arrays
+        is_last = np.append(group[1:] != group[:-1], True) if len(group) else np.zeros(0, dtype=bool)
+        latest = np.full(len(self.muscle_groups), -1, dtype=np.int64)
+        ends = np.flatnonzero(is_last & (group >= 0))
+        latest[group[ends]] = ends
+        return {
+            'group': group,
+            'timestamp': np.array([d.timestamp() for d in dates], dtype=float),
+            'day': whole_days(dates),
+            'circumference_cm': np.array([row[2] for row in rows], dtype=float),
+            'extra': [row[3:] for row in rows],
+            'latest': latest,
+        }
+
+    # ------------------------------------------------------------------
+    # Derived series
+    # ------------------------------------------------------------------
+    def _set_mask(self, start_day, end_day):
+        days = self.set_columns['day']
+        return (days >= np.datetime64(start_day, 'D')) & (days <= np.datetime64(end_day, 'D'))
+
+    @memoized
+    def strength_totals(self, start_day, end_day):
+        """Volume, set, rep and distinct-exercise totals of [start_day, end_day]"""
+        columns = self.set_columns
+        mask = self._set_mask(start_day, end_day)
+        return {
+            'total_volume_kg': float(columns['volume'][mask].sum()),
+            'total_sets': int(mask.sum()),
+            'total_reps': int(columns['reps'][mask].sum()),
+            'unique_exercises': int(len(np.unique(columns['exercise_id'][mask]))),
+        }
+
+    @memoized
+    def cardio_totals(self, start_day, end_day):
+        """Cardio minutes and distance of [start_day, end_day]"""
+        entries = [entry for session in self.sessions_between(start_day, end_day)
+                   for entry in session.cardio_entries.all()]
+        return {
+            'total_minutes': sum(entry.duration_minutes or 0 for entry in entries),
+            'total_distance_km': sum(entry.distance_km or 0 for entry in entries),
+        }
+
+    @memoized
+    def nutrition_totals(self, start_day, end_day):
+        """Calorie and macro totals and distinct meal types of [start_day, end_day]"""
+        columns = self.nutrition_columns
+        mask = (columns['day'] >= np.datetime64(start_day, 'D')) & (columns['day'] <= np.datetime64(end_day, 'D'))
+        meal_types = {meal for meal in columns['meal_type'][mask]}
+        return {
+            'logs': int(mask.sum()),
+            'total_calories': float(columns['calories'][mask].sum()),
+            'total_protein_g': float(columns['protein_g'][mask].sum()),
+            'total_carbs_g': float(columns['carbs_g'][mask].sum()),
+            'total_fat_g': float(columns['fat_g'][mask].sum()),
+            'meals_logged': len(meal_types),
+        }
+
+    @memoized
+    def exercise_stats(self, latest_sessions):
+        """Per exercise name: average reps and weight and max weight over the latest sessions"""
+        columns = self.set_columns
+        mask = columns['session_index'] < latest_sessions
+        names = columns['exercise_name'][mask]
+        if not len(names):
+            return {}
+        keys, group = np.unique(names.astype(str), return_inverse=True)
+        counts = np.bincount(group, minlength=len(keys))
+        reps = np.bincount(group, weights=columns['reps'][mask], minlength=len(keys))
+        weights = np.bincount(group, weights=columns['weight_kg'][mask], minlength=len(keys))
+        max_weight = np.zeros(len(keys))
+        np.fmax.at(max_weight, group, columns['weight_kg'][mask])
+        return {
+            str(name): {
+                'avg_reps': float(reps[i] / counts[i]),
+                'avg_weight': float(weights[i] / counts[i]),
+                'max_weight': float(max_weight[i]),
+            }
+            for i, name in enumerate(keys)
+        }
@@ -5,14 +5,38 @@ import math
 from datetime import date, timedelta, datetime
 from typing import Dict, List, Any, Optional, Tuple
 from django.contrib.auth.models import User
-from django.db.models import Sum, Avg, Count, Max, Min, Q, F
+from django.db import transaction
+from django.db.models import Sum, Avg, Count, Max, Min, Q, F, FloatField
+from django.db.models.functions import TruncDate
 from django.utils import timezone
+from .aggregates import day_bounds
 from .models import (
     UserConnection, Challenge, ChallengeParticipation, Leaderboard, 
     LeaderboardEntry, Achievement, UserAchievement, WorkoutSession,
     StrengthSet, CardioEntry, NutritionLog, BodyMeasurement
 )
 
+# Rows per INSERT ... ON CONFLICT statement when writing leaderboard entries
+LEADERBOARD_WRITE_BATCH = 1000
+# Workout-streak boards only read this many days back from the period end
+STREAK_WINDOW_DAYS = 365
+
+
+def rank_scores(scores):
+    """
+    Competition ranking (as SQL RANK()): highest score first, ties share a rank and
+    the next rank skips. Ties are listed by user id so the order is stable.
+    """
+    ordered = sorted(scores, key=lambda item: (-item[1], item[0]))
+    ranked = []
+    previous_score = None
+    rank = 0
+    for position, item in enumerate(ordered, 1):
+        if item[1] != previous_score:
+            rank, previous_score = position, item[1]
+        ranked.append((rank, item))
+    return ranked
+
 
 class SocialFeatures:
     """Social features engine for community and competition."""
@@ -93,29 +117,35 @@ class SocialFeatures:
             if not connection.can_view_workouts:
                 return {'error': 'No permission to view friend activity'}
             
-            # Get recent workouts
-            start_date = self.today - timedelta(days=days)
-            recent_workouts = WorkoutSession.objects.filter(
-                user=friend,
-                date__gte=start_date
-            ).order_by('-date')
+            # Get recent workouts, with set counts and volume from one grouped query
+            start, end = day_bounds(self.today - timedelta(days=days), self.today)
+            recent_workouts = list(
+                WorkoutSession.objects.filter(
+                    user=friend,
+                    start_time__gte=start,
+                    start_time__lt=end
+                ).annotate(
+                    sets_count=Count('strength_sets'),
+                    total_volume=Sum(F('strength_sets__weight_kg') * F('strength_sets__reps'), output_field=FloatField())
+                ).order_by('-start_time')
+            )
             
             activity = {
                 'friend_username': friend.username,
                 'workouts': [
                     {
-                        'date': workout.date,
-                        'duration_minutes': workout.duration_minutes,
-                        'exercises_count': workout.strength_sets.count(),
-                        'total_volume': sum(
-                            set_obj.weight_kg * set_obj.reps 
-                            for set_obj in workout.strength_sets.all()
-                        )
+                        'date': timezone.localdate(workout.start_time),
+                        'duration_minutes': (
+                            int((workout.end_time - workout.start_time).total_seconds() // 60)
+                            if workout.end_time else None
+                        ),
+                        'exercises_count': workout.sets_count,
+                        'total_volume': workout.total_volume or 0.0
                     }
                     for workout in recent_workouts
                 ],
-                'total_workouts': recent_workouts.count(),
-                'last_workout': recent_workouts.first().date if recent_workouts.exists() else None
+                'total_workouts': len(recent_workouts),
+                'last_workout': timezone.localdate(recent_workouts[0].start_time) if recent_workouts else None
             }
             
             return activity
@@ -428,56 +458,43 @@ class SocialFeatures:
         }
     
     def update_leaderboard(self, leaderboard_id: int) -> Dict[str, Any]:
-        """Update leaderboard entries."""
+        """Recompute leaderboard entries with one grouped query per metric."""
         try:
             leaderboard = Leaderboard.objects.get(id=leaderboard_id)
-            
-            # Calculate period dates
-            period_start, period_end = self._get_period_dates(leaderboard.period_type)
-            
-            # Get all users who have data for this metric
-            users_with_data = self._get_users_with_metric_data(
-                leaderboard.metric_type,
-                period_start,
-                period_end
-            )
-            
-            # Calculate scores and create entries
-            entries_data = []
-            for user, score, metadata in users_with_data:
-                entry, created = LeaderboardEntry.objects.update_or_create(
-                    leaderboard=leaderboard,
-                    user=user,
-                    period_start=period_start,
-                    defaults={
-                        'score': score,
-                        'metadata': metadata,
-                        'period_end': period_end
-                    }
-                )
-                entries_data.append((user, score))
-            
-            # Update rankings
-            entries = LeaderboardEntry.objects.filter(
-                leaderboard=leaderboard,
-                period_start=period_start
-            ).order_by('-score', 'created_at')
-            
-            for rank, entry in enumerate(entries, 1):
-                entry.rank = rank
-                entry.save()
-            
-            leaderboard.last_updated = timezone.now()
-            leaderboard.save()
-            
-            return {
-                'success': True,
-                'entries_updated': len(entries_data),
-                'message': f'Leaderboard "{leaderboard.name}" updated successfully'
-            }
-            
         except Leaderboard.DoesNotExist:
             return {'error': 'Leaderboard not found'}
+        
+        # Calculate period dates
+        period_start, period_end = self._get_period_dates(leaderboard.period_type)
+        scores = self._get_metric_scores(leaderboard.metric_type, period_start, period_end)
+        
+        refreshed_at = timezone.now()
+        entries = [
+            LeaderboardEntry(
+                leaderboard=leaderboard, user_id=user_id, rank=rank, score=score, metadata=metadata,
+                period_start=period_start, period_end=period_end,
+            )
+            for rank, (user_id, score, metadata) in rank_scores(scores)
+        ]
+        with transaction.atomic():
+            LeaderboardEntry.objects.bulk_create(
+                entries,
+                batch_size=LEADERBOARD_WRITE_BATCH,
+                update_conflicts=True,
+                unique_fields=['leaderboard', 'user', 'period_start'],
+                update_fields=['rank', 'score', 'metadata', 'period_end', 'updated_at'],
+            )
+            # Users without data in the period any more drop off the board
+            LeaderboardEntry.objects.filter(
+                leaderboard=leaderboard, period_start=period_start, updated_at__lt=refreshed_at
+            ).delete()
+            Leaderboard.objects.filter(pk=leaderboard.pk).update(last_updated=refreshed_at)
+        
+        return {
+            'success': True,
+            'entries_updated': len(entries),
+            'message': f'Leaderboard "{leaderboard.name}" updated successfully'
+        }
     
     def _get_period_dates(self, period_type: str) -> Tuple[date, date]:
         """Get start and end dates for a period type."""
@@ -502,57 +519,63 @@ class SocialFeatures:
         else:  # all_time
             return date(2020, 1, 1), today
     
-    def _get_users_with_metric_data(self, metric_type: str, start_date: date, end_date: date) -> List[Tuple[User, float, Dict]]:
-        """Get users with data for a specific metric."""
-        users_data = []
+    def _get_metric_scores(self, metric_type: str, start_date: date, end_date: date) -> List[Tuple[int, float, Dict]]:
+        """(user_id, score, metadata) for every user with data, from one grouped query."""
+        period = day_bounds(start_date, end_date)
         
         if metric_type == 'total_volume':
-            # Get users with workout sessions in the period
-            sessions = WorkoutSession.objects.filter(
-                date__gte=start_date,
-                date__lte=end_date
-            ).select_related('user')
-            
-            user_volumes = {}
-            for session in sessions:
-                user = session.user
-                if user not in user_volumes:
-                    user_volumes[user] = 0
-                
-                for set_obj in session.strength_sets.all():
-                    user_volumes[user] += set_obj.weight_kg * set_obj.reps
-            
-            for user, volume in user_volumes.items():
-                users_data.append((user, volume, {'total_sets': 0}))
+            rows = StrengthSet.objects.filter(
+                session__start_time__gte=period[0],
+                session__start_time__lt=period[1]
+            ).values('session__user_id').annotate(
+                volume=Sum(F('weight_kg') * F('reps'), output_field=FloatField()),
+                total_sets=Count('id')
+            ).order_by()
+            return [
+                (row['session__user_id'], row['volume'] or 0.0, {'total_sets': row['total_sets']})
+                for row in rows
+            ]
         
-        elif metric_type == 'workout_streak':
-            # This would require streak calculation for each user
-            # Simplified version
-            from .analytics import AdvancedAnalytics
-            
-            all_users = User.objects.all()
-            for user in all_users:
-                analytics = AdvancedAnalytics(user)
-                streak_data = analytics.update_workout_streak()
-                users_data.append((user, streak_data['current_streak'], {}))
+        if metric_type == 'consistency':
+            total_days = (end_date - start_date).days + 1
+            rows = WorkoutSession.objects.filter(
+                start_time__gte=period[0],
+                start_time__lt=period[1]
+            ).values('user_id').annotate(
+                workout_days=Count(TruncDate('start_time'), distinct=True)
+            ).order_by()
+            return [
+                (row['user_id'], (row['workout_days'] / total_days) * 100, {'workout_days': row['workout_days']})
+                for row in rows
+            ]
         
-        elif metric_type == 'consistency':
-            # Calculate consistency for each user
-            all_users = User.objects.all()
-            for user in all_users:
-                sessions = WorkoutSession.objects.filter(
-                    user=user,
-                    date__gte=start_date,
-                    date__lte=end_date
-                )
-                
-                if sessions.exists():
-                    total_days = (end_date - start_date).days + 1
-                    workout_days = sessions.values('date').distinct().count()
-                    consistency = (workout_days / total_days) * 100
-                    users_data.append((user, consistency, {'workout_days': workout_days}))
+        if metric_type == 'workout_streak':
+            # Distinct workout days of the trailing window for all users in one query; the
+            # run of consecutive days ending at each user's latest workout is found in a
+            # single pass. Only that run counts, so older history is never read
+            window = day_bounds(end_date - timedelta(days=STREAK_WINDOW_DAYS - 1), end_date)
+            days = WorkoutSession.objects.filter(
+                start_time__gte=window[0],
+                start_time__lt=window[1]
+            ).annotate(day=TruncDate('start_time')).values_list('user_id', 'day').distinct().order_by('user_id', '-day')
+            scores = []
+            current_user, streak, previous, last_day = None, 0, None, None
+            for user_id, day in days:
+                if user_id != current_user:
+                    if current_user is not None:
+                        scores.append((current_user, streak, {'last_workout_date': last_day.isoformat()}))
+                    current_user, streak, previous, last_day, counting = user_id, 1, day, day, True
+                    continue
+                if counting and (previous - day).days == 1:
+                    streak += 1
+                    previous = day
+                else:
+                    counting = False
+            if current_user is not None:
+                scores.append((current_user, streak, {'last_workout_date': last_day.isoformat()}))
+            return scores
         
-        return users_data
+        return []
     
     # Achievements
     def get_user_achievements(self) -> Dict[str, Any]:
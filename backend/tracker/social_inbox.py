@@ -0,0 +1,132 @@
+"""
+Per-user inbox delivery for real-time social events.
+
+Every SocialConsumer joins exactly one channel group, ``social_<user_id>``.
+Producers resolve an author's audience once per event, with one query on the
+friend graph, and push the event into each follower's inbox group. Connect
+and disconnect therefore cost one group_add/group_discard regardless of how
+many friends a user has, and the friend list is never queried per socket.
+
+The snapshot for an author lists who follows them as a friend together with
+the visibility flags of that connection. It is read from the database every
+time rather than cached: the cache is per process, and a revoked connection
+must stop delivery in every worker at once.
+"""
+import asyncio
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import get_channel_layer
+
+from .broadcast import frame_event
+
+logger = logging.getLogger(__name__)
+
+# Activity types a follower only sees when the connection grants the flag
+ACTIVITY_VISIBILITY = {
+    'workout_completed': 'can_view_workouts',
+    'personal_record': 'can_view_progress',
+    'goal_reached': 'can_view_progress',
+    'streak_milestone': 'can_view_progress',
+}
+
+# Events forwarded to the client whole under 'data'; the others send only their 'data' member
+WHOLE_PAYLOAD_EVENTS = {'activity_liked', 'activity_commented', 'challenge_joined'}
+
+
+def inbox_group(user_id):
+    """Channel group a user's social sockets listen on"""
+    return f'social_{user_id}'
+
+
+def follower_snapshot(author_id):
+    """[(follower_id, can_view_workouts, can_view_progress)] for an author, read from the database"""
+    from .models import UserConnection
+
+    return list(
+        UserConnection.objects.filter(following_id=author_id, connection_type='friend')
+        .values_list('follower_id', 'can_view_workouts', 'can_view_progress')
+    )
+
+
+def audience(author_id, activity_type=None):
+    """Follower ids allowed to see an activity of the given type"""
+    flag = ACTIVITY_VISIBILITY.get(activity_type)
+    allowed = []
+    for follower_id, can_view_workouts, can_view_progress in follower_snapshot(author_id):
+        if flag == 'can_view_workouts' and not can_view_workouts:
+            continue
+        if flag == 'can_view_progress' and not can_view_progress:
+            continue
+        allowed.append(follower_id)
+    return allowed
+
+
+def client_event(message):
+    """Channel-layer event carrying the client frame of a social message, serialized once"""
+    message_type = message['type']
+    data = message if message_type in WHOLE_PAYLOAD_EVENTS else message.get('data')
+    return frame_event(message_type, {
+        'type': message_type,
+        'data': data,
+        'timestamp': message.get('timestamp'),
+    })
+
+
+async def adeliver(user_ids, message):
+    """Push one message into each user's inbox; returns how many inboxes were written"""
+    channel_layer = get_channel_layer()
+    if channel_layer is None or not user_ids:
+        return 0
+    event = client_event(message)
+    await asyncio.gather(*(channel_layer.group_send(inbox_group(user_id), event) for user_id in user_ids))
+    return len(user_ids)
+
+
+async def afan_out(author_id, message, activity_type=None, include_author=False):
+    """Deliver an author's event to every follower allowed to see it"""
+    recipients = await database_sync_to_async(audience)(author_id, activity_type)
+    if include_author:
+        recipients = [author_id] + recipients
+    return await adeliver(recipients, message)
+
+
+def deliver(user_ids, message):
+    """Synchronous :func:`adeliver` for views and signal handlers"""
+    return async_to_sync(adeliver)(list(user_ids), message)
+
+
+def fan_out(author_id, message, activity_type=None, include_author=False):
+    """Synchronous :func:`afan_out` for views and signal handlers"""
+    recipients = audience(author_id, activity_type)
+    if include_author:
+        recipients = [author_id] + recipients
+    return deliver(recipients, message)
+
+
+def activity_message(activity):
+    """friend_activity event for a new Activity row"""
+    return {
+        'type': 'friend_activity',
+        'data': {
+            'activity_id': activity.id,
+            'user_id': activity.user_id,
+            'activity_type': activity.activity_type,
+            'title': activity.title,
+            'description': activity.description,
+            'activity_data': activity.activity_data,
+        },
+        'timestamp': activity.created_at.isoformat() if activity.created_at else None,
+    }
+
+
+def publish_activity(activity):
+    """Fan a public activity out to the author's followers"""
+    if not activity.is_public:
+        return 0
+    try:
+        return fan_out(activity.user_id, activity_message(activity), activity.activity_type)
+    except Exception as e:
+        logger.error(f"Activity fan-out failed for activity {activity.id}: {str(e)}")
+        return 0
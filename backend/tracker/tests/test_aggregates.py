@@ -0,0 +1,211 @@
+"""
+Tests for incremental maintenance of the daily aggregate tables
+"""
+from datetime import date, datetime, timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from tracker import aggregates
+from tracker.hr_ingest import to_sample_row, write_hr_rows
+from tracker.models import BodyMeasurement, ExerciseCatalog, StrengthSet, WorkoutSession
+
+
+class DailyAggregateTest(TestCase):
+    """Test that writes refresh only the affected aggregate rows"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='agg', password='pass12345')
+        self.squat = ExerciseCatalog.objects.create(name='Agg Squat', category='strength')
+        self.bench = ExerciseCatalog.objects.create(name='Agg Bench', category='strength')
+        self.day = date(2025, 3, 10)
+
+    def _session(self, day, hour=9):
+        start = timezone.make_aware(datetime.combine(day, datetime.min.time()) + timedelta(hours=hour))
+        return WorkoutSession.objects.create(user=self.user, start_time=start)
+
+    def test_strength_row_follows_set_writes(self):
+        """Saving and deleting sets recomputes the day's strength summary"""
+        with self.captureOnCommitCallbacks(execute=True):
+            session = self._session(self.day)
+            StrengthSet.objects.create(session=session, exercise=self.squat, set_number=1, reps=5, weight_kg=100)
+            doomed = StrengthSet.objects.create(session=session, exercise=self.bench, set_number=1, reps=10, weight_kg=60)
+
+        row = aggregates.stored_rows(aggregates.STRENGTH, self.user.id, self.day, self.day)[self.day]
+        self.assertEqual(row['sessions_count'], 1)
+        self.assertEqual(row['exercises_count'], 2)
+        self.assertAlmostEqual(row['total_tonnage'], 1100.0)
+        self.assertAlmostEqual(row['best_e1rm'], 116.6666, places=3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            doomed.delete()
+        row = aggregates.stored_rows(aggregates.STRENGTH, self.user.id, self.day, self.day)[self.day]
+        self.assertEqual(row['exercises_count'], 1)
+        self.assertAlmostEqual(row['total_tonnage'], 500.0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            session.delete()
+        self.assertEqual(aggregates.stored_rows(aggregates.STRENGTH, self.user.id, self.day, self.day), {})
+
+    def test_marks_after_a_rolled_back_savepoint_still_refresh(self):
+        """A savepoint rollback drops its own registration, not the batch marked again afterwards"""
+        session = self._session(self.day)
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    StrengthSet.objects.create(session=session, exercise=self.squat, set_number=1, reps=5,
+                                               weight_kg=100)
+                    raise RuntimeError('rolled back')
+            except RuntimeError:
+                pass
+            StrengthSet.objects.create(session=session, exercise=self.bench, set_number=1, reps=10, weight_kg=60)
+
+        row = aggregates.stored_rows(aggregates.STRENGTH, self.user.id, self.day, self.day)[self.day]
+        self.assertAlmostEqual(row['total_tonnage'], 600.0)
+
+    def test_batch_registers_once_per_savepoint_level(self):
+        """Repeated marks, nested or not, queue a single on_commit callback"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            for _ in range(50):
+                aggregates.mark_dirty(aggregates.STRENGTH, self.user.id, self.day)
+                with transaction.atomic():
+                    aggregates.mark_dirty(aggregates.STRENGTH, self.user.id, self.day + timedelta(days=1))
+        self.assertEqual(len(callbacks), 1)
+
+    def test_exercise_rows_follow_set_writes(self):
+        """Per-exercise rows hold max weight, both e1RMs, volume and set count per day"""
+        with self.captureOnCommitCallbacks(execute=True):
+            session = self._session(self.day)
+            StrengthSet.objects.create(session=session, exercise=self.squat, set_number=1, reps=5, weight_kg=100)
+            StrengthSet.objects.create(session=session, exercise=self.squat, set_number=2, reps=1, weight_kg=110)
+            StrengthSet.objects.create(session=session, exercise=self.bench, set_number=1, reps=10, weight_kg=60)
+
+        rows = aggregates.stored_rows(aggregates.EXERCISE, self.user.id, self.day, self.day)
+        squat = rows[(self.day, self.squat.id)]
+        self.assertAlmostEqual(squat['max_weight'], 110.0)
+        self.assertAlmostEqual(squat['best_e1rm_epley'], 116.6666, places=3)
+        self.assertAlmostEqual(squat['best_e1rm_brzycki'], 112.5)
+        self.assertAlmostEqual(squat['total_volume'], 610.0)
+        self.assertEqual(squat['set_count'], 2)
+        self.assertEqual(rows[(self.day, self.bench.id)]['set_count'], 1)
+
+        moved_to = self.day + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            session.start_time += timedelta(days=1)
+            session.save()
+        rows = aggregates.stored_rows(aggregates.EXERCISE, self.user.id, self.day, moved_to)
+        self.assertEqual(sorted(rows), sorted([(moved_to, self.squat.id), (moved_to, self.bench.id)]))
+        self.assertEqual(aggregates.diff_rows(aggregates.EXERCISE, self.user.id, self.day, moved_to), [])
+
+    def test_downsample_trend(self):
+        """Weekly buckets start on Monday and keep maxima and sums"""
+        rows = [
+            {'date': date(2025, 3, 10), 'max_weight': 100.0, 'best_e1rm_epley': 110.0, 'best_e1rm_brzycki': 105.0,
+             'total_volume': 500.0, 'set_count': 2, 'total_reps': 10},
+            {'date': date(2025, 3, 14), 'max_weight': 105.0, 'best_e1rm_epley': 108.0, 'best_e1rm_brzycki': 107.0,
+             'total_volume': 300.0, 'set_count': 1, 'total_reps': 3},
+            {'date': date(2025, 3, 17), 'max_weight': 90.0, 'best_e1rm_epley': 95.0, 'best_e1rm_brzycki': 93.0,
+             'total_volume': 200.0, 'set_count': 1, 'total_reps': 5},
+        ]
+        weekly = aggregates.downsample_trend(rows, 'week')
+        self.assertEqual([row['date'] for row in weekly], [date(2025, 3, 10), date(2025, 3, 17)])
+        self.assertEqual((weekly[0]['max_weight'], weekly[0]['best_e1rm_epley']), (105.0, 110.0))
+        self.assertEqual((weekly[0]['total_volume'], weekly[0]['set_count']), (800.0, 3))
+        monthly = aggregates.downsample_trend(rows, 'month')
+        self.assertEqual(len(monthly), 1)
+        self.assertEqual(monthly[0]['date'], date(2025, 3, 1))
+        self.assertEqual(rows[0]['total_volume'], 500.0)
+
+    def test_ground_truth_matches_stored_rows(self):
+        """The array-based ground truth agrees with the SQL rows on edge-case sets"""
+        with self.captureOnCommitCallbacks(execute=True):
+            session = self._session(self.day)
+            self._session(self.day)  # counted although it has no sets
+            for number, (exercise, reps, weight) in enumerate([
+                (self.squat, 5, 100), (self.squat, 40, 20), (self.bench, 0, 60), (self.bench, 8, 0),
+            ], start=1):
+                StrengthSet.objects.create(session=session, exercise=exercise, set_number=number,
+                                           reps=reps, weight_kg=weight)
+            StrengthSet.objects.create(session=self._session(self.day + timedelta(days=1)),
+                                       exercise=self.bench, set_number=1, reps=37, weight_kg=50)
+
+        end = self.day + timedelta(days=1)
+        for kind in (aggregates.STRENGTH, aggregates.EXERCISE):
+            with self.subTest(kind=kind):
+                self.assertEqual(aggregates.diff_rows(kind, self.user.id, self.day, end), [])
+        strength = aggregates.ground_truth_strength(self.user.id, self.day, end)[self.day]
+        self.assertEqual((strength['sessions_count'], strength['exercises_count']), (2, 2))
+        exercise = aggregates.ground_truth_exercise(self.user.id, self.day, end)
+        self.assertEqual(exercise[(end, self.bench.id)]['best_e1rm_brzycki'], 0.0)
+
+    def test_weight_change_updates_next_measurement(self):
+        """Inserting a measurement between two others fixes the later previous_weight"""
+        with self.captureOnCommitCallbacks(execute=True):
+            BodyMeasurement.objects.create(user=self.user, date=self.day, weight_kg=80)
+            BodyMeasurement.objects.create(user=self.user, date=self.day + timedelta(days=4), weight_kg=78)
+        with self.captureOnCommitCallbacks(execute=True):
+            BodyMeasurement.objects.create(user=self.user, date=self.day + timedelta(days=2), weight_kg=79)
+
+        rows = aggregates.stored_rows(aggregates.WEIGHT, self.user.id, self.day, self.day + timedelta(days=4))
+        last = rows[self.day + timedelta(days=4)]
+        self.assertEqual(last['previous_weight'], 79)
+        self.assertAlmostEqual(last['weight_change'], -1.0)
+
+    def test_hr_rows_refresh_cardio_in_batches(self):
+        """HR writes only mark keys; the periodic refresh writes the cardio row"""
+        start = timezone.make_aware(datetime.combine(self.day, datetime.min.time()) + timedelta(hours=12))
+        rows = [to_sample_row(self.user.id, None, bpm, start.timestamp() + i) for i, bpm in enumerate((100, 120, 140))]
+        write_hr_rows(rows)
+        aggregates.mark_hr_rows_dirty(rows)
+        self.assertEqual(aggregates.stored_rows(aggregates.CARDIO, self.user.id, self.day, self.day), {})
+
+        self.assertEqual(aggregates.refresh_hr_dirty(force=True), 1)
+        row = aggregates.stored_rows(aggregates.CARDIO, self.user.id, self.day, self.day)[self.day]
+        self.assertEqual(row['total_samples'], 3)
+        self.assertEqual((row['min_hr'], row['max_hr']), (100, 140))
+        self.assertAlmostEqual(row['avg_hr'], 120.0)
+
+    def test_cardio_range_is_computed_in_one_grouped_pass(self):
+        """A cardio backfill costs the same queries for 2 days as for 6, and matches the ground truth"""
+        session = self._session(self.day)
+        rows = []
+        for offset in range(6):
+            noon = timezone.make_aware(datetime.combine(self.day + timedelta(days=offset), datetime.min.time())
+                                       + timedelta(hours=12))
+            rows += [to_sample_row(self.user.id, session.id if offset == 0 else None, 100 + offset + i,
+                                   noon.timestamp() + i) for i in range(3)]
+        write_hr_rows(rows)
+
+        def queries(days):
+            with CaptureQueriesContext(connection) as captured:
+                computed = aggregates.compute_cardio_rows(self.user.id, self.day, self.day + timedelta(days=days - 1))
+            self.assertEqual(len(computed), days)
+            return len(captured)
+
+        self.assertEqual(queries(2), queries(6))
+        rows = aggregates.compute_cardio_rows(self.user.id, self.day, self.day + timedelta(days=5))
+        self.assertEqual(rows, aggregates.ground_truth_cardio(self.user.id, self.day, self.day + timedelta(days=5)))
+        self.assertEqual((rows[self.day]['sessions_count'], rows[self.day]['hr_session_ids']), (1, str(session.id)))
+
+    def test_backfill_and_verify_command(self):
+        """The command rebuilds a cleared table and then verifies it"""
+        with self.captureOnCommitCallbacks(execute=True):
+            for offset in range(3):
+                session = self._session(self.day + timedelta(days=offset))
+                StrengthSet.objects.create(session=session, exercise=self.squat, set_number=1,
+                                           reps=5, weight_kg=100 + offset)
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM tracker_strength_summary_daily WHERE user_id = %s", [self.user.id])
+
+        args = ['--user', str(self.user.id), '--to', str(self.day + timedelta(days=5))]
+        call_command('refresh_aggregates', *args, '--chunk-days', '2', stdout=StringIO())
+        out = StringIO()
+        call_command('refresh_aggregates', *args, '--verify', stdout=out)
+        self.assertIn('match', out.getvalue())
+        rows = aggregates.stored_rows(aggregates.STRENGTH, self.user.id, self.day, self.day + timedelta(days=5))
+        self.assertEqual(len(rows), 3)
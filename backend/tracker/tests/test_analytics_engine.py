@@ -0,0 +1,85 @@
+"""
+Tests for the array-based advanced analytics engine
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from tracker.analytics_engine import AdvancedAnalyticsEngine, grouped_slopes
+from tracker.models import BodyComposition, MuscleGroup, MuscleGroupMeasurement
+
+
+class GroupedSlopesTest(SimpleTestCase):
+    """Test the batched least-squares slopes"""
+
+    def test_matches_per_series_fit(self):
+        rng = np.random.default_rng(5)
+        groups = np.repeat([0, 1, 3], [6, 9, 4])
+        x = 20000 + rng.integers(0, 60, len(groups)).astype(float)
+        y = rng.normal(40, 3, len(groups))
+        slopes = grouped_slopes(x, y, groups, 4)
+        for group in (0, 1, 3):
+            expected = np.polyfit(x[groups == group], y[groups == group], 1)[0]
+            self.assertAlmostEqual(slopes[group], expected, places=9)
+        self.assertEqual(slopes[2], 0.0)
+
+    def test_constant_x_has_no_slope(self):
+        self.assertEqual(grouped_slopes([3, 3], [1, 5], [0, 0], 1).tolist(), [0.0])
+        self.assertEqual(grouped_slopes([], [], [], 2).tolist(), [0.0, 0.0])
+
+
+class AdvancedAnalyticsEngineTest(TestCase):
+    """Test the analyses over one bulk fetch per table"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='shape', password='pass12345')
+        self.chest = MuscleGroup.objects.create(name='chest', display_name='Chest')
+        self.biceps = MuscleGroup.objects.create(name='biceps', display_name='Biceps')
+        self.calves = MuscleGroup.objects.create(name='calves', display_name='Calves')
+        now = timezone.now()
+        for day in range(6):
+            # Date is auto_now_add on the model, so set it afterwards
+            composition = BodyComposition.objects.create(user=self.user, weight_kg=80 + 0.1 * day,
+                                                         body_fat_percentage=20 - 0.05 * day, muscle_mass_kg=40)
+            BodyComposition.objects.filter(pk=composition.pk).update(date=now - timedelta(days=5 - day))
+        for group, sizes in ((self.chest, [100, 100.5, 101, 101.5, 102, 102.5, 103]), (self.biceps, [35])):
+            for day, size in enumerate(sizes):
+                measurement = MuscleGroupMeasurement.objects.create(user=self.user, muscle_group=group,
+                                                                    circumference_cm=size, muscle_density='firm')
+                MuscleGroupMeasurement.objects.filter(pk=measurement.pk).update(
+                    date=now - timedelta(days=len(sizes) - 1 - day))
+
+    def test_constant_number_of_queries(self):
+        engine = AdvancedAnalyticsEngine(self.user)
+        with self.assertNumQueries(3):
+            composition = engine.analyze_body_composition_trends()
+            growth = engine.analyze_muscle_group_growth()
+            predictions = engine.generate_progress_predictions()
+            symmetry = engine.calculate_body_symmetry_score()
+
+        self.assertEqual(composition['data_points'], 6)
+        self.assertAlmostEqual(composition['weight_trend'], 0.1)
+        self.assertAlmostEqual(composition['weight_change_kg'], 0.5)
+
+        chest = growth['muscle_groups']['chest']
+        self.assertEqual(chest['measurements_count'], 7)
+        self.assertEqual((chest['current_size_cm'], chest['growth_cm']), (103.0, 3.0))
+
+        self.assertAlmostEqual(predictions['predicted_values']['weight_kg'], 80.5 + 3.0)
+        self.assertAlmostEqual(predictions['trends_analyzed']['body_fat_trend_per_day'], -0.05)
+        # Only the latest five chest measurements feed its prediction; biceps has one
+        self.assertEqual(predictions['muscle_predictions']['chest']['predicted_cm'], 103 + 0.5 * 30)
+        self.assertEqual(predictions['muscle_predictions']['biceps']['confidence'], 0.5)
+
+        self.assertEqual(symmetry['muscle_data']['chest']['size_cm'], 103.0)
+        self.assertEqual(symmetry['muscle_data']['biceps']['size_cm'], 35.0)
+
+    def test_windowed_growth_uses_recent_measurements(self):
+        growth = AdvancedAnalyticsEngine(self.user).analyze_muscle_group_growth(days=2)
+        chest = growth['muscle_groups']['chest']
+        self.assertEqual(chest['measurements_count'], 2)
+        self.assertAlmostEqual(chest['growth_cm'], 0.5)
+        self.assertEqual(growth['muscle_groups']['biceps']['measurements_count'], 0)
@@ -0,0 +1,45 @@
+"""
+Tests for pre-serialized broadcast frames
+"""
+import json
+
+from asgiref.sync import async_to_sync
+from channels.layers import InMemoryChannelLayer
+from django.test import SimpleTestCase
+
+from tracker.broadcast import agroup_broadcast, bytes_event
+from tracker.consumers import WorkoutConsumer
+
+
+class BroadcastFrameTest(SimpleTestCase):
+    """Test that group handlers forward the sender's frame untouched"""
+
+    def _consumer(self):
+        consumer = WorkoutConsumer()
+        consumer.sent = []
+
+        async def send(text_data=None, bytes_data=None, close=False):
+            consumer.sent.append(text_data if bytes_data is None else bytes_data)
+
+        consumer.send = send
+        return consumer
+
+    def test_handlers_forward_the_frame(self):
+        layer = InMemoryChannelLayer()
+        channels = [async_to_sync(layer.new_channel)() for _ in range(3)]
+        for channel in channels:
+            async_to_sync(layer.group_add)('workout_1', channel)
+        message = {'type': 'heart_rate_update', 'heart_rate': {'heart_rate': 140}, 'server_seq': 7}
+        event = async_to_sync(agroup_broadcast)(layer, 'workout_1', 'heart_rate_update', message)
+        self.assertEqual(event['type'], 'heart_rate_update')
+
+        consumer = self._consumer()
+        for channel in channels:
+            async_to_sync(consumer.heart_rate_update)(async_to_sync(layer.receive)(channel))
+        self.assertEqual(consumer.sent, [event['text']] * 3)
+        self.assertEqual(json.loads(consumer.sent[0]), message)
+
+    def test_binary_frames(self):
+        consumer = self._consumer()
+        async_to_sync(consumer.set_update)(bytes_event('set_update', b'\x01\x02'))
+        self.assertEqual(consumer.sent, [b'\x01\x02'])
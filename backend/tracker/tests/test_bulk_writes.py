@@ -0,0 +1,103 @@
+"""
+Tests for the bulk create/upsert endpoints used by offline-queue replays
+"""
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from tracker import aggregates, pr_index
+from tracker.bulk_writes import claim_keys, load_keys
+from tracker.models import ExerciseCatalog, NutritionLog, StrengthSet, WorkoutSession
+
+
+class BulkWriteTest(TestCase):
+    """Test per-item results, idempotent replays and side effects of bulk writes"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='lifter', password='pass12345')
+        self.other = User.objects.create_user(username='other', password='pass12345')
+        self.exercise = ExerciseCatalog.objects.create(name='Squat', category='strength')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.session = WorkoutSession.objects.create(user=self.user, start_time=timezone.now() - timedelta(hours=1))
+            self.foreign_session = WorkoutSession.objects.create(user=self.other, start_time=timezone.now())
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _sets(self, count, prefix='k'):
+        return [
+            {'idempotency_key': f'{prefix}{i}', 'session': self.session.id, 'exercise': self.exercise.id,
+             'set_number': i + 1, 'reps': 5, 'weight_kg': 100 + i}
+            for i in range(count)
+        ]
+
+    def test_bulk_create_in_few_queries(self):
+        """Many sets are validated and inserted with a constant number of queries"""
+        pr_index.ensure_indexed(self.user.id)
+        # Includes the PR index upserts of the new sets (their sessions, the indexed-user check, one executemany)
+        with self.assertNumQueries(12):
+            response = self.client.post('/api/v1/strength-sets/bulk/', self._sets(25), format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 25)
+        self.assertEqual(StrengthSet.objects.filter(session=self.session).count(), 25)
+        self.assertEqual([r['index'] for r in response.data['results']], list(range(25)))
+        self.assertEqual(pr_index.best(self.user.id, self.exercise.id)['value'], 124.0)
+
+    def test_replay_is_idempotent_upsert(self):
+        """Replaying the same keys updates the rows they created instead of duplicating them"""
+        first = self.client.post('/api/v1/strength-sets/bulk/', self._sets(3), format='json')
+        items = self._sets(3)
+        items[1]['reps'] = 8
+        items[2]['weight_kg'] = 90
+        second = self.client.post('/api/v1/strength-sets/bulk/', {'items': items}, format='json')
+        self.assertEqual(second.data['updated'], 3)
+        self.assertEqual([r['id'] for r in second.data['results']], [r['id'] for r in first.data['results']])
+        self.assertEqual(StrengthSet.objects.filter(session=self.session).count(), 3)
+        self.assertEqual(StrengthSet.objects.get(pk=first.data['results'][1]['id']).reps, 8)
+        # The lowered set gave up its record to the next best one
+        best = pr_index.best(self.user.id, self.exercise.id)
+        self.assertEqual((best['value'], best['set_id']), (101.0, first.data['results'][1]['id']))
+
+    def test_invalid_items_are_reported_per_item(self):
+        """Bad items and sessions of other users fail alone; the rest are written"""
+        items = self._sets(2)
+        items.append({'idempotency_key': 'x', 'session': self.foreign_session.id, 'exercise': self.exercise.id,
+                      'set_number': 1, 'reps': 5, 'weight_kg': 60})
+        items.append({'idempotency_key': 'y', 'session': self.session.id, 'exercise': self.exercise.id})
+        items.append(dict(items[0]))
+        response = self.client.post('/api/v1/strength-sets/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([r['status'] for r in response.data['results']],
+                         ['created', 'created', 'invalid', 'invalid', 'invalid'])
+        self.assertIn('session', response.data['results'][2]['errors'])
+        self.assertFalse(StrengthSet.objects.filter(session=self.foreign_session).exists())
+
+    def test_claim_keys_keeps_first_claim(self):
+        """A key already claimed by a concurrent request is not re-pointed at another row"""
+        winner = StrengthSet.objects.create(session=self.session, exercise=self.exercise, set_number=1, reps=5,
+                                            weight_kg=100)
+        self.assertEqual(claim_keys(self.user.id, 'strength_set', [('k0', winner.pk)]), {'k0'})
+        self.assertEqual(claim_keys(self.user.id, 'strength_set', [('k0', winner.pk + 1)]), set())
+        self.assertEqual(load_keys(self.user.id, 'strength_set', ['k0']), {'k0': winner.pk})
+
+    def test_bulk_marks_derived_data_dirty(self):
+        """bulk_create skips signals, so the endpoint marks the session's aggregates itself"""
+        with mock.patch.object(aggregates, 'mark_dirty') as mark_dirty:
+            self.client.post('/api/v1/strength-sets/bulk/', self._sets(2), format='json')
+        day = aggregates.local_day(self.session.start_time)
+        mark_dirty.assert_any_call(aggregates.STRENGTH, self.user.id, day)
+        mark_dirty.assert_any_call(aggregates.EXERCISE, self.user.id, day)
+
+    def test_bulk_nutrition_logs(self):
+        items = [
+            {'idempotency_key': f'n{i}', 'date': str(timezone.localdate()), 'calories': 500, 'protein_g': 30,
+             'carbs_g': 50, 'fat_g': 15}
+            for i in range(4)
+        ]
+        response = self.client.post('/api/v1/nutrition-logs/bulk/', items, format='json')
+        self.assertEqual(response.data['created'], 4)
+        self.assertEqual(NutritionLog.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(self.client.post('/api/v1/nutrition-logs/bulk/', [], format='json').status_code, 400)
@@ -0,0 +1,126 @@
+"""
+Tests for versioned dashboard change events and fragment deltas
+"""
+import json
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from tracker import dashboard_push
+from tracker.consumers import DashboardConsumer
+from tracker.models import BodyMeasurement, ExerciseCatalog, NutritionLog, StrengthSet, WorkoutSession
+
+IN_MEMORY_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class DashboardPushTest(TestCase):
+    """Test change events, fragment builders and the consumer's delta handling"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='lifter', password='pass12345')
+        self.exercise = ExerciseCatalog.objects.create(name='Bench Press', category='strength')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.session = WorkoutSession.objects.create(
+                user=self.user, start_time=timezone.now() - timedelta(hours=1), end_time=timezone.now(),
+            )
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(dashboard_push.dashboard_group(self.user.id), self.channel)
+
+    def _received(self):
+        messages = []
+        queue = self.layer.channels.get(self.channel)
+        while queue is not None and queue.qsize():
+            messages.append(async_to_sync(self.layer.receive)(self.channel))
+        return messages
+
+    def test_one_versioned_event_per_transaction(self):
+        """Several writes in one transaction bump the version once and name every changed fragment"""
+        epoch, version = dashboard_push.current_version(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            for reps in (5, 5, 3):
+                StrengthSet.objects.create(session=self.session, exercise=self.exercise, set_number=reps,
+                                           reps=reps, weight_kg=100)
+            NutritionLog.objects.create(user=self.user, date=timezone.localdate(), calories=600,
+                                        protein_g=40, carbs_g=60, fat_g=20)
+            self.assertEqual(self._received(), [])
+        messages = self._received()
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]['type'], 'dashboard_changed')
+        self.assertEqual((messages[0]['epoch'], messages[0]['version']), (epoch, version + 1))
+        self.assertEqual(messages[0]['fragments'], ['nutrition_today', 'recent_sessions'])
+
+    def test_batch_registers_once(self):
+        """Many writes in one transaction queue a single publish callback"""
+        with self.captureOnCommitCallbacks() as callbacks:
+            for _ in range(20):
+                dashboard_push.mark_changed('NutritionLog', self.user.id)
+        self.assertEqual(len(callbacks), 1)
+
+    def test_fragments(self):
+        """Fragments carry the set totals, today's nutrition and the latest measurement"""
+        with self.captureOnCommitCallbacks(execute=True):
+            StrengthSet.objects.create(session=self.session, exercise=self.exercise, set_number=1,
+                                       reps=5, weight_kg=100)
+            BodyMeasurement.objects.create(user=self.user, date=timezone.localdate(), weight_kg=82.5)
+        epoch, version, data = dashboard_push.snapshot(self.user.id)
+        self.assertEqual((epoch, version), dashboard_push.current_version(self.user.id))
+        self.assertEqual(data['recent_sessions'][0]['sets'], 1)
+        self.assertEqual(data['recent_sessions'][0]['volume'], 500.0)
+        self.assertEqual(data['recent_sessions'][0]['duration_minutes'], 60)
+        self.assertEqual(data['nutrition_today']['meals'], 0)
+        self.assertEqual(data['latest_measurement']['weight_kg'], 82.5)
+
+    def _consumer(self, epoch, version):
+        consumer = DashboardConsumer()
+        consumer.user_id = self.user.id
+        consumer.epoch = epoch
+        consumer.version = version
+        consumer.sent = []
+
+        async def send(text_data=None, bytes_data=None, close=False):
+            consumer.sent.append(json.loads(text_data))
+
+        consumer.send = send
+        return consumer
+
+    def test_consumer_sends_delta_or_resyncs_on_gap(self):
+        """The next version is pushed as a delta; stale events are dropped and gaps trigger a snapshot"""
+        epoch, _ = dashboard_push.current_version(self.user.id)
+        consumer = self._consumer(epoch, version=4)
+        async_to_sync(consumer.dashboard_changed)({'epoch': epoch, 'version': 4, 'fragments': ['recent_sessions']})
+        self.assertEqual(consumer.sent, [])
+
+        async_to_sync(consumer.dashboard_changed)({'epoch': epoch, 'version': 5, 'fragments': ['nutrition_today']})
+        self.assertEqual(consumer.sent[-1]['type'], 'dashboard_delta')
+        self.assertEqual(consumer.sent[-1]['version'], 5)
+        self.assertEqual(list(consumer.sent[-1]['fragments']), ['nutrition_today'])
+
+        async_to_sync(consumer.dashboard_changed)({'epoch': epoch, 'version': 9, 'fragments': ['nutrition_today']})
+        self.assertEqual(consumer.sent[-1]['type'], 'dashboard_update')
+        self.assertIn('recent_sessions', consumer.sent[-1]['data'])
+        self.assertEqual((consumer.epoch, consumer.version), dashboard_push.current_version(self.user.id))
+
+    def test_counter_is_shared_and_resets_resync(self):
+        """Workers with separate caches share one counter; a reset counter is resynced, not ignored"""
+        epoch, version = dashboard_push.current_version(self.user.id)
+        other_worker = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                    'LOCATION': 'other-worker'}}
+        with override_settings(CACHES=other_worker):
+            self.assertEqual(dashboard_push.next_version(self.user.id), (epoch, version + 1))
+        self.assertEqual(dashboard_push.current_version(self.user.id), (epoch, version + 1))
+
+        consumer = self._consumer(epoch, version=version + 1)
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM tracker_dashboard_version WHERE user_id = %s", [self.user.id])
+        new_epoch, new_version = dashboard_push.next_version(self.user.id)
+        self.assertEqual(new_version, 1)
+        async_to_sync(consumer.dashboard_changed)({'epoch': new_epoch, 'version': 1, 'fragments': ['nutrition_today']})
+        self.assertEqual(consumer.sent[-1]['type'], 'dashboard_update')
+        self.assertEqual((consumer.epoch, consumer.version), (new_epoch, 1))
@@ -0,0 +1,311 @@
+"""
+Tests for the streaming data export, background export jobs and bulk import
+"""
+import csv
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from tracker import export_jobs
+from tracker import aggregates
+from tracker.export_import import DataExporter, DataImporter
+from tracker.models import NutritionLog, WorkoutSession
+
+
+class StreamingExportTest(TestCase):
+    """Test JSON/NDJSON/CSV streaming and on-the-fly gzip"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='exporter', password='pass12345')
+        start = timezone.now() - timedelta(days=30)
+        for i in range(25):
+            WorkoutSession.objects.create(user=self.user, start_time=start + timedelta(days=i), notes=f'session {i}')
+        NutritionLog.objects.create(user=self.user, date=start.date(), calories=500, food_item='oats')
+        # A tiny chunk size forces several cursor round trips per data type
+        self.exporter = DataExporter(self.user, chunk_size=4)
+
+    def _body(self, *args, **kwargs):
+        return b''.join(self.exporter.stream_export(*args, **kwargs))
+
+    def test_stream_json_is_a_complete_document(self):
+        """The streamed JSON parses and carries the record count in its metadata"""
+        data = json.loads(self._body('json'))
+        self.assertEqual(len(data['workouts']), 25)
+        self.assertEqual(data['workouts'][0]['notes'], 'session 0')
+        self.assertEqual(len(data['nutrition_logs']), 1)
+        self.assertEqual(data['export_metadata']['total_records'], 26)
+
+    def test_stream_ndjson_one_record_per_line(self):
+        """Every NDJSON line is a typed record, metadata last"""
+        lines = [json.loads(line) for line in self._body('ndjson').decode().splitlines()]
+        self.assertEqual(sum(1 for line in lines if line['type'] == 'workouts'), 25)
+        self.assertEqual(lines[-1]['type'], 'export_metadata')
+        self.assertEqual(lines[-1]['record']['total_records'], 26)
+
+    def test_stream_csv_single_type(self):
+        """A single data type streams as a plain CSV table"""
+        rows = list(csv.reader(io.StringIO(self._body('csv', data_type='workouts').decode())))
+        self.assertIn('notes', rows[0])
+        self.assertEqual(len(rows), 26)
+
+    def test_every_format_honours_data_type(self):
+        """JSON and NDJSON carry only the requested data type besides the metadata"""
+        data = json.loads(self._body('json', data_type='nutrition_logs'))
+        self.assertEqual(set(data), {'nutrition_logs', 'export_metadata'})
+        self.assertEqual(data['export_metadata']['total_records'], 1)
+        types = {json.loads(line)['type'] for line in self._body('ndjson', data_type='workouts').decode().splitlines()}
+        self.assertEqual(types, {'workouts', 'export_metadata'})
+
+    def test_failures_raise_or_end_with_an_error_marker(self):
+        """Direct callers see the error; HTTP streams end with a marker instead of silently truncating"""
+        with mock.patch.object(DataExporter, 'export_metadata', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self._body('ndjson')
+            lines = [json.loads(line) for line in self._body('ndjson', error_marker=True).decode().splitlines()]
+            self.assertEqual(lines[-1]['type'], 'error')
+            self.assertEqual(lines[-1]['record']['records_streamed'], 26)
+            data = json.loads(self._body('json', error_marker=True))
+            self.assertIn('export_error', data)
+            self.assertEqual(len(data['workouts']), 25)
+
+        with mock.patch.object(DataExporter, 'iter_records', side_effect=RuntimeError('boom')):
+            data = json.loads(self._body('json', error_marker=True))
+            self.assertEqual(list(data), ['workouts', 'export_error'])
+
+    def test_gzip_stream_round_trips(self):
+        """Compressed output decompresses to the uncompressed stream"""
+        plain = json.loads(self._body('json'))
+        packed = json.loads(gzip.decompress(self._body('json', compress=True)))
+        plain['export_metadata'].pop('exported_at')
+        packed['export_metadata'].pop('exported_at')
+        self.assertEqual(plain, packed)
+
+    def test_export_endpoint_streams(self):
+        """The export endpoint answers stream=true with a StreamingHttpResponse"""
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        response = client.get('/api/v1/data/export/', {'format': 'ndjson', 'compress': 'gzip', 'stream': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        body = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertEqual(len(body.splitlines()), 27)
+
+
+class InlineExecutor:
+    """Runs submitted jobs immediately on the calling thread"""
+
+    def submit(self, fn, *args):
+        fn(*args)
+
+
+class ExportJobTest(TestCase):
+    """Test queued exports, artifact reuse and Range downloads"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        settings_override = override_settings(MAR_EXPORTS={'root': self.root, 'workers': 1, 'max_artifact_mb': 5})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        previous, export_jobs._executor = export_jobs._executor, InlineExecutor()
+        self.addCleanup(setattr, export_jobs, '_executor', previous)
+
+        self.user = User.objects.create_user(username='jobs', password='pass12345')
+        for i in range(10):
+            WorkoutSession.objects.create(user=self.user, start_time=timezone.now() - timedelta(days=i))
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _enqueue(self, **params):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.get('/api/v1/data/export/', dict({'format': 'json'}, **params))
+
+    def _artifacts(self):
+        return sorted(name for name in os.listdir(os.path.join(self.root, str(self.user.id))))
+
+    def test_job_runs_and_is_reused_until_data_changes(self):
+        """Exports are queued by default; unchanged data hands over the finished artifact"""
+        first = self._enqueue()
+        self.assertEqual(first.status_code, 202)
+        job = self.client.get(first.data['status_url']).data
+        self.assertEqual(job['status'], export_jobs.DONE)
+        self.assertEqual(job['records_written'], 10)
+        self.assertEqual(job['progress'], 1.0)
+
+        again = self.client.get(self._enqueue().data['status_url']).data
+        self.assertEqual(again['status'], export_jobs.DONE)
+        self.assertEqual(again['content_hash'], job['content_hash'])
+        self.assertEqual(len(self._artifacts()), 1)
+
+        WorkoutSession.objects.create(user=self.user, start_time=timezone.now())
+        changed = self.client.get(self._enqueue().data['status_url']).data
+        self.assertNotEqual(changed['content_hash'], job['content_hash'])
+
+        # Sessions have no updated_at; an edit in place still changes the fingerprint
+        WorkoutSession.objects.filter(user=self.user).update(notes='edited')
+        edited = self.client.get(self._enqueue().data['status_url']).data
+        self.assertNotEqual(edited['content_hash'], changed['content_hash'])
+        self.assertEqual(len(self._artifacts()), 3)
+
+    def test_enqueue_reuses_the_in_flight_job(self):
+        """A second request while a job is queued returns it without fingerprinting the data"""
+        with mock.patch.object(export_jobs, 'get_executor', return_value=mock.Mock()):
+            queued = self._enqueue()
+            with CaptureQueriesContext(connection) as queries:
+                again = self._enqueue()
+        self.assertEqual(again.status_code, 200)
+        self.assertTrue(again.data['reused'])
+        self.assertEqual(again.data['job_id'], queued.data['job_id'])
+        self.assertFalse(any('tracker_workoutsession' in query['sql'] for query in queries.captured_queries))
+
+    def test_failed_stream_marks_the_job_failed(self):
+        """An error mid-export fails the job instead of publishing a truncated artifact"""
+        with mock.patch.object(DataExporter, 'export_metadata', side_effect=RuntimeError('boom')):
+            job = self._enqueue().data
+        job = export_jobs.get_job(job['job_id'])
+        self.assertEqual(job['status'], export_jobs.FAILED)
+        self.assertIsNone(job['content_hash'])
+        self.assertEqual(self._artifacts(), [])
+
+    def test_expired_artifacts_are_deleted_once_unreferenced(self):
+        """Finished jobs past artifact_ttl_s expire; a shared artifact lives until its last job expires"""
+        old = self._enqueue().data['job_id']
+        new = self._enqueue().data['job_id']
+        path = export_jobs.get_job(old)['file_path']
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE tracker_export_job SET finished_at = %s WHERE id = %s", [
+                connection.ops.adapt_datetimefield_value(timezone.now() - timedelta(days=2)), old,
+            ])
+
+        self.assertEqual(export_jobs.expire_artifacts(), (1, 0))
+        self.assertEqual(export_jobs.get_job(old)['status'], export_jobs.EXPIRED)
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(self.client.get(f'/api/v1/data/export/jobs/{old}/download/').status_code, 410)
+
+        self.assertEqual(export_jobs.expire_artifacts(now=timezone.now() + timedelta(days=2)), (1, 1))
+        self.assertEqual(export_jobs.get_job(new)['status'], export_jobs.EXPIRED)
+        self.assertFalse(os.path.exists(path))
+
+    def test_dead_in_flight_job_is_not_reused(self):
+        """A running job whose worker stopped long ago is failed and a new one is queued"""
+        with mock.patch.object(export_jobs, 'get_executor', return_value=mock.Mock()):
+            dead = self._enqueue()
+        export_jobs.update_job(dead.data['job_id'], status=export_jobs.RUNNING)
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE tracker_export_job SET updated_at = %s WHERE id = %s", [
+                connection.ops.adapt_datetimefield_value(timezone.now() - timedelta(hours=1)), dead.data['job_id'],
+            ])
+
+        fresh = self._enqueue()
+        self.assertEqual(fresh.status_code, 202)
+        self.assertNotEqual(fresh.data['job_id'], dead.data['job_id'])
+        self.assertEqual(export_jobs.get_job(dead.data['job_id'])['status'], export_jobs.FAILED)
+
+    def test_download_supports_ranges(self):
+        """Full, partial, suffix and unsatisfiable ranges are answered per RFC 7233"""
+        job = self._enqueue(compress='gzip').data
+        url = self.client.get(job['status_url']).data['download_url']
+
+        full = self.client.get(url)
+        self.assertEqual(full.status_code, 200)
+        body = b''.join(full.streaming_content)
+        self.assertEqual(len(json.loads(gzip.decompress(body))['workouts']), 10)
+        self.assertEqual(full['Accept-Ranges'], 'bytes')
+
+        part = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(part.status_code, 206)
+        self.assertEqual(b''.join(part.streaming_content), body[10:20])
+        self.assertEqual(part['Content-Range'], f'bytes 10-19/{len(body)}')
+
+        tail = self.client.get(url, HTTP_RANGE='bytes=-5', HTTP_IF_RANGE=full['ETag'])
+        self.assertEqual(b''.join(tail.streaming_content), body[-5:])
+
+        stale = self.client.get(url, HTTP_RANGE='bytes=0-3', HTTP_IF_RANGE='"other"')
+        self.assertEqual(stale.status_code, 200)
+
+        self.assertEqual(self.client.get(url, HTTP_RANGE=f'bytes={len(body)}-').status_code, 416)
+
+    def test_oversized_export_fails_cleanly(self):
+        """Jobs past max_artifact_mb fail and leave no partial file behind"""
+        with override_settings(MAR_EXPORTS={'root': self.root, 'workers': 1, 'max_artifact_mb': 0}):
+            job = self._enqueue().data
+        job = export_jobs.get_job(job['job_id'])
+        self.assertEqual(job['status'], export_jobs.FAILED)
+        self.assertIn('exceeds', job['error'])
+        self.assertEqual(os.listdir(os.path.join(self.root, str(self.user.id))), [])
+
+
+class DataImportTest(TestCase):
+    """Test the batched, de-duplicating import path"""
+
+    def setUp(self):
+        self.source = User.objects.create_user(username='source', password='pass12345')
+        self.target = User.objects.create_user(username='target', password='pass12345')
+        start = timezone.now() - timedelta(days=20)
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(12):
+                WorkoutSession.objects.create(user=self.source, start_time=start + timedelta(days=i),
+                                              notes=f'session {i}')
+            for i in range(5):
+                NutritionLog.objects.create(user=self.source, date=(start + timedelta(days=i)).date(),
+                                            calories=400 + i, meal_type='lunch', food_item='rice')
+
+    def _export(self, format_type='json'):
+        return b''.join(DataExporter(self.source).stream_export(format_type))
+
+    def test_import_is_batched_and_idempotent(self):
+        """Rows land in per-batch transactions and a second import only finds duplicates"""
+        importer = DataImporter(self.target, batch_size=5)
+        self.assertTrue(importer.import_data(self._export()))
+        self.assertEqual(WorkoutSession.objects.filter(user=self.target).count(), 12)
+        self.assertEqual(NutritionLog.objects.filter(user=self.target).count(), 5)
+        self.assertEqual([b['received'] for b in importer.batches if b['type'] == 'workouts'], [5, 5, 2])
+
+        data = json.loads(self._export())
+        again = DataImporter(self.target, batch_size=5)
+        with CaptureQueriesContext(connection) as queries:
+            again.import_data(data)
+        lookups = [q for q in queries if 'tracker_workoutsession' in q['sql'] and q['sql'].startswith('SELECT')]
+        self.assertEqual(len(lookups), 3)
+        self.assertEqual(again.imported_count, 0)
+        self.assertEqual(again.duplicate_count, 17)
+        self.assertEqual(WorkoutSession.objects.filter(user=self.target).count(), 12)
+
+    def test_invalid_records_are_reported_not_fatal(self):
+        """Malformed records are counted while valid ones in the same batch import"""
+        data = json.loads(self._export())
+        data['nutrition_logs'].append({'date': 'not-a-date', 'calories': 1, 'food_item': 'x'})
+        data['workouts'].append({'start_time': 'yesterday'})
+        importer = DataImporter(self.target)
+        importer.import_data(data)
+        self.assertEqual(importer.invalid_count, 2)
+        self.assertEqual(len(importer.errors), 2)
+        self.assertEqual(NutritionLog.objects.filter(user=self.target).count(), 5)
+
+    def test_ndjson_import_marks_aggregates_dirty(self):
+        """NDJSON bodies stream through the endpoint and bulk-inserted sessions refresh aggregates"""
+        client = APIClient()
+        client.force_authenticate(user=self.target)
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = client.post('/api/v1/data/import/?import_nutrition=false', data=self._export('ndjson'),
+                                   content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['success'])
+        self.assertEqual(response.data['imported_count'], 12)
+        self.assertFalse(NutritionLog.objects.filter(user=self.target).exists())
+        self.assertTrue(callbacks)
+        self.assertTrue(any(key[0] == aggregates.STRENGTH and key[1] == self.target.id
+                            for batch in callbacks for key in getattr(batch, 'keys', ())))
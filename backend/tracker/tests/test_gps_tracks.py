@@ -0,0 +1,136 @@
+"""
+Tests for GPS track ingestion, summaries and simplification
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from tracker import gps_tracks
+from tracker.models import CardioEntry, ExerciseCatalog, WorkoutSession
+
+METRES_PER_DEGREE = 2 * np.pi * gps_tracks.EARTH_RADIUS_M / 360
+
+
+def run_north(seconds, speed_ms=3.0, lat0=52.5, lon0=13.4):
+    """A straight 1 Hz track heading north at a constant speed"""
+    t = np.arange(seconds, dtype=float)
+    return t, lat0 + t * speed_ms / METRES_PER_DEGREE, np.full(seconds, lon0)
+
+
+class TrackMathTest(SimpleTestCase):
+    """Test the vectorized distance, split and simplification helpers"""
+
+    def test_haversine(self):
+        self.assertAlmostEqual(float(gps_tracks.haversine_m(0, 0, 1, 0)), METRES_PER_DEGREE, places=3)
+        np.testing.assert_allclose(gps_tracks.haversine_m([0, 10], [0, 0], [0, 10], [0, 0]), [0, 0])
+
+    def test_summary_distance_pace_and_splits(self):
+        t, lat, lon = run_north(1068)  # 1067 s at 3 m/s = 3201 m
+        summary = gps_tracks.summarize_track(t, lat, lon, np.linspace(30, 60, len(t)))
+        self.assertAlmostEqual(summary['distance_m'], 3201, delta=1)
+        self.assertAlmostEqual(summary['moving_time_s'], 1067)
+        self.assertAlmostEqual(summary['avg_pace_s_per_km'], 1000 / 3, delta=0.5)
+        self.assertEqual([split['km'] for split in summary['splits']], [1, 2, 3, 4])
+        self.assertAlmostEqual(summary['splits'][0]['seconds'], 1000 / 3, delta=0.5)
+        self.assertAlmostEqual(summary['elevation_gain_m'], 30, delta=0.5)
+
+    def test_stops_and_gaps_are_not_moving_time(self):
+        t, lat, lon = run_north(101)
+        # Stand still for a minute, then lose signal for five
+        t = np.concatenate([t, t[-1] + np.arange(1, 61), t[-1] + 360 + np.arange(0, 101)])
+        lat = np.concatenate([lat, np.full(60, lat[-1]), lat[-1] + (np.arange(0, 101) + 5) * 3 / METRES_PER_DEGREE])
+        lon = np.full(len(t), lon[0])
+        summary = gps_tracks.summarize_track(t, lat, lon)
+        self.assertAlmostEqual(summary['moving_time_s'], 200)
+        self.assertAlmostEqual(summary['distance_m'], 600, delta=1)
+        self.assertAlmostEqual(summary['elapsed_time_s'], t[-1] - t[0])
+
+    def test_douglas_peucker(self):
+        x = np.arange(100, dtype=float)
+        np.testing.assert_array_equal(gps_tracks.douglas_peucker(x, np.zeros(100), 1.0), [0, 99])
+        # Out and back: the far end is kept although it lies on the start-end line
+        out_back = np.concatenate([x, x[::-1]])
+        kept = gps_tracks.douglas_peucker(out_back, np.zeros(200), 1.0)
+        self.assertIn(99, kept)
+
+    def test_simplify_respects_point_cap(self):
+        t = np.arange(5000, dtype=float)
+        lat = 52.5 + np.sin(t / 50) * 0.01
+        lon = 13.4 + t * 1e-5
+        kept = gps_tracks.simplify_track(lat, lon, tolerance_m=0.1, max_points=200)
+        self.assertLessEqual(len(kept), 200)
+        self.assertEqual((kept[0], kept[-1]), (0, 4999))
+
+    def test_encode_polyline(self):
+        """Reference example of the encoded polyline format"""
+        encoded = gps_tracks.encode_polyline([38.5, 40.7, 43.252], [-120.2, -120.95, -126.453])
+        self.assertEqual(encoded, '_p~iF~ps|U_ulLnnqC_mqNvxq`@')
+
+    def test_to_gps_row_validation(self):
+        self.assertIsNone(gps_tracks.to_gps_row(1, 2, {'latitude': 91, 'longitude': 0, 'timestamp': 1}))
+        self.assertIsNone(gps_tracks.to_gps_row(1, 2, {'latitude': 'x', 'longitude': 0, 'timestamp': 1}))
+        self.assertIsNone(gps_tracks.to_gps_row(1, 2, {'lat': 1, 'lng': 2}))
+        # Finite but unrepresentable epochs are rejected, not raised
+        self.assertIsNone(gps_tracks.to_gps_row(1, 2, {'lat': 1, 'lng': 2, 'timestamp': 1e20}))
+        row = gps_tracks.to_gps_row(1, 2, {'lat': 1, 'lng': 2, 'timestamp': '2025-01-01T10:00:00Z', 'accuracy': 4})
+        self.assertEqual(row[3:5], (1.0, 2.0))
+        self.assertEqual(row[7], 4.0)
+
+
+class SessionTrackTest(TestCase):
+    """Test the upload endpoint and the track stored on session completion"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='runner', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        start = timezone.now() - timedelta(hours=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.session = WorkoutSession.objects.create(user=self.user, start_time=start)
+        run = ExerciseCatalog.objects.create(name='Outdoor Run', category='cardio')
+        CardioEntry.objects.create(session=self.session, exercise=run, duration_minutes=20)
+        t, lat, lon = run_north(1200)
+        self.points = [
+            {'latitude': float(a), 'longitude': float(b), 'altitude': 35.0, 'accuracy': 5,
+             'timestamp': start.timestamp() + float(s)}
+            for s, a, b in zip(t, lat, lon)
+        ]
+
+    def test_upload_then_complete_stores_simplified_track(self):
+        bad = {'latitude': 200, 'longitude': 0, 'timestamp': 1}
+        response = self.client.post(f'/api/v1/sessions/{self.session.id}/gps/', {'points': self.points + [bad]},
+                                    format='json')
+        self.assertEqual((response.data['accepted'], response.data['rejected']), (1200, 1))
+        self.assertIsNone(response.data['track'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/v1/sessions/{self.session.id}/complete/')
+        track = gps_tracks.load_track(self.session.id)
+        self.assertAlmostEqual(track['distance_m'], 3597, delta=2)
+        self.assertEqual(track['point_count'], 1200)
+        self.assertLess(track['polyline_points'], 10)
+        self.assertEqual(len(track['splits']), 4)
+        self.assertAlmostEqual(CardioEntry.objects.get(session=self.session).distance_km, 3.597, delta=0.002)
+
+        response = self.client.get(f'/api/v1/sessions/{self.session.id}/track/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['polyline'], track['polyline'])
+
+    def test_active_track_is_summarized_without_writes(self):
+        """Reading an active session's track stores nothing and leaves its cardio entry blank"""
+        self.client.post(f'/api/v1/sessions/{self.session.id}/gps/', {'points': self.points[:600]}, format='json')
+        response = self.client.get(f'/api/v1/sessions/{self.session.id}/track/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['point_count'], 600)
+        self.assertIsNone(gps_tracks.load_track(self.session.id))
+        self.assertIsNone(CardioEntry.objects.get(session=self.session).distance_km)
+
+    def test_track_without_points(self):
+        response = self.client.get(f'/api/v1/sessions/{self.session.id}/track/')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(f'/api/v1/sessions/{self.session.id}/gps/', [], format='json')
+        self.assertEqual(response.status_code, 400)
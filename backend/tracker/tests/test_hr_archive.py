@@ -0,0 +1,100 @@
+"""
+Tests for the compressed per-session HR archive
+"""
+from datetime import date, datetime, timedelta
+from io import StringIO
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from tracker import aggregates, hr_archive
+from tracker.hr_ingest import to_sample_row, write_hr_rows
+from tracker.models import WorkoutSession
+
+
+class ArchiveCodecTest(SimpleTestCase):
+    """Test the delta/zlib payload encoding"""
+
+    def test_round_trip(self):
+        epoch_ms = np.array([1700000000000, 1700000001000, 1700000001500, 1700000009000], dtype=np.int64)
+        bpm = np.array([60, 190, 185, 40])
+        decoded_ms, decoded_bpm = hr_archive.decode(hr_archive.encode(epoch_ms, bpm))
+        np.testing.assert_array_equal(decoded_ms, epoch_ms)
+        np.testing.assert_array_equal(decoded_bpm, bpm)
+
+    def test_rejects_unsorted_and_foreign_payloads(self):
+        with self.assertRaises(ValueError):
+            hr_archive.encode([2000, 1000], [60, 61])
+        with self.assertRaises(ValueError):
+            hr_archive.decode(b'XXXX' + bytes(hr_archive.HEADER.size))
+
+
+class HRArchiveTest(TestCase):
+    """Test archiving sessions, reading them back and aggregates over archived samples"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='archiver', password='pass12345')
+        self.day = date(2025, 1, 15)
+        self.start = timezone.make_aware(datetime.combine(self.day, datetime.min.time()) + timedelta(hours=10))
+        self.session = WorkoutSession.objects.create(user=self.user, start_time=self.start,
+                                                     end_time=self.start + timedelta(hours=1))
+        # One hour at 1 Hz, a bounded random walk like a real recording
+        rng = np.random.default_rng(7)
+        self.bpm = np.clip(120 + np.cumsum(rng.integers(-2, 3, 3600)), 40, 220)
+        write_hr_rows([
+            to_sample_row(self.user.id, self.session.id, int(value), self.start.timestamp() + i)
+            for i, value in enumerate(self.bpm)
+        ])
+
+    def _raw_count(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM tracker_hr_sample WHERE session_id = %s", [self.session.id])
+            return cursor.fetchone()[0]
+
+    def test_archive_and_read_back(self):
+        """Archiving moves every sample into one compact row and the reader returns them unchanged"""
+        self.assertEqual(hr_archive.archive_session(self.session.id), 3600)
+        self.assertEqual(self._raw_count(), 0)
+        count, size = hr_archive.archive_size(self.session.id)
+        self.assertEqual(count, 3600)
+        self.assertLess(size / count, 2)  # a raw row alone is several times that
+
+        series = hr_archive.read_session(self.session.id)
+        np.testing.assert_array_equal(series.bpm, self.bpm)
+        self.assertEqual(series.timestamps[0], np.datetime64(int(self.start.timestamp() * 1000), 'ms'))
+        self.assertEqual(len(series.timestamps), 3600)
+
+    def test_late_samples_are_merged(self):
+        hr_archive.archive_session(self.session.id)
+        write_hr_rows([to_sample_row(self.user.id, self.session.id, 99, self.start.timestamp() + 3600)])
+        self.assertEqual(hr_archive.read_session(self.session.id).bpm[-1], 99)
+        self.assertEqual(hr_archive.archive_session(self.session.id), 1)
+        self.assertEqual(hr_archive.archive_size(self.session.id)[0], 3601)
+
+    def test_cardio_aggregates_unchanged(self):
+        """Daily cardio rows are the same before and after archiving"""
+        before = aggregates.compute_cardio_rows(self.user.id, self.day - timedelta(days=1), self.day + timedelta(days=1))
+        hr_archive.archive_session(self.session.id)
+        after = aggregates.compute_cardio_rows(self.user.id, self.day - timedelta(days=1), self.day + timedelta(days=1))
+        self.assertEqual(before.keys(), after.keys())
+        for column in ('total_samples', 'max_hr', 'min_hr', 'sessions_count'):
+            self.assertEqual(before[self.day][column], after[self.day][column])
+        self.assertAlmostEqual(before[self.day]['avg_hr'], after[self.day]['avg_hr'])
+        self.assertEqual(aggregates.first_hr_day(self.user.id), self.day)
+        truth = aggregates.ground_truth_cardio(self.user.id, self.day, self.day)[self.day]
+        self.assertEqual(truth['total_samples'], 3600)
+
+    def test_command_dry_run_then_archive(self):
+        out = StringIO()
+        call_command('archive_hr_sessions', '--dry-run', '--older-than-days', '1', stdout=out)
+        self.assertIn('3600 samples', out.getvalue())
+        self.assertEqual(self._raw_count(), 3600)
+
+        out = StringIO()
+        call_command('archive_hr_sessions', '--older-than-days', '1', stdout=out)
+        self.assertIn('Archived 3600 samples from 1 sessions', out.getvalue())
+        self.assertEqual(self._raw_count(), 0)
@@ -0,0 +1,96 @@
+"""
+Unit tests for the coalesced HR room broadcast scheduler
+"""
+import asyncio
+
+from django.test import SimpleTestCase
+
+from tracker.hr_broadcast import HRBroadcastScheduler
+
+
+class RecordingSender:
+    """Stands in for the channel-layer broadcast and records each message"""
+
+    def __init__(self, delay=0.0):
+        self.messages = []
+        self.delay = delay
+
+    async def __call__(self, group, message):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.messages.append((group, message))
+
+
+class HRBroadcastSchedulerTest(SimpleTestCase):
+    """Test coalescing, rate capping and adaptive intervals of HR broadcasts"""
+
+    def test_tick_coalesces_samples_per_room(self):
+        """Every sample since the last tick is folded into one aggregate per athlete and room"""
+        sender = RecordingSender()
+        scheduler = HRBroadcastScheduler(interval_ms=10000, sender=sender)
+
+        async def scenario():
+            for bpm in (120, 130, 140, 150):
+                scheduler.add('workout_1', 7, bpm)
+            scheduler.add('workout_2', 8, 90)
+            first = await scheduler.tick()
+            second = await scheduler.tick()
+            await scheduler.close()
+            return first, second
+
+        self.assertEqual(asyncio.run(scenario()), (2, 0))
+        by_group = {group: message for group, message in sender.messages}
+        self.assertEqual(by_group['workout_1']['heart_rate']['heart_rate'], 135)
+        self.assertEqual(by_group['workout_1']['heart_rate']['max_hr'], 150)
+        self.assertEqual(by_group['workout_1']['heart_rate']['samples_count'], 4)
+        self.assertEqual(by_group['workout_1']['server_seq'], 1)
+
+    def test_broadcasts_are_rate_capped(self):
+        """10x faster input than the interval yields about a tenth of the broadcasts and no lost samples"""
+        sender = RecordingSender()
+        scheduler = HRBroadcastScheduler(interval_ms=50, sender=sender)
+
+        async def scenario():
+            for i in range(60):
+                scheduler.add('workout_1', 7, 100 + i % 20)
+                await asyncio.sleep(0.005)
+            await scheduler.close()
+
+        asyncio.run(scenario())
+        self.assertLess(len(sender.messages), 15)
+        self.assertEqual(sum(m['heart_rate']['samples_count'] for _, m in sender.messages), 60)
+        seqs = [m['server_seq'] for _, m in sender.messages]
+        self.assertEqual(seqs, sorted(seqs))
+
+    def test_interval_backs_off_under_load(self):
+        """Slow ticks stretch the interval up to the ceiling, cheap ticks bring it back"""
+        sender = RecordingSender(delay=0.02)
+        scheduler = HRBroadcastScheduler(interval_ms=40, max_interval_ms=160, load_budget=0.25, sender=sender)
+
+        async def scenario():
+            for _ in range(3):
+                scheduler.add('workout_1', 7, 120)
+                await scheduler.tick()
+            slow = scheduler.stats()['interval_ms']
+            sender.delay = 0
+            for _ in range(3):
+                await scheduler.tick()
+            await scheduler.close()
+            return slow
+
+        self.assertEqual(asyncio.run(scenario()), 160)
+        self.assertEqual(scheduler.stats()['interval_ms'], 40)
+
+    def test_idle_rooms_are_forgotten(self):
+        now = [1000.0]
+        scheduler = HRBroadcastScheduler(interval_ms=10000, idle_rooms_s=30, sender=RecordingSender(),
+                                         clock=lambda: now[0])
+
+        async def scenario():
+            scheduler.add('workout_1', 7, 120)
+            await scheduler.tick()
+            now[0] += 31
+            await scheduler.close()
+
+        asyncio.run(scenario())
+        self.assertEqual(scheduler.stats()['rooms'], 0)
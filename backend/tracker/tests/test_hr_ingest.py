@@ -0,0 +1,196 @@
+"""
+Unit tests for the batched HR sample write-behind buffer
+"""
+import asyncio
+from datetime import datetime, timezone
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from tracker.hr_ingest import HRSampleBuffer, to_sample_row
+from tracker.minute_buckets import MinuteBucketAggregator, upsert_minute_rows, fetch_minute_series
+from tracker.views import HeartRateMinuteView
+
+
+class RecordingWriter:
+    """Stands in for the executemany writer and records each batch"""
+
+    def __init__(self, fail=False):
+        self.batches = []
+        self.fail = fail
+
+    def __call__(self, rows):
+        if self.fail:
+            raise RuntimeError("db down")
+        self.batches.append(list(rows))
+
+
+class HRSampleBufferTest(SimpleTestCase):
+    """Test batching, backpressure and flushing of HR samples"""
+
+    def test_to_sample_row_rejects_out_of_range(self):
+        """Samples outside the table CHECK range are rejected"""
+        self.assertIsNone(to_sample_row(1, 1, 12, 0))
+        self.assertIsNone(to_sample_row(1, 1, 250, 0))
+        self.assertIsNone(to_sample_row(1, 1, 'abc', 0))
+        self.assertIsNone(to_sample_row(1, 1, float('inf'), 0))
+        self.assertIsNone(to_sample_row(1, 1, 120, 1.7e12))
+        self.assertIsNone(to_sample_row(1, 1, 120, 1e20))
+        row = to_sample_row(1, 2, 142.6, 1700000000.0)
+        self.assertEqual(row[0:2], (1, 2))
+        self.assertEqual(row[3], 143)
+        self.assertEqual(row[4], 'websocket')
+
+    def test_flushes_when_batch_is_full(self):
+        """A full batch is written without waiting for the interval"""
+        writer = RecordingWriter()
+        buffer = HRSampleBuffer(flush_interval_ms=10000, max_batch=5, max_pending=100, writer=writer)
+
+        async def scenario():
+            for i in range(12):
+                await buffer.add(to_sample_row(1, 1, 100 + i, 1700000000 + i))
+            await asyncio.sleep(0.05)
+            await buffer.close()
+
+        asyncio.run(scenario())
+        self.assertEqual(sum(len(b) for b in writer.batches), 12)
+        self.assertTrue(all(len(b) <= 5 for b in writer.batches))
+        self.assertEqual(buffer.stats()['queue_depth'], 0)
+        self.assertEqual(buffer.stats()['flushed'], 12)
+
+    def test_flushes_on_interval(self):
+        """A partial batch is written once the interval elapses"""
+        writer = RecordingWriter()
+        buffer = HRSampleBuffer(flush_interval_ms=20, max_batch=500, max_pending=1000, writer=writer)
+
+        async def scenario():
+            await buffer.add(to_sample_row(1, 1, 120, 1700000000))
+            await asyncio.sleep(0.1)
+            flushed_before_close = buffer.stats()['flushed']
+            await buffer.close()
+            return flushed_before_close
+
+        self.assertEqual(asyncio.run(scenario()), 1)
+        self.assertGreater(buffer.stats()['flushes'], 0)
+
+    def test_explicit_flush_preserves_order(self):
+        """flush() drains everything in arrival order"""
+        writer = RecordingWriter()
+        buffer = HRSampleBuffer(flush_interval_ms=10000, max_batch=3, max_pending=100, writer=writer)
+
+        async def scenario():
+            for bpm in (90, 91, 92, 93):
+                await buffer.add(to_sample_row(1, 1, bpm, 1700000000))
+            await buffer.flush()
+            await buffer.close()
+
+        asyncio.run(scenario())
+        written = [row[3] for batch in writer.batches for row in batch]
+        self.assertEqual(written, [90, 91, 92, 93])
+
+    def test_backpressure_waits_for_space(self):
+        """Producers block while the buffer is at capacity"""
+        writer = RecordingWriter()
+        buffer = HRSampleBuffer(flush_interval_ms=10000, max_batch=2, max_pending=2, writer=writer)
+
+        async def scenario():
+            for i in range(6):
+                await buffer.add(to_sample_row(1, 1, 100, 1700000000 + i))
+            await buffer.close()
+
+        asyncio.run(scenario())
+        self.assertGreater(buffer.stats()['backpressure_waits'], 0)
+        self.assertEqual(buffer.stats()['flushed'], 6)
+        self.assertLessEqual(buffer.stats()['max_queue_depth'], 2)
+
+    def test_failed_flush_is_counted_not_raised(self):
+        """Writer errors drop the batch and free space for producers"""
+        buffer = HRSampleBuffer(flush_interval_ms=10000, max_batch=2, max_pending=10, writer=RecordingWriter(fail=True))
+
+        async def scenario():
+            for i in range(4):
+                await buffer.add(to_sample_row(1, 1, 100, 1700000000 + i))
+            await buffer.close()
+
+        asyncio.run(scenario())
+        stats = buffer.stats()
+        self.assertEqual(stats['dropped'], 4)
+        self.assertGreater(stats['flush_errors'], 0)
+        self.assertEqual(stats['queue_depth'], 0)
+
+
+class MinuteBucketAggregatorTest(SimpleTestCase):
+    """Test in-memory per-minute HR aggregation"""
+
+    def setUp(self):
+        self.t0 = datetime(2025, 1, 1, 10, 0, 0, tzinfo=timezone.utc)
+
+    def test_minute_closes_when_user_moves_on(self):
+        """A minute is emitted once a later minute arrives for the same user"""
+        agg = MinuteBucketAggregator(grace_seconds=5)
+        for second, bpm in ((0, 100), (20, 110), (59, 120)):
+            agg.add(1, self.t0.replace(second=second), bpm)
+        self.assertEqual(agg.pop_closed(now=self.t0.replace(second=59)), [])
+
+        agg.add(1, self.t0.replace(minute=1, second=2), 130)
+        closed = agg.pop_closed(now=self.t0.replace(minute=1, second=2))
+        self.assertEqual(closed, [(1, self.t0, 110, 3)])
+        self.assertEqual(len(agg), 1)
+
+    def test_minute_closes_after_grace(self):
+        """An idle user's last minute is closed by the wall clock"""
+        agg = MinuteBucketAggregator(grace_seconds=5)
+        agg.add(7, self.t0.replace(second=30), 90)
+        self.assertEqual(agg.pop_closed(now=self.t0.replace(minute=1, second=4)), [])
+        closed = agg.pop_closed(now=self.t0.replace(minute=1, second=6))
+        self.assertEqual(closed, [(7, self.t0, 90, 1)])
+
+    def test_buffer_feeds_aggregator(self):
+        """Written HR batches are folded into minute buckets and upserted on close"""
+        minutes = []
+        agg = MinuteBucketAggregator()
+        buffer = HRSampleBuffer(flush_interval_ms=10000, max_batch=100, max_pending=100,
+                                writer=RecordingWriter(), aggregator=agg, minute_writer=minutes.extend)
+        base = self.t0.timestamp()
+
+        async def scenario():
+            for i in range(90):
+                await buffer.add(to_sample_row(3, 1, 100 + (i % 2), base + i))
+            await buffer.close()
+
+        asyncio.run(scenario())
+        self.assertEqual([(m[1].minute, m[3]) for m in minutes], [(0, 60), (1, 30)])
+        self.assertEqual(buffer.stats()['minutes_upserted'], 2)
+
+
+class MinuteBucketUpsertTest(TestCase):
+    """Test the ON CONFLICT upsert into tracker_minute_hr"""
+
+    def test_upsert_merges_repeated_minutes(self):
+        """Flushing the same minute twice yields a sample-weighted average"""
+        minute = datetime(2025, 1, 1, 10, 0, tzinfo=timezone.utc)
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM tracker_minute_hr WHERE user_id = %s", [42])
+        upsert_minute_rows([(42, minute, 100, 30)])
+        upsert_minute_rows([(42, minute, 130, 10)])
+
+        rows = fetch_minute_series(42, minute, minute.replace(minute=1))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(int(rows[0][1]), 108)  # (100*30 + 130*10) / 40 = 107.5
+        self.assertEqual(int(rows[0][2]), 40)
+
+    def test_minute_view_rejects_impossible_dates(self):
+        """A well-formed but invalid date is a 400, not a 500"""
+        request = APIRequestFactory().get('/api/v1/analytics/heart-rate/minutes/', {'from': '2025-02-30T00:00'})
+        force_authenticate(request, user=User.objects.create_user(username='minutes', password='pass12345'))
+        self.assertEqual(HeartRateMinuteView.as_view()(request).status_code, 400)
+
+    def test_minute_view_caps_the_range(self):
+        """More than a week of minutes is a 400"""
+        request = APIRequestFactory().get('/api/v1/analytics/heart-rate/minutes/', {
+            'from': '2025-01-01T00:00:00Z', 'to': '2025-01-09T00:00:00Z',
+        })
+        force_authenticate(request, user=User.objects.create_user(username='minutes-range', password='pass12345'))
+        self.assertEqual(HeartRateMinuteView.as_view()(request).status_code, 400)
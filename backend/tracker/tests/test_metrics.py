@@ -1,8 +1,15 @@
 """
 Unit tests for fitness metrics calculations
 """
+import math
+
+import numpy as np
 from django.test import TestCase
-from tracker.metrics import epley_e1rm, coarse_trimp
+from tracker.calculators import FitnessCalculator
+from tracker.metrics import (
+    brzycki_e1rm, brzycki_e1rm_array, coarse_trimp, coarse_trimp_array, epley_e1rm, epley_e1rm_array,
+    mifflin_st_jeor_bmr, mifflin_st_jeor_bmr_array,
+)
 
 
 class MetricsTest(TestCase):
@@ -69,3 +76,44 @@ class MetricsTest(TestCase):
         # Invalid inputs
         self.assertEqual(coarse_trimp(-10, 30), 1)  # Negative HR
         self.assertEqual(coarse_trimp(150, -10), 1)  # Negative age
+
+    def test_array_variants_match_scalars(self):
+        """Test that the array variants agree with the scalar functions"""
+        weights = np.repeat([-10, 0, 42.5, 100], 6)
+        reps = np.tile([-5, 0, 1, 5, 12, 36], 4)
+        np.testing.assert_allclose(epley_e1rm_array(weights, reps), [epley_e1rm(w, r) for w, r in zip(weights, reps)])
+        np.testing.assert_allclose(brzycki_e1rm_array(weights, reps),
+                                   [brzycki_e1rm(w, r) for w, r in zip(weights, reps)])
+
+        heart_rates = [-10, 50, 100, 120, 150, 170, 190, 220]
+        for age in (-10, 18, 30, 60):
+            with self.subTest(age=age):
+                self.assertEqual(coarse_trimp_array(heart_rates, age).tolist(),
+                                 [coarse_trimp(hr, age) for hr in heart_rates])
+
+        bmr = mifflin_st_jeor_bmr_array([80, 60, 0], [180, 165, 170], [30, 25, 20], ['Male', 'female', 'male'])
+        self.assertEqual(bmr.tolist(), [mifflin_st_jeor_bmr(80, 180, 30, 'male'),
+                                        mifflin_st_jeor_bmr(60, 165, 25, 'female'), 0.0])
+
+    def test_brzycki_array_undefined_from_37_reps(self):
+        """Test that Brzycki is NaN where the formula is undefined"""
+        result = brzycki_e1rm_array([100, 100, 0], [36, 37, 40])
+        self.assertAlmostEqual(result[0], 3600)
+        self.assertTrue(math.isnan(result[1]))
+        self.assertEqual(result[2], 0.0)
+
+    def test_calculator_arrays(self):
+        """Test the FitnessCalculator array variants"""
+        bmi = FitnessCalculator.calculate_bmi_array([50, 70, 90, 120, 70], [180, 175, 180, 175, 0])
+        for i, (weight, height) in enumerate([(50, 180), (70, 175), (90, 180), (120, 175)]):
+            scalar = FitnessCalculator.calculate_bmi(weight, height)
+            self.assertEqual((bmi['bmi'][i], bmi['category'][i]), (scalar['bmi'], scalar['category']))
+        self.assertTrue(math.isnan(bmi['bmi'][4]))
+        self.assertIsNone(bmi['category'][4])
+
+        bmr = FitnessCalculator.calculate_bmr_array([80, 60], [180, 165], [30, 25], ['m', 'female'])
+        self.assertEqual(bmr[0], FitnessCalculator.calculate_bmr(80, 180, 30, 'm')['bmr'])
+        self.assertEqual(bmr[1], FitnessCalculator.calculate_bmr(60, 165, 25, 'female')['bmr'])
+        tdee = FitnessCalculator.calculate_tdee_array(bmr, ['active', 'unknown'])
+        self.assertEqual(tdee[0], FitnessCalculator.calculate_tdee(bmr[0], 'active')['tdee'])
+        self.assertTrue(math.isnan(tdee[1]))
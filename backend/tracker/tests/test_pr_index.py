@@ -0,0 +1,159 @@
+"""
+Tests for the incremental personal-record index
+"""
+from datetime import datetime, timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from tracker import pr_index
+from tracker.analytics import AdvancedAnalytics
+from tracker.gamification import GamificationEngine
+from tracker.models import ExerciseCatalog, Goal, StrengthSet, WorkoutSession
+from tracker.views import GoalViewSet
+
+
+def _forget(user_id):
+    """Drop a user's index rows and marker, as for sets written before the index existed"""
+    with pr_index.connection.cursor() as cursor:
+        cursor.execute("DELETE FROM tracker_pr_index WHERE user_id = %s", [user_id])
+        cursor.execute("DELETE FROM tracker_pr_index_user WHERE user_id = %s", [user_id])
+
+
+def _stored(user_id):
+    with pr_index.connection.cursor() as cursor:
+        cursor.execute(f"SELECT {', '.join(pr_index.COLUMNS[:-1])} FROM tracker_pr_index WHERE user_id = %s",
+                       [user_id])
+        return sorted(tuple(row) for row in cursor.fetchall())
+
+
+class RepBucketTest(SimpleTestCase):
+    """Test the keys a set competes for"""
+
+    def test_buckets(self):
+        self.assertEqual([pr_index.rep_bucket(r) for r in (0, 1, 2, 3, 4, 6, 7, 10, 11, 30)],
+                         [None, 1, 2, 2, 4, 4, 7, 7, 11, 11])
+
+    def test_set_keys(self):
+        self.assertEqual(pr_index.set_keys(60, 15), [
+            ('max_weight', 0, 60.0), ('one_rm', 0, 90.0), ('max_volume', 0, 900.0),
+            ('max_reps', 0, 15.0), ('max_weight', 11, 60.0),
+        ])
+        # Bodyweight sets only hold a reps record
+        self.assertEqual(pr_index.set_keys(None, 12), [('max_reps', 0, 12.0)])
+
+
+class PRIndexTest(TestCase):
+    """Test that signal-driven updates match a rebuild from the stored sets"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='prs', password='pass12345')
+        self.squat = ExerciseCatalog.objects.create(name='PR Squat', category='strength')
+        self.bench = ExerciseCatalog.objects.create(name='PR Bench', category='strength')
+        self.first_day = timezone.localdate() - timedelta(days=10)
+
+    def _session(self, offset, sets):
+        start = timezone.make_aware(datetime.combine(self.first_day + timedelta(days=offset), datetime.min.time())
+                                    + timedelta(hours=18))
+        session = WorkoutSession.objects.create(user=self.user, start_time=start)
+        return [
+            StrengthSet.objects.create(session=session, exercise=exercise, set_number=number, reps=reps,
+                                       weight_kg=weight)
+            for number, (exercise, reps, weight) in enumerate(sets, start=1)
+        ]
+
+    def _assert_matches_rebuild(self):
+        incremental = _stored(self.user.id)
+        pr_index.refresh_exercises(self.user.id)
+        self.assertEqual(incremental, _stored(self.user.id))
+
+    def test_writes_keep_the_index_current(self):
+        first = self._session(0, [(self.squat, 5, 100), (self.squat, 1, 120), (self.bench, 10, 60)])
+        second = self._session(2, [(self.squat, 5, 100), (self.squat, 3, 115)])
+        self._assert_matches_rebuild()
+
+        best = pr_index.best(self.user.id, self.squat.id)
+        self.assertEqual((best['value'], best['set_id']), (120.0, first[1].id))
+        # An equal value later does not take the record over
+        self.assertEqual(pr_index.best(self.user.id, self.squat.id, 'max_weight', 4)['set_id'], first[0].id)
+        self.assertEqual(pr_index.best(self.user.id, self.squat.id, 'max_weight', 2)['value'], 115.0)
+        self.assertEqual(pr_index.best(self.user.id, self.bench.id, 'max_reps')['value'], 10.0)
+
+        # Editing the holder down hands the key to the next best set
+        first[1].weight_kg = 90
+        first[1].save()
+        self.assertEqual(pr_index.best(self.user.id, self.squat.id)['set_id'], second[1].id)
+        self._assert_matches_rebuild()
+
+        # Deleting a set that holds nothing leaves the index alone; deleting a holder rebuilds its keys
+        second[0].delete()
+        self.assertEqual(pr_index.best(self.user.id, self.squat.id, 'max_weight', 4)['set_id'], first[0].id)
+        first[0].delete()
+        self.assertIsNone(pr_index.best(self.user.id, self.squat.id, 'max_weight', 4))
+        self._assert_matches_rebuild()
+
+        # Deleting the session removes its sets' records
+        second[1].session.delete()
+        self.assertEqual(pr_index.best(self.user.id, self.squat.id)['value'], 90.0)
+        self._assert_matches_rebuild()
+
+    def test_sets_written_before_the_index_are_backfilled_on_read(self):
+        held = self._session(0, [(self.squat, 5, 100), (self.bench, 8, 60)])
+        _forget(self.user.id)
+        self.assertEqual(pr_index.best(self.user.id, self.squat.id)['set_id'], held[0].id)
+        self.assertEqual(len(_stored(self.user.id)), 10)
+        # A user without sets stays empty
+        other = User.objects.create_user(username='no-sets', password='pass12345')
+        self.assertEqual(pr_index.records(other.id), {})
+
+    def test_older_sets_are_indexed_before_the_first_write(self):
+        """A weaker set saved before any read neither takes the record nor is reported as one"""
+        held = self._session(0, [(self.squat, 5, 100), (self.bench, 8, 60)])
+        _forget(self.user.id)
+        (weaker,) = self._session(1, [(self.squat, 5, 80)])
+
+        self.assertEqual(pr_index.best(self.user.id, self.squat.id)['set_id'], held[0].id)
+        self._assert_matches_rebuild()
+        daily = AdvancedAnalytics(self.user).compute_daily_analytics(weaker.session.start_time.date())
+        self.assertEqual(daily['personal_records'], [])
+
+    def test_session_delete_rebuilds_its_keys_once(self):
+        """Deleting a session rebuilds the keys its sets held in one pass, not once per set"""
+        self._session(0, [(self.squat, 5, 100), (self.bench, 8, 60)])
+        doomed = self._session(1, [(self.squat, 5, 110), (self.squat, 3, 115), (self.bench, 8, 70)])
+        with mock.patch.object(pr_index, 'rebuild_keys', wraps=pr_index.rebuild_keys) as rebuild:
+            doomed[0].session.delete()
+        self.assertEqual(rebuild.call_count, 1)
+        self.assertEqual(pr_index.best(self.user.id, self.squat.id)['value'], 100.0)
+        self._assert_matches_rebuild()
+
+    def test_session_start_moves_achieved_at(self):
+        (held,) = self._session(0, [(self.squat, 5, 100)])
+        session = held.session
+        session.start_time += timedelta(days=1)
+        session.save()
+        self.assertEqual(pr_index.best(self.user.id, self.squat.id)['achieved_at'], session.start_time)
+
+    def test_top_and_records(self):
+        self._session(0, [(self.squat, 5, 100), (self.bench, 5, 80)])
+        self.assertEqual([r['exercise_id'] for r in pr_index.top(self.user.id, limit=1)], [self.squat.id])
+        self.assertEqual(set(pr_index.records(self.user.id, 'one_rm')), {self.squat.id, self.bench.id})
+        self.assertEqual(pr_index.records(self.user.id, exercise_ids=[]), {})
+
+    def test_callers_read_the_index(self):
+        self._session(0, [(self.squat, 5, 140)])
+        Goal.objects.create(user=self.user, goal_type='strength', metric='lift_kg', target_value=200,
+                            exercise=self.squat)
+        request = APIRequestFactory().get('/api/v1/goals/')
+        force_authenticate(request, user=self.user)
+        response = GoalViewSet.as_view({'get': 'list'})(request)
+        goals = response.data['results'] if isinstance(response.data, dict) else response.data
+        self.assertEqual((goals[0]['current_value'], goals[0]['percent']), (140.0, 70.0))
+
+        engine = GamificationEngine(self.user)
+        self.assertTrue(engine.check_exercise_pr('pr squat'))
+        self.assertFalse(engine.check_exercise_pr('PR Bench'))
+        self.assertFalse(engine.check_exercise_pr({'exercise': 'PR Squat', 'weight_kg': 150}))
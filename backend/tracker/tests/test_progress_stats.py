@@ -0,0 +1,140 @@
+"""
+Tests for the grouped-aggregate fallback of ProgressStatsView
+"""
+from datetime import date, datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from tracker.models import ExerciseCatalog, NutritionLog, StrengthSet, WorkoutSession
+from tracker.views import ProgressExerciseTrendView, ProgressStatsView
+
+
+@override_settings(MAR_FLAGS={"aggregates_enabled": False})
+class ProgressStatsFallbackTest(TestCase):
+    """Test the ORM fallback against hand-computed history"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='stats', password='pass12345')
+        self.squat = ExerciseCatalog.objects.create(name='Stats Squat', category='strength')
+        self.bench = ExerciseCatalog.objects.create(name='Stats Bench', category='strength')
+        self.monday = date(2025, 3, 10)
+
+    def _session(self, day, sets=()):
+        start = timezone.make_aware(datetime.combine(day, datetime.min.time()) + timedelta(hours=18))
+        session = WorkoutSession.objects.create(user=self.user, start_time=start)
+        for number, (exercise, reps, weight) in enumerate(sets, start=1):
+            StrengthSet.objects.create(session=session, exercise=exercise, set_number=number,
+                                       reps=reps, weight_kg=weight)
+        return session
+
+    def _get(self):
+        request = APIRequestFactory().get('/api/v1/analytics/progress/summary/')
+        force_authenticate(request, user=self.user)
+        return ProgressStatsView.as_view()(request).data
+
+    def test_grouped_stats_match_history(self):
+        """Volume, PRs, weekly counts, streaks and nutrition come from grouped queries"""
+        self._session(self.monday, [(self.squat, 5, 100), (self.bench, 8, 60)])
+        self._session(self.monday, [(self.squat, 3, 110)])
+        self._session(self.monday + timedelta(days=1), [(self.squat, 5, 110)])
+        self._session(self.monday + timedelta(days=2))
+        self._session(self.monday + timedelta(days=7), [(self.bench, 5, 70)])
+        NutritionLog.objects.create(user=self.user, date=self.monday, calories=500, protein_g=30)
+        NutritionLog.objects.create(user=self.user, date=self.monday, calories=700, protein_g=40)
+
+        data = self._get()
+        self.assertEqual(data['volume_trend'], [
+            {'date': '2025-03-10', 'volume': 1310.0},
+            {'date': '2025-03-11', 'volume': 550.0},
+            {'date': '2025-03-12', 'volume': 0.0},
+            {'date': '2025-03-17', 'volume': 350.0},
+        ])
+        self.assertEqual(data['recent_sessions'][0], {'date': '2025-03-17', 'sets': 1, 'volume': 350.0})
+        self.assertEqual(len(data['recent_sessions']), 5)
+        self.assertEqual(
+            [(pr['exercise'], pr['max_weight'], pr['date']) for pr in data['prs']],
+            [('Stats Squat', 110.0, '2025-03-10'), ('Stats Bench', 70.0, '2025-03-17')],
+        )
+        self.assertEqual(data['sessions_per_week'], [
+            {'week': '2025-W11', 'count': 4},
+            {'week': '2025-W12', 'count': 1},
+        ])
+        self.assertEqual(data['kpis']['longest_streak'], 3)
+        self.assertEqual(data['kpis']['current_streak'], 1)
+        self.assertEqual(data['kpis']['best_week'], {'week': '2025-W11', 'count': 4})
+        self.assertEqual(data['nutrition_by_date'], [{'date': '2025-03-10', 'calories': 1200.0, 'protein': 70.0}])
+
+    def test_query_count_is_independent_of_history(self):
+        """A longer history does not add queries"""
+        self._session(self.monday, [(self.squat, 5, 100)])
+        with CaptureQueriesContext(connection) as short_history:
+            self._get()
+
+        for offset in range(1, 30):
+            self._session(self.monday + timedelta(days=offset), [(self.squat, 5, 100 + offset)])
+            NutritionLog.objects.create(user=self.user, date=self.monday + timedelta(days=offset), calories=100)
+        with CaptureQueriesContext(connection) as long_history:
+            data = self._get()
+
+        self.assertEqual(len(long_history), len(short_history))
+        self.assertEqual(len(data['volume_trend']), 30)
+        self.assertEqual(data['prs'][0]['max_weight'], 129.0)
+
+
+class ProgressExerciseTrendTest(TestCase):
+    """Test the per-exercise trend endpoint"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='trend', password='pass12345')
+        self.squat = ExerciseCatalog.objects.create(name='Trend Squat', category='strength')
+        self.bench = ExerciseCatalog.objects.create(name='Trend Bench', category='strength')
+        first = date(2025, 3, 10)
+        with self.captureOnCommitCallbacks(execute=True):
+            for offset, weight in ((0, 100), (2, 105), (8, 110)):
+                start = timezone.make_aware(datetime.combine(first + timedelta(days=offset), datetime.min.time())
+                                            + timedelta(hours=18))
+                session = WorkoutSession.objects.create(user=self.user, start_time=start)
+                StrengthSet.objects.create(session=session, exercise=self.squat, set_number=1, reps=5, weight_kg=weight)
+                StrengthSet.objects.create(session=session, exercise=self.bench, set_number=2, reps=5, weight_kg=200)
+
+    def _get(self, **params):
+        request = APIRequestFactory().get('/api/v1/analytics/progress/exercise-trend/', params)
+        force_authenticate(request, user=self.user)
+        return ProgressExerciseTrendView.as_view()(request)
+
+    def test_trend_is_per_exercise(self):
+        """Only the requested exercise is returned, with from/to bounds"""
+        response = self._get(exercise_id=self.squat.id, **{'from': '2025-03-11'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(p['date'], p['max_weight']) for p in response.data['trend']],
+            [('2025-03-12', 105.0), ('2025-03-18', 110.0)],
+        )
+
+    def test_weekly_resolution_matches_orm_fallback(self):
+        """The aggregate table and the grouped ORM fallback give the same weekly series"""
+        params = {'exercise_id': self.squat.id, 'resolution': 'week', 'to': '2025-03-31'}
+        from_table = self._get(**params).data['trend']
+        with override_settings(MAR_FLAGS={"aggregates_enabled": False}):
+            from_sets = self._get(**params).data['trend']
+        self.assertEqual(from_table, from_sets)
+        self.assertEqual([(p['date'], p['max_weight'], p['sets']) for p in from_table],
+                         [('2025-03-10', 105.0, 2), ('2025-03-17', 110.0, 1)])
+
+    def test_falls_back_before_backfill(self):
+        """A table without the user's rows (not backfilled yet) falls back to the sets"""
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM tracker_exercise_strength_daily WHERE user_id = %s", [self.user.id])
+        response = self._get(exercise_id=self.squat.id)
+        self.assertEqual([p['max_weight'] for p in response.data['trend']], [100.0, 105.0, 110.0])
+
+    def test_rejects_bad_parameters(self):
+        """Unknown resolutions and malformed dates are 400s"""
+        self.assertEqual(self._get(exercise_id=self.squat.id, resolution='year').status_code, 400)
+        self.assertEqual(self._get(exercise_id=self.squat.id, **{'from': '2025-13-01'}).status_code, 400)
+        self.assertEqual(self._get().status_code, 400)
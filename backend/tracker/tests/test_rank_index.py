@@ -0,0 +1,109 @@
+"""
+Tests for the gamification rank index
+"""
+import bisect
+import random
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from tracker import rank_index
+from tracker.models import GamificationProfile
+
+
+class SkipListTest(SimpleTestCase):
+    """Test the indexable skip list against a sorted Python list"""
+
+    def test_matches_sorted_list(self):
+        rng = random.Random(7)
+        skiplist, reference = rank_index.SkipList(), []
+        for _ in range(2000):
+            if reference and rng.random() < 0.4:
+                key = reference.pop(rng.randrange(len(reference)))
+                skiplist.remove(key)
+            else:
+                key = (rng.randint(-100, 100), rng.random())
+                bisect.insort(reference, key)
+                skiplist.insert(key)
+        self.assertEqual(len(skiplist), len(reference))
+        self.assertEqual(skiplist.slice(0, len(reference)), reference)
+        self.assertEqual(skiplist.slice(10, 25), reference[10:25])
+        for key in reference[::17]:
+            self.assertEqual(skiplist.bisect_left(key), bisect.bisect_left(reference, key))
+
+    def test_memory_index_ranks(self):
+        """Ties share a competition rank; positions and neighbours follow score order"""
+        index = rank_index.MemoryRankIndex()
+        index.load('xp', [(1, 50), (2, 80), (3, 50), (4, 10)])
+        index.update('xp', 4, 90)
+        self.assertEqual(index.range('xp', 0, 2), [(4, 90), (2, 80)])
+        self.assertEqual(index.count_above('xp', 50), 2)
+        self.assertEqual(index.position('xp', 3), 3)
+        index.remove('xp', 2)
+        self.assertEqual(index.range('xp', 0, 10), [(4, 90), (1, 50), (3, 50)])
+
+
+class GamificationLeaderboardTest(TestCase):
+    """Test the leaderboard endpoint served from the in-process index"""
+
+    def setUp(self):
+        previous, rank_index._index = rank_index._index, rank_index.MemoryRankIndex()
+        self.addCleanup(setattr, rank_index, '_index', previous)
+        self.users = []
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(12):
+                user = User.objects.create_user(username=f'gamer{i}', password='pass12345')
+                GamificationProfile.objects.create(user=user, total_xp=i * 100, current_level=1 + i // 5,
+                                                   current_streak=i % 4)
+                self.users.append(user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.users[5])
+
+    def test_top_rank_and_around_me(self):
+        """Top-K, the caller's rank and neighbours come from the index with no N+1"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/gamification/leaderboard/', {'limit': 3, 'around': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['username'] for row in response.data['leaderboard']], ['gamer11', 'gamer10', 'gamer9'])
+        self.assertEqual(response.data['user_rank'], 7)
+        self.assertEqual([(row['rank'], row['username']) for row in response.data['around_me']],
+                         [(6, 'gamer6'), (7, 'gamer5'), (8, 'gamer4')])
+        # Caller's profile, one load of the xp board, one bulk profile fetch
+        self.assertLessEqual(len(queries), 3)
+
+    def test_index_follows_profile_writes(self):
+        """Saving XP or a streak moves the user without reloading the board"""
+        rank_index.ensure_loaded('streak')
+        profile = GamificationProfile.objects.get(user=self.users[5])
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.total_xp = 5000
+            profile.current_streak = 30
+            profile.save()
+        self.assertEqual(rank_index.rank_of('xp', self.users[5].id), 1)
+        self.assertEqual(rank_index.rank_of('streak', self.users[5].id), 1)
+        # Level 2 with 5000 XP still ranks below both level-3 players
+        self.assertEqual(rank_index.rank_of('level', self.users[5].id), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.delete()
+        self.assertIsNone(rank_index.rank_of('xp', self.users[5].id))
+
+    def test_ties_share_a_rank_in_every_list(self):
+        """Top-K and neighbours use competition ranks, from the index and from the database alike"""
+        expected_top = [(1, 'gamer3'), (1, 'gamer7'), (1, 'gamer11'), (4, 'gamer2')]
+        expected_around = [(7, 'gamer1'), (7, 'gamer5'), (7, 'gamer9')]
+        params = {'type': 'streak', 'limit': 4, 'around': 1}
+
+        def ranks(response):
+            return ([(row['rank'], row['username']) for row in response.data['leaderboard']],
+                    response.data['user_rank'],
+                    [(row['rank'], row['username']) for row in response.data['around_me']])
+
+        response = self.client.get('/api/v1/gamification/leaderboard/', params)
+        self.assertEqual(ranks(response), (expected_top, 7, expected_around))
+        with mock.patch.object(rank_index, 'top', side_effect=RuntimeError('index down')):
+            response = self.client.get('/api/v1/gamification/leaderboard/', params)
+        self.assertEqual(ranks(response), (expected_top, 7, expected_around))
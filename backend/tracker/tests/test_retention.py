@@ -0,0 +1,111 @@
+"""
+Tests for the tiered time-series retention policy
+"""
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.utils import timezone
+
+from tracker import aggregates, hr_archive
+from tracker.hr_ingest import to_sample_row, write_hr_rows
+from tracker.minute_buckets import upsert_minute_rows
+from tracker.models import CardioEntry, ExerciseCatalog, WorkoutSession
+from tracker.retention import RetentionRun, delete_chunked
+
+
+class RetentionTest(TestCase):
+    """Test rollups, chunked deletes and frozen cardio days"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='keeper', password='pass12345')
+        self.old_day = timezone.localdate() - timedelta(days=40)
+        self.old_start = aggregates.day_bounds(self.old_day)[0] + timedelta(hours=8)
+        recent = timezone.now() - timedelta(days=1)
+        # Two minutes of device-synced samples without a session, and a few recent ones
+        write_hr_rows([to_sample_row(self.user.id, None, 100 + i % 20, self.old_start.timestamp() + i)
+                       for i in range(120)])
+        write_hr_rows([to_sample_row(self.user.id, None, 90, recent.timestamp() + i) for i in range(5)])
+        with connection.cursor() as cursor:
+            cursor.executemany("""
+                INSERT INTO tracker_gps_point (user_id, session_id, timestamp, latitude, longitude)
+                VALUES (%s, NULL, %s, 52.5, 13.4)
+            """, [(self.user.id, connection.ops.adapt_datetimefield_value(timezone.now() - timedelta(days=days)))
+                  for days in (100, 10)])
+        upsert_minute_rows([(self.user.id, timezone.now().replace(second=0, microsecond=0) - timedelta(days=400), 80, 60)])
+        aggregates.refresh_range(aggregates.CARDIO, self.user.id, self.old_day, self.old_day)
+
+    def _count(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE user_id = %s", [self.user.id])
+            return cursor.fetchone()[0]
+
+    def test_dry_run_changes_nothing(self):
+        report = RetentionRun(dry_run=True).run([self.user.id])
+        self.assertEqual(report['hr_samples_deleted'], 120)
+        self.assertEqual(report['gps_points_deleted'], 1)
+        self.assertEqual(report['minute_rows_deleted'], 1)
+        self.assertEqual(self._count('tracker_hr_sample'), 125)
+        self.assertEqual(self._count('tracker_gps_point'), 2)
+
+    def test_rolls_up_then_deletes_in_chunks(self):
+        """Expired samples become minute rows and a frozen daily row before they are deleted"""
+        before = aggregates.stored_rows(aggregates.CARDIO, self.user.id, self.old_day, self.old_day)[self.old_day]
+        report = RetentionRun(batch_size=7).run([self.user.id])
+
+        self.assertEqual(report['hr_samples_deleted'], 120)
+        self.assertEqual(report['minute_rows_filled'], 2)
+        self.assertEqual(self._count('tracker_hr_sample'), 5)
+        self.assertEqual(self._count('tracker_gps_point'), 1)
+        self.assertEqual(self._count('tracker_minute_hr'), 2)
+
+        # Refreshing or verifying the expired day keeps the rolled-up row
+        aggregates.refresh_range(aggregates.CARDIO, self.user.id, self.old_day, self.old_day)
+        after = aggregates.stored_rows(aggregates.CARDIO, self.user.id, self.old_day, self.old_day)[self.old_day]
+        self.assertEqual(after['total_samples'], 120)
+        self.assertEqual(after, before)
+        self.assertEqual(aggregates.diff_rows(aggregates.CARDIO, self.user.id, self.old_day, self.old_day), [])
+
+    def test_frozen_day_still_counts_cardio_entries(self):
+        """Only the HR columns of an expired day are frozen; its cardio entries are still counted and verified"""
+        RetentionRun().run([self.user.id])
+        run = ExerciseCatalog.objects.create(name='Frozen Run', category='cardio')
+        with self.captureOnCommitCallbacks(execute=True):
+            session = WorkoutSession.objects.create(user=self.user, start_time=self.old_start + timedelta(hours=2))
+            CardioEntry.objects.create(session=session, exercise=run, duration_minutes=30)
+        row = aggregates.stored_rows(aggregates.CARDIO, self.user.id, self.old_day, self.old_day)[self.old_day]
+        self.assertEqual((row['total_samples'], row['sessions_count']), (120, 1))
+
+        with connection.cursor() as cursor:
+            cursor.execute("UPDATE tracker_cardio_load_daily SET sessions_count = 0 WHERE user_id = %s",
+                           [self.user.id])
+        mismatches = aggregates.diff_rows(aggregates.CARDIO, self.user.id, self.old_day, self.old_day)
+        self.assertEqual(mismatches, [(self.old_day, 'sessions_count', 0, 1)])
+
+    def test_completed_sessions_are_archived_not_rolled_up(self):
+        session = WorkoutSession.objects.create(user=self.user, start_time=self.old_start,
+                                                end_time=self.old_start + timedelta(hours=1))
+        write_hr_rows([to_sample_row(self.user.id, session.id, 150, self.old_start.timestamp() + 600 + i)
+                       for i in range(30)])
+        report = RetentionRun().run([self.user.id])
+        self.assertEqual(report['sessions_archived'], 1)
+        self.assertEqual(report['hr_samples_deleted'], 120)
+        self.assertEqual(len(hr_archive.read_session(session.id).bpm), 30)
+
+    def test_delete_chunked_removes_whole_range(self):
+        end = timezone.now() - timedelta(days=30)
+        deleted = delete_chunked('tracker_hr_sample', 'timestamp', self.user.id, end, batch_size=13)
+        self.assertEqual(deleted, 120)
+        self.assertEqual(self._count('tracker_hr_sample'), 5)
+
+    def test_command_reports(self):
+        out = StringIO()
+        call_command('expire_timeseries', '--user', str(self.user.id), '--dry-run', stdout=out)
+        self.assertIn('hr_samples_deleted=120', out.getvalue())
+        out = StringIO()
+        call_command('expire_timeseries', '--user', str(self.user.id), stdout=out)
+        self.assertIn('Retention complete', out.getvalue())
+        self.assertEqual(self._count('tracker_hr_sample'), 5)
@@ -6,7 +6,9 @@ from rest_framework.test import APIClient
 from rest_framework import status
 import json
 from django.contrib.auth.models import User
+from django.utils import timezone
 from rest_framework_simplejwt.tokens import RefreshToken
+from tracker.models import WorkoutSession
 
 
 class APIV1SchemaTest(TestCase):
@@ -70,6 +72,7 @@ class APIV1SchemaTest(TestCase):
         """Test analytics endpoints schema"""
         analytics_endpoints = [
             '/api/v1/analytics/progress/summary/',
+            '/api/v1/analytics/heart-rate/minutes/',
             '/api/v1/analytics/nutrition/',
             '/api/v1/analytics/advanced/',
         ]
@@ -259,3 +262,59 @@ class APIV1ContractTest(TestCase):
         # Verify common analytics fields (adjust based on your implementation)
         # self.assertIn('total_sessions', data)
         # self.assertIn('total_volume', data)
+    
+    def test_export_job_endpoints_contract(self):
+        """Test background export job endpoints contract"""
+        for endpoint in [
+            '/api/v1/data/export/jobs/0123456789abcdef0123456789abcdef/',
+            '/api/v1/data/export/jobs/0123456789abcdef0123456789abcdef/download/',
+        ]:
+            response = self.client.get(endpoint)
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+            self.assertIn('error', response.json())
+    
+    def test_activity_feed_endpoint_contract(self):
+        """Test activity feed endpoint contract"""
+        response = self.client.get('/api/v1/social/feed/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        
+        data = response.json()
+        self.assertIn('results', data)
+        self.assertIn('next_cursor', data)
+        self.assertIsInstance(data['results'], list)
+    
+    def test_bulk_write_endpoints_contract(self):
+        """Test bulk write endpoints contract"""
+        for endpoint in ['/api/v1/strength-sets/bulk/', '/api/v1/nutrition-logs/bulk/']:
+            response = self.client.post(endpoint, [{'idempotency_key': 'k1'}], format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+            
+            data = response.json()
+            for field in ('results', 'created', 'updated', 'duplicate', 'invalid'):
+                self.assertIn(field, data)
+            self.assertEqual(data['results'][0]['status'], 'invalid')
+            self.assertIn('errors', data['results'][0])
+
+    def test_session_gps_endpoints_contract(self):
+        """Test session GPS upload and track endpoints contract"""
+        session = WorkoutSession.objects.create(user=self.user, start_time=timezone.now())
+        response = self.client.post(f'/api/v1/sessions/{session.id}/gps/', {'points': [
+            {'latitude': 52.5, 'longitude': 13.4, 'timestamp': 1700000000},
+            {'latitude': 52.501, 'longitude': 13.4, 'timestamp': 1700000300},
+        ]}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        for field in ('accepted', 'rejected', 'track'):
+            self.assertIn(field, response.json())
+        
+        response = self.client.get(f'/api/v1/sessions/{session.id}/track/')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.json()
+        for field in ('distance_m', 'moving_time_s', 'elevation_gain_m', 'avg_pace_s_per_km', 'splits', 'polyline'):
+            self.assertIn(field, data)
+
+    def test_session_hr_analytics_endpoint_contract(self):
+        """Test session HR analytics endpoint contract"""
+        session = WorkoutSession.objects.create(user=self.user, start_time=timezone.now())
+        response = self.client.get(f'/api/v1/sessions/{session.id}/hr-analytics/')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertIn('error', response.json())
@@ -0,0 +1,133 @@
+"""
+Tests for per-session HR analytics and the daily TRIMP rollup
+"""
+import math
+from datetime import timedelta
+from io import StringIO
+
+import numpy as np
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from tracker import aggregates, session_hr
+from tracker.hr_ingest import to_sample_row, write_hr_rows
+from tracker.models import WorkoutSession
+
+
+class AnalyzeHRTest(SimpleTestCase):
+    """Test the vectorized TRIMP, zone and drift computation"""
+
+    def test_steady_session(self):
+        t = np.arange(3600, dtype=float)
+        metrics = session_hr.analyze_hr(t, np.full(3600, 120), resting_hr=60, max_hr=180)
+        self.assertAlmostEqual(metrics['duration_s'], 3600)
+        self.assertAlmostEqual(metrics['banister_trimp'], 60 * 0.5 * 0.64 * math.exp(1.92 * 0.5), places=6)
+        self.assertAlmostEqual(metrics['edwards_trimp'], 60 * 2)  # 67% HRmax
+        self.assertEqual(metrics['zone_seconds']['recovery'], 3600)
+        self.assertAlmostEqual(metrics['cardiac_drift_pct'], 0.0)
+
+    def test_matches_per_sample_loop(self):
+        rng = np.random.default_rng(3)
+        t = np.cumsum(rng.integers(1, 4, 2000)).astype(float)
+        bpm = rng.integers(70, 200, 2000)
+        metrics = session_hr.analyze_hr(t, bpm, resting_hr=55, max_hr=195)
+
+        banister = 0.0
+        for i, value in enumerate(bpm):
+            gap = (t[i + 1] - t[i]) if i + 1 < len(t) else float(np.median(np.diff(t)))
+            fraction = min(max((value - 55) / 140, 0), 1)
+            banister += gap / 60 * fraction * 0.64 * math.exp(1.92 * fraction)
+        self.assertAlmostEqual(metrics['banister_trimp'], banister, places=6)
+        self.assertAlmostEqual(sum(metrics['zone_seconds'].values()), metrics['duration_s'])
+        self.assertEqual(metrics['max_hr'], int(bpm.max()))
+
+    def test_drift_and_gaps(self):
+        t = np.arange(2400, dtype=float)
+        bpm = np.where(t < 1200, 140, 147)
+        self.assertAlmostEqual(session_hr.analyze_hr(t, bpm, 60, 190)['cardiac_drift_pct'], 5.0)
+        # A ten-minute dropout counts as max_gap_s, and short sessions have no drift
+        gapped = session_hr.analyze_hr([0, 1, 601, 602], [100, 100, 100, 100], 60, 190)
+        self.assertAlmostEqual(gapped['duration_s'], 1 + 10 + 1 + 1)
+        self.assertIsNone(gapped['cardiac_drift_pct'])
+        self.assertIsNone(session_hr.analyze_hr([], [], 60, 190))
+
+
+class SessionHRStorageTest(TestCase):
+    """Test storage on completion, the total_trimp rollup and the backfill"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='pulse', password='pass12345')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def _session_with_samples(self, bpm=150, minutes=30, ended=False):
+        start = aggregates.day_bounds(timezone.localdate() - timedelta(days=1))[0] + timedelta(hours=12)
+        session = WorkoutSession.objects.create(user=self.user, start_time=start,
+                                                end_time=start + timedelta(minutes=minutes) if ended else None)
+        write_hr_rows([to_sample_row(self.user.id, session.id, bpm, start.timestamp() + i)
+                       for i in range(minutes * 60)])
+        return session
+
+    def test_complete_stores_analytics_and_daily_trimp(self):
+        session = self._session_with_samples()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/v1/sessions/{session.id}/complete/')
+        stored = session_hr.load_session(session.id)
+        self.assertEqual(stored['samples'], 1800)
+        self.assertEqual((stored['resting_hr'], stored['hr_max_used']), (60, 190))
+
+        day = aggregates.local_day(session.start_time)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT total_trimp, total_samples FROM tracker_cardio_load_daily "
+                           "WHERE user_id = %s AND date = %s", [self.user.id, day])
+            total_trimp, total_samples = cursor.fetchone()
+        self.assertEqual(total_trimp, round(stored['banister_trimp']))
+        self.assertEqual(total_samples, 1800)
+
+        response = self.client.get(f'/api/v1/sessions/{session.id}/hr-analytics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('zone_seconds', response.data)
+
+    def _daily_trimp(self, day):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT total_trimp FROM tracker_cardio_load_daily WHERE user_id = %s AND date = %s",
+                           [self.user.id, day])
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def test_moving_or_deleting_a_session_re_rolls_its_days(self):
+        session = self._session_with_samples()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/v1/sessions/{session.id}/complete/')
+        session.refresh_from_db()
+        day = aggregates.local_day(session.start_time)
+        trimp = round(session_hr.load_session(session.id)['banister_trimp'])
+        self.assertEqual(self._daily_trimp(day), trimp)
+
+        # Its samples stay on the old day, which no longer counts the session's TRIMP
+        session.start_time -= timedelta(days=1)
+        session.save()
+        self.assertEqual(self._daily_trimp(day), 0)
+        session.start_time += timedelta(days=1)
+        session.save()
+        self.assertEqual(self._daily_trimp(day), trimp)
+
+        session_id = session.id
+        session.delete()
+        self.assertIsNone(session_hr.load_session(session_id))
+        self.assertEqual(self._daily_trimp(day), 0)
+
+    def test_backfill_command(self):
+        sessions = [self._session_with_samples(bpm=120 + i, minutes=5, ended=True) for i in range(3)]
+        out = StringIO()
+        call_command('backfill_session_hr', '--workers', '1', '--chunk-size', '2', stdout=out)
+        self.assertIn('Stored HR analytics for 3 of 3 sessions', out.getvalue())
+        self.assertTrue(all(session_hr.load_session(s.id) for s in sessions))
+
+        out = StringIO()
+        call_command('backfill_session_hr', '--workers', '1', stdout=out)
+        self.assertIn('for 0 of 0 sessions', out.getvalue())
@@ -0,0 +1,89 @@
+"""
+Tests for the shared per-request data snapshot
+"""
+from datetime import datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from tracker.analytics import AdvancedAnalytics
+from tracker.models import (
+    BodyMeasurement, CardioEntry, ExerciseCatalog, NutritionLog, PersonalRecord, StrengthSet, WorkoutSession,
+)
+from tracker.recommendations import SmartRecommendations
+from tracker.snapshot import UserDataSnapshot
+
+
+class UserDataSnapshotTest(TestCase):
+    """Test the columnar views and that engines share one fetch"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='snap', password='pass12345')
+        self.squat = ExerciseCatalog.objects.create(name='Snap Squat', category='strength')
+        self.bench = ExerciseCatalog.objects.create(name='Snap Bench', category='strength')
+        self.run = ExerciseCatalog.objects.create(name='Snap Run', category='cardio')
+        self.today = timezone.localdate()
+        for offset, sets in ((1, [(self.squat, 5, 100)]), (0, [(self.squat, 5, 110), (self.bench, 20, 50)])):
+            start = timezone.make_aware(datetime.combine(self.today - timedelta(days=offset), datetime.min.time())
+                                        + timedelta(hours=9))
+            session = WorkoutSession.objects.create(user=self.user, start_time=start,
+                                                    end_time=start + timedelta(minutes=60))
+            for number, (exercise, reps, weight) in enumerate(sets, start=1):
+                StrengthSet.objects.create(session=session, exercise=exercise, set_number=number,
+                                           reps=reps, weight_kg=weight)
+        CardioEntry.objects.create(session=session, exercise=self.run, duration_minutes=20, distance_km=4.0)
+        NutritionLog.objects.create(user=self.user, date=self.today, calories=2000, protein_g=150,
+                                    carbs_g=200, fat_g=60, meal_type='lunch')
+        BodyMeasurement.objects.create(user=self.user, date=self.today - timedelta(days=60), weight_kg=82)
+        BodyMeasurement.objects.create(user=self.user, date=self.today, weight_kg=80)
+
+    def test_columns_and_derived_series(self):
+        snapshot = UserDataSnapshot(self.user)
+        self.assertEqual(len(snapshot.sessions), 2)
+        self.assertEqual(snapshot.set_columns['volume'].tolist(), [550.0, 1000.0, 500.0])
+
+        today = snapshot.strength_totals(self.today, self.today)
+        self.assertEqual(today, {'total_volume_kg': 1550.0, 'total_sets': 2, 'total_reps': 25,
+                                 'unique_exercises': 2})
+        self.assertIs(snapshot.strength_totals(self.today, self.today), today)
+        self.assertEqual(snapshot.cardio_totals(self.today, self.today)['total_distance_km'], 4.0)
+        self.assertEqual(snapshot.nutrition_totals(self.today, self.today)['meals_logged'], 1)
+        self.assertEqual(snapshot.exercise_stats(1)['Snap Bench']['avg_reps'], 20.0)
+        self.assertEqual(snapshot.exercise_stats(2)['Snap Squat']['max_weight'], 110.0)
+        # Measurements reach back past the 30-day window
+        self.assertEqual(len(snapshot.measurements), 2)
+
+    def test_engines_share_one_fetch(self):
+        snapshot = UserDataSnapshot(self.user)
+        analytics = AdvancedAnalytics(self.user, snapshot)
+        with CaptureQueriesContext(connection) as queries:
+            daily = analytics.compute_daily_analytics(self.today)
+            recommender = SmartRecommendations(self.user, snapshot)
+            recommender.get_workout_recommendations()
+            recommender.get_progress_recommendations()
+        session_reads = [q['sql'] for q in queries.captured_queries
+                         if 'FROM "tracker_workoutsession"' in q['sql'] or 'FROM "tracker_strengthset"' in q['sql']]
+        # The window's sessions, their sets, and the all-time session count
+        self.assertEqual(len(session_reads), 3)
+
+        self.assertEqual(daily['strength']['total_volume_kg'], 1550.0)
+        self.assertEqual(daily['cardio']['total_minutes'], 20)
+        self.assertEqual(daily['nutrition']['total_calories'], 2000)
+        self.assertEqual(daily['performance']['workout_frequency_7d'], 2)
+        self.assertEqual(daily['performance']['progress_indicators']['weight_change'], -2.0)
+        self.assertEqual({r['exercise'] for r in daily['personal_records']}, {'Snap Squat', 'Snap Bench'})
+        self.assertEqual(PersonalRecord.objects.get(user=self.user, exercise=self.squat).weight_kg, 110)
+
+    def test_records_are_reported_once(self):
+        first = AdvancedAnalytics(self.user, UserDataSnapshot(self.user)).compute_daily_analytics(self.today)
+        self.assertEqual(len(first['personal_records']), 2)
+        again = AdvancedAnalytics(self.user, UserDataSnapshot(self.user)).compute_daily_analytics(self.today)
+        self.assertEqual(again['personal_records'], [])
+
+    def test_dates_outside_the_window_get_their_own_snapshot(self):
+        analytics = AdvancedAnalytics(self.user, UserDataSnapshot(self.user, days=0))
+        daily = analytics.compute_daily_analytics(self.today - timedelta(days=1))
+        self.assertEqual(daily['strength']['total_volume_kg'], 500.0)
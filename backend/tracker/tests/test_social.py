@@ -0,0 +1,101 @@
+"""
+Tests for set-based leaderboard recomputation
+"""
+from datetime import date, datetime, timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from tracker.models import ExerciseCatalog, Leaderboard, LeaderboardEntry, StrengthSet, WorkoutSession
+from tracker.social import STREAK_WINDOW_DAYS, SocialFeatures, rank_scores
+
+
+class LeaderboardRecomputeTest(TestCase):
+    """Test grouped scoring, RANK() semantics and the upsert"""
+
+    def setUp(self):
+        self.users = [User.objects.create_user(username=f'lb{i}', password='pass12345') for i in range(3)]
+        self.squat = ExerciseCatalog.objects.create(name='LB Squat', category='strength')
+        self.engine = SocialFeatures(self.users[0])
+        self.engine.today = date(2025, 3, 12)
+
+    def _board(self, metric, period='weekly'):
+        return Leaderboard.objects.create(name=metric, description='', metric_type=metric, period_type=period)
+
+    def _session(self, user, day, volume=None):
+        start = timezone.make_aware(datetime.combine(day, datetime.min.time()) + timedelta(hours=7))
+        session = WorkoutSession.objects.create(user=user, start_time=start)
+        if volume:
+            StrengthSet.objects.create(session=session, exercise=self.squat, set_number=1, reps=1, weight_kg=volume)
+        return session
+
+    def _ranks(self, board):
+        return [(e.user.username, e.rank, e.score) for e in LeaderboardEntry.objects.filter(leaderboard=board)
+                .select_related('user').order_by('rank', 'user_id')]
+
+    def test_rank_scores_matches_sql_rank(self):
+        """Ties share a rank and the following rank is skipped"""
+        ranked = rank_scores([(3, 5.0, {}), (1, 9.0, {}), (2, 5.0, {}), (4, 1.0, {})])
+        self.assertEqual([(rank, item[0]) for rank, item in ranked], [(1, 1), (2, 2), (2, 3), (4, 4)])
+
+    def test_total_volume_ranks_and_drops_stale_entries(self):
+        """Weekly volume ranks users, and users without data leave the board"""
+        board = self._board('total_volume')
+        self._session(self.users[0], date(2025, 3, 10), 300)
+        self._session(self.users[1], date(2025, 3, 11), 200)
+        self._session(self.users[1], date(2025, 3, 12), 100)
+        stale = self._session(self.users[2], date(2025, 3, 11), 50)
+        self._session(self.users[2], date(2025, 3, 3), 1000)  # previous week
+
+        result = self.engine.update_leaderboard(board.id)
+        self.assertEqual(result['entries_updated'], 3)
+        self.assertEqual(self._ranks(board), [('lb0', 1, 300.0), ('lb1', 1, 300.0), ('lb2', 3, 50.0)])
+
+        stale.delete()
+        self.engine.update_leaderboard(board.id)
+        self.assertEqual(self._ranks(board), [('lb0', 1, 300.0), ('lb1', 1, 300.0)])
+
+    def test_query_count_is_independent_of_users(self):
+        """Recomputing costs the same number of queries for 3 or 20 users"""
+        board = self._board('consistency')
+        for user in self.users:
+            self._session(user, date(2025, 3, 10))
+        with CaptureQueriesContext(connection) as few:
+            self.engine.update_leaderboard(board.id)
+
+        for i in range(17):
+            self._session(User.objects.create_user(username=f'more{i}'), date(2025, 3, 11))
+        with CaptureQueriesContext(connection) as many:
+            self.engine.update_leaderboard(board.id)
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(LeaderboardEntry.objects.filter(leaderboard=board).count(), 20)
+
+    def test_streak_and_consistency_scores(self):
+        """Streaks count consecutive days up to the latest workout; consistency is days/period"""
+        for offset in (0, 1, 2, 4):
+            self._session(self.users[0], date(2025, 3, 2) + timedelta(days=offset))
+        self._session(self.users[0], date(2025, 3, 2))
+        self._session(self.users[1], date(2025, 3, 10))
+        self._session(self.users[1], date(2025, 3, 11))
+
+        streaks = self._board('workout_streak', 'all_time')
+        self.engine.update_leaderboard(streaks.id)
+        self.assertEqual(self._ranks(streaks), [('lb1', 1, 2.0), ('lb0', 2, 1.0)])
+
+        consistency = self._board('consistency', 'monthly')
+        self.engine.update_leaderboard(consistency.id)
+        scores = {name: score for name, _, score in self._ranks(consistency)}
+        self.assertAlmostEqual(scores['lb0'], 4 / 31 * 100)
+        self.assertAlmostEqual(scores['lb1'], 2 / 31 * 100)
+
+    def test_streak_reads_only_the_trailing_window(self):
+        """Workouts older than the streak window do not reach the board"""
+        self._session(self.users[0], self.engine.today - timedelta(days=STREAK_WINDOW_DAYS))
+        self._session(self.users[1], self.engine.today - timedelta(days=STREAK_WINDOW_DAYS - 1))
+
+        streaks = self._board('workout_streak', 'all_time')
+        self.engine.update_leaderboard(streaks.id)
+        self.assertEqual(self._ranks(streaks), [('lb1', 1, 1.0)])
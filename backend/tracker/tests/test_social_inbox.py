@@ -0,0 +1,81 @@
+"""
+Tests for fan-out-on-write social inbox delivery
+"""
+import json
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from tracker import social_inbox
+from tracker.models import Activity, UserConnection
+
+IN_MEMORY_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_LAYERS)
+class SocialInboxTest(TestCase):
+    """Test audience snapshots and delivery into per-user inbox groups"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', password='pass12345')
+        self.friend = User.objects.create_user(username='friend', password='pass12345')
+        self.private = User.objects.create_user(username='private', password='pass12345')
+        self.stranger = User.objects.create_user(username='stranger', password='pass12345')
+        UserConnection.objects.create(follower=self.friend, following=self.author)
+        UserConnection.objects.create(follower=self.private, following=self.author, can_view_workouts=False)
+        self.layer = get_channel_layer()
+        self.inboxes = {}
+        for user in (self.author, self.friend, self.private, self.stranger):
+            channel = async_to_sync(self.layer.new_channel)()
+            async_to_sync(self.layer.group_add)(social_inbox.inbox_group(user.id), channel)
+            self.inboxes[user.username] = channel
+
+    def _received(self, username):
+        messages = []
+        queue = self.layer.channels.get(self.inboxes[username])
+        while queue is not None and queue.qsize():
+            event = async_to_sync(self.layer.receive)(self.inboxes[username])
+            # Events carry the client frame already serialized
+            messages.append(json.loads(event['text']))
+        return messages
+
+    def test_revoked_connection_stops_delivery_in_every_process(self):
+        """A connection removed by a worker with its own cache is seen by the others at once"""
+        self.assertEqual(sorted(social_inbox.audience(self.author.id)), sorted([self.friend.id, self.private.id]))
+        other_worker = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                    'LOCATION': 'other-worker'}}
+        with override_settings(CACHES=other_worker):
+            UserConnection.objects.filter(follower=self.friend, following=self.author).delete()
+        self.assertEqual(social_inbox.audience(self.author.id), [self.private.id])
+        with self.assertNumQueries(1):
+            social_inbox.audience(self.author.id)
+
+    def test_activity_is_fanned_out_on_write(self):
+        """A new activity reaches each allowed follower's single inbox group"""
+        with self.captureOnCommitCallbacks(execute=True):
+            Activity.objects.create(user=self.author, activity_type='workout_completed', title='Leg day',
+                                    description='Squats')
+            Activity.objects.create(user=self.author, activity_type='personal_record', title='PR',
+                                    description='Bench', is_public=False)
+        friend_messages = self._received('friend')
+        self.assertEqual([m['type'] for m in friend_messages], ['friend_activity'])
+        self.assertEqual(friend_messages[0]['data']['title'], 'Leg day')
+        # No workout visibility for this follower; authors and strangers get nothing
+        self.assertEqual(self._received('private'), [])
+        self.assertEqual(self._received('stranger'), [])
+        self.assertEqual(self._received('author'), [])
+
+    def test_frame_is_serialized_once_per_delivery(self):
+        """Every inbox receives the identical pre-serialized frame"""
+        social_inbox.deliver([self.friend.id, self.private.id], {
+            'type': 'challenge_joined', 'challenge_id': 3, 'username': 'author', 'timestamp': None,
+        })
+        events = [
+            async_to_sync(self.layer.receive)(self.inboxes[name]) for name in ('friend', 'private')
+        ]
+        self.assertEqual(events[0]['text'], events[1]['text'])
+        self.assertEqual(json.loads(events[0]['text'])['data']['challenge_id'], 3)
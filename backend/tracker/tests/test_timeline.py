@@ -0,0 +1,97 @@
+"""
+Tests for the materialized, keyset-paginated activity timeline
+"""
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from tracker import timeline
+from tracker.models import Activity, ActivityComment, ActivityLike, UserConnection
+
+
+class ActivityTimelineTest(TestCase):
+    """Test write-time materialization, privacy and cursor pagination"""
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader', password='pass12345')
+        self.friend = User.objects.create_user(username='buddy', password='pass12345')
+        self.stranger = User.objects.create_user(username='nobody', password='pass12345')
+        UserConnection.objects.create(follower=self.reader, following=self.friend, can_view_progress=False)
+
+    def _activity(self, user, activity_type='workout_completed', **kwargs):
+        return Activity.objects.create(user=user, activity_type=activity_type, title=f'{user.username} {activity_type}',
+                                       description='', **kwargs)
+
+    def _titles(self, owner):
+        items, _ = timeline.fetch_page(owner.id, limit=100)
+        return [item['title'] for item in items]
+
+    def test_privacy_is_applied_at_write_time(self):
+        """Readers see their own and allowed friends' activities only"""
+        self._activity(self.reader)
+        self._activity(self.friend)
+        self._activity(self.friend, 'personal_record')   # connection hides progress
+        self._activity(self.friend, is_public=False)
+        self._activity(self.stranger)
+        self.assertEqual(sorted(self._titles(self.reader)), ['buddy workout_completed', 'reader workout_completed'])
+        self.assertEqual(len(self._titles(self.friend)), 3)
+
+    def test_keyset_pages_cover_ties_once(self):
+        """Pages never skip or repeat rows, even when timestamps collide"""
+        for _ in range(25):
+            self._activity(self.friend)
+        Activity.objects.filter(user=self.friend).update(created_at=timezone.now() - timedelta(hours=1))
+        timeline.rebuild_timeline(self.reader.id)
+
+        seen, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                items, cursor = timeline.fetch_page(self.reader.id, cursor, limit=10)
+            seen += [item['id'] for item in items]
+            if cursor is None:
+                break
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(len(set(seen)), 25)
+
+    def test_counters_and_connection_changes(self):
+        """Likes/comments are denormalized; connections backfill and drop an author's rows"""
+        activity = self._activity(self.stranger)
+        ActivityLike.objects.create(user=self.friend, activity=activity)
+        ActivityComment.objects.create(user=self.friend, activity=activity, comment='nice')
+        ActivityComment.objects.create(user=self.reader, activity=activity, comment='wow')
+
+        connection = UserConnection.objects.create(follower=self.reader, following=self.stranger)
+        items, _ = timeline.fetch_page(self.reader.id)
+        self.assertEqual([(i['id'], i['like_count'], i['comment_count']) for i in items], [(activity.id, 1, 2)])
+
+        connection.delete()
+        self.assertEqual(self._titles(self.reader), [])
+
+    def test_revoked_friend_misses_later_activities(self):
+        """An activity saved after a revocation in another worker is not materialized for the ex-friend"""
+        self._activity(self.friend)
+        other_worker = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                    'LOCATION': 'other-worker'}}
+        with override_settings(CACHES=other_worker):
+            UserConnection.objects.filter(follower=self.reader, following=self.friend).delete()
+        self._activity(self.friend)
+        self.assertEqual(self._titles(self.reader), [])
+
+    def test_feed_endpoint(self):
+        """The v1 feed returns results with a next cursor and rejects bad cursors"""
+        for _ in range(3):
+            self._activity(self.friend)
+        client = APIClient()
+        client.force_authenticate(user=self.reader)
+        first = client.get('/api/v1/social/feed/', {'limit': 2})
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(len(first.data['results']), 2)
+        rest = client.get('/api/v1/social/feed/', {'limit': 2, 'cursor': first.data['next_cursor']})
+        self.assertEqual(len(rest.data['results']), 1)
+        self.assertIsNone(rest.data['next_cursor'])
+        self.assertEqual(client.get('/api/v1/social/feed/', {'cursor': '!!'}).status_code, 400)
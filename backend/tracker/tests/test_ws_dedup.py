@@ -0,0 +1,136 @@
+"""
+Unit tests for time-windowed WebSocket message de-duplication
+"""
+import asyncio
+import json
+
+from channels.layers import InMemoryChannelLayer
+from django.test import SimpleTestCase
+
+from tracker.consumers import WorkoutConsumer
+from tracker.ws_dedup import MessageDeduplicator, RecentMessageIds
+
+
+class FakeRedis:
+    """Stands in for a Redis connection and honours SET NX"""
+
+    def __init__(self, keys, fail=False):
+        self.keys = keys
+        self.fail = fail
+
+    async def set(self, key, value, nx=False, ex=None):
+        if self.fail:
+            raise ConnectionError("redis down")
+        if nx and key in self.keys:
+            return None
+        self.keys[key] = ex
+        return True
+
+    async def delete(self, key):
+        if self.fail:
+            raise ConnectionError("redis down")
+        return int(self.keys.pop(key, None) is not None)
+
+
+class FakeRedisLayer:
+    """Stands in for a channels_redis layer shared by several workers"""
+
+    def __init__(self, fail=False):
+        self.keys = {}
+        self.fail = fail
+
+    def consistent_hash(self, value):
+        return 0
+
+    def connection(self, index):
+        return FakeRedis(self.keys, self.fail)
+
+
+class RecentMessageIdsTest(SimpleTestCase):
+    """Test the local sliding window"""
+
+    def test_duplicates_inside_window(self):
+        now = [0.0]
+        ids = RecentMessageIds(window_s=10, max_ids=100, clock=lambda: now[0])
+        self.assertTrue(ids.add('a'))
+        self.assertFalse(ids.add('a'))
+        now[0] = 11
+        self.assertNotIn('a', ids)
+        self.assertTrue(ids.add('a'))
+
+    def test_cap_evicts_oldest(self):
+        """The newest ids survive when the cap is reached"""
+        ids = RecentMessageIds(window_s=60, max_ids=3)
+        for msg_id in ('a', 'b', 'c', 'd'):
+            ids.add(msg_id)
+        self.assertEqual(len(ids), 3)
+        self.assertNotIn('a', ids)
+        self.assertIn('d', ids)
+
+
+class MessageDeduplicatorTest(SimpleTestCase):
+    """Test per-connection and shared duplicate detection"""
+
+    def test_local_only_layer(self):
+        dedup = MessageDeduplicator('1:2', InMemoryChannelLayer(), window_s=60, max_ids=10)
+        self.assertIsNone(dedup.store)
+
+        async def scenario():
+            return [await dedup.is_duplicate(msg_id) for msg_id in ('m1', 'm2', 'm1', None, None, 'x' * 200)]
+
+        self.assertEqual(asyncio.run(scenario()), [False, False, True, False, False, False])
+
+    def test_shared_window_survives_reconnect(self):
+        """A replay on a new connection (another worker) is caught through the channel layer"""
+        layer = FakeRedisLayer()
+        first = MessageDeduplicator('1:2', layer, window_s=60, shared=True)
+        second = MessageDeduplicator('1:2', layer, window_s=60, shared=True)
+        other_session = MessageDeduplicator('1:3', layer, window_s=60, shared=True)
+
+        async def scenario():
+            return (
+                await first.is_duplicate('m1'),
+                await second.is_duplicate('m1'),
+                await other_session.is_duplicate('m1'),
+            )
+
+        self.assertEqual(asyncio.run(scenario()), (False, True, False))
+        self.assertEqual(layer.keys['mar:wsdedup:1:2:m1'], 60)
+
+    def test_shared_store_failure_fails_open(self):
+        dedup = MessageDeduplicator('1:2', FakeRedisLayer(fail=True), window_s=60, shared=True)
+
+        async def scenario():
+            return await dedup.is_duplicate('m1'), await dedup.is_duplicate('m1')
+
+        self.assertEqual(asyncio.run(scenario()), (False, True))
+
+    def test_failed_handler_releases_the_id(self):
+        """A message whose handler raised is processed again when the client retries it"""
+        layer = FakeRedisLayer()
+        consumer = WorkoutConsumer()
+        consumer.server_seq = 0
+        consumer.dedup = MessageDeduplicator('1:2', layer, window_s=60, shared=True)
+        handled, errors = [], []
+
+        async def handle_set_completed(data):
+            handled.append(data['client_msg_id'])
+            if len(handled) == 1:
+                raise ValueError("database unavailable")
+
+        async def send_error(code, message):
+            errors.append(code)
+
+        consumer.handle_set_completed = handle_set_completed
+        consumer.send_error = send_error
+        message = json.dumps({'type': 'set_completed', 'client_msg_id': 'm1', 'set': {}})
+
+        async def scenario():
+            for _ in range(3):
+                await consumer.receive(message)
+
+        asyncio.run(scenario())
+        # Failed once, applied on the retry, and only then a duplicate
+        self.assertEqual(handled, ['m1', 'm1'])
+        self.assertEqual(errors, ['internal_error'])
+        self.assertIn('mar:wsdedup:1:2:m1', layer.keys)
@@ -0,0 +1,197 @@
+"""
+Materialized activity timelines.
+
+Each user's feed lives in ``tracker_activity_timeline`` (migration 0030): one
+row per (owner, activity), written when the activity is saved, with the
+author's privacy settings and each follower's connection flags already
+applied (see ``social_inbox.audience``, which reads the connections from the
+database, so a revoked friend never receives a later activity). Like and
+comment totals are kept per activity in ``tracker_activity_counts``.
+
+Reading a page is one query: a keyset range scan on
+(owner_id, created_at DESC, activity_id DESC) joined to the activity, its
+author and its counters, so its cost does not depend on how many friends the
+reader has or how far back they scroll.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.db import connection
+
+from .minute_buckets import as_aware_utc
+from .social_inbox import ACTIVITY_VISIBILITY, audience
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# Activities copied into a timeline when a new friend connection is made
+BACKFILL_ACTIVITIES = 50
+
+
+class InvalidCursor(ValueError):
+    """Raised for a malformed or tampered pagination cursor"""
+
+
+def encode_cursor(created_at, activity_id):
+    raw = f"{created_at.isoformat()}|{activity_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, activity_id) from a cursor produced by :func:`encode_cursor`"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, activity_id = base64.urlsafe_b64decode(padded.encode()).decode().split('|')
+        return datetime.fromisoformat(created_at), int(activity_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError) as e:
+        raise InvalidCursor(str(e))
+
+
+# ----------------------------------------------------------------------
+# Writes
+# ----------------------------------------------------------------------
+def _insert_rows(rows):
+    """rows: (owner_id, activity_id, author_id, created_at)"""
+    if not rows:
+        return
+    adapt = connection.ops.adapt_datetimefield_value
+    with connection.cursor() as cursor:
+        cursor.executemany("""
+            INSERT INTO tracker_activity_timeline (owner_id, activity_id, author_id, created_at)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (owner_id, activity_id) DO NOTHING
+        """, [(owner, activity, author, adapt(created)) for owner, activity, author, created in rows])
+
+
+def materialize_activity(activity):
+    """(Re)write the timeline rows of one activity for its author and allowed followers"""
+    owners = [activity.user_id]
+    if activity.is_public:
+        owners += audience(activity.user_id, activity.activity_type)
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM tracker_activity_timeline WHERE activity_id = %s", [activity.id])
+    _insert_rows([(owner, activity.id, activity.user_id, activity.created_at) for owner in owners])
+
+
+def remove_activity(activity_id):
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM tracker_activity_timeline WHERE activity_id = %s", [activity_id])
+        cursor.execute("DELETE FROM tracker_activity_counts WHERE activity_id = %s", [activity_id])
+
+
+def _visible_activities(author_id, flags, limit):
+    """Recent public activities of an author that a connection with these flags may see"""
+    from .models import Activity
+
+    hidden = [activity_type for activity_type, flag in ACTIVITY_VISIBILITY.items() if not flags.get(flag)]
+    return (
+        Activity.objects.filter(user_id=author_id, is_public=True)
+        .exclude(activity_type__in=hidden)
+        .order_by('-created_at', '-id')
+        .values_list('id', 'created_at')[:limit]
+    )
+
+
+def rebuild_pair(owner_id, author_id, limit=BACKFILL_ACTIVITIES):
+    """Re-derive an author's rows in one follower's timeline after their connection changed"""
+    from .models import UserConnection
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "DELETE FROM tracker_activity_timeline WHERE owner_id = %s AND author_id = %s",
+            [owner_id, author_id],
+        )
+    flags = (
+        UserConnection.objects.filter(follower_id=owner_id, following_id=author_id, connection_type='friend')
+        .values('can_view_workouts', 'can_view_progress').first()
+    )
+    if flags is not None:
+        _insert_rows([
+            (owner_id, activity_id, author_id, created_at)
+            for activity_id, created_at in _visible_activities(author_id, flags, limit)
+        ])
+
+
+def rebuild_timeline(owner_id, limit=BACKFILL_ACTIVITIES):
+    """Rebuild one user's whole timeline: their own activities plus those of everyone they follow"""
+    from .models import Activity, UserConnection
+
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM tracker_activity_timeline WHERE owner_id = %s", [owner_id])
+    own = Activity.objects.filter(user_id=owner_id).order_by('-created_at', '-id').values_list('id', 'created_at')
+    _insert_rows([(owner_id, activity_id, owner_id, created_at) for activity_id, created_at in own[:limit]])
+    followed = UserConnection.objects.filter(follower_id=owner_id, connection_type='friend')
+    for author_id in followed.values_list('following_id', flat=True):
+        rebuild_pair(owner_id, author_id, limit)
+
+
+def refresh_counts(activity_id):
+    """Recount likes and comments of one activity into its counter row"""
+    from .models import ActivityComment, ActivityLike
+
+    likes = ActivityLike.objects.filter(activity_id=activity_id).count()
+    comments = ActivityComment.objects.filter(activity_id=activity_id).count()
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            INSERT INTO tracker_activity_counts (activity_id, like_count, comment_count)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (activity_id) DO UPDATE SET
+                like_count = excluded.like_count, comment_count = excluded.comment_count
+        """, [activity_id, likes, comments])
+
+
+# ----------------------------------------------------------------------
+# Reads
+# ----------------------------------------------------------------------
+def fetch_page(owner_id, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """One page of a user's timeline, newest first, and the cursor for the next page"""
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    sql = """
+        SELECT t.activity_id, t.created_at, t.author_id, u.username,
+               a.activity_type, a.title, a.description, a.activity_data,
+               COALESCE(c.like_count, 0), COALESCE(c.comment_count, 0)
+        FROM tracker_activity_timeline t
+        JOIN tracker_activity a ON a.id = t.activity_id
+        JOIN auth_user u ON u.id = t.author_id
+        LEFT JOIN tracker_activity_counts c ON c.activity_id = t.activity_id
+        WHERE t.owner_id = %s
+    """
+    params = [owner_id]
+    if cursor:
+        created_at, activity_id = decode_cursor(cursor)
+        created_at = connection.ops.adapt_datetimefield_value(created_at)
+        sql += " AND (t.created_at < %s OR (t.created_at = %s AND t.activity_id < %s))"
+        params += [created_at, created_at, activity_id]
+    # One row past the page tells whether another page exists
+    sql += " ORDER BY t.created_at DESC, t.activity_id DESC LIMIT %s"
+    params.append(limit + 1)
+
+    with connection.cursor() as db:
+        db.execute(sql, params)
+        rows = db.fetchall()
+
+    items = []
+    for activity_id, created_at, author_id, username, activity_type, title, description, data, likes, comments in rows[:limit]:
+        created_at = as_aware_utc(created_at)
+        if isinstance(data, str):
+            data = json.loads(data)
+        items.append({
+            'id': activity_id,
+            'user_id': author_id,
+            'username': username,
+            'type': activity_type,
+            'title': title,
+            'description': description,
+            'data': data or {},
+            'created_at': created_at.isoformat(),
+            'like_count': likes,
+            'comment_count': comments,
+            '_created_at': created_at,
+        })
+    next_cursor = None
+    if len(rows) > limit and items:
+        next_cursor = encode_cursor(items[-1]['_created_at'], items[-1]['id'])
+    for item in items:
+        del item['_created_at']
+    return items, next_cursor
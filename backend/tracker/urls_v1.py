@@ -8,9 +8,9 @@ from .views import (
     RegisterView, LoginView, NutritionLogViewSet, FoodCatalogViewSet, WorkoutSessionViewSet,
     StrengthSetViewSet, CardioEntryViewSet, ExerciseCatalogViewSet,
     MuscleViewSet, EquipmentViewSet, TagViewSet, WeeklyPlanView, ProgressStatsView, 
-    ProgressExerciseTrendView, MeasurementViewSet, GoalViewSet, CalculatorView,
+    ProgressExerciseTrendView, HeartRateMinuteView, MeasurementViewSet, GoalViewSet, CalculatorView,
     MacroTargetViewSet, CalculatorResultViewSet, RecommendationsView,
-    AnalyticsView, SocialView, LeaderboardView, FriendActivityView,
+    AnalyticsView, SocialView, LeaderboardView, FriendActivityView, ActivityFeedView,
     ProgressPhotoViewSet, PhotoComparisonViewSet, BodyPartMeasurementViewSet,
     ProgressMilestoneViewSet, PhotoProgressAPIView, MuscleGroupViewSet,
     BodyCompositionViewSet, MuscleGroupMeasurementViewSet, BodyAnalyticsViewSet,
@@ -26,7 +26,7 @@ from .views import (
     OnboardingCompleteAPIView, OnboardingResetAPIView, UserProfileViewSet
 )
 from .auth_cookies import CookieTokenObtainPairView
-from .export_import import export_data, import_data, export_status
+from .export_import import export_data, import_data, export_status, export_job_status, export_job_download
 from .gamification_views import (
     gamification_dashboard, user_badges, daily_quests, award_xp,
     leaderboard, streak_bonuses, complete_quest, initialize_gamification
@@ -105,6 +105,7 @@ urlpatterns = [
     path('analytics/weekly-plan/', WeeklyPlanView.as_view(), name='v1_weekly_plan'),
     path('analytics/progress/summary/', ProgressStatsView.as_view(), name='v1_progress_summary'),
     path('analytics/progress/exercise-trend/', ProgressExerciseTrendView.as_view(), name='v1_progress_exercise_trend'),
+    path('analytics/heart-rate/minutes/', HeartRateMinuteView.as_view(), name='v1_heart_rate_minutes'),
     path('analytics/advanced/', AdvancedAnalyticsAPIView.as_view(), name='v1_advanced_analytics'),
     path('analytics/nutrition/', NutritionAnalyticsAPIView.as_view(), name='v1_nutrition_analytics'),
     
@@ -117,11 +118,14 @@ urlpatterns = [
     path('social/', SocialView.as_view(), name='v1_social'),
     path('social/leaderboards/<int:leaderboard_id>/', LeaderboardView.as_view(), name='v1_leaderboard'),
     path('social/friends/<int:friend_id>/activity/', FriendActivityView.as_view(), name='v1_friend_activity'),
+    path('social/feed/', ActivityFeedView.as_view(), name='v1_activity_feed'),
     
     # Data Management
     path('data/export/', export_data, name='v1_export_data'),
     path('data/import/', import_data, name='v1_import_data'),
     path('data/export-status/', export_status, name='v1_export_status'),
+    path('data/export/jobs/<str:job_id>/', export_job_status, name='v1_export_job_status'),
+    path('data/export/jobs/<str:job_id>/download/', export_job_download, name='v1_export_job_download'),
     
     # Photo Progress
     path('progress/photo-progress/', PhotoProgressAPIView.as_view(), name='v1_photo_progress'),
@@ -34,11 +34,13 @@ from .serializers import (
     NutritionGoalSerializer, WaterIntakeSerializer, SupplementLogSerializer, MealRatingSerializer,
     GroceryListSerializer, RestaurantFoodSerializer, NutritionalAnalysisSerializer,
     TrainerProfileSerializer, ExerciseContraindicationSerializer, UserProfileSerializer,
-    OnboardingStatusSerializer, OnboardingAnswersSerializer
+    OnboardingStatusSerializer, OnboardingAnswersSerializer, BulkStrengthSetSerializer
 )
+from .bulk_writes import BulkWriteMixin
 from .permissions import IsOwner
 from .filters import ExerciseFilter
 from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce, ExtractIsoYear, ExtractWeek, TruncDate
 from django.shortcuts import render
 from rest_framework import viewsets, permissions, generics
 from rest_framework.views import APIView
@@ -523,6 +525,8 @@ class ProgressStatsView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
+        from . import pr_index
+
         user = request.user
         
         # Try to use materialized views first, fallback to ORM
@@ -579,91 +583,62 @@ class ProgressStatsView(APIView):
         
         # If materialized view failed, use ORM fallback
         if not strength_data:
-            # Gather sessions and related strength sets
-            sessions = (
-                WorkoutSession.objects
-                .filter(user=user)
-                .prefetch_related('strength_sets')
-                .order_by('-start_time')
+            # Every query below is grouped in the database, so rows transferred are
+            # bounded by the number of output points rather than by account age
+            sessions = WorkoutSession.objects.filter(user=user, start_time__isnull=False)
+            set_volume = Sum(
+                F('strength_sets__reps') * F('strength_sets__weight_kg'),
+                output_field=models.FloatField(),
             )
 
-            # Volume trend per day (sum of reps*weight)
-            volume_by_date = {}
-            recent_sessions_data = []
-            session_dates = []
-            for s in sessions:
-                if not s.date:
-                    continue
-                date_key = s.date.isoformat() if hasattr(s.date, 'isoformat') else str(s.date)
-                session_dates.append(s.date)
-                total = 0
-                set_count = 0
-                for ss in getattr(s, 'strength_sets', []).all() if hasattr(s, 'strength_sets') else []:
-                    reps = ss.reps or 0
-                    weight = ss.weight_kg or 0
-                    total += reps * weight
-                    set_count += 1
-                volume_by_date[date_key] = volume_by_date.get(date_key, 0) + total
-                recent_sessions_data.append({
-                    'date': date_key,
-                    'sets': set_count,
-                    'volume': total,
-                })
-
-            # Sort recent sessions desc and trim
-            recent_sessions_data.sort(key=lambda x: x['date'], reverse=True)
-            recent_sessions = recent_sessions_data[:10]
+            # Volume trend per day (sum of reps*weight); days without sets count as 0
+            daily = (
+                sessions
+                .annotate(day=TruncDate('start_time'))
+                .values('day')
+                .annotate(volume=Coalesce(set_volume, 0.0))
+                .order_by('day')
+            )
+            volume_trend = [{'date': row['day'].isoformat(), 'volume': row['volume']} for row in daily]
+            session_dates = [row['day'] for row in daily]
 
-            volume_trend = [
-                { 'date': d, 'volume': volume_by_date[d] }
-                for d in sorted(volume_by_date.keys())
+            recent_sessions = [
+                {
+                    'date': timezone.localdate(row['start_time']).isoformat(),
+                    'sets': row['sets'],
+                    'volume': row['volume'],
+                }
+                for row in (
+                    sessions
+                    .values('id', 'start_time')
+                    .annotate(sets=Count('strength_sets'), volume=Coalesce(set_volume, 0.0))
+                    .order_by('-start_time')[:10]
+                )
             ]
 
-            # Personal records: max weight per exercise
-            max_by_exercise = {}
-            max_date_by_exercise = {}
-            for s in sessions:
-                for ss in getattr(s, 'strength_sets', []).all() if hasattr(s, 'strength_sets') else []:
-                    ex_id = ss.exercise_id
-                    weight = ss.weight_kg or 0
-                    if ex_id not in max_by_exercise or weight > max_by_exercise[ex_id]:
-                        max_by_exercise[ex_id] = weight
-                        max_date_by_exercise[ex_id] = s.date
-
-            # Resolve exercise names
-            exercise_names = {}
-            if max_by_exercise:
-                for ex in ExerciseCatalog.objects.filter(id__in=max_by_exercise.keys()):
-                    exercise_names[ex.id] = ex.name
-            prs = []
-            for ex_id, max_w in max_by_exercise.items():
-                date_val = max_date_by_exercise.get(ex_id)
-                date_str = date_val.isoformat() if hasattr(date_val, 'isoformat') else str(date_val)
-                prs.append({ 'exercise_id': ex_id, 'exercise': exercise_names.get(ex_id, f'Exercise #{ex_id}'), 'max_weight': max_w, 'date': date_str })
-            prs.sort(key=lambda x: x['max_weight'], reverse=True)
-            prs = prs[:8]  # top 8
-
             # Sessions per ISO week (YYYY-Www)
-            sessions_per_week = {}
-            for s in sessions:
-                if not s.date:
-                    continue
-                year, week, _ = s.date.isocalendar()
-                key = f"{year}-W{str(week).zfill(2)}"
-                sessions_per_week[key] = sessions_per_week.get(key, 0) + 1
-            sessions_per_week_list = [ { 'week': k, 'count': sessions_per_week[k] } for k in sorted(sessions_per_week.keys()) ]
+            weekly = (
+                sessions
+                .annotate(iso_year=ExtractIsoYear('start_time'), iso_week=ExtractWeek('start_time'))
+                .values('iso_year', 'iso_week')
+                .annotate(count=Count('id'))
+                .order_by('iso_year', 'iso_week')
+            )
+            sessions_per_week_list = [
+                {'week': f"{row['iso_year']}-W{str(row['iso_week']).zfill(2)}", 'count': row['count']}
+                for row in weekly
+            ]
 
             # KPIs
             last7_vol = sum([v['volume'] for v in volume_trend[-7:]]) if volume_trend else 0
             sessions_this_week = sessions_per_week_list[-1]['count'] if sessions_per_week_list else 0
 
             # Streaks (by day)
-            session_dates = sorted(set(session_dates))
             longest_streak = 0
             current_streak = 0
             prev = None
             for d in session_dates:
-                if prev and (d - prev == datetime.timedelta(days=1)):
+                if prev and (d - prev == timedelta(days=1)):
                     current_streak += 1
                 else:
                     current_streak = 1
@@ -682,7 +657,6 @@ class ProgressStatsView(APIView):
                 {'date': str(row[0]), 'sets': int(row[4]) or 0, 'volume': float(row[1]) or 0}
                 for row in strength_data[:10]
             ]
-            prs = []  # TODO: Implement PR extraction from materialized view
             sessions_per_week_list = []  # TODO: Implement weekly aggregation
             last7_vol = sum([v['volume'] for v in volume_trend[-7:]]) if volume_trend else 0
             sessions_this_week = 0  # TODO: Calculate from materialized view
@@ -690,17 +664,35 @@ class ProgressStatsView(APIView):
             longest_streak = 0  # TODO: Calculate from materialized view
             best_week = None  # TODO: Calculate from materialized view
 
-        # Nutrition overlay per date (always use ORM for now)
-        nutrition_by_date = []
-        totals = {}
-        for n in NutritionLog.objects.filter(user=user).only('date', 'calories', 'protein_g'):
-            key = n.date.isoformat() if hasattr(n.date, 'isoformat') else str(n.date)
-            entry = totals.get(key, {'calories': 0, 'protein': 0})
-            entry['calories'] += getattr(n, 'calories', 0) or 0
-            entry['protein'] += getattr(n, 'protein_g', 0) or 0
-            totals[key] = entry
-        for k in sorted(totals.keys()):
-            nutrition_by_date.append({ 'date': k, 'calories': totals[k]['calories'], 'protein': totals[k]['protein'] })
+        # Personal records: heaviest set per exercise from the PR index, top 8
+        records = pr_index.top(user.id, limit=8)
+        names = dict(
+            ExerciseCatalog.objects.filter(id__in=[r['exercise_id'] for r in records]).values_list('id', 'name')
+        )
+        prs = [
+            {
+                'exercise_id': r['exercise_id'],
+                'exercise': names.get(r['exercise_id']) or f"Exercise #{r['exercise_id']}",
+                'max_weight': r['value'],
+                'date': timezone.localdate(r['achieved_at']).isoformat(),
+            }
+            for r in records
+        ]
+
+        # Nutrition overlay per date
+        nutrition_by_date = [
+            {'date': row['date'].isoformat(), 'calories': row['calories'], 'protein': row['protein']}
+            for row in (
+                NutritionLog.objects
+                .filter(user=user)
+                .values('date')
+                .annotate(
+                    calories=Coalesce(Sum('calories'), 0.0, output_field=models.FloatField()),
+                    protein=Coalesce(Sum('protein_g'), 0.0, output_field=models.FloatField()),
+                )
+                .order_by('date')
+            )
+        ]
 
         # Fallback for current weight if materialized view didn't provide it
         if current_weight is None:
@@ -711,16 +703,9 @@ class ProgressStatsView(APIView):
             except Exception:
                 pass
 
-        # Today's calories from NutritionLog
-        try:
-            today = datetime.date.today()
-            calories_today = (
-                NutritionLog.objects.filter(user=user, date=today)
-                .aggregate(total=models.Sum('calories'))
-                .get('total') or 0
-            )
-        except Exception:
-            calories_today = 0
+        # Today's calories, already summed in the per-date overlay
+        today = timezone.localdate().isoformat()
+        calories_today = next((n['calories'] for n in nutrition_by_date if n['date'] == today), 0)
 
         # Generate ETag for caching
         etag_data = f"{user.id}:{current_weight}:{calories_today}:{len(volume_trend)}"
@@ -754,86 +739,117 @@ class ProgressStatsView(APIView):
         return response
 
 class ProgressExerciseTrendView(APIView):
+    """Per-exercise strength trend read from tracker_exercise_strength_daily"""
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request, *args, **kwargs):
+        from django.db import DatabaseError
+        from django.utils.dateparse import parse_date
+        from . import aggregates
+
         user = request.user
         ex_id = request.query_params.get('exercise_id')
         if not ex_id:
             return Response({ 'detail': 'exercise_id is required' }, status=400)
-        
-        # Try to use materialized view first, fallback to ORM
-        if not settings.MAR_FLAGS.get("aggregates_enabled", True):
-            # Force legacy ORM path for backward compatibility
-            strength_data = []
-        else:
+        try:
+            ex_id = int(ex_id)
+        except (TypeError, ValueError):
+            return Response({ 'detail': 'exercise_id must be an integer' }, status=400)
+
+        resolution = request.query_params.get('resolution') or 'day'
+        if resolution not in aggregates.RESOLUTIONS:
+            return Response({ 'detail': f"resolution must be one of {', '.join(aggregates.RESOLUTIONS)}" }, status=400)
+        bounds = {}
+        for param in ('from', 'to'):
+            raw = request.query_params.get(param)
             try:
-                with connection.cursor() as cursor:
-                    # Get exercise trend from materialized view
-                    cursor.execute("""
-                        SELECT date, best_e1rm, max_weight_lifted
-                        FROM tracker_strength_summary_daily 
-                        WHERE user_id = %s 
-                        ORDER BY date ASC
-                    """, [user.id])
-                    strength_data = cursor.fetchall()
-                    
-                    if strength_data:
-                        # Use materialized view data
-                        series = []
-                        for row in strength_data:
-                            date_str = str(row[0])
-                            best_e1rm = float(row[1]) if row[1] else 0
-                            max_weight = float(row[2]) if row[2] else 0
-                            series.append({
-                                'date': date_str,
-                                'max_weight': max_weight,
-                                'est_1rm': best_e1rm
-                            })
-                    else:
-                        raise Exception("No data in materialized view")
-                        
-            except Exception:
-                # Fallback to ORM if materialized views don't exist or fail
-                strength_data = []
-        
-        # If materialized view failed, use ORM fallback
-        if not strength_data:
-            trend = {}
-            for s in WorkoutSession.objects.filter(user=user).prefetch_related('strength_sets').order_by('start_time'):
-                date_key = s.start_time.isoformat() if hasattr(s.start_time, 'isoformat') else str(s.start_time)
-                for ss in getattr(s, 'strength_sets', []).all() if hasattr(s, 'strength_sets') else []:
-                    if str(ss.exercise_id) != str(ex_id):
-                        continue
-                    w = ss.weight_kg or 0
-                    r = ss.reps or 0
-                    est_1rm = w * (1 + r/30.0)
-                    if date_key not in trend or w > trend[date_key]['max_weight']:
-                        trend[date_key] = { 'date': date_key, 'max_weight': w, 'est_1rm': est_1rm }
-            series = [trend[k] for k in sorted(trend.keys())]
-        else:
-            # Use materialized view data
-            series = []
-            for row in strength_data:
-                date_str = str(row[0])
-                best_e1rm = float(row[1]) if row[1] else 0
-                max_weight = float(row[2]) if row[2] else 0
-                series.append({
-                    'date': date_str,
-                    'max_weight': max_weight,
-                    'est_1rm': best_e1rm
-                })
+                bounds[param] = parse_date(raw) if raw else None
+            except ValueError:
+                bounds[param] = None
+            if raw and bounds[param] is None:
+                return Response({ 'detail': f'"{param}" must be a YYYY-MM-DD date' }, status=400)
+        start_day, end_day = bounds['from'], bounds['to']
+        if start_day and end_day and start_day > end_day:
+            return Response({ 'detail': '"from" must not be after "to"' }, status=400)
+
+        # One range scan of the (user, exercise, date) aggregate; grouped ORM query as fallback
+        rows = None
+        if settings.MAR_FLAGS.get("aggregates_enabled", True):
+            try:
+                rows = aggregates.fetch_exercise_trend(user.id, ex_id, start_day, end_day)
+            except DatabaseError:
+                # Table missing (migrations not applied)
+                rows = None
+        if not rows:
+            # Also covers a table that has not been backfilled yet; without sets this stays empty
+            rows = aggregates.compute_exercise_trend(user.id, ex_id, start_day, end_day)
+
+        series = [
+            {
+                'date': row['date'].isoformat(),
+                'max_weight': row['max_weight'],
+                'est_1rm': row['best_e1rm_epley'],
+                'est_1rm_brzycki': row['best_e1rm_brzycki'],
+                'volume': row['total_volume'],
+                'sets': row['set_count'],
+                'reps': row['total_reps'],
+            }
+            for row in aggregates.downsample_trend(rows, resolution)
+        ]
 
         # Generate ETag for caching
-        etag_data = f"{user.id}:{ex_id}:{len(series)}"
+        last = series[-1] if series else {}
+        etag_data = f"{user.id}:{ex_id}:{start_day}:{end_day}:{resolution}:{len(series)}:{last.get('date')}:{last.get('volume')}"
         etag = hashlib.md5(etag_data.encode()).hexdigest()
 
-        response = Response({ 'trend': series })
+        response = Response({ 'trend': series, 'resolution': resolution })
         response['ETag'] = f'"{etag}"'
         response['Cache-Control'] = 'public, max-age=300'  # 5 minutes
         
         return response
 
+class HeartRateMinuteView(APIView):
+    """Minute-resolution heart rate read from the live tracker_minute_hr buckets"""
+    permission_classes = [permissions.IsAuthenticated]
+    # One row per minute: a week is ~10k rows, enough for any chart
+    max_range = timedelta(days=7)
+
+    def get(self, request, *args, **kwargs):
+        from django.utils.dateparse import parse_datetime
+        from .minute_buckets import fetch_minute_series
+
+        try:
+            # Well-formed but impossible dates (2025-02-30) raise ValueError
+            end = parse_datetime(request.query_params.get('to') or '') or timezone.now()
+            start = parse_datetime(request.query_params.get('from') or '') or (end - timedelta(hours=24))
+        except ValueError:
+            return Response({'detail': '"from" and "to" must be valid datetimes'}, status=400)
+        if timezone.is_naive(start):
+            start = timezone.make_aware(start)
+        if timezone.is_naive(end):
+            end = timezone.make_aware(end)
+        if start >= end:
+            return Response({'detail': '"from" must be before "to"'}, status=400)
+        if end - start > self.max_range:
+            return Response({'detail': f'Range is limited to {self.max_range.days} days'}, status=400)
+
+        # Table missing (migrations not applied) - behave like an empty range.
+        # Checked up front: a failed query would abort the Postgres transaction.
+        if 'tracker_minute_hr' in connection.introspection.table_names():
+            rows = fetch_minute_series(request.user.id, start, end)
+        else:
+            rows = []
+
+        series = [
+            {
+                'minute': row[0].isoformat() if hasattr(row[0], 'isoformat') else str(row[0]),
+                'avg_bpm': int(row[1]),
+                'samples': int(row[2]),
+            }
+            for row in rows
+        ]
+        return Response({'from': start.isoformat(), 'to': end.isoformat(), 'series': series})
+
 # A base viewset that automatically associates the user with the object
 class BaseUserViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated, IsOwner]
@@ -888,6 +904,49 @@ class WorkoutSessionViewSet(BaseUserViewSet):
         serializer = self.get_serializer(session)
         return Response(serializer.data)
 
+    @action(detail=True, methods=['get'], url_path='hr-analytics')
+    def hr_analytics(self, request, pk=None):
+        """TRIMP, HRR zone time and cardiac drift stored when the session was completed"""
+        from . import session_hr
+        session = self.get_object()
+        analytics = session_hr.load_session(session.id)
+        if analytics is None:
+            return Response({'error': 'No HR analytics for this session'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(analytics)
+
+    @action(detail=True, methods=['post'], url_path='gps')
+    def gps(self, request, pk=None):
+        """Bulk-upload GPS points recorded for a session (e.g. replayed from the device)"""
+        from . import gps_tracks
+        session = self.get_object()
+        points = request.data.get('points') if isinstance(request.data, dict) else request.data
+        if not isinstance(points, list) or not points:
+            return Response({'error': 'Expected a non-empty list of points'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(points) > gps_tracks.MAX_UPLOAD_POINTS:
+            return Response({'error': f'At most {gps_tracks.MAX_UPLOAD_POINTS} points per request'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        rows = [gps_tracks.to_gps_row(request.user.id, session.id, point) for point in points]
+        accepted = [row for row in rows if row is not None]
+        if accepted:
+            gps_tracks.write_gps_rows(accepted)
+        # Points uploaded after completion update the stored track right away
+        track = gps_tracks.store_track(session.id, session.user_id) if accepted and session.end_time else None
+        return Response({'accepted': len(accepted), 'rejected': len(rows) - len(accepted), 'track': track})
+
+    @action(detail=True, methods=['get'])
+    def track(self, request, pk=None):
+        """Distance, pace splits, elevation gain and simplified polyline of a session's GPS track"""
+        from . import gps_tracks
+        session = self.get_object()
+        # Completed sessions are served from the stored summary; active ones are summarized live, unstored
+        track = gps_tracks.load_track(session.id) if session.end_time else None
+        if track is None:
+            track = gps_tracks.compute_track(session.id)
+        if track is None:
+            return Response({'error': 'No GPS points for this session'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(track)
+
 class UserProfileViewSet(viewsets.ModelViewSet):
     """
     API endpoint for viewing and editing the user's profile and preferences.
@@ -918,9 +977,17 @@ class UserProfileViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(instance)
         return Response(serializer.data)
 
-class NutritionLogViewSet(BaseUserViewSet):
+class NutritionLogViewSet(BulkWriteMixin, BaseUserViewSet):
     queryset = NutritionLog.objects.all()
     serializer_class = NutritionLogSerializer
+    bulk_scope = 'nutrition_log'
+    bulk_owner_field = 'user'
+
+    def bulk_changed(self, objects, created=()):
+        from . import dashboard_push
+
+        if objects:
+            dashboard_push.mark_changed('NutritionLog', self.request.user.id)
 
 class MeasurementViewSet(BaseUserViewSet):
     queryset = BodyMeasurement.objects.all()
@@ -931,13 +998,20 @@ class GoalViewSet(BaseUserViewSet):
     serializer_class = GoalSerializer
 
     def list(self, request, *args, **kwargs):
+        from . import pr_index
+
         # Include a computed progress field per goal
         response = super().list(request, *args, **kwargs)
-        items = response.data
+        # Paginated responses carry the goals under 'results'
+        items = response.data['results'] if isinstance(response.data, dict) else response.data
         try:
             # Resolve exercise names
             exercise_ids = [g['exercise'] for g in items if g.get('exercise')]
             ex_names = { ex.id: ex.name for ex in ExerciseCatalog.objects.filter(id__in=exercise_ids) }
+            # Heaviest set per lift goal exercise, from the PR index
+            lift_records = pr_index.records(
+                request.user.id, exercise_ids=[g['exercise'] for g in items if g.get('metric') == 'lift_kg']
+            )
             # Compute progress
             for g in items:
                 metric = g.get('metric')
@@ -955,12 +1029,8 @@ class GoalViewSet(BaseUserViewSet):
                     ex_id = g.get('exercise')
                     if ex_id:
                         g['exercise_name'] = ex_names.get(ex_id)
-                        best = 0
-                        for s in WorkoutSession.objects.filter(user=request.user).prefetch_related('strength_sets'):
-                            for ss in s.strength_sets.all():
-                                if ss.exercise_id == ex_id and (ss.weight_kg or 0) > best:
-                                    best = ss.weight_kg or 0
-                        progress = best
+                        record = lift_records.get(ex_id)
+                        progress = record['value'] if record else 0
                 g['current_value'] = progress
                 # ETA calculation
                 if progress is not None and target:
@@ -1075,13 +1145,48 @@ class FoodCatalogViewSet(viewsets.ReadOnlyModelViewSet):
 # These viewsets are for nested objects and are more tightly controlled
 # For simplicity, StrengthSet and CardioEntry are created/managed via WorkoutSession
 # If direct access is needed, they would look like this:
-class StrengthSetViewSet(viewsets.ModelViewSet):
+class StrengthSetViewSet(BulkWriteMixin, viewsets.ModelViewSet):
     serializer_class = StrengthSetSerializer
     permission_classes = [permissions.IsAuthenticated]
+    bulk_scope = 'strength_set'
+    bulk_serializer_class = BulkStrengthSetSerializer
 
     def get_queryset(self):
         return StrengthSet.objects.filter(session__user=self.request.user)
 
+    def bulk_prefetch(self, items):
+        """The user's sessions and the exercises referenced by a bulk write, one query each"""
+        session_ids = {item.get('session') for item in items if isinstance(item, dict)}
+        exercise_ids = {item.get('exercise') for item in items if isinstance(item, dict)}
+        return {
+            WorkoutSession: WorkoutSession.objects.filter(user=self.request.user).in_bulk(
+                [pk for pk in session_ids if isinstance(pk, (int, str)) and str(pk).isdigit()]
+            ),
+            ExerciseCatalog: ExerciseCatalog.objects.in_bulk(
+                [pk for pk in exercise_ids if isinstance(pk, (int, str)) and str(pk).isdigit()]
+            ),
+        }
+
+    def bulk_changed(self, objects, created=()):
+        from . import aggregates, dashboard_push, pr_index
+
+        session_ids = {obj.session_id for obj in objects}
+        sessions = WorkoutSession.objects.filter(pk__in=session_ids).values_list('user_id', 'start_time')
+        for user_id, start_time in sessions:
+            day = aggregates.local_day(start_time)
+            if day is not None:
+                aggregates.mark_dirty(aggregates.STRENGTH, user_id, day)
+                aggregates.mark_dirty(aggregates.EXERCISE, user_id, day)
+        if objects:
+            # Bulk writes skip the set signals; updated sets come before their previous copies
+            created_ids = {obj.pk for obj in created}
+            updated = {}
+            for obj in objects:
+                if obj.pk not in created_ids:
+                    updated.setdefault(obj.pk, obj)
+            pr_index.sets_written(created, list(updated.values()))
+            dashboard_push.mark_changed('StrengthSet', self.request.user.id)
+
 class CardioEntryViewSet(viewsets.ModelViewSet):
     serializer_class = CardioEntrySerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -1188,7 +1293,6 @@ class RecommendationsView(APIView):
             # For testing without authentication, use a sample user or return sample data
             if not request.user.is_authenticated:
                 # Return sample recommendations for unauthenticated users
-                from .recommendations import SmartRecommendations
                 sample_recommender = SmartRecommendations(None)
                 recommendations = sample_recommender._get_sample_recommendations()
                 return Response(recommendations)
@@ -1495,6 +1599,26 @@ class FriendActivityView(APIView):
             return Response({'error': f'Failed to get friend activity: {str(e)}'}, status=500)
 
 
+class ActivityFeedView(APIView):
+    """Materialized activity timeline, paginated with keyset cursors."""
+    permission_classes = [permissions.IsAuthenticated]
+    
+    def get(self, request):
+        from .timeline import DEFAULT_PAGE_SIZE, InvalidCursor, fetch_page
+        
+        try:
+            limit = int(request.query_params.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            return Response({'error': 'limit must be an integer'}, status=400)
+        
+        try:
+            items, next_cursor = fetch_page(request.user.id, request.query_params.get('cursor'), limit)
+        except InvalidCursor:
+            return Response({'error': 'Invalid cursor'}, status=400)
+        
+        return Response({'results': items, 'next_cursor': next_cursor})
+
+
 # Photo Progress Viewsets
 class ProgressPhotoViewSet(viewsets.ModelViewSet):
     """ViewSet for managing progress photos."""
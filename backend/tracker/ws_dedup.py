@@ -0,0 +1,140 @@
+"""
+Memory-bounded, time-windowed de-duplication of client WebSocket messages.
+
+Each ``WorkoutConsumer`` connection owns a ``MessageDeduplicator`` for its
+(user, workout session). Locally it keeps the ``client_msg_id`` values seen in
+the last ``window_s`` seconds in insertion order (an ``OrderedDict`` used as a
+ring), so check-and-insert and eviction of the oldest ids are O(1) and at most
+``max_ids`` ids are held per connection. Nothing is kept after disconnect.
+
+When the channel layer is Redis-backed, ids are also claimed there with
+``SET NX EX window_s`` under a key scoped to the (user, session). A client that
+reconnects to another worker and replays its queue is then still recognised.
+Other layers (e.g. the in-memory one) only get the local window.
+
+An id is claimed before its handler runs; if the handler fails the consumer
+releases it (locally and in Redis), so the client's retry is applied.
+"""
+import logging
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'window_s': 300,          # an id is a duplicate for this long after first seen
+    'max_ids': 1000,          # local ids kept per connection
+    'shared': True,           # also claim ids in the Redis channel layer when available
+    'key_prefix': 'mar:wsdedup',
+}
+
+# Longer ids are not tracked, so a misbehaving client cannot inflate memory
+MAX_ID_LENGTH = 128
+
+
+def dedup_settings():
+    return {**DEFAULTS, **getattr(settings, 'MAR_WS_DEDUP', {})}
+
+
+class RecentMessageIds:
+    """Ids seen in a sliding time window, capped in size; oldest evicted first"""
+
+    def __init__(self, window_s, max_ids, clock=time.monotonic):
+        self.window_s = window_s
+        self.max_ids = max_ids
+        self.clock = clock
+        self._ids = OrderedDict()  # id -> first seen, oldest first
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, msg_id):
+        self._expire(self.clock())
+        return msg_id in self._ids
+
+    def add(self, msg_id):
+        """Record an id; returns False if it was already in the window"""
+        now = self.clock()
+        self._expire(now)
+        if msg_id in self._ids:
+            return False
+        while len(self._ids) >= self.max_ids:
+            self._ids.popitem(last=False)
+        self._ids[msg_id] = now
+        return True
+
+    def discard(self, msg_id):
+        self._ids.pop(msg_id, None)
+
+    def _expire(self, now):
+        cutoff = now - self.window_s
+        ids = self._ids
+        while ids:
+            oldest = next(iter(ids))
+            if ids[oldest] >= cutoff:
+                break
+            del ids[oldest]
+
+
+def _shared_store(channel_layer):
+    """The Redis connection factory of a channels_redis layer, or None"""
+    if channel_layer is None:
+        return None
+    if not callable(getattr(channel_layer, 'connection', None)) or not hasattr(channel_layer, 'consistent_hash'):
+        return None
+    return channel_layer
+
+
+class MessageDeduplicator:
+    """Per-connection duplicate detection for client_msg_id values"""
+
+    def __init__(self, scope_key, channel_layer=None, window_s=None, max_ids=None, shared=None, clock=time.monotonic):
+        config = dedup_settings()
+        self.scope_key = scope_key
+        self.window_s = window_s or config['window_s']
+        self.key_prefix = config['key_prefix']
+        self.local = RecentMessageIds(self.window_s, max_ids or config['max_ids'], clock=clock)
+        use_shared = config['shared'] if shared is None else shared
+        self.store = _shared_store(channel_layer) if use_shared else None
+
+    @staticmethod
+    def _tracked(msg_id):
+        return msg_id is not None and isinstance(msg_id, (str, int)) and len(str(msg_id)) <= MAX_ID_LENGTH
+
+    def _key(self, msg_id):
+        return f"{self.key_prefix}:{self.scope_key}:{msg_id}"
+
+    async def is_duplicate(self, msg_id):
+        """Check-and-insert: True if ``msg_id`` was already seen in the window"""
+        if not self._tracked(msg_id):
+            return False
+        if not self.local.add(msg_id):
+            return True
+        if self.store is None:
+            return False
+        key = self._key(msg_id)
+        try:
+            connection = self.store.connection(self.store.consistent_hash(key))
+            claimed = await connection.set(key, 1, nx=True, ex=int(self.window_s))
+        except Exception as e:
+            # Fail open: the local window still catches same-connection replays
+            logger.error(f"Shared message de-duplication failed for {self.scope_key}: {str(e)}")
+            return False
+        return not claimed
+
+    async def release(self, msg_id):
+        """Forget a claimed id whose handler failed, so the client's retry is processed"""
+        if not self._tracked(msg_id):
+            return
+        self.local.discard(msg_id)
+        if self.store is None:
+            return
+        key = self._key(msg_id)
+        try:
+            connection = self.store.connection(self.store.consistent_hash(key))
+            await connection.delete(key)
+        except Exception as e:
+            # The claim expires with the window
+            logger.error(f"Releasing message id failed for {self.scope_key}: {str(e)}")